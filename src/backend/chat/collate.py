@@ -1,10 +1,14 @@
+import asyncio
 import json
 from typing import Any, Dict, List
 
 from backend.model_deployments.base import BaseDeployment
 from backend.schemas.context import Context
+from backend.services.rerank import CachedReranker, LocalReranker, get_reranker
 
 RELEVANCE_THRESHOLD = 0.1
+MAX_CONCURRENT_RERANKS = 4
+SENTENCE_TERMINATORS = (".", "!", "?")
 
 
 async def rerank_and_chunk(
@@ -17,6 +21,10 @@ async def rerank_and_chunk(
     Takes a list of tool_results and internally reranks the documents for each query, if there's one e.g:
     [{"q1":[1, 2, 3],"q2": [4, 5, 6]] -> [{"q1":[2 , 3, 1],"q2": [4, 6, 5]]
 
+    The rerank calls for the different queries are run concurrently, bounded by
+    MAX_CONCURRENT_RERANKS. Deployments without rerank use the local reranker of
+    chat.local_rerank.
+
     Args:
         tool_results (List[Dict[str, Any]]): List of tool_results from different retrievers.
             Each tool_result contains a ToolCall and a list of Outputs.
@@ -28,7 +36,8 @@ async def rerank_and_chunk(
         List[Dict[str, Any]]: List of reranked and combined documents.
     """
     # If rerank is not enabled return documents as is:
-    if not model.rerank_enabled:
+    reranker = get_reranker(model)
+    if reranker is None:
         return tool_results
 
     # Merge all the documents with the same tool call and parameters
@@ -48,58 +57,76 @@ async def rerank_and_chunk(
         )
 
     # Rerank the documents for each query
-    reranked_results = {}
-    for tool_call_hashable, tool_result in unified_tool_results.items():
-        tool_call = tool_result["call"]
-        query = tool_call.get("parameters").get("query") or tool_call.get(
-            "parameters"
-        ).get("search_query")
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_RERANKS)
+    reranked_results = await asyncio.gather(
+        *[
+            _rerank_tool_result(tool_result, reranker, ctx, semaphore)
+            for tool_result in unified_tool_results.values()
+        ]
+    )
 
-        # Only rerank if there is a query
-        if not query:
-            reranked_results[tool_call_hashable] = tool_result
-            continue
+    # Tool results without any document to rerank are dropped
+    return [result for result in reranked_results if result is not None]
 
-        chunked_outputs: list[dict[str, Any]] = []
-        for output in tool_result["outputs"]:
-            text = output.get("text")
 
-            if not text:
-                # If one doesn't have text, skip it
-                reranked_results[tool_call_hashable] = tool_result
-                continue
+async def _rerank_tool_result(
+    tool_result: Dict[str, Any],
+    reranker: BaseDeployment | CachedReranker | LocalReranker,
+    ctx: Context,
+    semaphore: asyncio.Semaphore,
+) -> Dict[str, Any] | None:
+    tool_call = tool_result["call"]
+    query = tool_call.get("parameters").get("query") or tool_call.get(
+        "parameters"
+    ).get("search_query")
+
+    # Only rerank if there is a query
+    if not query:
+        return tool_result
+
+    reranked_result = None
+    chunked_outputs: list[dict[str, Any]] = []
+    for output in tool_result["outputs"]:
+        text = output.get("text")
+
+        if not text:
+            # If one doesn't have text, skip it
+            reranked_result = tool_result
+            continue
 
-            chunks = chunk(text)
-            chunked_outputs.extend([dict(output, text=chunk) for chunk in chunks])
+        chunks = chunk(text)
+        chunked_outputs.extend([dict(output, text=chunk) for chunk in chunks])
 
-        # If no documents to rerank, continue to the next query
-        if not chunked_outputs:
-            continue
+    # If no documents to rerank, continue to the next query
+    if not chunked_outputs:
+        return reranked_result
 
-        res = await model.invoke_rerank(
+    async with semaphore:
+        res = await reranker.invoke_rerank(
             query=query,
             documents=[output["text"] for output in chunked_outputs],
             ctx=ctx,
         )
 
-        if not res:
-            reranked_results[tool_call_hashable] = tool_result
-            continue
+    if not res:
+        return tool_result
 
-        # Sort the results by relevance score
-        res["results"].sort(key=lambda x: x["relevance_score"], reverse=True)
+    # Sort the results by relevance score
+    res["results"].sort(key=lambda x: x["relevance_score"], reverse=True)
 
-        # Map the results back to the original documents
-        reranked_results[tool_call_hashable] = {
-            "call": tool_call,
-            "outputs": [
-                chunked_outputs[r["index"]]
-                for r in res["results"]
-                if r["relevance_score"] > RELEVANCE_THRESHOLD
-            ],
-        }
+    # The local scores only count shared tokens, they reorder the documents without
+    # dropping the ones that match the query semantically
+    threshold = None if isinstance(reranker, LocalReranker) else RELEVANCE_THRESHOLD
 
-    return list(reranked_results.values())
+    # Map the results back to the original documents
+    return {
+        "call": tool_call,
+        "outputs": [
+            chunked_outputs[r["index"]]
+            for r in res["results"]
+            if threshold is None or r["relevance_score"] > threshold
+        ],
+    }
 
 
 def chunk(
@@ -107,39 +134,62 @@ def chunk(
     compact_mode: bool = False,
     soft_word_cut_off: int = 100,
     hard_word_cut_off: int = 300,
+    overlap: int = 0,
 ) -> list[str]:
+    """
+    Splits content into chunks of words in a single pass.
+
+    A chunk is closed at the first sentence end once it holds more than soft_word_cut_off
+    words, and is always closed before it exceeds hard_word_cut_off words. Chunks are built
+    from word indices, so each word is joined once and the cost is linear in the content size.
+
+    Args:
+        content (str): Text to chunk.
+        compact_mode (bool): Whether to replace newlines with spaces before chunking.
+        soft_word_cut_off (int): Word count after which a chunk ends at the next sentence end.
+        hard_word_cut_off (int): Maximum number of words in a chunk.
+        overlap (int): Number of trailing words of a chunk repeated at the start of the next one.
+
+    Returns:
+        list[str]: List of chunks.
+
+    Raises:
+        ValueError: If the overlap is not smaller than both cut-offs.
+    """
+    if overlap >= min(soft_word_cut_off, hard_word_cut_off):
+        raise ValueError(
+            f"Chunk overlap ({overlap}) must be smaller than the word cut-offs "
+            f"({soft_word_cut_off}, {hard_word_cut_off})"
+        )
+
     if compact_mode:
         content = content.replace("\n", " ")
 
-    chunks = []
-    current_chunk = ""
     words = content.split()
-    word_count = 0
+    chunks = []
+    # Index of the first word of the current chunk
+    start = 0
+    # Index after the last word already emitted in a chunk
+    emitted_end = 0
 
-    for word in words:
-        if word_count + len(word.split()) > hard_word_cut_off:
+    for index, word in enumerate(words):
+        if index - start + 1 > hard_word_cut_off and index > start:
             # If adding the next word exceeds the hard limit, finalize the current chunk
-            chunks.append(current_chunk)
-            current_chunk = ""
-            word_count = 0
-
-        if word_count + len(word.split()) > soft_word_cut_off and word.endswith("."):
-            # If adding the next word exceeds the soft limit and the word ends with a period, finalize the current chunk
-            current_chunk += " " + word
-            chunks.append(current_chunk.strip())
-            current_chunk = ""
-            word_count = 0
-        else:
-            # Add the word to the current chunk
-            if current_chunk == "":
-                current_chunk = word
-            else:
-                current_chunk += " " + word
-            word_count += len(word.split())
-
-    # Add any remaining content as the last chunk
-    if current_chunk != "":
-        chunks.append(current_chunk.strip())
+            chunks.append(" ".join(words[start:index]))
+            emitted_end = index
+            start = index - overlap
+
+        if index - start + 1 > soft_word_cut_off and word.endswith(
+            SENTENCE_TERMINATORS
+        ):
+            # If adding the next word exceeds the soft limit and the word ends a sentence, finalize the current chunk
+            chunks.append(" ".join(words[start : index + 1]))
+            emitted_end = index + 1
+            start = index + 1 - overlap
+
+    # Add any remaining content as the last chunk, unless it only repeats the overlap
+    if emitted_end < len(words):
+        chunks.append(" ".join(words[start:]))
 
     return chunks
 
@@ -0,0 +1,230 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from enum import StrEnum
+from typing import AsyncIterator
+
+from backend.config.settings import Settings
+from backend.metrics import collector
+from backend.schemas.tool import ToolDefinition
+from backend.services.logger.utils import LoggerFactory
+
+DEFAULT_RESET_TIMEOUT_SECONDS = 30
+
+logger = LoggerFactory().get_logger()
+
+# Tool name of each bulkhead and circuit breaker, they are shared by the requests of the process
+_bulkheads: dict[str, "Bulkhead"] = {}
+_circuit_breakers: dict[str, "CircuitBreaker"] = {}
+
+
+class BulkheadFullError(Exception):
+    """Raised when a call cannot wait for a free slot because the queue is full."""
+
+
+class CircuitState(StrEnum):
+    Closed = "closed"
+    Open = "open"
+    HalfOpen = "half_open"
+
+
+class Bulkhead:
+    """
+    Limits the concurrent calls of a tool. The calls beyond the limit wait for a free slot,
+    and fail immediately if max_queued_calls calls are already waiting.
+    """
+
+    def __init__(
+        self, name: str, max_concurrent_calls: int, max_queued_calls: int | None = None
+    ) -> None:
+        self.name = name
+        self.max_concurrent_calls = max_concurrent_calls
+        self.max_queued_calls = max_queued_calls
+        self.active = 0
+        self.queued = 0
+        self.rejected = 0
+        self.semaphore = asyncio.Semaphore(max_concurrent_calls)
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[None]:
+        """
+        Waits for a free slot and holds it until the end of the block.
+
+        Raises:
+            BulkheadFullError: If the queue of calls waiting for a slot is full.
+        """
+        if (
+            self.semaphore.locked()
+            and self.max_queued_calls is not None
+            and self.queued >= self.max_queued_calls
+        ):
+            self.rejected += 1
+            _add_metric("bulkhead", f"{self.name}_rejected")
+            raise BulkheadFullError(
+                f"{self.max_concurrent_calls} calls running and {self.queued} calls waiting"
+            )
+
+        self.queued += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.queued -= 1
+
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self.semaphore.release()
+
+
+class CircuitBreaker:
+    """
+    Fails the calls of a tool fast after failure_threshold consecutive failures.
+
+    The circuit opens after the failures, and the calls are rejected without calling the tool.
+    After reset_timeout seconds the circuit is half open: a single probe call goes through,
+    closing the circuit if it succeeds or opening it again if it fails.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int,
+        reset_timeout: float = DEFAULT_RESET_TIMEOUT_SECONDS,
+    ) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self._state = CircuitState.Closed
+
+    @property
+    def state(self) -> CircuitState:
+        if (
+            self._state == CircuitState.Open
+            and time.monotonic() - self.opened_at >= self.reset_timeout
+        ):
+            self._set_state(CircuitState.HalfOpen)
+        return self._state
+
+    def allow_call(self) -> bool:
+        """
+        Checks if a call can go through, marking it as the probe call if the circuit is half open.
+
+        Returns:
+            bool: Whether the tool can be called.
+        """
+        state = self.state
+        if state == CircuitState.Closed:
+            return True
+        if state == CircuitState.HalfOpen and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def record(self, success: bool | None) -> None:
+        """
+        Records the outcome of an allowed call.
+
+        Args:
+            success (bool | None): Whether the call succeeded, or None if the call ended
+                without telling if the tool is healthy, like a cancelled call.
+        """
+        was_probe = self.probing and self._state == CircuitState.HalfOpen
+        if was_probe:
+            self.probing = False
+
+        if success is None:
+            return
+        if success:
+            self.failures = 0
+            if self._state != CircuitState.Closed:
+                self._set_state(CircuitState.Closed)
+            return
+
+        self.failures += 1
+        if was_probe or (
+            self._state == CircuitState.Closed and self.failures >= self.failure_threshold
+        ):
+            self.opened_at = time.monotonic()
+            self._set_state(CircuitState.Open)
+
+    def _set_state(self, state: CircuitState) -> None:
+        self._state = state
+        logger.warning(
+            event="[Custom Chat] Tool circuit breaker state changed",
+            tool=self.name,
+            state=state,
+            failures=self.failures,
+        )
+        _add_metric("circuit_breaker", f"{self.name}_{state}")
+
+
+def get_bulkhead(tool_definition: ToolDefinition) -> Bulkhead | None:
+    """
+    Get the bulkhead of a tool, limited by max_concurrent_calls of the tool definition or
+    tools.max_concurrent_calls.
+
+    Args:
+        tool_definition (ToolDefinition): Tool definition.
+
+    Returns:
+        Bulkhead | None: Bulkhead, or None if the concurrent calls are not limited.
+    """
+    max_concurrent_calls = tool_definition.max_concurrent_calls or Settings().get(
+        "tools.max_concurrent_calls"
+    )
+    if not max_concurrent_calls:
+        return None
+
+    max_queued_calls = Settings().get("tools.max_queued_calls")
+    bulkhead = _bulkheads.get(tool_definition.name)
+    if (
+        bulkhead is None
+        or bulkhead.max_concurrent_calls != max_concurrent_calls
+        or bulkhead.max_queued_calls != max_queued_calls
+    ):
+        bulkhead = Bulkhead(tool_definition.name, max_concurrent_calls, max_queued_calls)
+        _bulkheads[tool_definition.name] = bulkhead
+    return bulkhead
+
+
+def get_circuit_breaker(tool_definition: ToolDefinition) -> CircuitBreaker | None:
+    """
+    Get the circuit breaker of a tool, tripped by circuit_breaker_failures of the tool
+    definition or tools.circuit_breaker_failures.
+
+    Args:
+        tool_definition (ToolDefinition): Tool definition.
+
+    Returns:
+        CircuitBreaker | None: Circuit breaker, or None if it is not enabled for the tool.
+    """
+    failure_threshold = tool_definition.circuit_breaker_failures or Settings().get(
+        "tools.circuit_breaker_failures"
+    )
+    if not failure_threshold:
+        return None
+
+    reset_timeout = Settings().get("tools.circuit_breaker_reset_timeout")
+    if reset_timeout is None:
+        reset_timeout = DEFAULT_RESET_TIMEOUT_SECONDS
+    circuit_breaker = _circuit_breakers.get(tool_definition.name)
+    if circuit_breaker is None:
+        circuit_breaker = CircuitBreaker(
+            tool_definition.name, failure_threshold, reset_timeout
+        )
+        _circuit_breakers[tool_definition.name] = circuit_breaker
+    else:
+        # The state is kept when the thresholds change
+        circuit_breaker.failure_threshold = failure_threshold
+        circuit_breaker.reset_timeout = reset_timeout
+    return circuit_breaker
+
+
+def _add_metric(metric_type: str, name: str) -> None:
+    if Settings().get("metrics.enabled"):
+        collector.add_metric(metric_type, name, 0)
@@ -1,22 +1,29 @@
+import asyncio
+from contextlib import aclosing
 from typing import Any, AsyncGenerator, Dict, List
 
 from fastapi import HTTPException
 from sqlalchemy.orm import Session
 
 from backend.chat.base import BaseChat
-from backend.chat.custom.tool_calls import async_call_tools
+from backend.chat.custom.tool_calls import SpeculativeToolCalls, async_call_tools
 from backend.chat.custom.utils import get_deployment
 from backend.chat.enums import StreamEvent
+from backend.chat.history import fit_chat_request_history
 from backend.config import Settings
 from backend.config.tools import get_available_tools
 from backend.database_models.file import File
 from backend.model_deployments.base import BaseDeployment
-from backend.schemas.chat import ChatMessage, ChatRole, EventState
+from backend.schemas.chat import ChatMessage, ChatRole
 from backend.schemas.cohere_chat import CohereChatRequest
 from backend.schemas.context import Context
 from backend.schemas.tool import Tool, ToolCategory
-from backend.services.chat import check_death_loop, generate_tools_preamble
-from backend.services.file import get_file_service
+from backend.services.chat import (
+    check_death_loop,
+    create_event_state,
+    generate_tools_preamble,
+)
+from backend.services.file import get_file_preview, get_file_service
 from backend.tools.utils.tools_checkers import tool_has_category
 
 MAX_STEPS = 15
@@ -25,13 +32,6 @@ MAX_STEPS = 15
 class CustomChat(BaseChat):
     """Custom chat flow not using integrations for models."""
 
-    event_state = EventState(
-        distances_plans=[],
-        distances_actions=[],
-        previous_plan="",
-        previous_action="",
-    )
-
     async def chat(
         self,
         chat_request: CohereChatRequest,
@@ -67,25 +67,29 @@ class CustomChat(BaseChat):
 
         self.chat_request = chat_request
         self.is_first_start = True
+        # Death loop detection only compares the tool calls of this request
+        self.event_state = create_event_state()
 
         try:
-            stream = self.call_chat(
-                self.chat_request, deployment_model, session, ctx, **kwargs
-            )
-
-            async for event in stream:
-                result = self.handle_event(event, chat_request, ctx)
-
-                if result:
-                    yield result
-
-                if event[
-                    "event_type"
-                ] == StreamEvent.STREAM_END and self.is_final_event(
-                    event, chat_request
-                ):
-                    logger.debug(event=f"Final event: {event}")
-                    break
+            # Closing this stream, e.g. when the client disconnects, also closes the model stream
+            async with aclosing(
+                self.call_chat(
+                    self.chat_request, deployment_model, session, ctx, **kwargs
+                )
+            ) as stream:
+                async for event in stream:
+                    result = self.handle_event(event, chat_request, ctx)
+
+                    if result:
+                        yield result
+
+                    if event[
+                        "event_type"
+                    ] == StreamEvent.STREAM_END and self.is_final_event(
+                        event, chat_request
+                    ):
+                        logger.debug(event=f"Final event: {event}")
+                        break
         except Exception as e:
             logger.exception(
                 event="[Custom Chat] Error occurred during chat stream",
@@ -212,46 +216,110 @@ class CustomChat(BaseChat):
         if chat_request.tools and Settings().get("tools.use_tools_preamble"):
             chat_request.preamble = generate_tools_preamble(chat_request)
 
+        use_speculative_tool_calls = Settings().get("tools.speculative_tool_calls")
+        history_tokens_saved = 0
+
         # Loop until there are no new tool calls
         for step in range(MAX_STEPS):
+            # Each step resends the chat history, with the tool results of the previous steps
+            history_tokens_saved += fit_chat_request_history(chat_request, ctx)
             logger.debug(
                 event=f"[Custom Chat] Chat request: {chat_request.model_dump()}",
                 step=step + 1,
             )
 
-            # Invoke chat stream
-            has_tool_calls = False
-            async for event in deployment_model.invoke_chat_stream(
-                chat_request,
-                ctx,
-            ):
-                if event["event_type"] == StreamEvent.STREAM_END:
-                    chat_request.chat_history = event["response"].get(
-                        "chat_history", []
-                    )
-                elif event["event_type"] == StreamEvent.TOOL_CALLS_GENERATION:
-                    has_tool_calls = True
+            # Start idempotent tool calls as soon as their parameters are streamed
+            speculative_tool_calls = None
+            if use_speculative_tool_calls:
+                speculative_tool_calls = SpeculativeToolCalls(
+                    kwargs.get("session"), deployment_model, ctx
+                )
 
-                yield event
+            try:
+                # Invoke chat stream
+                has_tool_calls = False
+                async with aclosing(
+                    deployment_model.invoke_chat_stream(chat_request, ctx)
+                ) as events:
+                    async for event in events:
+                        if event["event_type"] == StreamEvent.STREAM_END:
+                            chat_request.chat_history = event["response"].get(
+                                "chat_history", []
+                            )
+                        elif event["event_type"] == StreamEvent.TOOL_CALLS_GENERATION:
+                            has_tool_calls = True
+                        elif (
+                            event["event_type"] == StreamEvent.TOOL_CALLS_CHUNK
+                            and speculative_tool_calls
+                        ):
+                            speculative_tool_calls.add_delta(
+                                event.get("tool_call_delta")
+                            )
+
+                        yield event
+
+                logger.info(
+                    event=f"[Custom Chat] Chat stream completed: Has tool calls {has_tool_calls}",
+                )
 
+                # Check for new tool calls in the chat history
+                if has_tool_calls:
+                    # Handle tool calls
+                    if Settings().get("tools.stream_tool_results"):
+                        # Send each tool's results to the stream as soon as the tool finishes
+                        results_queue: asyncio.Queue = asyncio.Queue()
+                        tools_task = asyncio.create_task(
+                            async_call_tools(
+                                chat_request.chat_history,
+                                deployment_model,
+                                ctx,
+                                on_tool_result=results_queue.put_nowait,
+                                speculative_tool_calls=speculative_tool_calls,
+                                **kwargs,
+                            )
+                        )
+                        tools_task.add_done_callback(
+                            lambda _: results_queue.put_nowait(None)
+                        )
+                        try:
+                            while (
+                                results := await results_queue.get()
+                            ) is not None:
+                                for result in results:
+                                    yield {
+                                        "event_type": StreamEvent.TOOL_RESULT,
+                                        "tool_name": result["call"]["name"],
+                                        "result": result["outputs"],
+                                    }
+                        finally:
+                            tools_task.cancel()
+                        tool_results = await tools_task
+                    else:
+                        tool_results = await async_call_tools(
+                            chat_request.chat_history,
+                            deployment_model,
+                            ctx,
+                            speculative_tool_calls=speculative_tool_calls,
+                            **kwargs,
+                        )
+
+                    # Remove the message if tool results are present
+                    if tool_results:
+                        chat_request.tool_results = list(tool_results)
+                        chat_request.message = ""
+                else:
+                    break  # Exit loop if there are no new tool calls
+            finally:
+                # Also stop the speculative calls if the stream is closed or fails
+                if speculative_tool_calls:
+                    speculative_tool_calls.cancel()
+
+        if history_tokens_saved:
             logger.info(
-                event=f"[Custom Chat] Chat stream completed: Has tool calls {has_tool_calls}",
+                event="[Custom Chat] Chat history fitted in the token budget",
+                tokens_saved=history_tokens_saved,
             )
 
-            # Check for new tool calls in the chat history
-            if has_tool_calls:
-                # Handle tool calls
-                tool_results = await async_call_tools(
-                    chat_request.chat_history, deployment_model, ctx, **kwargs
-                )
-
-                # Remove the message if tool results are present
-                if tool_results:
-                    chat_request.tool_results = list(tool_results)
-                    chat_request.message = ""
-            else:
-                break  # Exit loop if there are no new tool calls
-
         # Restore the original chat request message if needed
         self.chat_request = chat_request
 
@@ -290,11 +358,8 @@ class CustomChat(BaseChat):
         files_message = "The user uploaded the following attachments:\n"
 
         for file in files:
-            word_count = len(file.file_content.split())
-
             # Use the first 25 words as the document preview in the preamble
-            num_words = min(25, word_count)
-            preview = " ".join(file.file_content.split()[:num_words])
+            word_count, preview = get_file_preview(session, file, 25)
 
             files_message += f"Filename: {file.file_name}\nFile ID: {file.id}\nWord Count: {word_count} Preview: {preview}\n\n"
 
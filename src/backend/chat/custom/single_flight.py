@@ -0,0 +1,63 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+
+@dataclass
+class SingleFlightStats:
+    calls: int = 0
+    coalesced: int = 0
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task) -> None:
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller starts the call, and the
+    callers that arrive while it is in flight wait for its result instead of calling again.
+
+    The call is cancelled only when all of its callers are cancelled. Once it finishes, the
+    next call with the same key starts a new call, results are not cached.
+    """
+
+    def __init__(self) -> None:
+        self.flights: dict[str, _Flight] = {}
+        self.stats = SingleFlightStats()
+
+    async def call(self, key: str, function: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Calls the function, or waits for the call in flight with the same key.
+
+        Args:
+            key (str): Key of identical calls.
+            function (Callable[[], Awaitable[Any]]): Function starting the call.
+
+        Returns:
+            Any: Result of the call.
+        """
+        flight = self.flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(function()))
+            self.flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._remove(key, flight))
+            self.stats.calls += 1
+        else:
+            self.stats.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _remove(self, key: str, flight: _Flight) -> None:
+        if self.flights.get(key) is flight:
+            del self.flights[key]
@@ -1,15 +1,25 @@
 import asyncio
-from typing import Any, Dict, List
+import copy
+import json
+from typing import Any, Callable, Dict, List
 
-from fastapi import HTTPException
 from sqlalchemy.orm import Session
 
 from backend.chat.collate import rerank_and_chunk, to_dict
+from backend.chat.custom.circuit_breaker import (
+    BulkheadFullError,
+    get_bulkhead,
+    get_circuit_breaker,
+)
+from backend.chat.custom.single_flight import SingleFlight
+from backend.config.settings import Settings
 from backend.config.tools import get_available_tools
 from backend.model_deployments.base import BaseDeployment
 from backend.schemas.context import Context
+from backend.schemas.tool import ToolCallScope
 from backend.services.logger.utils import LoggerFactory
 from backend.tools.base import (
+    BaseTool,
     ToolAuthException,
     ToolErrorCode,
 )
@@ -18,13 +28,32 @@ TIMEOUT_SECONDS = 60
 
 logger = LoggerFactory().get_logger()
 
+# Identical tool calls in flight across requests, for the user and global scopes
+tool_calls_single_flight = SingleFlight()
+
 
 async def async_call_tools(
     chat_history: List[Dict[str, Any]],
     deployment_model: BaseDeployment,
     ctx: Context,
+    on_tool_result: Callable[[List[Dict[str, Any]]], None] | None = None,
+    speculative_tool_calls: "SpeculativeToolCalls | None" = None,
     **kwargs: Any,
 ) -> list[dict[str, str]]:
+    """
+    Calls the tools from the last message of the chat history and reranks their results.
+
+    Args:
+        chat_history (List[Dict[str, Any]]): Chat history, the last message holds the tool calls.
+        deployment_model (BaseDeployment): Model deployment.
+        ctx (Context): Context object.
+        on_tool_result (Callable): Optional callback, called with the reranked results of each tool as soon as it finishes.
+        speculative_tool_calls (SpeculativeToolCalls): Optional tool calls already started while the model was streaming.
+        **kwargs (Any): Additional arguments.
+
+    Returns:
+        list[dict[str, str]]: Reranked tool results.
+    """
     logger = ctx.get_logger()
 
     tool_results = []
@@ -40,10 +69,20 @@ async def async_call_tools(
     )
 
     tool_results = await _call_all_tools_async(
-        kwargs.get("session"), tool_calls, deployment_model, ctx
+        kwargs.get("session"),
+        tool_calls,
+        deployment_model,
+        ctx,
+        on_tool_result,
+        speculative_tool_calls,
+        **kwargs,
     )
 
-    tool_results = await rerank_and_chunk(tool_results, deployment_model, ctx, **kwargs)
+    # The results reported to on_tool_result are already reranked
+    if not on_tool_result:
+        tool_results = await rerank_and_chunk(
+            tool_results, deployment_model, ctx, **kwargs
+        )
     logger.info(
         event="[Custom Chat] Tool results",
         tool_results=to_dict(tool_results),
@@ -57,22 +96,96 @@ async def _call_all_tools_async(
     tool_calls: list[dict],
     deployment_model: BaseDeployment,
     ctx: Context,
-) -> dict[str, str]:
-    tasks = [
-        _call_tool_async(ctx, db, tool_call, deployment_model)
+    on_tool_result: Callable[[List[Dict[str, Any]]], None] | None = None,
+    speculative_tool_calls: "SpeculativeToolCalls | None" = None,
+    **kwargs: Any,
+) -> list[dict[str, Any]]:
+    speculative_tasks = [
+        speculative_tool_calls.pop(tool_call) if speculative_tool_calls else None
         for tool_call in tool_calls
     ]
-    combined = asyncio.gather(*tasks)
-    try:
-        tool_results = await asyncio.wait_for(combined, timeout=TIMEOUT_SECONDS)
-        # Flatten a list of list of tool results
-        return [n for m in tool_results for n in m]
-    except asyncio.TimeoutError:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Timeout while calling tools with timeout: {TIMEOUT_SECONDS}",
+    if speculative_tool_calls:
+        # The remaining speculative calls do not match any final tool call
+        speculative_tool_calls.cancel()
+
+    step_single_flight = SingleFlight()
+
+    async def call_tool(
+        tool_call: dict, speculative_task: asyncio.Task | None
+    ) -> List[Dict[str, Any]]:
+        if speculative_task:
+            # Reuse the call started while streaming, it has the same name and parameters
+            results = [
+                dict(result, call=tool_call) for result in await speculative_task
+            ]
+        else:
+            results = await _call_tool_single_flight(
+                ctx, db, tool_call, deployment_model, step_single_flight
+            )
+        if on_tool_result:
+            # Rerank each tool's results when it finishes, so the reported results
+            # are the ones sent to the model
+            results = await rerank_and_chunk(
+                results, deployment_model, ctx, **kwargs
+            )
+            on_tool_result(results)
+        return results
+
+    # Each tool call has its own deadline, so a slow tool only fails its own results
+    tool_results = await asyncio.gather(
+        *[
+            call_tool(tool_call, speculative_task)
+            for tool_call, speculative_task in zip(tool_calls, speculative_tasks)
+        ]
+    )
+    # Flatten a list of list of tool results
+    return [n for m in tool_results for n in m]
+
+
+async def _call_tool_single_flight(
+    ctx: Context,
+    db: Session,
+    tool_call: dict,
+    deployment_model: BaseDeployment,
+    step_single_flight: SingleFlight,
+) -> List[Dict[str, Any]]:
+    """
+    Calls a tool, sharing the call with the identical calls in flight in its scope if
+    tools.single_flight_tool_calls is set. Only idempotent tools share their calls.
+    """
+    tool_definition = get_available_tools().get(tool_call["name"])
+    if (
+        not Settings().get("tools.single_flight_tool_calls")
+        or not tool_definition
+        or not tool_definition.is_idempotent
+    ):
+        return await _call_tool_async(ctx, db, tool_call, deployment_model)
+
+    scope = tool_definition.single_flight_scope or ToolCallScope(
+        Settings().get("tools.single_flight_scope") or ToolCallScope.Step
+    )
+    single_flight = tool_calls_single_flight
+    key = f"{scope}:{_get_tool_call_key(tool_call)}"
+    if scope == ToolCallScope.Step:
+        single_flight = step_single_flight
+    elif scope == ToolCallScope.User:
+        key = f"{scope}:{ctx.get_user_id()}:{_get_tool_call_key(tool_call)}"
+
+    if key in single_flight.flights:
+        logger.debug(
+            event="[Custom Chat] Reusing identical tool call in flight",
+            tool_call=tool_call,
+            scope=scope,
         )
+    results = await single_flight.call(
+        key, lambda: _call_tool_async(ctx, db, tool_call, deployment_model)
+    )
 
+    # Each caller gets its own copy of the shared results
+    return [
+        dict(result, call=tool_call, outputs=copy.deepcopy(result["outputs"]))
+        for result in results
+    ]
 
 
 async def _call_tool_async(
@@ -95,9 +208,24 @@ async def _call_tool_async(
         return outputs
 
     tool = tool_definition.implementation()
+    timeout = tool_definition.timeout or TIMEOUT_SECONDS
+    bulkhead = get_bulkhead(tool_definition)
+    circuit_breaker = get_circuit_breaker(tool_definition)
 
-    try:
-        outputs = await tool.call(
+    if circuit_breaker and not circuit_breaker.allow_call():
+        return [
+            {
+                "call": tool_call,
+                "outputs": tool.get_tool_error(
+                    details=f"Tool calls fail fast after {circuit_breaker.failures} consecutive failures",
+                    text="Tool temporarily unavailable",
+                    error_type=ToolErrorCode.UNAVAILABLE,
+                ),
+            }
+        ]
+
+    async def call_tool() -> Any:
+        return await tool.call(
             parameters=tool_call.get("parameters"),
             ctx=ctx,
             session=db,
@@ -108,6 +236,42 @@ async def _call_tool_async(
             conversation_id=ctx.get_conversation_id(),
             agent_tool_metadata=ctx.get_agent_tool_metadata(),
         )
+
+    async def call_tool_in_bulkhead() -> Any:
+        async with bulkhead.acquire():
+            return await call_tool()
+
+    # Outcome of the call for the circuit breaker, None if it doesn't tell the tool's health
+    success = None
+    try:
+        # The tool call is cancelled if it doesn't finish before its deadline, the time
+        # waiting for a free slot in the bulkhead counts in the deadline
+        outputs = await asyncio.wait_for(
+            call_tool_in_bulkhead() if bulkhead else call_tool(), timeout=timeout
+        )
+    except asyncio.TimeoutError:
+        success = False
+        return [
+            {
+                "call": tool_call,
+                "outputs": tool.get_tool_error(
+                    details=f"Tool call did not finish within {timeout} seconds",
+                    text="Timeout while calling tool",
+                    error_type=ToolErrorCode.TIMEOUT,
+                ),
+            }
+        ]
+    except BulkheadFullError as e:
+        return [
+            {
+                "call": tool_call,
+                "outputs": tool.get_tool_error(
+                    details=str(e),
+                    text="Too many concurrent calls of tool",
+                    error_type=ToolErrorCode.UNAVAILABLE,
+                ),
+            }
+        ]
     except ToolAuthException as e:
         return [
             {
@@ -120,14 +284,169 @@ async def _call_tool_async(
             }
         ]
     except Exception as e:
+        success = False
         return [
             {
                 "call": tool_call,
                 "outputs": tool.get_tool_error(details=str(e)),
             }
         ]
+    else:
+        # If the tool returns a list of outputs, append each output to the tool_results list
+        # Otherwise, append the single output to the tool_results list
+        outputs = outputs if isinstance(outputs, list) else [outputs]
+        success = not _is_tool_failure(tool, outputs)
+        return [{"call": tool_call, "outputs": outputs}]
+    finally:
+        if circuit_breaker:
+            circuit_breaker.record(success)
+
+
+def _is_tool_failure(tool: BaseTool, outputs: list) -> bool:
+    # Most tools return their errors instead of raising them. No results, or an error of
+    # the user's authentication, does not mean the tool is unhealthy
+    errors = [
+        output
+        for output in outputs
+        if isinstance(output, dict) and output.get("success") is False
+    ]
+    return (
+        bool(errors)
+        and len(errors) == len(outputs)
+        and errors != tool.get_no_results_error()
+        and all(error.get("type") != ToolErrorCode.AUTH for error in errors)
+    )
+
+
+class SpeculativeToolCalls:
+    """
+    Starts idempotent tool calls while the model is still streaming them.
+
+    The parameters of each tool call are rebuilt from the streamed tool_call_delta fragments,
+    and the tool is called as soon as they form a complete JSON object. The final tool calls
+    only reuse a speculative call with the same name and parameters, any other speculative
+    call is cancelled. Tools that are not idempotent are never called speculatively.
+    """
+
+    def __init__(
+        self, db: Session, deployment_model: BaseDeployment, ctx: Context
+    ) -> None:
+        self.db = db
+        self.deployment_model = deployment_model
+        self.ctx = ctx
+        self.names: dict[int, str] = {}
+        self.parameters: dict[int, _ParametersBuffer] = {}
+        self.tasks: dict[str, list[asyncio.Task]] = {}
+
+    def add_delta(self, tool_call_delta: dict[str, Any] | None) -> None:
+        """
+        Adds a streamed tool call delta, starting the tool call if its parameters are complete.
 
-    # If the tool returns a list of outputs, append each output to the tool_results list
-    # Otherwise, append the single output to the tool_results list
-    outputs = outputs if isinstance(outputs, list) else [outputs]
-    return [{"call": tool_call, "outputs": outputs}]
+        Args:
+            tool_call_delta (dict[str, Any]): Tool call delta from a tool calls chunk event.
+        """
+        if not tool_call_delta or tool_call_delta.get("index") is None:
+            return
+
+        index = tool_call_delta["index"]
+        if tool_call_delta.get("name"):
+            self.names[index] = tool_call_delta["name"]
+
+        fragment = tool_call_delta.get("parameters")
+        if not fragment:
+            return
+
+        parameters = self.parameters.setdefault(index, _ParametersBuffer())
+        if not parameters.complete and parameters.feed(fragment):
+            self._start(self.names.get(index), parameters.text)
+
+    def pop(self, tool_call: dict) -> asyncio.Task | None:
+        """
+        Takes the speculative call matching a final tool call, if there is one.
+
+        Args:
+            tool_call (dict): Final tool call.
+
+        Returns:
+            asyncio.Task | None: Task of the speculative call.
+        """
+        tasks = self.tasks.get(_get_tool_call_key(tool_call))
+        return tasks.pop(0) if tasks else None
+
+    def cancel(self) -> None:
+        """
+        Cancels the speculative calls that were not used by the final tool calls.
+        """
+        for tasks in self.tasks.values():
+            for task in tasks:
+                task.cancel()
+        self.tasks = {}
+
+    def _start(self, name: str | None, parameters_text: str) -> None:
+        tool_definition = get_available_tools().get(name)
+        if not tool_definition or not tool_definition.is_idempotent:
+            return
+
+        try:
+            parameters = json.loads(parameters_text)
+        except json.JSONDecodeError:
+            return
+        if not isinstance(parameters, dict):
+            return
+
+        tool_call = {"name": name, "parameters": parameters}
+        logger.debug(
+            event="[Custom Chat] Starting speculative tool call",
+            tool_call=tool_call,
+        )
+        task = asyncio.create_task(
+            _call_tool_async(self.ctx, self.db, tool_call, self.deployment_model)
+        )
+        self.tasks.setdefault(_get_tool_call_key(tool_call), []).append(task)
+
+
+class _ParametersBuffer:
+    """
+    Accumulates streamed JSON fragments and tracks when the top level object is complete.
+    """
+
+    def __init__(self) -> None:
+        self.fragments: list[str] = []
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.complete = False
+
+    @property
+    def text(self) -> str:
+        return "".join(self.fragments)
+
+    def feed(self, fragment: str) -> bool:
+        self.fragments.append(fragment)
+        for char in fragment:
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.depth += 1
+            elif char in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    self.complete = True
+                    break
+
+        return self.complete
+
+
+def _get_tool_call_key(tool_call: dict) -> str:
+    return json.dumps(
+        {"name": tool_call.get("name"), "parameters": tool_call.get("parameters")},
+        sort_keys=True,
+        default=str,
+    )
@@ -0,0 +1,220 @@
+import json
+import math
+from typing import Any, Callable, Dict, List
+
+from backend.config.settings import Settings
+from backend.schemas.chat import ChatMessage, ChatRole
+from backend.schemas.cohere_chat import CohereChatRequest
+from backend.schemas.context import Context
+
+Tokenizer = Callable[[str], int]
+
+CHARACTERS_PER_TOKEN = 4
+DEFAULT_RECENT_MESSAGES = 6
+COMPACTED_OUTPUT_CHARACTERS = 200
+
+
+def count_tokens_approximately(text: str) -> int:
+    """Estimates the number of tokens of a text, without a model specific vocabulary."""
+    return math.ceil(len(text) / CHARACTERS_PER_TOKEN)
+
+
+TOKENIZERS: Dict[str, Tokenizer] = {
+    "approximate": count_tokens_approximately,
+}
+
+
+def register_tokenizer(name: str, tokenizer: Tokenizer) -> None:
+    """
+    Registers a tokenizer that can be set in chat.history_tokenizer.
+
+    Args:
+        name (str): Tokenizer name.
+        tokenizer (Tokenizer): Function that returns the number of tokens of a text.
+    """
+    TOKENIZERS[name] = tokenizer
+
+
+def get_tokenizer() -> Tokenizer:
+    """
+    Get the tokenizer set in chat.history_tokenizer, the approximate one by default.
+
+    Returns:
+        Tokenizer: Function that returns the number of tokens of a text.
+    """
+    name = Settings().get("chat.history_tokenizer") or "approximate"
+    return TOKENIZERS.get(name, count_tokens_approximately)
+
+
+def get_history_token_budget(model: str | None) -> int | None:
+    """
+    Get the chat history token budget of a model, from chat.history_token_budgets or the
+    default chat.history_token_budget.
+
+    Args:
+        model (str | None): Model name.
+
+    Returns:
+        int | None: Token budget, None if the chat history is not limited.
+    """
+    budgets = Settings().get("chat.history_token_budgets") or {}
+    if model in budgets:
+        return budgets[model]
+    return Settings().get("chat.history_token_budget")
+
+
+def count_message_tokens(message: ChatMessage | Dict[str, Any], tokenizer: Tokenizer) -> int:
+    """
+    Count the tokens of a chat history message: its text, tool plan, tool calls and tool results.
+
+    Args:
+        message (ChatMessage | Dict[str, Any]): Chat message, or its dict from a chat stream.
+        tokenizer (Tokenizer): Tokenizer.
+
+    Returns:
+        int: Number of tokens.
+    """
+    message = _to_dict(message)
+    text = " ".join(
+        str(message[field])
+        for field in ("message", "tool_plan")
+        if message.get(field)
+    )
+    for field in ("tool_calls", "tool_results"):
+        if message.get(field):
+            text += " " + json.dumps(message[field], default=str)
+    return tokenizer(text)
+
+
+def fit_chat_history(
+    chat_history: List[ChatMessage | Dict[str, Any]],
+    token_budget: int,
+    tokenizer: Tokenizer = count_tokens_approximately,
+    recent_messages: int = DEFAULT_RECENT_MESSAGES,
+) -> tuple[List[ChatMessage | Dict[str, Any]], int]:
+    """
+    Fits a chat history in a token budget.
+
+    The most recent messages are kept verbatim. If the history is over the budget, the tool
+    results of the older messages are compacted first, then the oldest messages are dropped.
+    A tool message is never kept without the message that called the tool. The system
+    messages at the start of the history, e.g. the conversation summary, are always kept.
+
+    Args:
+        chat_history (List[ChatMessage | Dict[str, Any]]): Chat history, oldest message first.
+        token_budget (int): Maximum number of tokens of the chat history.
+        tokenizer (Tokenizer): Tokenizer.
+        recent_messages (int): Number of recent messages that are always kept verbatim.
+
+    Returns:
+        tuple[List[ChatMessage | Dict[str, Any]], int]: Fitted chat history, and number of tokens saved.
+    """
+    tokens = [count_message_tokens(message, tokenizer) for message in chat_history]
+    original_tokens = total_tokens = sum(tokens)
+    if total_tokens <= token_budget:
+        return chat_history, 0
+
+    history = list(chat_history)
+    pinned_count = 0
+    while pinned_count < len(history) and _is_system_message(history[pinned_count]):
+        pinned_count += 1
+    older_count = max(len(history) - recent_messages, pinned_count)
+
+    # Compact the tool results of the older messages, oldest first
+    for index in range(pinned_count, older_count):
+        if total_tokens <= token_budget:
+            break
+        if not _to_dict(history[index]).get("tool_results"):
+            continue
+
+        history[index] = _compact_tool_results(history[index])
+        compacted_tokens = count_message_tokens(history[index], tokenizer)
+        total_tokens -= tokens[index] - compacted_tokens
+        tokens[index] = compacted_tokens
+
+    # Drop the oldest messages after the pinned ones, and the tool results left without
+    # their tool calls
+    dropped = pinned_count
+    while dropped < len(history) and (
+        (dropped < older_count and total_tokens > token_budget)
+        or (dropped > pinned_count and _is_tool_message(history[dropped]))
+    ):
+        total_tokens -= tokens[dropped]
+        dropped += 1
+
+    return (
+        history[:pinned_count] + history[dropped:],
+        original_tokens - total_tokens,
+    )
+
+
+def fit_chat_request_history(chat_request: CohereChatRequest, ctx: Context) -> int:
+    """
+    Fits the chat history of a chat request in the token budget of its model, before it is sent
+    to the deployment. Does nothing if no budget is set.
+
+    Args:
+        chat_request (CohereChatRequest): Chat request, its chat history is replaced.
+        ctx (Context): Context object.
+
+    Returns:
+        int: Number of tokens saved.
+    """
+    model = chat_request.model or ctx.get_model()
+    token_budget = get_history_token_budget(model)
+    if token_budget is None or not chat_request.chat_history:
+        return 0
+
+    recent_messages = Settings().get("chat.history_recent_messages")
+    chat_request.chat_history, tokens_saved = fit_chat_history(
+        chat_request.chat_history,
+        token_budget,
+        get_tokenizer(),
+        DEFAULT_RECENT_MESSAGES if recent_messages is None else recent_messages,
+    )
+    return tokens_saved
+
+
+def _compact_tool_results(
+    message: ChatMessage | Dict[str, Any],
+) -> ChatMessage | Dict[str, Any]:
+    tool_results = [
+        {
+            "call": tool_result.get("call"),
+            "outputs": [
+                _compact_output(output) for output in tool_result.get("outputs", [])
+            ],
+        }
+        for tool_result in _to_dict(message)["tool_results"]
+    ]
+    if isinstance(message, ChatMessage):
+        return message.model_copy(update={"tool_results": tool_results})
+    return message | {"tool_results": tool_results}
+
+
+def _compact_output(output: Any) -> Any:
+    if not isinstance(output, dict):
+        return output
+
+    return {
+        key: (
+            value[:COMPACTED_OUTPUT_CHARACTERS] + "..."
+            if isinstance(value, str) and len(value) > COMPACTED_OUTPUT_CHARACTERS
+            else value
+        )
+        for key, value in output.items()
+    }
+
+
+def _is_tool_message(message: ChatMessage | Dict[str, Any]) -> bool:
+    return str(_to_dict(message).get("role", "")).upper() == ChatRole.TOOL
+
+
+def _is_system_message(message: ChatMessage | Dict[str, Any]) -> bool:
+    return str(_to_dict(message).get("role", "")).upper() == ChatRole.SYSTEM
+
+
+def _to_dict(message: ChatMessage | Dict[str, Any]) -> Dict[str, Any]:
+    if isinstance(message, ChatMessage):
+        return message.model_dump()
+    return message
@@ -325,6 +325,163 @@ class ToolSettings(BaseSettings, BaseModel):
         default=False,
         validation_alias=AliasChoices("USE_TOOLS_PREAMBLE", "use_tools_preamble")
     )
+    stream_tool_results: Optional[bool] = Field(
+        default=False,
+        validation_alias=AliasChoices("STREAM_TOOL_RESULTS", "stream_tool_results")
+    )
+    speculative_tool_calls: Optional[bool] = Field(
+        default=False,
+        validation_alias=AliasChoices("SPECULATIVE_TOOL_CALLS", "speculative_tool_calls")
+    )
+    reuse_tool_results_on_regeneration: Optional[bool] = Field(
+        default=False,
+        validation_alias=AliasChoices(
+            "REUSE_TOOL_RESULTS_ON_REGENERATION", "reuse_tool_results_on_regeneration"
+        )
+    )
+    single_flight_tool_calls: Optional[bool] = Field(
+        default=False,
+        validation_alias=AliasChoices(
+            "SINGLE_FLIGHT_TOOL_CALLS", "single_flight_tool_calls"
+        )
+    )
+    single_flight_scope: Optional[str] = Field(
+        default="step",
+        validation_alias=AliasChoices("SINGLE_FLIGHT_SCOPE", "single_flight_scope")
+    )
+    max_concurrent_calls: Optional[int] = Field(
+        default=None,
+        validation_alias=AliasChoices("TOOL_MAX_CONCURRENT_CALLS", "max_concurrent_calls")
+    )
+    max_queued_calls: Optional[int] = Field(
+        default=None,
+        validation_alias=AliasChoices("TOOL_MAX_QUEUED_CALLS", "max_queued_calls")
+    )
+    circuit_breaker_failures: Optional[int] = Field(
+        default=None,
+        validation_alias=AliasChoices(
+            "TOOL_CIRCUIT_BREAKER_FAILURES", "circuit_breaker_failures"
+        )
+    )
+    circuit_breaker_reset_timeout: Optional[float] = Field(
+        default=30,
+        validation_alias=AliasChoices(
+            "TOOL_CIRCUIT_BREAKER_RESET_TIMEOUT", "circuit_breaker_reset_timeout"
+        )
+    )
+    vector_store_path: Optional[str] = Field(
+        default="./vector_stores",
+        validation_alias=AliasChoices("VECTOR_STORE_PATH", "vector_store_path")
+    )
+    file_search_index: Optional[str] = Field(
+        default="flat",
+        validation_alias=AliasChoices("FILE_SEARCH_INDEX", "file_search_index")
+    )
+
+
+class ChatSettings(BaseSettings, BaseModel):
+    model_config = SETTINGS_CONFIG
+    persist_partial_message_on_disconnect: Optional[bool] = Field(
+        default=False,
+        validation_alias=AliasChoices(
+            "PERSIST_PARTIAL_MESSAGE_ON_DISCONNECT",
+            "persist_partial_message_on_disconnect",
+        ),
+    )
+    resumable_streams: Optional[bool] = Field(
+        default=False,
+        validation_alias=AliasChoices("RESUMABLE_STREAMS", "resumable_streams"),
+    )
+    stream_buffer_backend: Optional[str] = Field(
+        default="memory",
+        validation_alias=AliasChoices("STREAM_BUFFER_BACKEND", "stream_buffer_backend"),
+    )
+    stream_buffer_size: Optional[int] = Field(
+        default=1000,
+        validation_alias=AliasChoices("STREAM_BUFFER_SIZE", "stream_buffer_size"),
+    )
+    stream_buffer_ttl: Optional[int] = Field(
+        default=300,
+        validation_alias=AliasChoices("STREAM_BUFFER_TTL", "stream_buffer_ttl"),
+    )
+    idempotency_backend: Optional[str] = Field(
+        default="memory",
+        validation_alias=AliasChoices("IDEMPOTENCY_BACKEND", "idempotency_backend"),
+    )
+    idempotency_ttl: Optional[int] = Field(
+        default=86400,
+        validation_alias=AliasChoices("IDEMPOTENCY_TTL", "idempotency_ttl"),
+    )
+    response_cache: Optional[bool] = Field(
+        default=False,
+        validation_alias=AliasChoices("RESPONSE_CACHE", "response_cache"),
+    )
+    response_cache_force: Optional[bool] = Field(
+        default=False,
+        validation_alias=AliasChoices("RESPONSE_CACHE_FORCE", "response_cache_force"),
+    )
+    response_cache_backend: Optional[str] = Field(
+        default="memory",
+        validation_alias=AliasChoices(
+            "RESPONSE_CACHE_BACKEND", "response_cache_backend"
+        ),
+    )
+    response_cache_size: Optional[int] = Field(
+        default=1000,
+        validation_alias=AliasChoices("RESPONSE_CACHE_SIZE", "response_cache_size"),
+    )
+    response_cache_ttl: Optional[int] = Field(
+        default=3600,
+        validation_alias=AliasChoices("RESPONSE_CACHE_TTL", "response_cache_ttl"),
+    )
+    local_rerank: Optional[str] = Field(
+        default=None,
+        validation_alias=AliasChoices("LOCAL_RERANK", "local_rerank")
+    )
+    rerank_cache: Optional[bool] = Field(
+        default=False,
+        validation_alias=AliasChoices("RERANK_CACHE", "rerank_cache")
+    )
+    rerank_cache_size: Optional[int] = Field(
+        default=10000,
+        validation_alias=AliasChoices("RERANK_CACHE_SIZE", "rerank_cache_size")
+    )
+    conversation_search_rerank_top_k: Optional[int] = Field(
+        default=0,
+        validation_alias=AliasChoices(
+            "CONVERSATION_SEARCH_RERANK_TOP_K", "conversation_search_rerank_top_k"
+        ),
+    )
+    history_token_budget: Optional[int] = Field(
+        default=None,
+        validation_alias=AliasChoices("HISTORY_TOKEN_BUDGET", "history_token_budget"),
+    )
+    history_token_budgets: Optional[dict[str, int]] = Field(
+        default=None,
+        validation_alias=AliasChoices(
+            "HISTORY_TOKEN_BUDGETS", "history_token_budgets"
+        ),
+    )
+    history_tokenizer: Optional[str] = Field(
+        default="approximate",
+        validation_alias=AliasChoices("HISTORY_TOKENIZER", "history_tokenizer"),
+    )
+    history_recent_messages: Optional[int] = Field(
+        default=6,
+        validation_alias=AliasChoices(
+            "HISTORY_RECENT_MESSAGES", "history_recent_messages"
+        ),
+    )
+    conversation_summary: Optional[bool] = Field(
+        default=False,
+        validation_alias=AliasChoices("CONVERSATION_SUMMARY", "conversation_summary"),
+    )
+    conversation_summary_window: Optional[int] = Field(
+        default=4,
+        validation_alias=AliasChoices(
+            "CONVERSATION_SUMMARY_WINDOW", "conversation_summary_window"
+        ),
+    )
 
 
 class DatabaseSettings(BaseSettings, BaseModel):
@@ -344,6 +501,48 @@ class RedisSettings(BaseSettings, BaseModel):
     )
 
 
+class FileStorageSettings(BaseSettings, BaseModel):
+    model_config = SETTINGS_CONFIG
+    backend: Optional[str] = Field(
+        default="database",
+        validation_alias=AliasChoices("FILE_STORAGE_BACKEND", "backend"),
+    )
+    local_path: Optional[str] = Field(
+        default="data/files",
+        validation_alias=AliasChoices("FILE_STORAGE_LOCAL_PATH", "local_path"),
+    )
+    compression_level: Optional[int] = Field(
+        default=3,
+        validation_alias=AliasChoices(
+            "FILE_STORAGE_COMPRESSION_LEVEL", "compression_level"
+        ),
+    )
+    s3_bucket: Optional[str] = Field(
+        default=None,
+        validation_alias=AliasChoices("FILE_STORAGE_S3_BUCKET", "s3_bucket"),
+    )
+    s3_prefix: Optional[str] = Field(
+        default="files/",
+        validation_alias=AliasChoices("FILE_STORAGE_S3_PREFIX", "s3_prefix"),
+    )
+    s3_endpoint_url: Optional[str] = Field(
+        default=None,
+        validation_alias=AliasChoices("FILE_STORAGE_S3_ENDPOINT_URL", "s3_endpoint_url"),
+    )
+    s3_region: Optional[str] = Field(
+        default=None,
+        validation_alias=AliasChoices("FILE_STORAGE_S3_REGION", "s3_region"),
+    )
+    s3_access_key: Optional[str] = Field(
+        default=None,
+        validation_alias=AliasChoices("FILE_STORAGE_S3_ACCESS_KEY", "s3_access_key"),
+    )
+    s3_secret_key: Optional[str] = Field(
+        default=None,
+        validation_alias=AliasChoices("FILE_STORAGE_S3_SECRET_KEY", "s3_secret_key"),
+    )
+
+
 class GoogleCloudSettings(BaseSettings, BaseModel):
     model_config = SETTINGS_CONFIG
     api_key: Optional[str] = Field(
@@ -421,10 +620,46 @@ class BedrockSettings(BaseSettings, BaseModel, DeploymentSettingsMixin):
     )
 
 
+class RoutingSettings(BaseSettings, BaseModel):
+    model_config = SETTINGS_CONFIG
+    deployments: Optional[List[dict]] = Field(
+        default=None,
+        validation_alias=AliasChoices("ROUTING_DEPLOYMENTS", "deployments"),
+    )
+    strategy: Optional[str] = Field(
+        default="least_outstanding",
+        validation_alias=AliasChoices("ROUTING_STRATEGY", "strategy"),
+    )
+    failure_threshold: Optional[int] = Field(
+        default=3,
+        validation_alias=AliasChoices("ROUTING_FAILURE_THRESHOLD", "failure_threshold"),
+    )
+    cooldown: Optional[float] = Field(
+        default=30,
+        validation_alias=AliasChoices("ROUTING_COOLDOWN", "cooldown"),
+    )
+    hedged_requests: Optional[bool] = Field(
+        default=False,
+        validation_alias=AliasChoices("ROUTING_HEDGED_REQUESTS", "hedged_requests"),
+    )
+    hedge_percentile: Optional[float] = Field(
+        default=95,
+        validation_alias=AliasChoices("ROUTING_HEDGE_PERCENTILE", "hedge_percentile"),
+    )
+
+
 class DeploymentSettings(BaseSettings, BaseModel):
     model_config = SETTINGS_CONFIG
     default_deployment: Optional[str] = None
     enabled_deployments: Optional[List[str]] = None
+    embed_batch_size: Optional[int] = Field(
+        default=96,
+        validation_alias=AliasChoices("EMBED_BATCH_SIZE", "embed_batch_size")
+    )
+    embed_cache_size: Optional[int] = Field(
+        default=10000,
+        validation_alias=AliasChoices("EMBED_CACHE_SIZE", "embed_cache_size")
+    )
 
     azure: Optional[AzureSettings] = Field(default=AzureSettings())
     bedrock: Optional[BedrockSettings] = Field(default=BedrockSettings())
@@ -435,6 +670,7 @@ class DeploymentSettings(BaseSettings, BaseModel):
     single_container: Optional[SingleContainerSettings] = Field(
         default=SingleContainerSettings()
     )
+    routing: Optional[RoutingSettings] = Field(default=RoutingSettings())
 
 
 class LoggerSettings(BaseSettings, BaseModel):
@@ -469,8 +705,10 @@ class Settings(BaseSettings):
     auth: Optional[AuthSettings] = Field(default=AuthSettings())
     feature_flags: Optional[FeatureFlags] = Field(default=FeatureFlags())
     tools: Optional[ToolSettings] = Field(default=ToolSettings())
+    chat: Optional[ChatSettings] = Field(default=ChatSettings())
     database: Optional[DatabaseSettings] = Field(default=DatabaseSettings())
     redis: Optional[RedisSettings] = Field(default=RedisSettings())
+    file_storage: Optional[FileStorageSettings] = Field(default=FileStorageSettings())
     google_cloud: Optional[GoogleCloudSettings] = Field(default=GoogleCloudSettings())
     deployments: Optional[DeploymentSettings] = Field(default=DeploymentSettings())
     logger: Optional[LoggerSettings] = Field(default=LoggerSettings())
@@ -1,6 +1,7 @@
 from sqlalchemy import desc
 from sqlalchemy.orm import Session
 
+from backend.crud import conversation_search as conversation_search_crud
 from backend.database_models.conversation import (
     Conversation,
     ConversationFileAssociation,
@@ -27,6 +28,7 @@ def create_conversation(db: Session, conversation: Conversation) -> Conversation
     db.add(conversation)
     db.commit()
     db.refresh(conversation)
+    conversation_search_crud.index_conversation_title(db, conversation)
     return conversation
 
 
@@ -110,6 +112,34 @@ def update_conversation(
             setattr(conversation, attr, value)
     db.commit()
     db.refresh(conversation)
+    if new_conversation.title is not None:
+        conversation_search_crud.index_conversation_title(db, conversation)
+    return conversation
+
+
+@validate_transaction
+def update_conversation_summary(
+    db: Session, conversation: Conversation, summary: str, summary_position: int
+) -> Conversation:
+    """
+    Update the running summary of a conversation, without changing its last update time.
+
+    Args:
+        db (Session): Database session.
+        conversation (Conversation): Conversation to be updated.
+        summary (str): Summary of the turns before summary_position.
+        summary_position (int): Position of the first turn not in the summary.
+
+    Returns:
+        Conversation: Updated conversation.
+    """
+    db.query(Conversation).filter(Conversation.id == conversation.id).update({
+        Conversation.summary: summary,
+        Conversation.summary_position: summary_position,
+        Conversation.updated_at: conversation.updated_at
+    })
+    db.commit()
+    db.refresh(conversation)
     return conversation
 
 
@@ -147,6 +177,7 @@ def delete_conversation(db: Session, conversation_id: str, user_id: str) -> None
         conversation_id (str): Conversation ID.
         user_id (str): User ID.
     """
+    conversation_search_crud.delete_conversation_index(db, conversation_id, user_id)
     conversation = db.query(Conversation).filter(
         Conversation.id == conversation_id, Conversation.user_id == user_id
     )
@@ -0,0 +1,309 @@
+import re
+
+from sqlalchemy import and_, case, cast, desc, func, text
+from sqlalchemy.dialects.postgresql import TSVECTOR, insert
+from sqlalchemy.orm import Session
+
+from backend.database_models.conversation import Conversation, ConversationSearch
+from backend.services.transaction import validate_transaction
+
+# Text search configuration of the Postgres index
+SEARCH_TEXT_CONFIG = "english"
+TOKEN_PATTERN = re.compile(r"\w+")
+# Postgres caps a tsvector at 1MB: the indexed characters of a message and of the
+# messages indexed at once are limited, and the indexed messages of a conversation are
+# not added to once their vector reaches MAX_CONTENT_VECTOR_SIZE bytes
+MAX_INDEXED_MESSAGE_LENGTH = 20000
+MAX_INDEXED_CONTENT_LENGTH = 100000
+MAX_CONTENT_VECTOR_SIZE = 512 * 1024
+
+# SQLite (used by tests) has no tsvector, the index is an FTS5 table instead
+SQLITE_SEARCH_TABLE = """
+CREATE VIRTUAL TABLE IF NOT EXISTS conversation_search USING fts5(
+    conversation_id UNINDEXED,
+    user_id UNINDEXED,
+    title,
+    content,
+    tokenize = 'porter unicode61'
+)
+"""
+# bm25 weights of the FTS5 columns, the title weighs more than the messages
+SQLITE_RANK = "bm25(conversation_search, 0.0, 0.0, 10.0, 1.0)"
+
+
+def create_sqlite_search_table(db: Session) -> None:
+    """
+    Create the FTS5 search table of a SQLite database. On Postgres the index is created by
+    the migrations.
+
+    Args:
+        db (Session): Database session.
+    """
+    db.execute(text(SQLITE_SEARCH_TABLE))
+    db.commit()
+
+
+@validate_transaction
+def index_conversation_title(db: Session, conversation: Conversation) -> None:
+    """
+    Index the title of a conversation, keeping its indexed messages.
+
+    Args:
+        db (Session): Database session.
+        conversation (Conversation): Conversation.
+    """
+    if _is_sqlite(db):
+        _upsert_sqlite(db, conversation, title=conversation.title or "")
+        return
+
+    _upsert(
+        db,
+        conversation,
+        content_vector=ConversationSearch.content_vector,
+        new_content_vector=cast("", TSVECTOR),
+    )
+
+
+@validate_transaction
+def index_conversation_messages(
+    db: Session, conversation: Conversation, texts: list[str]
+) -> None:
+    """
+    Add the text of new messages to the index of a conversation. Only the first
+    MAX_INDEXED_MESSAGE_LENGTH characters of each message are indexed, and the messages
+    are no longer added once the index of the conversation reaches
+    MAX_CONTENT_VECTOR_SIZE.
+
+    Args:
+        db (Session): Database session.
+        conversation (Conversation): Conversation.
+        texts (list[str]): Text of the new messages.
+    """
+    content = " ".join(
+        message_text[:MAX_INDEXED_MESSAGE_LENGTH] for message_text in texts if message_text
+    )[:MAX_INDEXED_CONTENT_LENGTH]
+    if not content:
+        return
+
+    if _is_sqlite(db):
+        _upsert_sqlite(db, conversation, title=conversation.title or "", content=content)
+        return
+
+    new_content_vector = func.to_tsvector(SEARCH_TEXT_CONFIG, content)
+    appended_content_vector = ConversationSearch.content_vector.op("||")(
+        new_content_vector
+    )
+    _upsert(
+        db,
+        conversation,
+        content_vector=case(
+            (
+                func.pg_column_size(appended_content_vector) <= MAX_CONTENT_VECTOR_SIZE,
+                appended_content_vector,
+            ),
+            else_=ConversationSearch.content_vector,
+        ),
+        new_content_vector=new_content_vector,
+    )
+
+
+@validate_transaction
+def reindex_conversation(db: Session, conversation: Conversation) -> None:
+    """
+    Rebuild the index of a conversation from its title and active messages, e.g. after
+    messages are deleted.
+
+    Args:
+        db (Session): Database session.
+        conversation (Conversation): Conversation.
+    """
+    delete_conversation_index(db, conversation.id, conversation.user_id)
+    index_conversation_title(db, conversation)
+    index_conversation_messages(
+        db,
+        conversation,
+        [message.text for message in conversation.messages if message.is_active],
+    )
+
+
+@validate_transaction
+def delete_conversation_index(db: Session, conversation_id: str, user_id: str) -> None:
+    """
+    Delete the index of a conversation.
+
+    Args:
+        db (Session): Database session.
+        conversation_id (str): Conversation ID.
+        user_id (str): User ID.
+    """
+    if _is_sqlite(db):
+        db.execute(
+            text(
+                "DELETE FROM conversation_search "
+                "WHERE conversation_id = :conversation_id AND user_id = :user_id"
+            ),
+            {"conversation_id": conversation_id, "user_id": user_id},
+        )
+    else:
+        db.query(ConversationSearch).filter(
+            ConversationSearch.conversation_id == conversation_id,
+            ConversationSearch.user_id == user_id,
+        ).delete()
+    db.commit()
+
+
+@validate_transaction
+def search_conversations(
+    db: Session,
+    user_id: str,
+    query: str,
+    offset: int = 0,
+    limit: int = 100,
+    order_by: str | None = None,
+    agent_id: str | None = None,
+) -> list[Conversation]:
+    """
+    Search the conversations of a user by title and message text, best matches first.
+
+    Args:
+        db (Session): Database session.
+        user_id (str): User ID.
+        query (str): Search query, every term must match.
+        offset (int): Offset to start the list.
+        limit (int): Limit of conversations to be listed.
+        order_by (str): A field by which to order the conversations before the rank.
+        agent_id (str): Agent ID.
+
+    Returns:
+        list[Conversation]: Matching conversations.
+    """
+    terms = TOKEN_PATTERN.findall(query)
+    if not terms:
+        return []
+
+    if _is_sqlite(db):
+        return _search_sqlite(db, user_id, terms, offset, limit, order_by, agent_id)
+
+    ts_query = func.plainto_tsquery(SEARCH_TEXT_CONFIG, " ".join(terms))
+    db_query = (
+        db.query(Conversation)
+        .join(
+            ConversationSearch,
+            and_(
+                ConversationSearch.conversation_id == Conversation.id,
+                ConversationSearch.user_id == Conversation.user_id,
+            ),
+        )
+        .filter(
+            Conversation.user_id == user_id,
+            ConversationSearch.search_vector.op("@@")(ts_query),
+        )
+    )
+    if agent_id is not None:
+        db_query = db_query.filter(Conversation.agent_id == agent_id)
+    if order_by is not None:
+        db_query = db_query.order_by(desc(getattr(Conversation, order_by)))
+    db_query = db_query.order_by(
+        func.ts_rank_cd(ConversationSearch.search_vector, ts_query).desc(),
+        Conversation.updated_at.desc(),
+    )
+
+    return db_query.offset(offset).limit(limit).all()
+
+
+def _is_sqlite(db: Session) -> bool:
+    return db.get_bind().dialect.name == "sqlite"
+
+
+def _upsert(db: Session, conversation: Conversation, content_vector, new_content_vector) -> None:
+    title_vector = func.setweight(
+        func.to_tsvector(SEARCH_TEXT_CONFIG, conversation.title or ""), "A"
+    )
+    statement = insert(ConversationSearch).values(
+        conversation_id=conversation.id,
+        user_id=conversation.user_id,
+        content_vector=new_content_vector,
+        search_vector=title_vector.op("||")(new_content_vector),
+    )
+    statement = statement.on_conflict_do_update(
+        constraint="conversation_search_conversation_user",
+        set_={
+            ConversationSearch.content_vector: content_vector,
+            ConversationSearch.search_vector: title_vector.op("||")(content_vector),
+            ConversationSearch.updated_at: func.now(),
+        },
+    )
+    db.execute(statement)
+    db.commit()
+
+
+def _upsert_sqlite(
+    db: Session, conversation: Conversation, title: str, content: str = ""
+) -> None:
+    params = {
+        "conversation_id": conversation.id,
+        "user_id": conversation.user_id,
+        "title": title,
+        "content": content,
+    }
+    updated = db.execute(
+        text(
+            "UPDATE conversation_search "
+            "SET title = :title, content = trim(content || ' ' || :content) "
+            "WHERE conversation_id = :conversation_id AND user_id = :user_id"
+        ),
+        params,
+    )
+    if not updated.rowcount:
+        db.execute(
+            text(
+                "INSERT INTO conversation_search (conversation_id, user_id, title, content) "
+                "VALUES (:conversation_id, :user_id, :title, :content)"
+            ),
+            params,
+        )
+    db.commit()
+
+
+def _search_sqlite(
+    db: Session,
+    user_id: str,
+    terms: list[str],
+    offset: int,
+    limit: int,
+    order_by: str | None,
+    agent_id: str | None,
+) -> list[Conversation]:
+    # Quoted terms are matched as plain tokens, not as FTS5 query syntax
+    match = " ".join('"{}"'.format(term.replace('"', '""')) for term in terms)
+    order = f"{SQLITE_RANK}, conversations.updated_at DESC"
+    if order_by is not None:
+        # Validated like the ORM query, by the column of the model
+        order = f"conversations.{getattr(Conversation, order_by).key} DESC, {order}"
+    agent_filter = "AND conversations.agent_id = :agent_id" if agent_id is not None else ""
+
+    rows = db.execute(
+        text(
+            "SELECT conversation_search.conversation_id FROM conversation_search "
+            "JOIN conversations ON conversations.id = conversation_search.conversation_id "
+            "AND conversations.user_id = conversation_search.user_id "
+            f"WHERE conversation_search MATCH :match AND conversation_search.user_id = :user_id {agent_filter} "
+            f"ORDER BY {order} LIMIT :limit OFFSET :offset"
+        ),
+        {
+            "match": match,
+            "user_id": user_id,
+            "agent_id": agent_id,
+            "limit": limit,
+            "offset": offset,
+        },
+    ).all()
+    conversation_ids = [row[0] for row in rows]
+
+    conversations = (
+        db.query(Conversation)
+        .filter(Conversation.id.in_(conversation_ids), Conversation.user_id == user_id)
+        .all()
+    )
+    conversations_by_id = {conversation.id: conversation for conversation in conversations}
+    return [conversations_by_id[conversation_id] for conversation_id in conversation_ids]
@@ -1,8 +1,15 @@
-from sqlalchemy.orm import Session
+from collections import Counter
+from typing import Iterator
 
-from backend.database_models.file import File
+from sqlalchemy import case, exists, func, select
+from sqlalchemy.orm import Session, defer, joinedload, undefer
+
+from backend.database_models.conversation import ConversationFileAssociation
+from backend.database_models.file import File, SharedFileContent
 from backend.services.transaction import validate_transaction
 
+DEFAULT_CONTENT_CHUNK_SIZE = 1_000_000
+
 
 @validate_transaction
 def create_file(db: Session, file: File) -> File:
@@ -35,7 +42,9 @@ def batch_create_files(db: Session, files: list[File]) -> list[File]:
 
 
 @validate_transaction
-def get_file(db: Session, file_id: str, user_id: str | None = None) -> File:
+def get_file(
+    db: Session, file_id: str, user_id: str | None = None, with_content: bool = False
+) -> File:
     """
     Get a file by ID.
 
@@ -43,6 +52,8 @@ def get_file(db: Session, file_id: str, user_id: str | None = None) -> File:
         db (Session): Database session.
         file_id (str): File ID.
         user_id (str): User ID.
+        with_content (bool): Whether to load the file content in the same query,
+            otherwise it's loaded when accessed.
 
     Returns:
         File: File with the given ID.
@@ -52,7 +63,34 @@ def get_file(db: Session, file_id: str, user_id: str | None = None) -> File:
     if user_id:
         filters.append(File.user_id == user_id)
 
-    return db.query(File).filter(*filters).first()
+    return _query_files(db, with_content).filter(*filters).first()
+
+
+@validate_transaction
+def get_file_metadata(db: Session, file_id: str, user_id: str | None = None) -> File:
+    """
+    Get a file by ID, without its content. Accessing the content raises an error
+    instead of loading it.
+
+    Args:
+        db (Session): Database session.
+        file_id (str): File ID.
+        user_id (str): User ID.
+
+    Returns:
+        File: File with the given ID.
+    """
+    filters = [File.id == file_id]
+
+    if user_id:
+        filters.append(File.user_id == user_id)
+
+    return (
+        db.query(File)
+        .options(defer(File.file_content, raiseload=True))
+        .filter(*filters)
+        .first()
+    )
 
 
 @validate_transaction
@@ -74,10 +112,36 @@ def get_files(db: Session, user_id: str, offset: int = 0, limit: int = 100):
     )
 
 
-def get_files_by_ids(db: Session, file_ids: list[str], user_id: str) -> list[File]:
+def get_files_by_ids(
+    db: Session, file_ids: list[str], user_id: str, with_content: bool = False
+) -> list[File]:
     """
     Get files by IDs.
 
+    Args:
+        db (Session): Database session.
+        file_ids (list[str]): File IDs.
+        user_id (str): User ID.
+        with_content (bool): Whether to load the file contents in the same query,
+            otherwise each one is loaded when accessed.
+
+    Returns:
+        list[File]: List of files with the given IDs.
+    """
+    return (
+        _query_files(db, with_content)
+        .filter(File.id.in_(file_ids), File.user_id == user_id)
+        .all()
+    )
+
+
+def get_files_metadata_by_ids(
+    db: Session, file_ids: list[str], user_id: str
+) -> list[File]:
+    """
+    Get files by IDs, without their content. Accessing the content raises an error
+    instead of loading it.
+
     Args:
         db (Session): Database session.
         file_ids (list[str]): File IDs.
@@ -86,7 +150,96 @@ def get_files_by_ids(db: Session, file_ids: list[str], user_id: str) -> list[Fil
     Returns:
         list[File]: List of files with the given IDs.
     """
-    return db.query(File).filter(File.id.in_(file_ids), File.user_id == user_id).all()
+    return (
+        db.query(File)
+        .options(defer(File.file_content, raiseload=True))
+        .filter(File.id.in_(file_ids), File.user_id == user_id)
+        .all()
+    )
+
+
+def iter_file_content(
+    db: Session,
+    file_id: str,
+    user_id: str | None = None,
+    chunk_size: int = DEFAULT_CONTENT_CHUNK_SIZE,
+) -> Iterator[str]:
+    """
+    Stream the content of a file in chunks, each read with its own query, so the whole
+    content is never held in memory.
+
+    Args:
+        db (Session): Database session.
+        file_id (str): File ID.
+        user_id (str): User ID.
+        chunk_size (int): Number of characters of each chunk.
+
+    Yields:
+        str: Chunks of the file content.
+    """
+    filters = [File.id == file_id]
+
+    if user_id:
+        filters.append(File.user_id == user_id)
+
+    content = case(
+        (File.shared_content_id.is_(None), File.file_content),
+        else_=SharedFileContent.text,
+    )
+    # SQL substrings start at 1
+    start = 1
+    while True:
+        chunk = (
+            db.query(func.substr(content, start, chunk_size))
+            .outerjoin(SharedFileContent, SharedFileContent.id == File.shared_content_id)
+            .filter(*filters)
+            .scalar()
+        )
+        if not chunk:
+            return
+
+        yield chunk
+
+        if len(chunk) < chunk_size:
+            return
+        start += chunk_size
+
+
+@validate_transaction
+def get_files_by_conversation_ids(
+    db: Session, conversation_ids: list[str], user_id: str
+) -> dict[str, list[File]]:
+    """
+    Get the files of several conversations in a single query, without their content.
+
+    Args:
+        db (Session): Database session.
+        conversation_ids (list[str]): Conversation IDs, of conversations of the user.
+        user_id (str): User ID.
+
+    Returns:
+        dict[str, list[File]]: Files of each conversation, by conversation ID. The
+            file_content of the files is not loaded.
+    """
+    files_by_conversation_id = {conversation_id: [] for conversation_id in conversation_ids}
+    if not conversation_ids:
+        return files_by_conversation_id
+
+    rows = (
+        db.query(ConversationFileAssociation.conversation_id, File)
+        .join(File, File.id == ConversationFileAssociation.file_id)
+        .options(defer(File.file_content))
+        .filter(
+            ConversationFileAssociation.conversation_id.in_(conversation_ids),
+            File.user_id == user_id,
+        )
+        .order_by(File.created_at)
+        .all()
+    )
+    for conversation_id, file in rows:
+        files_by_conversation_id[conversation_id].append(file)
+
+    return files_by_conversation_id
 
 
 @validate_transaction
@@ -126,6 +279,141 @@ def get_files_by_user_id(db: Session, user_id: str) -> list[File]:
     return db.query(File).filter(File.user_id == user_id).all()
 
 
+def get_referenced_storage_keys(db: Session, storage_keys: list[str]) -> set[str]:
+    """
+    Get the storage keys that are still referred to by a file or a shared content.
+
+    Args:
+        db (Session): Database session.
+        storage_keys (list[str]): Storage keys.
+
+    Returns:
+        set[str]: Storage keys of at least one file or shared content.
+    """
+    file_keys = db.query(File.storage_key).filter(File.storage_key.in_(storage_keys))
+    shared_keys = db.query(SharedFileContent.storage_key).filter(
+        SharedFileContent.storage_key.in_(storage_keys)
+    )
+    return {row[0] for row in file_keys.union(shared_keys).all()}
+
+
+def lock_storage_keys(db: Session, storage_keys: list[str]) -> None:
+    """
+    Lock storage keys until the end of the transaction, so a stored text isn't deleted
+    while a file or shared content is created to refer to it. The keys are locked in
+    order, so concurrent transactions don't deadlock.
+
+    Args:
+        db (Session): Database session.
+        storage_keys (list[str]): Storage keys.
+    """
+    for storage_key in sorted(set(storage_keys)):
+        db.execute(select(func.pg_advisory_xact_lock(func.hashtext(storage_key))))
+
+
+def acquire_shared_file_content(
+    db: Session, upload_hash: str
+) -> SharedFileContent | None:
+    """
+    Add a reference to the shared content of an upload, if its content was already
+    extracted. The reference count is incremented in the database, so concurrent
+    uploads don't lose references.
+
+    Args:
+        db (Session): Database session.
+        upload_hash (str): Hash of the uploaded bytes.
+
+    Returns:
+        SharedFileContent | None: Shared content, or None if there's none for the hash.
+    """
+    updated = (
+        db.query(SharedFileContent)
+        .filter(SharedFileContent.upload_hash == upload_hash)
+        .update(
+            {SharedFileContent.ref_count: SharedFileContent.ref_count + 1},
+            synchronize_session=False,
+        )
+    )
+    db.commit()
+    if not updated:
+        return None
+
+    return (
+        db.query(SharedFileContent)
+        .filter(SharedFileContent.upload_hash == upload_hash)
+        .first()
+    )
+
+
+def create_shared_file_content(
+    db: Session, shared_content: SharedFileContent
+) -> SharedFileContent:
+    """
+    Create the shared content of an upload, with a first reference. Raises an
+    IntegrityError if a concurrent upload of the same content created it first.
+
+    Args:
+        db (Session): Database session.
+        shared_content (SharedFileContent): Shared content.
+
+    Returns:
+        SharedFileContent: Created shared content.
+    """
+    db.add(shared_content)
+    db.commit()
+    db.refresh(shared_content)
+    return shared_content
+
+
+def release_shared_file_contents(db: Session, shared_content_ids: list[str]) -> None:
+    """
+    Remove references to shared contents, one per ID, e.g. for deleted files. The
+    contents no file refers to are deleted by delete_unreferenced_shared_file_contents.
+
+    Args:
+        db (Session): Database session.
+        shared_content_ids (list[str]): Shared content IDs, repeated for each reference.
+    """
+    for shared_content_id, count in Counter(shared_content_ids).items():
+        db.query(SharedFileContent).filter(
+            SharedFileContent.id == shared_content_id
+        ).update(
+            {SharedFileContent.ref_count: SharedFileContent.ref_count - count},
+            synchronize_session=False,
+        )
+    db.commit()
+
+
+def delete_unreferenced_shared_file_contents(db: Session) -> list[str]:
+    """
+    Delete the shared contents no file refers to anymore.
+
+    Args:
+        db (Session): Database session.
+
+    Returns:
+        list[str]: Storage keys of the deleted contents, whose text may be deleted from
+            the file storage.
+    """
+    unreferenced = ~exists().where(File.shared_content_id == SharedFileContent.id)
+    rows = (
+        db.query(SharedFileContent.id, SharedFileContent.storage_key)
+        .filter(SharedFileContent.ref_count <= 0, unreferenced)
+        .all()
+    )
+    if not rows:
+        return []
+
+    # Filtered again, a content may have been uploaded again since it was selected
+    db.query(SharedFileContent).filter(
+        SharedFileContent.id.in_([row.id for row in rows]),
+        SharedFileContent.ref_count <= 0,
+        unreferenced,
+    ).delete(synchronize_session=False)
+    db.commit()
+    return [row.storage_key for row in rows if row.storage_key]
+
+
 @validate_transaction
 def delete_file(db: Session, file_id: str, user_id: str) -> None:
     """
@@ -153,3 +441,13 @@ def bulk_delete_files(db: Session, file_ids: list[str], user_id: str) -> None:
     files = db.query(File).filter(File.id.in_(file_ids), File.user_id == user_id)
     files.delete()
     db.commit()
+
+
+def _query_files(db: Session, with_content: bool):
+    query = db.query(File)
+    if with_content:
+        query = query.options(
+            undefer(File.file_content),
+            joinedload(File.shared_content).undefer(SharedFileContent.text),
+        )
+    return query
@@ -46,3 +46,23 @@ def list_tool_calls_by_message_id(db: Session, message_id: str) -> list[ToolCall
         list[ToolCall]: List of tool calls.
     """
     return db.query(ToolCall).filter(ToolCall.message_id == message_id).all()
+
+
+def update_tool_call_outputs(
+    db: Session, tool_call: ToolCall, outputs: list[dict]
+) -> ToolCall:
+    """
+    Update the outputs of a tool call.
+
+    Args:
+        db (Session): Database session.
+        tool_call (ToolCall): Tool call to be updated.
+        outputs (list[dict]): Outputs of the tool.
+
+    Returns:
+        ToolCall: Updated tool call.
+    """
+    tool_call.outputs = outputs
+    db.commit()
+    db.refresh(tool_call)
+    return tool_call
@@ -4,11 +4,14 @@ from uuid import uuid4
 from sqlalchemy import (
     Boolean,
     ForeignKey,
+    ForeignKeyConstraint,
     Index,
+    Integer,
     PrimaryKeyConstraint,
     String,
     UniqueConstraint,
 )
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from backend.database_models.base import Base
@@ -54,6 +57,9 @@ class Conversation(Base):
         )
     )
     is_pinned: Mapped[bool] = mapped_column(Boolean, default=False)
+    # Running summary of the turns before summary_position, sent instead of those turns
+    summary: Mapped[Optional[str]] = mapped_column(String, nullable=True, default=None)
+    summary_position: Mapped[int] = mapped_column(Integer, nullable=True, default=0)
 
     @property
     def messages(self):
@@ -72,3 +78,36 @@ class Conversation(Base):
         Index("conversation_user_agent_index", "user_id", "agent_id"),
         Index("conversation_user_id_index", "id", "user_id", unique=True),
     )
+
+
+class ConversationSearch(Base):
+    """
+    Full-text search index of a conversation: its title and the text of its user and chatbot
+    messages. Maintained incrementally on each turn, see backend.crud.conversation_search.
+    """
+
+    __tablename__ = "conversation_search"
+
+    conversation_id: Mapped[str] = mapped_column(String, nullable=False)
+    user_id: Mapped[str] = mapped_column(String, nullable=False)
+    # Lexemes of the messages, appended to on each turn
+    content_vector: Mapped[str] = mapped_column(TSVECTOR, nullable=False)
+    # Lexemes of the title, weighted higher, followed by the ones of the messages
+    search_vector: Mapped[str] = mapped_column(TSVECTOR, nullable=False)
+
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["conversation_id", "user_id"],
+            ["conversations.id", "conversations.user_id"],
+            name="conversation_search_conversation_id_user_id_fkey",
+            ondelete="CASCADE",
+        ),
+        UniqueConstraint(
+            "conversation_id", "user_id", name="conversation_search_conversation_user"
+        ),
+        Index(
+            "conversation_search_vector_index",
+            "search_vector",
+            postgresql_using="gin",
+        ),
+    )
@@ -1,15 +1,51 @@
-from sqlalchemy import String
-from sqlalchemy.orm import Mapped, mapped_column
+from typing import Optional
+
+from sqlalchemy import ForeignKey, Index, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from backend.database_models.base import Base
 
 
+class SharedFileContent(Base):
+    """
+    Extracted text of an uploaded document, shared by the files uploaded with the same
+    content. ref_count is the number of files referring to it, the records no file refers
+    to are deleted in the background.
+    """
+
+    __tablename__ = "shared_file_contents"
+
+    # SHA-256 hash of the uploaded bytes, prefixed with the file extension they're parsed with
+    upload_hash: Mapped[str] = mapped_column(String, nullable=False, unique=True)
+    # SHA-256 hash of the text
+    content_hash: Mapped[str] = mapped_column(String, nullable=True, default=None)
+    # Key of the text in the file storage, if it's not stored in text
+    storage_key: Mapped[str] = mapped_column(String, nullable=True, default=None)
+    text: Mapped[str] = mapped_column(default="", deferred=True)
+    ref_count: Mapped[int] = mapped_column(Integer, default=1)
+
+    __table_args__ = (Index("shared_file_content_ref_count", ref_count),)
+
+
 class File(Base):
     __tablename__ = "files"
 
     user_id: Mapped[str] = mapped_column(String, nullable=True)
     file_name: Mapped[str]
     file_size: Mapped[int] = mapped_column(default=0)
-    file_content: Mapped[str] = mapped_column(default="")
+    # Deferred: the text of a document is only loaded when it's accessed, or with undefer
+    file_content: Mapped[str] = mapped_column(default="", deferred=True)
+    # Key of the text in the file storage, if it's not stored in file_content
+    storage_key: Mapped[str] = mapped_column(String, nullable=True, default=None)
+    # SHA-256 hash of the text
+    content_hash: Mapped[str] = mapped_column(String, nullable=True, default=None)
+    # Shared text of the file, instead of file_content and storage_key
+    shared_content_id: Mapped[Optional[str]] = mapped_column(
+        ForeignKey("shared_file_contents.id"), nullable=True, default=None
+    )
+    shared_content: Mapped[Optional[SharedFileContent]] = relationship()
 
-    __table_args__ = ()
+    __table_args__ = (
+        Index("file_storage_key", storage_key),
+        Index("file_shared_content_id", shared_content_id),
+    )
@@ -13,6 +13,8 @@ class ToolCall(Base):
 
     name: Mapped[str]
     parameters: Mapped[dict] = mapped_column(JSON, nullable=True)
+    # Outputs of the tool, replayed when the response is regenerated
+    outputs: Mapped[list] = mapped_column(JSON, nullable=True)
     message_id: Mapped[str] = mapped_column(
         ForeignKey("messages.id", ondelete="CASCADE")
     )
@@ -1,6 +1,7 @@
 from backend.model_deployments.azure import AzureDeployment
 from backend.model_deployments.bedrock import BedrockDeployment
 from backend.model_deployments.cohere_platform import CohereDeployment
+from backend.model_deployments.routing import RoutingDeployment
 from backend.model_deployments.sagemaker import SageMakerDeployment
 from backend.model_deployments.single_container import SingleContainerDeployment
 
@@ -10,4 +11,5 @@ __all__ = [
     "SingleContainerDeployment",
     "SageMakerDeployment",
     "BedrockDeployment",
+    "RoutingDeployment",
 ]
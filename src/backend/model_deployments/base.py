@@ -1,10 +1,17 @@
+import asyncio
 from abc import ABC, abstractmethod
 from typing import Any
 
+import numpy as np
+
 from backend.config.settings import Settings
 from backend.schemas.cohere_chat import CohereChatRequest
 from backend.schemas.context import Context
 from backend.schemas.deployment import DeploymentDefinition
+from backend.services.embeddings import EmbedInputType, get_embedding_cache
+
+DEFAULT_EMBED_BATCH_SIZE = 96
+MAX_CONCURRENT_EMBED_BATCHES = 4
 
 
 class BaseDeployment(ABC):
@@ -13,6 +20,8 @@ class BaseDeployment(ABC):
     rerank_enabled: bool: Whether the deployment supports reranking.
     invoke_chat_stream: Generator[StreamedChatResponse, None, None]: Invoke the chat stream.
     invoke_rerank: Any: Invoke the rerank.
+    embed_enabled: bool: Whether the deployment supports embeddings.
+    invoke_embed: np.ndarray: Invoke the embed, batched and cached.
     list_models: List[str]: List all models.
     is_available: bool: Check if the deployment is available.
     """
@@ -45,6 +54,16 @@ class BaseDeployment(ABC):
     @abstractmethod
     def is_available() -> bool: ...
 
+    @staticmethod
+    def embed_enabled() -> bool:
+        return False
+
+    def embed_model(self) -> str | None:
+        return None
+
+    def rerank_model(self) -> str | None:
+        return None
+
     @classmethod
     def is_community(cls) -> bool:
         return False
@@ -87,3 +106,71 @@ class BaseDeployment(ABC):
     async def invoke_rerank(
         self, query: str, documents: list[str], ctx: Context, **kwargs: Any
     ) -> Any: ...
+
+    async def invoke_embed(
+        self,
+        texts: list[str],
+        ctx: Context,
+        input_type: str = EmbedInputType.SearchDocument,
+        **kwargs: Any,
+    ) -> np.ndarray | None:
+        """
+        Embed texts with the embedding model of the deployment, or None if the deployment
+        doesn't support embeddings.
+
+        The texts already embedded by the model are taken from the embedding cache. The other
+        texts are deduplicated and sent with embed_batch in batches of
+        deployments.embed_batch_size texts, a few batches at a time.
+
+        Args:
+            texts (list[str]): Texts to embed.
+            ctx (Context): Context.
+            input_type (str): Input type of the texts, search_document or search_query.
+
+        Returns:
+            np.ndarray | None: Embeddings of the texts, one row per text.
+        """
+        if not self.embed_enabled():
+            return None
+
+        cache = get_embedding_cache()
+        model = self.embed_model() or self.id()
+        embeddings = {}
+        missing_texts = []
+        for text in dict.fromkeys(texts):
+            embedding = cache.get(model, input_type, text)
+            if embedding is None:
+                missing_texts.append(text)
+            else:
+                embeddings[text] = embedding
+
+        batch_size = (
+            Settings().get("deployments.embed_batch_size") or DEFAULT_EMBED_BATCH_SIZE
+        )
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_EMBED_BATCHES)
+
+        async def embed(batch: list[str]) -> None:
+            async with semaphore:
+                batch_embeddings = await self.embed_batch(batch, input_type, ctx, **kwargs)
+            for text, embedding in zip(batch, batch_embeddings):
+                embeddings[text] = np.asarray(embedding, dtype=np.float32)
+                cache.set(model, input_type, text, embeddings[text])
+
+        await asyncio.gather(
+            *(
+                embed(missing_texts[index : index + batch_size])
+                for index in range(0, len(missing_texts), batch_size)
+            )
+        )
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([embeddings[text] for text in texts])
+
+    async def embed_batch(
+        self, texts: list[str], input_type: str, ctx: Context, **kwargs: Any
+    ) -> list[list[float]] | None:
+        """
+        Embed one batch of texts with the model, called by invoke_embed. The deployments
+        with embed_enabled override it, it's never called for the other ones.
+        """
+        return None
@@ -1,3 +1,4 @@
+import asyncio
 from typing import Any
 
 import cohere
@@ -13,6 +14,7 @@ from backend.services.logger.utils import LoggerFactory
 
 COHERE_API_KEY_ENV_VAR = "COHERE_API_KEY"
 DEFAULT_RERANK_MODEL = "rerank-english-v2.0"
+DEFAULT_EMBED_MODEL = "embed-english-v3.0"
 
 
 class CohereDeployment(BaseDeployment):
@@ -41,6 +43,16 @@ class CohereDeployment(BaseDeployment):
     def rerank_enabled() -> bool:
         return True
 
+    @staticmethod
+    def embed_enabled() -> bool:
+        return True
+
+    def embed_model(self) -> str | None:
+        return DEFAULT_EMBED_MODEL
+
+    def rerank_model(self) -> str | None:
+        return DEFAULT_RERANK_MODEL
+
     @classmethod
     def list_models(cls) -> list[str]:
         logger = LoggerFactory().get_logger()
@@ -101,7 +113,22 @@ class CohereDeployment(BaseDeployment):
     async def invoke_rerank(
         self, query: str, documents: list[str], ctx: Context, **kwargs: Any
     ) -> Any:
-        response = self.client.rerank(
-            query=query, documents=documents, model=DEFAULT_RERANK_MODEL
+        # The client is synchronous, run it in a thread so concurrent reranks don't block the event loop
+        response = await asyncio.to_thread(
+            self.client.rerank,
+            query=query,
+            documents=documents,
+            model=DEFAULT_RERANK_MODEL,
         )
         return to_dict(response)
+
+    async def embed_batch(
+        self, texts: list[str], input_type: str, ctx: Context, **kwargs: Any
+    ) -> list[list[float]]:
+        response = await asyncio.to_thread(
+            self.client.embed,
+            texts=texts,
+            model=DEFAULT_EMBED_MODEL,
+            input_type=input_type,
+        )
+        return response.embeddings
@@ -0,0 +1,426 @@
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from enum import StrEnum
+from typing import Any, AsyncGenerator
+
+from backend.config.settings import Settings
+from backend.model_deployments.base import BaseDeployment
+from backend.schemas.cohere_chat import CohereChatRequest
+from backend.schemas.context import Context
+from backend.services.logger.utils import LoggerFactory
+
+EWMA_ALPHA = 0.3
+LATENCY_SAMPLES = 100
+MIN_HEDGE_SAMPLES = 20
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_COOLDOWN_SECONDS = 30
+DEFAULT_HEDGE_PERCENTILE = 95
+
+logger = LoggerFactory().get_logger()
+
+
+class RoutingStrategy(StrEnum):
+    LeastOutstanding = "least_outstanding"
+    LatencyEWMA = "ewma"
+
+
+@dataclass
+class RoutingMemberStats:
+    """
+    Passive health and load of a deployment of the pool, from the requests routed to it.
+    """
+
+    outstanding: int = 0
+    ewma_latency: float | None = None
+    latencies: deque = field(default_factory=lambda: deque(maxlen=LATENCY_SAMPLES))
+    failures: int = 0
+    unhealthy_until: float = 0
+    last_selected: float = 0
+
+    def is_healthy(self) -> bool:
+        return self.unhealthy_until <= time.monotonic()
+
+    def record_success(self, latency: float | None = None) -> None:
+        self.failures = 0
+        self.unhealthy_until = 0
+        if latency is None:
+            return
+
+        self.latencies.append(latency)
+        self.ewma_latency = (
+            latency
+            if self.ewma_latency is None
+            else EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.ewma_latency
+        )
+
+    def record_failure(self, failure_threshold: int, cooldown: float) -> None:
+        self.failures += 1
+        if self.failures >= failure_threshold:
+            self.unhealthy_until = time.monotonic() + cooldown
+
+    def get_latency_percentile(self, percentile: float) -> float | None:
+        if len(self.latencies) < MIN_HEDGE_SAMPLES:
+            return None
+
+        latencies = sorted(self.latencies)
+        index = min(len(latencies) - 1, int(len(latencies) * percentile / 100))
+        return latencies[index]
+
+
+# Stats of each deployment of the pool by member key, shared by the requests of the process
+_member_stats: dict[str, RoutingMemberStats] = {}
+
+
+def get_member_stats(key: str) -> RoutingMemberStats:
+    return _member_stats.setdefault(key, RoutingMemberStats())
+
+
+class _MemberStream:
+    """
+    Chat stream of a deployment of the pool, counted as outstanding until it is closed.
+    """
+
+    def __init__(self, key: str, stream: AsyncGenerator[Any, Any]) -> None:
+        self.key = key
+        self.stats = get_member_stats(key)
+        self.stream = stream
+        self.started_at = time.perf_counter()
+        self.stats.outstanding += 1
+        self.stats.last_selected = time.monotonic()
+        self.first_event = asyncio.ensure_future(stream.__anext__())
+        self.closed = False
+
+    async def close(self) -> None:
+        if self.closed:
+            return
+
+        self.closed = True
+        self.stats.outstanding -= 1
+        if not self.first_event.done():
+            self.first_event.cancel()
+            await asyncio.gather(self.first_event, return_exceptions=True)
+        await self.stream.aclose()
+
+
+class RoutingDeployment(BaseDeployment):
+    """
+    Routes the requests across a pool of deployments serving the same model, set in
+    deployments.routing.deployments.
+
+    Each request goes to the healthy deployment with the fewest requests in flight, or the
+    lowest first token latency. A request that fails before its first token is retried on the
+    next deployment, and a deployment is skipped for a cooldown after consecutive failures.
+    With hedged requests, a second deployment is called when the first token is slower than
+    usual, and the first one to respond is used.
+    """
+
+    def __init__(
+        self, members: list[tuple[str, BaseDeployment]] | None = None, **kwargs: Any
+    ):
+        super().__init__(**kwargs)
+        self.members = members if members is not None else _create_members(**kwargs)
+        self.strategy = RoutingStrategy(
+            Settings().get("deployments.routing.strategy")
+            or RoutingStrategy.LeastOutstanding
+        )
+        self.failure_threshold = (
+            Settings().get("deployments.routing.failure_threshold")
+            or DEFAULT_FAILURE_THRESHOLD
+        )
+        cooldown = Settings().get("deployments.routing.cooldown")
+        self.cooldown = DEFAULT_COOLDOWN_SECONDS if cooldown is None else cooldown
+        self.hedged_requests = bool(Settings().get("deployments.routing.hedged_requests"))
+        self.hedge_percentile = (
+            Settings().get("deployments.routing.hedge_percentile")
+            or DEFAULT_HEDGE_PERCENTILE
+        )
+
+    @staticmethod
+    def name() -> str:
+        return "Routing"
+
+    @staticmethod
+    def env_vars() -> list[str]:
+        return []
+
+    @staticmethod
+    def rerank_enabled() -> bool:
+        return any(
+            deployment_class.rerank_enabled()
+            for deployment_class, _ in _get_member_configs()
+        )
+
+    @staticmethod
+    def embed_enabled() -> bool:
+        return any(
+            deployment_class.embed_enabled()
+            for deployment_class, _ in _get_member_configs()
+        )
+
+    def embed_model(self) -> str | None:
+        # The pool serves the same model, the embeddings are cached once for all its deployments
+        return next(
+            (
+                deployment.embed_model()
+                for _, deployment in self.members
+                if deployment.embed_enabled()
+            ),
+            None,
+        )
+
+    def rerank_model(self) -> str | None:
+        return next(
+            (
+                deployment.rerank_model()
+                for _, deployment in self.members
+                if deployment.rerank_enabled()
+            ),
+            None,
+        )
+
+    @classmethod
+    def list_models(cls) -> list[str]:
+        models = []
+        for deployment_class, _ in _get_member_configs():
+            models.extend(
+                model
+                for model in deployment_class.list_models()
+                if model not in models
+            )
+        return models
+
+    @staticmethod
+    def is_available() -> bool:
+        return any(
+            deployment_class.is_available()
+            for deployment_class, _ in _get_member_configs()
+        )
+
+    @classmethod
+    def config(cls) -> dict[str, Any]:
+        # The config of the pool holds the secrets of its deployments
+        return {}
+
+    def get_candidates(self) -> list[tuple[str, BaseDeployment]]:
+        """
+        Get the deployments of the pool in order of preference: the healthy ones first,
+        ranked by the routing strategy.
+
+        Returns:
+            list[tuple[str, BaseDeployment]]: Member keys and deployments.
+        """
+
+        def rank(member: tuple[str, BaseDeployment]) -> tuple:
+            stats = get_member_stats(member[0])
+            if self.strategy == RoutingStrategy.LatencyEWMA:
+                # Deployments without latencies yet are tried first
+                load = stats.ewma_latency or 0
+            else:
+                load = stats.outstanding
+            return (
+                not stats.is_healthy(),
+                load,
+                stats.outstanding,
+                stats.last_selected,
+            )
+
+        return sorted(self.members, key=rank)
+
+    async def invoke_chat(
+        self, chat_request: CohereChatRequest, **kwargs: Any
+    ) -> Any:
+        last_error = None
+        for key, deployment in self.get_candidates():
+            stats = get_member_stats(key)
+            stats.outstanding += 1
+            stats.last_selected = time.monotonic()
+            try:
+                responses = [
+                    response
+                    async for response in deployment.invoke_chat(chat_request, **kwargs)
+                ]
+            except Exception as e:
+                last_error = e
+                self._record_failure(key, e)
+                continue
+            finally:
+                stats.outstanding -= 1
+
+            stats.record_success()
+            for response in responses:
+                yield response
+            return
+
+        raise last_error or ValueError("No deployments to route the request to")
+
+    async def invoke_chat_stream(
+        self, chat_request: CohereChatRequest, ctx: Context, **kwargs: Any
+    ) -> AsyncGenerator[Any, Any]:
+        candidates = self.get_candidates()
+        streams: list[_MemberStream] = []
+        winner = None
+        hedged = False
+        last_error = None
+
+        def open_stream() -> None:
+            key, deployment = candidates.pop(0)
+            streams.append(
+                _MemberStream(
+                    key, deployment.invoke_chat_stream(chat_request, ctx, **kwargs)
+                )
+            )
+
+        try:
+            while winner is None:
+                if not streams:
+                    if not candidates:
+                        raise last_error or ValueError(
+                            "No deployments to route the request to"
+                        )
+                    open_stream()
+
+                hedge_delay = None
+                if self.hedged_requests and not hedged and candidates:
+                    hedge_delay = get_member_stats(streams[0].key).get_latency_percentile(
+                        self.hedge_percentile
+                    )
+                done, _ = await asyncio.wait(
+                    [stream.first_event for stream in streams],
+                    timeout=hedge_delay,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    hedged = True
+                    logger.info(
+                        event="[Routing Deployment] Hedging request",
+                        deployment=streams[0].key,
+                        hedge_delay=hedge_delay,
+                    )
+                    open_stream()
+                    continue
+
+                for stream in [stream for stream in streams if stream.first_event in done]:
+                    error = stream.first_event.exception()
+                    if error is None or isinstance(error, StopAsyncIteration):
+                        winner = stream
+                        break
+
+                    # Nothing was sent yet, so the request fails over to the next deployment
+                    last_error = error
+                    self._record_failure(stream.key, error)
+                    streams.remove(stream)
+                    await stream.close()
+
+            for stream in streams:
+                if stream is not winner:
+                    await stream.close()
+
+            winner.stats.record_success(time.perf_counter() - winner.started_at)
+            if winner.first_event.exception():
+                return
+
+            yield winner.first_event.result()
+            try:
+                async for event in winner.stream:
+                    yield event
+            except Exception as e:
+                self._record_failure(winner.key, e)
+                raise
+        finally:
+            for stream in streams:
+                await stream.close()
+
+    async def invoke_rerank(
+        self, query: str, documents: list[str], ctx: Context, **kwargs: Any
+    ) -> Any:
+        last_error = None
+        for key, deployment in self.get_candidates():
+            if not deployment.rerank_enabled():
+                continue
+
+            stats = get_member_stats(key)
+            stats.outstanding += 1
+            try:
+                response = await deployment.invoke_rerank(query, documents, ctx, **kwargs)
+            except Exception as e:
+                last_error = e
+                self._record_failure(key, e)
+                continue
+            finally:
+                stats.outstanding -= 1
+
+            stats.record_success()
+            return response
+
+        raise last_error or ValueError("No deployments with rerank to route the request to")
+
+    async def embed_batch(
+        self, texts: list[str], input_type: str, ctx: Context, **kwargs: Any
+    ) -> list[list[float]]:
+        last_error = None
+        for key, deployment in self.get_candidates():
+            if not deployment.embed_enabled():
+                continue
+
+            stats = get_member_stats(key)
+            stats.outstanding += 1
+            try:
+                embeddings = await deployment.embed_batch(texts, input_type, ctx, **kwargs)
+            except Exception as e:
+                last_error = e
+                self._record_failure(key, e)
+                continue
+            finally:
+                stats.outstanding -= 1
+
+            stats.record_success()
+            return embeddings
+
+        raise last_error or ValueError("No deployments with embed to route the request to")
+
+    def _record_failure(self, key: str, error: BaseException) -> None:
+        stats = get_member_stats(key)
+        stats.record_failure(self.failure_threshold, self.cooldown)
+        logger.warning(
+            event="[Routing Deployment] Deployment failed",
+            deployment=key,
+            failures=stats.failures,
+            is_healthy=stats.is_healthy(),
+            error=str(error),
+        )
+
+
+def _get_member_configs() -> list[tuple[type[BaseDeployment], dict]]:
+    # Imported here, the deployments are registered when this module is imported
+    from backend.config.deployments import ALL_MODEL_DEPLOYMENTS
+
+    deployment_classes = {
+        deployment_class.id(): deployment_class
+        for deployment_class in ALL_MODEL_DEPLOYMENTS.values()
+        if deployment_class is not RoutingDeployment
+    }
+    member_configs = []
+    for member in Settings().get("deployments.routing.deployments") or []:
+        deployment_class = deployment_classes.get(member.get("deployment"))
+        if deployment_class is None:
+            logger.warning(
+                event="[Routing Deployment] Deployment not found",
+                deployment=member.get("deployment"),
+            )
+            continue
+        member_configs.append((deployment_class, member.get("config") or {}))
+    return member_configs
+
+
+def _create_members(**kwargs: Any) -> list[tuple[str, BaseDeployment]]:
+    kwargs.pop("db_id", None)
+    kwargs.pop("db_config", None)
+    return [
+        (
+            f"{index}:{deployment_class.id()}",
+            deployment_class(db_config=config, **kwargs),
+        )
+        for index, (deployment_class, config) in enumerate(_get_member_configs())
+    ]
@@ -1,3 +1,4 @@
+import asyncio
 from typing import Any, AsyncGenerator
 
 import cohere
@@ -45,6 +46,16 @@ class SingleContainerDeployment(BaseDeployment):
     def rerank_enabled() -> bool:
         return SingleContainerDeployment.default_model.startswith("rerank")
 
+    @staticmethod
+    def embed_enabled() -> bool:
+        return (SingleContainerDeployment.default_model or "").startswith("embed")
+
+    def embed_model(self) -> str | None:
+        return self.model
+
+    def rerank_model(self) -> str | None:
+        return DEFAULT_RERANK_MODEL
+
     @classmethod
     def list_models(cls) -> list[str]:
         if not SingleContainerDeployment.is_available():
@@ -82,6 +93,22 @@ class SingleContainerDeployment(BaseDeployment):
     async def invoke_rerank(
         self, query: str, documents: list[str], ctx: Context, **kwargs
     ) -> Any:
-        return self.client.rerank(
-            query=query, documents=documents, model=DEFAULT_RERANK_MODEL
+        # The client is synchronous, run it in a thread so concurrent reranks don't block the event loop
+        response = await asyncio.to_thread(
+            self.client.rerank,
+            query=query,
+            documents=documents,
+            model=DEFAULT_RERANK_MODEL,
+        )
+        return to_dict(response)
+
+    async def embed_batch(
+        self, texts: list[str], input_type: str, ctx: Context, **kwargs: Any
+    ) -> list[list[float]]:
+        response = await asyncio.to_thread(
+            self.client.embed,
+            texts=texts,
+            model=self.model,
+            input_type=input_type,
         )
+        return response.embeddings
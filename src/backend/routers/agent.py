@@ -58,6 +58,7 @@ from backend.services.file import (
     get_file_service,
     validate_file,
 )
+from backend.services.file_storage import aread_file_content
 from backend.services.request_validators import (
     validate_create_agent_request,
     validate_update_agent_request,
@@ -573,7 +574,7 @@ async def get_agent_file(
             detail=f"File with ID: {file_id} does not belong to the agent with ID: {agent_id}."
         )
 
-    file = file_crud.get_file(session, file_id)
+    file = file_crud.get_file(session, file_id, with_content=True)
 
     if not file:
         raise HTTPException(
@@ -584,7 +585,7 @@ async def get_agent_file(
     return FileMetadata(
         id=file.id,
         file_name=file.file_name,
-        file_content=file.file_content,
+        file_content=await aread_file_content(file),
         file_size=file.file_size,
         created_at=file.created_at,
         updated_at=file.updated_at,
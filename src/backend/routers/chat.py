@@ -4,30 +4,53 @@ import uuid
 from enum import Enum
 from typing import Any, AsyncGenerator, Dict, Generator
 
-from fastapi import APIRouter, Depends, Header
+from fastapi import APIRouter, Depends, Header, HTTPException
+from sqlalchemy.orm import Session
 from sse_starlette.sse import EventSourceResponse
 
 from backend.chat.custom.custom import CustomChat
 from backend.config.routers import RouterName
+from backend.config.settings import Settings
 from backend.crud import agent_tool_metadata as agent_tool_metadata_crud
-from backend.crud import message as message_crud
+from backend.database_models.base import CustomFilterQuery
 from backend.database_models.database import DBSessionDep
 from backend.database_models.message import MessageAgent
 from backend.model_deployments.cohere_platform import CohereDeployment
 from backend.schemas.agent import Agent, AgentToolMetadata
 from backend.schemas.chat import ChatResponseEvent, NonStreamedChatResponse
-from backend.schemas.cohere_chat import CohereChatRequest
+from backend.schemas.cohere_chat import (
+    CohereChatRequest,
+    CohereHumanFeedbackChatRequest,
+)
 from backend.schemas.context import Context
-from backend.schemas.message import Message
 from backend.services.agent import validate_agent_exists
 from backend.services.chat import (
+    close_session_after_stream,
+    create_message,
     generate_chat_response,
     generate_chat_stream,
+    multiplex_chat_streams,
     process_chat,
     process_message_regeneration,
 )
 from backend.services.context import get_context
-from backend.services.request_validators import validate_deployment_header
+from backend.services.idempotency import (
+    get_idempotency_key,
+    get_idempotency_store,
+    get_or_claim_response,
+    save_response,
+)
+from backend.services.request_validators import (
+    validate_deployment_header,
+    validate_variant_deployments,
+)
+from backend.services.response_cache import cached_chat_stream
+from backend.services.stream_buffer import (
+    StreamBuffer,
+    StreamEventsExpired,
+    get_stream_buffer,
+    start_resumable_stream,
+)
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -50,9 +73,13 @@ async def chat_stream(
     chat_request: CohereChatRequest,
     session: DBSessionDep,
     ctx: Context = Depends(get_context),
+    idempotency_key: str | None = Header(default=None),
 ) -> Generator[ChatResponseEvent, Any, None]:
     """
     Stream chat endpoint to handle user messages and return chatbot responses.
+
+    A retry with the same Idempotency-Key header attaches to the stream of the first request
+    instead of generating the response again.
     """
 
     logger.debug(f"Request model dump: {chat_request.model_dump()}")
@@ -60,34 +87,129 @@ async def chat_stream(
     agent_id = chat_request.agent_id
     ctx.with_agent_id(agent_id)
 
-    (
-        session,
-        chat_request,
-        response_message,
-        should_store,
-        managed_tools,
-        next_message_position,
-        ctx,
-    ) = process_chat(session, chat_request, ctx)
+    stream_id = None
+    if idempotency_key:
+        idempotency_store_key = get_idempotency_key(
+            "chat-stream", ctx.get_user_id(), idempotency_key
+        )
+        stream_id = str(uuid.uuid4())
+        existing_stream_id = await claim_stream(idempotency_store_key, stream_id)
+        if existing_stream_id:
+            return await get_buffered_stream_response(
+                get_stream_buffer(), existing_stream_id, 0
+            )
 
-    logger.info(f"Calling CustomChat().chat with request: {chat_request.model_dump()}")
-    return EventSourceResponse(
-        generate_chat_stream(
+    try:
+        (
             session,
-            CustomChat().chat(
-                chat_request,
-                stream=True,
-                managed_tools=managed_tools,
-                session=session,
-                ctx=ctx,
-            ),
+            chat_request,
             response_message,
-            should_store=should_store,
-            next_message_position=next_message_position,
+            should_store,
+            managed_tools,
+            next_message_position,
+            ctx,
+        ) = process_chat(session, chat_request, ctx)
+    except BaseException:
+        if idempotency_key:
+            await get_idempotency_store().delete(idempotency_store_key)
+        raise
+
+    logger.info(f"Calling CustomChat().chat with request: {chat_request.model_dump()}")
+    stream = generate_chat_stream(
+        session,
+        CustomChat().chat(
+            chat_request,
+            stream=True,
+            managed_tools=managed_tools,
+            session=session,
             ctx=ctx,
         ),
+        response_message,
+        should_store=should_store,
+        next_message_position=next_message_position,
+        ctx=ctx,
+    )
+    headers = {"Connection": "keep-alive"}
+
+    # Retries of requests with an Idempotency-Key attach to the buffered stream
+    if stream_id or Settings().get("chat.resumable_streams"):
+        # The generation runs in the background, the response follows its buffered events
+        stream_id = stream_id or str(uuid.uuid4())
+        buffer = get_stream_buffer()
+        await start_resumable_stream(stream_id, ctx.get_user_id(), stream, buffer)
+        stream = buffer.events(stream_id)
+        headers["X-Stream-ID"] = stream_id
+
+    return EventSourceResponse(
+        stream,
         media_type="text/event-stream",
-        headers={"Connection": "keep-alive"},
+        headers=headers,
+        send_timeout=300,
+        ping=5,
+    )
+
+
+async def claim_stream(idempotency_store_key: str, stream_id: str) -> str | None:
+    """
+    Claim an Idempotency-Key for a new stream, or get the stream of the request that claimed
+    it. The buffer of a stream expires long before the key, a key whose stream is no longer
+    buffered is released and claimed again, so the retry generates a new response.
+    """
+    store = get_idempotency_store()
+    buffer = get_stream_buffer()
+    existing_stream_id = await store.claim(idempotency_store_key, stream_id)
+    if existing_stream_id and await buffer.get_owner(existing_stream_id) is None:
+        await store.delete(idempotency_store_key)
+        existing_stream_id = await store.claim(idempotency_store_key, stream_id)
+
+    return existing_stream_id
+
+
+@router.get("/chat-stream/{stream_id}/resume")
+async def resume_chat_stream(
+    stream_id: str,
+    ctx: Context = Depends(get_context),
+    last_event_id: str | None = Header(default=None),
+) -> EventSourceResponse:
+    """
+    Resume a chat stream after a disconnect.
+
+    Replays the events after the Last-Event-ID header, then follows the generation until it ends.
+    Only available when chat.resumable_streams is enabled.
+    """
+    buffer = get_stream_buffer()
+    if await buffer.get_owner(stream_id) != ctx.get_user_id():
+        raise HTTPException(status_code=404, detail=f"Stream {stream_id} not found.")
+
+    try:
+        after_id = int(last_event_id or 0)
+    except ValueError:
+        raise HTTPException(
+            status_code=400, detail=f"Invalid Last-Event-ID: {last_event_id}."
+        )
+
+    return await get_buffered_stream_response(buffer, stream_id, after_id)
+
+
+async def get_buffered_stream_response(
+    buffer: StreamBuffer, stream_id: str, after_id: int
+) -> EventSourceResponse:
+    """
+    Stream the buffered events of a chat stream after an event ID, then follow the generation.
+    """
+    try:
+        # Check that the stream can still be resumed before starting the response
+        await buffer.read(stream_id, after_id)
+    except StreamEventsExpired:
+        raise HTTPException(
+            status_code=410,
+            detail=f"The events of stream {stream_id} after {after_id} are no longer available, regenerate the response instead.",
+        )
+
+    return EventSourceResponse(
+        buffer.events(stream_id, after_id),
+        media_type="text/event-stream",
+        headers={"Connection": "keep-alive", "X-Stream-ID": stream_id},
         send_timeout=300,
         ping=5,
     )
@@ -159,15 +281,54 @@ async def chat(
     chat_request: CohereChatRequest,
     session: DBSessionDep,
     ctx: Context = Depends(get_context),
+    idempotency_key: str | None = Header(default=None),
 ) -> NonStreamedChatResponse:
     """
     Chat endpoint to handle user messages and return chatbot responses.
+
+    A retry with the same Idempotency-Key header returns the response of the first request
+    instead of generating it again.
     """
     ctx.with_model(chat_request.model)
     agent_id = chat_request.agent_id
     ctx.with_agent_id(agent_id)
     user_id = ctx.get_user_id()
 
+    if not idempotency_key:
+        return await generate_chat(chat_request, session, ctx)
+
+    idempotency_store_key = get_idempotency_key("chat", user_id, idempotency_key)
+    stored_response = await get_or_claim_response(idempotency_store_key)
+    if stored_response:
+        return NonStreamedChatResponse.model_validate_json(stored_response)
+
+    response = None
+    try:
+        response = await generate_chat(chat_request, session, ctx)
+    finally:
+        # Released on errors and cancellations too (e.g. a client disconnect), so the next
+        # retry generates the response instead of replaying an error
+        await save_response(
+            idempotency_store_key,
+            response.model_dump_json()
+            if response is not None and response.finish_reason != "ERROR"
+            else None,
+        )
+
+    return response
+
+
+async def generate_chat(
+    chat_request: CohereChatRequest,
+    session: DBSessionDep,
+    ctx: Context,
+) -> NonStreamedChatResponse:
+    """
+    Generate the non-streamed chat response of a request.
+    """
+    agent_id = chat_request.agent_id
+    user_id = ctx.get_user_id()
+
     if agent_id:
         agent = validate_agent_exists(session, agent_id, user_id)
         agent_schema = Agent.model_validate(agent)
@@ -194,12 +355,16 @@ async def chat(
 
     response = await generate_chat_response(
         session,
-        CustomChat().chat(
+        cached_chat_stream(
             chat_request,
-            session=session,
-            stream=False,
-            managed_tools=managed_tools,
-            ctx=ctx,
+            CustomChat().chat(
+                chat_request,
+                session=session,
+                stream=False,
+                managed_tools=managed_tools,
+                ctx=ctx,
+            ),
+            ctx,
         ),
         response_message,
         should_store=should_store,
@@ -217,36 +382,39 @@ experimental_router = APIRouter(
 
 @router.post("/chat-human-feedback")
 async def chat_human_feedback(
-    chat_request: CohereChatRequest,
+    chat_request: CohereHumanFeedbackChatRequest,
     session: DBSessionDep,
     ctx: Context = Depends(get_context),
     stream_id: str | None = Header(default=None),
 ) -> EventSourceResponse:
     """
-    Streaming endpoint for chat with human feedback
-    """
+    Streaming endpoint for chat with human feedback.
 
-    logger = logging.getLogger(__name__)
+    The variants of the response are generated concurrently, optionally with different
+    deployments, models or temperatures. Their events are sent in one stream, tagged with
+    their parallel_variant, and each variant is stored as a message of the same parallel group.
+    """
     logger.info(f"Starting human feedback chat with stream_id: {stream_id}")
 
-    # Remove human_feedback from the request if it exists
-    chat_data = chat_request.model_dump()
-    if "human_feedback" in chat_data:
-        del chat_data["human_feedback"]
-
-    # Create new request without human_feedback
-    chat_request = CohereChatRequest(**chat_data)
+    variants = chat_request.variants
+    chat_request = CohereChatRequest(
+        **{name: getattr(chat_request, name) for name in CohereChatRequest.model_fields}
+    )
 
     # Add stream identification to context
     ctx.with_stream_id(stream_id)
 
-    # Generate a unique parallel group ID for this pair of responses
+    # Generate a unique parallel group ID for the variants of the response
     parallel_group_id = str(uuid.uuid4())
+    ctx.with_parallel_group(parallel_group_id)
     logger.info(f"Created parallel group ID: {parallel_group_id}")
 
     if not chat_request.model:
         chat_request.model = "c4ai-aya-expanse-32b"
 
+    # The deployments of all the variants are checked before any stream starts
+    validate_variant_deployments(session, variants)
+
     # Process the chat request
     (
         session,
@@ -258,75 +426,64 @@ async def chat_human_feedback(
         ctx,
     ) = process_chat(session, chat_request, ctx)
 
-    # Mark this message as part of a parallel group
-    logger.info(
-        f"Setting parallel attributes on response_message ID: {response_message.id}"
-    )
-    response_message.is_parallel = True
-    response_message.parallel_group_id = parallel_group_id
-    response_message.parallel_variant = 1
+    variant_streams = []
+    for parallel_variant, variant in enumerate(variants, start=1):
+        variant_request = chat_request.model_copy(
+            update=variant.model_dump(exclude={"deployment"}, exclude_none=True),
+            deep=True,
+        )
+        variant_ctx = ctx.model_copy()
+        if variant.deployment:
+            variant_ctx.with_deployment_name(variant.deployment)
+        variant_ctx.with_model(variant_request.model)
+
+        # The first variant uses the response message and the session of the request, the
+        # other ones run concurrently with a session of their own
+        variant_message = response_message
+        variant_session = session
+        if parallel_variant > 1:
+            variant_session = Session(session.get_bind(), query_cls=CustomFilterQuery)
+            variant_message = create_message(
+                session,
+                chat_request,
+                ctx.get_conversation_id(),
+                ctx.get_user_id(),
+                next_message_position,
+                "",
+                MessageAgent.CHATBOT,
+                should_store=False,
+            )
+        variant_message.is_parallel = True
+        variant_message.parallel_group_id = parallel_group_id
+        variant_message.parallel_variant = parallel_variant
 
-    # Create a wrapper around the stream generator to set parallel attributes on the second response
-    async def parallel_stream_wrapper():
-        async for event in CustomChat().chat(
-            chat_request,
-            stream=True,
-            managed_tools=managed_tools,
-            session=session,
-            ctx=ctx,
-        ):
-            # Check if this is a STREAM_START event
-            if event.get("event_type") == StreamEvent.STREAM_START:
-                # This is the start of the second response
-                logger.info(
-                    f"Second response starting with generation_id: {event.get('generation_id')}"
-                )
-
-                # We need to create or update a message object for this response
-                # Create a new response message for the second variant
-                from uuid import uuid4
-
-                second_response_message = message_crud.create_message(
-                    session=session,
-                    message=Message(
-                        id=str(uuid4()),
-                        text="",  # Will be filled during streaming
-                        user_id=ctx.get_user_id(),
-                        conversation_id=ctx.get_conversation_id(),
-                        position=next_message_position
-                        + 1,  # Position after the first response
-                        agent=MessageAgent.CHATBOT,
-                        is_active=True,
-                        generation_id=event.get("generation_id"),
-                        is_parallel=True,  # Mark as parallel
-                        parallel_group_id=parallel_group_id,  # Same group ID
-                        parallel_variant=2,  # Second variant
-                    ),
-                )
-                logger.info(
-                    f"Created second response message: {second_response_message.id} with parallel attributes"
-                )
-
-                # Store the ID in the context to reference later
-                ctx.second_response_id = second_response_message.id
-
-            yield event
-
-    logger.info("Starting generate_chat_stream for parallel responses")
-    return EventSourceResponse(
-        generate_chat_stream(
-            session,
-            parallel_stream_wrapper(),
-            response_message,
+        variant_stream = generate_chat_stream(
+            variant_session,
+            CustomChat().chat(
+                variant_request,
+                stream=True,
+                managed_tools=managed_tools,
+                session=variant_session,
+                ctx=variant_ctx,
+            ),
+            variant_message,
             should_store=should_store,
             next_message_position=next_message_position,
-            ctx=ctx,
-        ),
+            ctx=variant_ctx,
+        )
+        if variant_session is not session:
+            variant_stream = close_session_after_stream(variant_stream, variant_session)
+        variant_streams.append(variant_stream)
+
+    headers = {"Connection": "keep-alive"}
+    if stream_id:
+        headers["X-Stream-ID"] = stream_id
+
+    logger.info(f"Starting {len(variant_streams)} parallel chat streams")
+    return EventSourceResponse(
+        multiplex_chat_streams(variant_streams, ctx),
         media_type="text/event-stream",
-        headers={
-            "Connection": "keep-alive",
-            "X-Stream-ID": stream_id,
-        },
+        headers=headers,
         send_timeout=300,
         ping=5,
     )
@@ -7,6 +7,8 @@ from backend.chat.custom.utils import get_deployment
 from backend.config.routers import RouterName
 from backend.crud import agent as agent_crud
 from backend.crud import conversation as conversation_crud
+from backend.crud import conversation_search as conversation_search_crud
+from backend.crud import file as file_crud
 from backend.crud import message as message_crud
 from backend.database_models import Conversation as ConversationModel
 from backend.database_models.database import DBSessionDep
@@ -35,10 +37,9 @@ from backend.schemas.params.shared import OrderByQueryParam, PaginationQueryPara
 from backend.services.agent import validate_agent_exists
 from backend.services.context import get_context
 from backend.services.conversation import (
-    filter_conversations,
     generate_conversation_title,
-    get_documents_to_rerank,
     get_messages_with_files,
+    rerank_conversations,
     validate_conversation,
 )
 from backend.services.file import (
@@ -46,6 +47,7 @@ from backend.services.file import (
     get_file_service,
     validate_file,
 )
+from backend.services.file_storage import aread_file_content
 from backend.services.synthesizer import synthesize
 
 router = APIRouter(
@@ -123,13 +125,14 @@ async def list_conversations(
         session, offset=page_params.offset, limit=page_params.limit, order_by=order_by, user_id=user_id, agent_id=agent_id
     )
 
+    files_by_conversation_id = get_file_service().get_files_by_conversation_ids(
+        session, user_id, [conversation.id for conversation in conversations], ctx
+    )
+
     results = []
     for conversation in conversations:
-        files = get_file_service().get_files_by_conversation_id(
-            session, user_id, conversation.id, ctx
-        )
         files_with_conversation_id = attach_conversation_id_to_files(
-            conversation.id, files
+            conversation.id, files_by_conversation_id[conversation.id]
         )
         results.append(
             ConversationWithoutMessages(
@@ -261,7 +264,7 @@ async def search_conversations(
     ctx: Context = Depends(get_context),
 ) -> list[ConversationWithoutMessages]:
     """
-    Search conversations by title.
+    Search conversations by title and message text.
     """
     user_id = ctx.get_user_id()
     deployment_name = ctx.get_deployment_name()
@@ -275,29 +278,31 @@ async def search_conversations(
         agent_schema = Agent.model_validate(agent)
         ctx.with_agent(agent_schema)
 
-    conversations = conversation_crud.get_conversations(
-        session, offset=page_params.offset, limit=page_params.limit, order_by=order_by, user_id=user_id, agent_id=agent_id
+    conversations = conversation_search_crud.search_conversations(
+        session,
+        user_id,
+        query,
+        offset=page_params.offset,
+        limit=page_params.limit,
+        order_by=order_by,
+        agent_id=agent_id,
     )
 
     if not conversations:
         return []
 
-    rerank_documents = get_documents_to_rerank(conversations)
-    filtered_documents = await filter_conversations(
-        query,
-        conversations,
-        rerank_documents,
-        model_deployment,
-        ctx,
+    conversations = await rerank_conversations(
+        query, conversations, model_deployment, ctx
+    )
+
+    files_by_conversation_id = get_file_service().get_files_by_conversation_ids(
+        session, user_id, [conversation.id for conversation in conversations], ctx
     )
 
     results = []
-    for conversation in filtered_documents:
-        files = get_file_service().get_files_by_conversation_id(
-            session, user_id, conversation.id, ctx
-        )
+    for conversation in conversations:
         files_with_conversation_id = attach_conversation_id_to_files(
-            conversation.id, files
+            conversation.id, files_by_conversation_id[conversation.id]
         )
         results.append(
             ConversationWithoutMessages(
@@ -430,12 +435,17 @@ async def get_file(
             detail=f"File with ID: {file_id} does not belong to the conversation with ID: {conversation.id}."
         )
 
-    file = validate_file(session, file_id, user_id)
+    file = file_crud.get_file(session, file_id, user_id, with_content=True)
+    if not file:
+        raise HTTPException(
+            status_code=404,
+            detail=f"File with ID: {file_id} not found.",
+        )
 
     return FileMetadata(
         id=file.id,
         file_name=file.file_name,
-        file_content=file.file_content,
+        file_content=await aread_file_content(file),
         file_size=file.file_size,
         created_at=file.created_at,
         updated_at=file.updated_at,
@@ -1,4 +1,5 @@
 from abc import ABC
+from collections.abc import MutableSequence
 from dataclasses import dataclass
 from enum import StrEnum
 from typing import Any, ClassVar, Optional, Union
@@ -15,8 +16,8 @@ from backend.schemas.tool import Tool, ToolCall, ToolCallDelta
 
 @dataclass
 class EventState:
-    distances_plans: list
-    distances_actions: list
+    distances_plans: MutableSequence[float]
+    distances_actions: MutableSequence[float]
     previous_plan: str
     previous_action: str
 
@@ -1,10 +1,12 @@
 from enum import StrEnum
 from typing import Any, Optional
 
-from pydantic import Field
+from pydantic import BaseModel, Field
 
 from backend.schemas.chat import BaseChatRequest
 
+MAX_PARALLEL_VARIANTS = 4
+
 
 class CohereChatPromptTruncation(StrEnum):
     """Dictates how the prompt will be constructed. Defaults to "AUTO_PRESERVE_ORDER"."""
@@ -130,3 +132,40 @@ class CohereChatRequest(BaseChatRequest):
         title="Agent ID",
         description="The agent ID to use for the chat.",
     )
+
+
+class ChatVariant(BaseModel):
+    """
+    Settings of a response variant generated for human feedback, unset values are taken from the request.
+    """
+
+    deployment: Optional[str] = Field(
+        None,
+        title="Deployment",
+        description="Name of the deployment that generates the variant, defaults to the Deployment-Name header.",
+    )
+    model: Optional[str] = Field(
+        None,
+        title="Model",
+        description="The model that generates the variant.",
+    )
+    temperature: Optional[float] = Field(
+        None,
+        title="Temperature",
+        description="Temperature used to generate the variant.",
+        ge=0,
+    )
+
+
+class CohereHumanFeedbackChatRequest(CohereChatRequest):
+    """
+    Request shape for chat with human feedback, where several variants of the response are generated in parallel.
+    """
+
+    variants: list[ChatVariant] = Field(
+        default_factory=lambda: [ChatVariant(), ChatVariant()],
+        title="Variants",
+        description="Variants of the response to generate in parallel, defaults to two variants with the request settings.",
+        min_length=1,
+        max_length=MAX_PARALLEL_VARIANTS,
+    )
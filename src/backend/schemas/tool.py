@@ -14,6 +14,15 @@ class ToolCategory(StrEnum):
     WebSearch = "Web search"
 
 
+class ToolCallScope(StrEnum):
+    """
+    Scope in which identical concurrent tool calls share one call
+    """
+    Step = "step"
+    User = "user"
+    Global = "global"
+
+
 class Tool(BaseModel):
     """
     Tool Schema
@@ -89,6 +98,36 @@ class ToolDefinition(Tool):
         title="Should Return Token",
         description="If the tool returns a token",
     )
+    is_idempotent: bool = Field(
+        False,
+        title="Is Idempotent",
+        description="If the tool has no side effects, so it is safe to call it speculatively or more than once",
+        exclude=True,
+    )
+    timeout: Optional[float] = Field(
+        None,
+        title="Timeout",
+        description="Maximum time in seconds to wait for a tool call, defaults to the chat tool call timeout",
+        exclude=True,
+    )
+    single_flight_scope: Optional[ToolCallScope] = Field(
+        None,
+        title="Single Flight Scope",
+        description="Scope in which identical concurrent calls of an idempotent tool share one call, defaults to tools.single_flight_scope",
+        exclude=True,
+    )
+    max_concurrent_calls: Optional[int] = Field(
+        None,
+        title="Max Concurrent Calls",
+        description="Maximum concurrent calls of the tool, defaults to tools.max_concurrent_calls",
+        exclude=True,
+    )
+    circuit_breaker_failures: Optional[int] = Field(
+        None,
+        title="Circuit Breaker Failures",
+        description="Consecutive failures after which the calls of the tool fail fast, defaults to tools.circuit_breaker_failures",
+        exclude=True,
+    )
 
     implementation: Any = Field(
         ...,
@@ -1,6 +1,8 @@
+import asyncio
 import json
 import logging
-from typing import Any, AsyncGenerator, Dict, Generator, List, Union
+from collections import deque
+from typing import Any, AsyncGenerator, Dict, Generator, List, Sequence, Union
 from uuid import uuid4
 
 import nltk
@@ -10,9 +12,11 @@ from fastapi.encoders import jsonable_encoder
 
 from backend.chat.collate import to_dict
 from backend.chat.enums import StreamEvent
+from backend.config.settings import Settings
 from backend.config.tools import get_available_tools
 from backend.crud import agent_tool_metadata as agent_tool_metadata_crud
 from backend.crud import conversation as conversation_crud
+from backend.crud import conversation_search as conversation_search_crud
 from backend.crud import message as message_crud
 from backend.crud import tool_call as tool_call_crud
 from backend.database_models.citation import Citation
@@ -43,12 +47,14 @@ from backend.schemas.chat import (
     StreamTextGeneration,
     StreamToolCallsChunk,
     StreamToolCallsGeneration,
+    StreamToolResult,
 )
 from backend.schemas.context import Context
 from backend.schemas.conversation import UpdateConversationRequest
 from backend.schemas.search_query import SearchQuery
 from backend.schemas.tool import Tool, ToolCall, ToolCallDelta
 from backend.services.agent import validate_agent_exists
+from backend.services.conversation_summary import schedule_conversation_summary
 
 LOOKBACKS = [3, 5, 7]
 DEATHLOOP_SIMILARITY_THRESHOLDS = [0.5, 0.7, 0.9]
@@ -257,6 +263,16 @@ def process_message_regeneration(
         id=str(uuid4()),
     )
 
+    # The stored tool calls are kept to replay them instead of calling the tools again
+    tool_call_messages = []
+    if Settings().get("tools.reuse_tool_results_on_regeneration"):
+        tool_call_messages = get_tool_call_messages_to_replay(
+            conversation,
+            last_user_message.position,
+            user_id,
+            [tool.name for tool in chat_request.tools or []],
+        )
+
     previous_chatbot_message_ids = [
         message.id
         for message in conversation.messages
@@ -265,6 +281,7 @@ def process_message_regeneration(
             and message.user_id == user_id
             and message.position == last_user_message.position
             and message.agent == MessageAgent.CHATBOT
+            and message not in tool_call_messages
         )
     ]
 
@@ -273,6 +290,12 @@ def process_message_regeneration(
     chat_request.chat_history = create_chat_history(
         conversation, last_user_message.position, chat_request
     )
+    if tool_call_messages:
+        replay_tool_calls(chat_request, tool_call_messages)
+        ctx.get_logger().info(
+            event="[Chat] Replaying stored tool results for regeneration",
+            tool_calls=sum(len(message.tool_calls) for message in tool_call_messages),
+        )
 
     managed_tools = (
         len(
@@ -295,6 +318,161 @@ def process_message_regeneration(
     )
 
 
+def get_tool_call_messages_to_replay(
+    conversation: Conversation, position: int, user_id: str, tool_names: list[str]
+) -> list[Message]:
+    """
+    Get the tool call messages of a turn, if the outputs of all their tool calls are stored
+    and their tools are still requested.
+
+    Args:
+        conversation (Conversation): Conversation object.
+        position (int): Position of the turn.
+        user_id (str): User ID.
+        tool_names (list[str]): Names of the tools of the chat request.
+
+    Returns:
+        list[Message]: Tool call messages in the order of the model steps, empty if the turn
+            has no tool calls or some of them can't be replayed.
+    """
+    # Only the tool calls of the first variant of a parallel response are replayed, like
+    # the chat history only has its first variant
+    tool_call_messages = [
+        message
+        for message in conversation.messages
+        if message.is_active
+        and message.user_id == user_id
+        and message.position == position
+        and message.agent == MessageAgent.CHATBOT
+        and message.tool_calls
+        and not (message.is_parallel and message.parallel_variant != 1)
+    ]
+    if any(
+        tool_call.outputs is None or tool_call.name not in tool_names
+        for message in tool_call_messages
+        for tool_call in message.tool_calls
+    ):
+        return []
+
+    return sorted(tool_call_messages, key=lambda message: message.created_at)
+
+
+def replay_tool_calls(
+    chat_request: CohereChatRequest, tool_call_messages: list[Message]
+) -> None:
+    """
+    Replay the stored tool calls of a turn and their outputs into a chat request, so its first
+    model step generates the response from them, like the step after the last tool calls.
+
+    Args:
+        chat_request (CohereChatRequest): Chat request of the turn, with the chat history before it.
+        tool_call_messages (list[Message]): Tool call messages of the turn, from get_tool_call_messages_to_replay.
+    """
+    steps = []
+    for message in tool_call_messages:
+        tool_calls = [
+            {"name": tool_call.name, "parameters": tool_call.parameters or {}}
+            for tool_call in message.tool_calls
+        ]
+        tool_results = [
+            {"call": call, "outputs": tool_call.outputs}
+            for call, tool_call in zip(tool_calls, message.tool_calls)
+        ]
+        steps.append(
+            (
+                ChatMessage(
+                    role=ChatRole.CHATBOT,
+                    message=message.tool_plan,
+                    tool_calls=tool_calls,
+                ),
+                tool_results,
+            )
+        )
+
+    chat_request.chat_history.append(
+        ChatMessage(role=ChatRole.USER, message=chat_request.message)
+    )
+    for tool_calls_message, tool_results in steps[:-1]:
+        chat_request.chat_history.extend(
+            [tool_calls_message, ChatMessage(role=ChatRole.TOOL, tool_results=tool_results)]
+        )
+
+    tool_calls_message, tool_results = steps[-1]
+    chat_request.chat_history.append(tool_calls_message)
+    chat_request.tool_results = tool_results
+    chat_request.message = ""
+
+
+def save_tool_results(
+    session: DBSessionDep,
+    conversation_id: str,
+    user_id: str,
+    position: int,
+    chat_history: list[dict[str, Any]],
+) -> None:
+    """
+    Save the outputs of the tool calls of a turn, from its chat history at the end of the
+    stream, so they can be replayed when the response is regenerated.
+
+    Args:
+        session (DBSessionDep): Database session.
+        conversation_id (str): Conversation ID.
+        user_id (str): User ID.
+        position (int): Position of the turn.
+        chat_history (list[dict[str, Any]]): Chat history at the end of the stream.
+    """
+    chat_history = [to_dict(message) for message in chat_history or []]
+    user_message_indexes = [
+        index
+        for index, message in enumerate(chat_history)
+        if str(message.get("role", "")).upper() == ChatRole.USER
+    ]
+    turn_start = user_message_indexes[-1] + 1 if user_message_indexes else 0
+    tool_results = [
+        tool_result
+        for message in chat_history[turn_start:]
+        if str(message.get("role", "")).upper() == ChatRole.TOOL
+        for tool_result in message.get("tool_results") or []
+    ]
+    if not tool_results:
+        return
+
+    tool_call_messages = sorted(
+        (
+            message
+            for message in message_crud.get_messages_by_conversation_id(
+                session, conversation_id, user_id
+            )
+            if message.position == position
+            and message.agent == MessageAgent.CHATBOT
+            and not (message.is_parallel and message.parallel_variant != 1)
+        ),
+        key=lambda message: message.created_at,
+    )
+    for message in tool_call_messages:
+        for tool_call in tool_call_crud.list_tool_calls_by_message_id(
+            session, message.id
+        ):
+            if tool_call.outputs is not None:
+                continue
+
+            tool_result = next(
+                (
+                    tool_result
+                    for tool_result in tool_results
+                    if tool_result.get("call", {}).get("name") == tool_call.name
+                    and (tool_result["call"].get("parameters") or {})
+                    == (tool_call.parameters or {})
+                ),
+                None,
+            )
+            if tool_result is not None:
+                tool_results.remove(tool_result)
+                tool_call_crud.update_tool_call_outputs(
+                    session, tool_call, tool_result.get("outputs") or []
+                )
+
+
 def get_last_message(
     conversation: Conversation, user_id: str, agent: MessageAgent
 ) -> Message:
@@ -517,20 +695,37 @@ def create_chat_history(
     if conversation.messages is None:
         return []
 
+    # The turns before the summary position are replaced by the conversation summary
+    summary_position = 0
+    if conversation.summary and conversation.summary_position <= user_message_position:
+        summary_position = conversation.summary_position
+
     # Filter out user message that was just sent
     # And any empty messages
+    # Only the first variant of the parallel responses is part of the history
     text_messages = [
         message
         for message in conversation.messages
-        if message.position < user_message_position and message.text
+        if summary_position <= message.position < user_message_position
+        and message.text
+        and not (message.is_parallel and message.parallel_variant != 1)
     ]
-    return [
+    chat_history = [
         ChatMessage(
             role=ChatRole(message.agent.value.upper()),
             message=message.text,
         )
         for message in text_messages
     ]
+    if summary_position:
+        chat_history.insert(
+            0,
+            ChatMessage(
+                role=ChatRole.SYSTEM,
+                message=f"Summary of the earlier conversation:\n{conversation.summary}",
+            ),
+        )
+    return chat_history
 
 
 def update_conversation_after_turn(
@@ -540,9 +735,12 @@ def update_conversation_after_turn(
     final_message_text: str,
     user_id: str,
     previous_response_message_ids: list[str] | None = None,
+    ctx: Context | None = None,
+    chat_history: list[dict[str, Any]] | None = None,
 ) -> None:
     """
     After the last message in a conversation, updates the conversation description with that message's text
+    and, if chat.conversation_summary is set, its running summary in the background
 
     Args:
         session (DBSessionDep): Database session.
@@ -551,6 +749,8 @@ def update_conversation_after_turn(
         final_message_text (str): Final message text.
         user_id (str): The user ID.
         previous_response_message_ids (list[str]): Previous response message IDs.
+        ctx (Context | None): Context object, used to generate the summary.
+        chat_history (list[dict[str, Any]] | None): Chat history at the end of the stream, with the tool results of the turn.
     """
     # Add logging for parallel attributes
     if hasattr(response_message, "is_parallel") and response_message.is_parallel:
@@ -571,6 +771,16 @@ def update_conversation_after_turn(
     # Create the message, ensuring parallel attributes are passed through
     message_crud.create_message(session, response_message)
 
+    # The variants of a parallel response share the turn, its tool results, description,
+    # search index and summary are updated by the first one
+    if response_message.is_parallel and response_message.parallel_variant != 1:
+        return
+
+    if chat_history:
+        save_tool_results(
+            session, conversation_id, user_id, response_message.position, chat_history
+        )
+
     # Update conversation description with final message
     conversation = conversation_crud.get_conversation(session, conversation_id, user_id)
     new_conversation = UpdateConversationRequest(
@@ -579,6 +789,54 @@ def update_conversation_after_turn(
     )
     conversation_crud.update_conversation(session, conversation, new_conversation)
 
+    index_conversation_turn(
+        session, conversation, response_message, bool(previous_response_message_ids)
+    )
+
+    if ctx:
+        schedule_conversation_summary(session, conversation_id, ctx)
+
+
+def index_conversation_turn(
+    session: DBSessionDep,
+    conversation: Conversation,
+    response_message: Message,
+    regenerated: bool = False,
+) -> None:
+    """
+    Adds the user message and the response of a turn to the conversation search index.
+    A regenerated response replaces messages, so the conversation is reindexed. Indexing
+    errors are logged, they never fail the turn.
+
+    Args:
+        session (DBSessionDep): Database session.
+        conversation (Conversation): Conversation object.
+        response_message (Message): Response message object.
+        regenerated (bool): Whether the response replaces previous responses.
+    """
+    conversation_id = conversation.id
+    try:
+        if regenerated:
+            conversation_search_crud.reindex_conversation(session, conversation)
+            return
+
+        texts = [
+            message.text
+            for message in conversation.messages
+            if message.position == response_message.position
+            and message.agent == MessageAgent.USER
+            and message.is_active
+        ]
+        texts.append(response_message.text)
+        conversation_search_crud.index_conversation_messages(
+            session, conversation, texts
+        )
+    except Exception as e:
+        # The crud functions roll back the failed transaction
+        logging.getLogger(__name__).error(
+            f"Failed to index conversation {conversation_id} for search: {e}"
+        )
+
 
 def save_tool_calls_message(
     session: DBSessionDep,
@@ -587,6 +845,7 @@ def save_tool_calls_message(
     user_id: str,
     position: int,
     conversation_id: str,
+    response_message: Message | None = None,
 ) -> None:
     """
     Save tool calls to the database.
@@ -596,8 +855,9 @@ def save_tool_calls_message(
         tool_calls (List[ToolCall]): List of ToolCall objects.
         message (str): Message text.
         position (int): Message position.
+        response_message (Message | None): Response message of the tool calls, a parallel
+            variant tags its tool call messages with its parallel attributes.
     """
-    # Save message to the database
     message = create_message(
         session,
         chat_request=None,
@@ -607,8 +867,15 @@ def save_tool_calls_message(
         text=text,
         tool_plan=text,
         agent=MessageAgent.CHATBOT,
-        should_store=True,
+        should_store=False,
     )
+    if response_message is not None and response_message.is_parallel:
+        message.is_parallel = True
+        message.parallel_group_id = response_message.parallel_group_id
+        message.parallel_variant = response_message.parallel_variant
+
+    # Save message to the database
+    message = message_crud.create_message(session, message)
 
     # Save tool calls to the database
     for tool_call in tool_calls:
@@ -691,6 +958,10 @@ async def generate_chat_stream(
     """
     Generate chat stream from model deployment stream.
 
+    When the client disconnects, the model deployment stream is closed so no more model or tool
+    work is done for it, and the partial message is saved if
+    chat.persist_partial_message_on_disconnect is set.
+
     Args:
         session (DBSessionDep): Database session.
         model_deployment_stream (AsyncGenerator[Any, Any]): Model deployment stream.
@@ -724,33 +995,62 @@ async def generate_chat_stream(
     document_ids_to_document = {}
 
     stream_event = None
-    async for event in model_deployment_stream:
-        (
-            stream_event,
-            stream_end_data,
-            response_message,
-            document_ids_to_document,
-        ) = handle_stream_event(
-            event,
-            conversation_id,
-            stream_end_data,
-            response_message,
-            ctx,
-            document_ids_to_document,
-            session=session,
-            should_store=should_store,
-            user_id=user_id,
-            next_message_position=kwargs.get("next_message_position", 0),
-        )
+    try:
+        async for event in model_deployment_stream:
+            (
+                stream_event,
+                stream_end_data,
+                response_message,
+                document_ids_to_document,
+            ) = handle_stream_event(
+                event,
+                conversation_id,
+                stream_end_data,
+                response_message,
+                ctx,
+                document_ids_to_document,
+                session=session,
+                should_store=should_store,
+                user_id=user_id,
+                next_message_position=kwargs.get("next_message_position", 0),
+            )
 
-        yield json.dumps(
-            jsonable_encoder(
+            response_event = jsonable_encoder(
                 ChatResponseEvent(
                     event=stream_event.event_type.value,
                     data=stream_event,
                 )
             )
+            # Tag the events of parallel variants, which are multiplexed in one stream
+            if getattr(response_message, "is_parallel", False):
+                response_event["parallel_variant"] = response_message.parallel_variant
+
+            yield json.dumps(response_event)
+    except (asyncio.CancelledError, GeneratorExit):
+        # The SSE response is cancelled or closed when the client disconnects
+        ctx.get_logger().info(
+            event="[Chat] Client disconnected, closing the chat stream",
+            conversation_id=conversation_id,
         )
+        # Closing the chat stream stops the model stream and the running tool calls
+        await model_deployment_stream.aclose()
+
+        if (
+            should_store
+            and stream_end_data["text"]
+            and Settings().get("chat.persist_partial_message_on_disconnect")
+        ):
+            update_conversation_after_turn(
+                session,
+                response_message,
+                conversation_id,
+                stream_end_data["text"],
+                user_id,
+                kwargs.get("previous_response_message_ids"),
+                ctx,
+                stream_end_data.get("chat_history"),
+            )
+        raise
 
     if should_store:
         update_conversation_after_turn(
@@ -760,9 +1060,80 @@ async def generate_chat_stream(
             stream_end_data["text"],
             user_id,
             kwargs.get("previous_response_message_ids"),
+            ctx,
+            stream_end_data.get("chat_history"),
         )
 
 
+async def close_session_after_stream(
+    stream: AsyncGenerator[str, None], session: DBSessionDep
+) -> AsyncGenerator[str, None]:
+    """
+    Close the session of a chat stream once the stream ends or is closed, e.g. the session
+    of its own of a parallel variant.
+
+    Args:
+        stream (AsyncGenerator[str, None]): Chat stream, e.g. from generate_chat_stream.
+        session (DBSessionDep): Database session of the stream.
+
+    Yields:
+        str: Chat response event.
+    """
+    try:
+        async for data in stream:
+            yield data
+    finally:
+        session.close()
+
+
+async def multiplex_chat_streams(
+    streams: list[AsyncGenerator[str, None]],
+    ctx: Context = Context(),
+) -> AsyncGenerator[str, None]:
+    """
+    Run chat streams concurrently and yield their events in the order they are generated.
+
+    Closing the multiplexed stream, e.g. when the client disconnects, cancels all the streams.
+
+    Args:
+        streams (list[AsyncGenerator[str, None]]): Chat streams, e.g. from generate_chat_stream.
+        ctx (Context): Context object.
+
+    Yields:
+        str: Chat response event.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    stream_done = object()
+
+    async def consume(stream: AsyncGenerator[str, None]) -> None:
+        try:
+            async for data in stream:
+                queue.put_nowait(data)
+        finally:
+            queue.put_nowait(stream_done)
+
+    tasks = [asyncio.create_task(consume(stream)) for stream in streams]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            data = await queue.get()
+            if data is stream_done:
+                remaining -= 1
+                continue
+            yield data
+    finally:
+        for task in tasks:
+            task.cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for result in results:
+            # A failed stream does not stop the other ones
+            if isinstance(result, Exception):
+                ctx.get_logger().error(
+                    event="[Chat] Error in multiplexed chat stream",
+                    error=str(result),
+                )
+
+
 def handle_stream_event(
     event: dict[str, Any],
     conversation_id: str,
@@ -785,6 +1156,7 @@ def handle_stream_event(
         StreamEvent.TOOL_CALLS_GENERATION: handle_stream_tool_calls_generation,
         StreamEvent.CITATION_GENERATION: handle_stream_citation_generation,
         StreamEvent.TOOL_CALLS_CHUNK: handle_stream_tool_calls_chunk,
+        StreamEvent.TOOL_RESULT: handle_stream_tool_result,
         StreamEvent.STREAM_END: handle_stream_end,
     }
     event_type = event["event_type"]
@@ -943,6 +1315,7 @@ def handle_stream_tool_calls_generation(
             user_id,
             next_message_position,
             conversation_id,
+            response_message,
         )
 
     return stream_event, stream_end_data, response_message, document_ids_to_document
@@ -1000,6 +1373,19 @@ def handle_stream_tool_calls_chunk(
     return stream_event, stream_end_data, response_message, document_ids_to_document
 
 
+def handle_stream_tool_result(
+    event: dict[str, Any],
+    _: str,
+    stream_end_data: dict[str, Any],
+    response_message: Message,
+    document_ids_to_document: dict[str, Document],
+    **kwargs: Any,
+) -> tuple[StreamToolResult, dict[str, Any], Message, dict[str, Document]]:
+    # The tool results are already part of the chat history sent at stream end
+    stream_event = StreamToolResult.model_validate(event)
+    return stream_event, stream_end_data, response_message, document_ids_to_document
+
+
 def handle_stream_end(
     event: dict[str, Any],
     _: str,
@@ -1027,17 +1413,17 @@ def handle_stream_end(
 
 
 def are_previous_actions_similar(
-    distances: List[float], threshold: float, lookback: int
+    distances: Sequence[float], threshold: float, lookback: int
 ) -> bool:
-    return all(dist > threshold for dist in distances[-lookback:])
+    return all(dist > threshold for dist in list(distances)[-lookback:])
 
 
-def check_similarity(distances: list[float], ctx: Context) -> bool:
+def check_similarity(distances: Sequence[float], ctx: Context) -> bool:
     """
     Check if the previous actions are similar to detect a potential death loop.
 
     Args:
-        distances (list[float]): List of distances between previous actions.
+        distances (Sequence[float]): Distances between previous actions.
 
     Raises:
         HTTPException: If a potential death loop is detected.
@@ -1053,7 +1439,7 @@ def check_similarity(distances: list[float], ctx: Context) -> bool:
             if are_previous_actions_similar(distances, threshold, lookback):
                 logger.warning(
                     event="[Chat] Potential death loop detected",
-                    distances=distances,
+                    distances=list(distances),
                     threshold=threshold,
                     lookback=lookback,
                 )
@@ -1062,6 +1448,24 @@ def check_similarity(distances: list[float], ctx: Context) -> bool:
     return False
 
 
+def create_event_state() -> EventState:
+    """
+    Create the death loop detection state for a single chat request.
+
+    Only the distances needed by the largest lookback are kept, so the state has a fixed size
+    however many tool steps the request runs.
+
+    Returns:
+        EventState: Empty event state.
+    """
+    return EventState(
+        distances_plans=deque(maxlen=max(LOOKBACKS)),
+        distances_actions=deque(maxlen=max(LOOKBACKS)),
+        previous_plan="",
+        previous_action="",
+    )
+
+
 def check_death_loop(
     event: Dict[str, Any], event_state: EventState, ctx: Context
 ) -> EventState:
@@ -4,6 +4,7 @@ from typing import Optional
 from fastapi import HTTPException
 
 from backend.chat.custom.custom import CustomChat
+from backend.config.settings import Settings
 from backend.crud import conversation as conversation_crud
 from backend.database_models import Message as MessageModel
 from backend.database_models.conversation import Conversation as ConversationModel
@@ -17,6 +18,8 @@ from backend.schemas.conversation import Conversation
 from backend.schemas.message import Message
 from backend.services.chat import create_message, generate_chat_response
 from backend.services.file import attach_conversation_id_to_files, get_file_service
+from backend.services.rerank import get_reranker
+from backend.services.response_cache import cached_chat_stream
 
 DEFAULT_TITLE = "New Conversation"
 GENERATE_TITLE_PROMPT = """# TASK
@@ -157,60 +160,48 @@ def get_documents_to_rerank(conversations: list[Conversation]) -> list[str]:
 
         document = f"Title: {conversation.title}\n"
         if len(chatlog.strip()) != 0:
-            document += "\nChatlog:\n{chatlog}"
+            document += f"\nChatlog:\n{chatlog}"
 
         rerank_documents.append(document)
 
     return rerank_documents
 
 
-async def filter_conversations(
+async def rerank_conversations(
     query: str,
     conversations: list[Conversation],
-    rerank_documents: list[str],
     model_deployment: BaseDeployment,
     ctx: Context,
 ) -> list[Conversation]:
-    """Filter conversations based on the rerank score
+    """Reorder the best conversation search matches with the rerank, set in
+    chat.conversation_search_rerank_top_k. The other matches keep their order.
 
     Args:
-        query (str): The query to filter conversations
-        conversations (list[Conversation]): List of conversations
-        rerank_documents (list[str]): List of documents to rerank
+        query (str): The search query
+        conversations (list[Conversation]): Conversations matching the query, best first
         model_deployment: Model deployment object
         ctx (Context): Context object
 
     Returns:
-        list[Conversation]: List of filtered conversations
+        list[Conversation]: List of reordered conversations
     """
-    # if rerank is not enabled, filter out conversations that don't contain the query
-    if not model_deployment.rerank_enabled():
-        filtered_conversations = []
+    top_k = Settings().get("chat.conversation_search_rerank_top_k") or 0
+    reranker = get_reranker(model_deployment)
+    if top_k <= 0 or reranker is None:
+        return conversations
 
-        for rerank_document, conversation in zip(rerank_documents, conversations):
-            if query.lower() in rerank_document.lower():
-                filtered_conversations.append(conversation)
-
-        return filtered_conversations
-
-    # Rerank documents
-    res = await model_deployment.invoke_rerank(
+    top_conversations = conversations[:top_k]
+    res = await reranker.invoke_rerank(
         query=query,
-        documents=rerank_documents,
+        documents=get_documents_to_rerank(top_conversations),
         ctx=ctx,
     )
 
     # Sort conversations by rerank score
     res["results"].sort(key=lambda x: x["relevance_score"], reverse=True)
+    reranked_conversations = [top_conversations[r["index"]] for r in res["results"]]
 
-    # Filter out conversations with low relevance score
-    reranked_conversations = [
-        conversations[r["index"]]
-        for r in res["results"]
-        if r["relevance_score"] > SEARCH_RELEVANCE_THRESHOLD
-    ]
-
-    return reranked_conversations
+    return reranked_conversations + conversations[top_k:]
 
 
 async def generate_conversation_title(
@@ -243,9 +234,12 @@ async def generate_conversation_title(
     try:
         chatlog = extract_details_from_conversation(conversation)
         prompt = GENERATE_TITLE_PROMPT % chatlog
+        # Sampled at temperature 0, the title of the same chatlog is served from the
+        # response cache
         chat_request = CohereChatRequest(
             message=prompt,
             model=model,
+            temperature=0,
         )
         response_message = create_message(
             session,
@@ -261,12 +255,16 @@ async def generate_conversation_title(
 
         response = await generate_chat_response(
             session,
-            CustomChat().chat(
+            cached_chat_stream(
                 chat_request,
-                session=session,
-                stream=False,
-                agent_id=agent_id,
-                ctx=ctx,
+                CustomChat().chat(
+                    chat_request,
+                    session=session,
+                    stream=False,
+                    agent_id=agent_id,
+                    ctx=ctx,
+                ),
+                ctx,
             ),
             response_message=response_message,
             conversation_id=None,
@@ -0,0 +1,187 @@
+import asyncio
+from itertools import groupby
+
+from sqlalchemy.orm import Session
+
+from backend.chat.custom.utils import get_deployment
+from backend.config.settings import Settings
+from backend.crud import conversation as conversation_crud
+from backend.database_models.base import CustomFilterQuery
+from backend.database_models.conversation import Conversation
+from backend.database_models.database import DBSessionDep
+from backend.database_models.message import Message
+from backend.schemas.cohere_chat import CohereChatRequest
+from backend.schemas.context import Context
+
+DEFAULT_SUMMARY_WINDOW = 4
+SUMMARY_PROMPT = """# TASK
+Update the summary of a conversation with its new messages. Keep the facts, names, decisions and open questions the rest of the conversation may need. Be concise and respond with just the summary.
+
+## CURRENT SUMMARY
+%s
+
+## START NEW MESSAGES
+%s
+## END NEW MESSAGES
+
+# SUMMARY
+"""
+
+# Conversation ID of each running summary task
+_summary_tasks: dict[str, asyncio.Task] = {}
+
+
+def get_summary_window() -> int:
+    """
+    Get the number of recent turns sent verbatim, set in chat.conversation_summary_window.
+
+    Returns:
+        int: Number of recent turns.
+    """
+    window = Settings().get("chat.conversation_summary_window")
+    return DEFAULT_SUMMARY_WINDOW if window is None else window
+
+
+def get_history_messages(conversation: Conversation) -> list[Message]:
+    """
+    Get the messages of a conversation that are part of its chat history, oldest first.
+    Only the first variant of the parallel responses is part of the history.
+
+    Args:
+        conversation (Conversation): Conversation.
+
+    Returns:
+        list[Message]: Messages.
+    """
+    return sorted(
+        (
+            message
+            for message in conversation.messages
+            if message.is_active
+            and message.text
+            and not (message.is_parallel and message.parallel_variant != 1)
+        ),
+        key=lambda message: (message.position, message.created_at),
+    )
+
+
+def get_turns_to_summarize(
+    conversation: Conversation, window: int
+) -> tuple[list[Message], int]:
+    """
+    Get the messages of the turns that are older than the window and not summarized yet.
+    The user message and the response of a turn share the same position.
+
+    Args:
+        conversation (Conversation): Conversation.
+        window (int): Number of recent turns kept out of the summary.
+
+    Returns:
+        tuple[list[Message], int]: Messages to add to the summary, and the position of the
+            first turn not in the summary once they are added.
+    """
+    summary_position = conversation.summary_position or 0
+    turns = [
+        list(messages)
+        for position, messages in groupby(
+            get_history_messages(conversation), key=lambda message: message.position
+        )
+        if position >= summary_position
+    ]
+    if len(turns) <= window:
+        return [], summary_position
+
+    new_turns = turns[: len(turns) - window]
+    next_summary_position = turns[len(new_turns)][0].position
+    return [message for turn in new_turns for message in turn], next_summary_position
+
+
+async def summarize_conversation(
+    session: DBSessionDep, conversation_id: str, ctx: Context
+) -> str | None:
+    """
+    Add the turns older than the window to the running summary of a conversation. The summary
+    is generated with the chat deployment of the context.
+
+    Args:
+        session (DBSessionDep): Database session.
+        conversation_id (str): Conversation ID.
+        ctx (Context): Context object.
+
+    Returns:
+        str | None: Updated summary, or None if there was nothing new to summarize.
+    """
+    conversation = conversation_crud.get_conversation(
+        session, conversation_id, ctx.get_user_id()
+    )
+    if not conversation:
+        return None
+
+    messages, summary_position = get_turns_to_summarize(
+        conversation, get_summary_window()
+    )
+    if not messages:
+        return None
+
+    chatlog = "\n".join(f"{message.agent}: {message.text}" for message in messages)
+    chat_request = CohereChatRequest(
+        message=SUMMARY_PROMPT % (conversation.summary or "None", chatlog),
+        model=ctx.get_model(),
+    )
+    deployment = get_deployment(ctx.get_deployment_name(), session, ctx)
+
+    summary = ""
+    async for response in deployment.invoke_chat(chat_request, ctx=ctx):
+        summary = response.get("text") or ""
+    if not summary:
+        return None
+
+    conversation_crud.update_conversation_summary(
+        session, conversation, summary.strip(), summary_position
+    )
+    ctx.get_logger().info(
+        event="[Conversation Summary] Summary updated",
+        conversation_id=conversation_id,
+        summarized_messages=len(messages),
+        summary_position=summary_position,
+    )
+    return conversation.summary
+
+
+def schedule_conversation_summary(
+    session: DBSessionDep, conversation_id: str, ctx: Context
+) -> asyncio.Task | None:
+    """
+    Update the summary of a conversation in the background after a turn, if
+    chat.conversation_summary is set. A turn that ends while the summary of its conversation
+    is being updated is added by the next update. The summary is updated with a session of
+    its own, the request session is closed or used by other turns in the meantime.
+
+    Args:
+        session (DBSessionDep): Database session, whose engine the summary uses.
+        conversation_id (str): Conversation ID.
+        ctx (Context): Context object.
+
+    Returns:
+        asyncio.Task | None: Summary task, or None if no summary is updated.
+    """
+    if not Settings().get("chat.conversation_summary") or conversation_id in _summary_tasks:
+        return None
+
+    bind = session.get_bind()
+
+    async def summarize() -> None:
+        try:
+            with Session(bind, query_cls=CustomFilterQuery) as summary_session:
+                await summarize_conversation(summary_session, conversation_id, ctx)
+        except Exception as e:
+            ctx.get_logger().exception(
+                event="[Conversation Summary] Error updating summary",
+                conversation_id=conversation_id,
+                error=str(e),
+            )
+
+    task = asyncio.create_task(summarize())
+    _summary_tasks[conversation_id] = task
+    task.add_done_callback(lambda _: _summary_tasks.pop(conversation_id, None))
+    return task
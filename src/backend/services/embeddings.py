@@ -0,0 +1,325 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import tempfile
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from enum import StrEnum
+from typing import Callable
+
+import numpy as np
+
+from backend.config.settings import Settings
+
+DEFAULT_VECTOR_STORE_PATH = "./vector_stores"
+DEFAULT_HASHING_DIMENSIONS = 512
+MAX_LOADED_ENTRIES = 256
+DEFAULT_EMBED_CACHE_SIZE = 10000
+
+_embedding_stores: dict[str, "EmbeddingStore"] = {}
+_embedding_cache: "EmbeddingCache | None" = None
+
+
+class EmbedInputType(StrEnum):
+    SearchDocument = "search_document"
+    SearchQuery = "search_query"
+
+
+class AsyncEmbedder(ABC):
+    """
+    Embeds texts with one embedding model without blocking the event loop. The documents
+    and the queries can be embedded differently, like the search_document and
+    search_query input types of Cohere.
+    """
+
+    model_name: str
+
+    @abstractmethod
+    async def aembed_documents(self, texts: list[str]) -> np.ndarray:
+        """Returns the embeddings of the texts, one row per text."""
+
+    @abstractmethod
+    async def aembed_query(self, text: str) -> np.ndarray:
+        """Returns the embedding of a query."""
+
+
+class Embedder(AsyncEmbedder):
+    """
+    Embedder that runs synchronously, the async methods run it in a worker thread.
+    """
+
+    @abstractmethod
+    def embed_documents(self, texts: list[str]) -> np.ndarray:
+        """Returns the embeddings of the texts, one row per text."""
+
+    @abstractmethod
+    def embed_query(self, text: str) -> np.ndarray:
+        """Returns the embedding of a query."""
+
+    async def aembed_documents(self, texts: list[str]) -> np.ndarray:
+        """Returns the embeddings of the texts without blocking the event loop."""
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    async def aembed_query(self, text: str) -> np.ndarray:
+        """Returns the embedding of a query without blocking the event loop."""
+        return await asyncio.to_thread(self.embed_query, text)
+
+
+class HashingEmbedder(Embedder):
+    """
+    Deterministic embedder that runs locally: each word is hashed to a signed dimension,
+    and the embedding is the normalized sum, with log scaled word counts so the frequent
+    words do not dominate. Meant for tests and offline benchmarks.
+    """
+
+    def __init__(self, dimensions: int = DEFAULT_HASHING_DIMENSIONS) -> None:
+        self.dimensions = dimensions
+        self.model_name = f"hashing-{dimensions}"
+
+    def embed_documents(self, texts: list[str]) -> np.ndarray:
+        embeddings = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                digest = int.from_bytes(
+                    hashlib.blake2b(word.encode(), digest_size=8).digest(), "little"
+                )
+                sign = 1.0 if digest & 1 else -1.0
+                embeddings[row, (digest >> 1) % self.dimensions] += sign
+
+        embeddings = np.sign(embeddings) * np.log1p(np.abs(embeddings))
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.where(norms == 0, 1, norms)
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return self.embed_documents([text])[0]
+
+
+class EmbeddingStore:
+    """
+    Chunks and embeddings of texts, persisted on disk by content hash, embedding model and
+    chunking. The embeddings are stored as float16 NumPy arrays and memory-mapped when they
+    are loaded, so they are computed once and shared by the workers.
+    """
+
+    def __init__(self, directory: str, max_loaded_entries: int = MAX_LOADED_ENTRIES) -> None:
+        self.directory = directory
+        self.max_loaded_entries = max_loaded_entries
+        self.loaded: OrderedDict[str, tuple[list[str], np.ndarray]] = OrderedDict()
+
+    def get_or_create(
+        self,
+        content: str,
+        embedder: Embedder,
+        split: Callable[[str], list[str]],
+        chunking: str = "default",
+    ) -> tuple[list[str], np.ndarray]:
+        """
+        Get the chunks and embeddings of a text, splitting and embedding it if they are not
+        stored yet.
+
+        Args:
+            content (str): Text.
+            embedder (Embedder): Embedder of the chunks.
+            split (Callable[[str], list[str]]): Splits the text into chunks.
+            chunking (str): Name of the chunking, part of the key with the embedding model.
+
+        Returns:
+            tuple[list[str], np.ndarray]: Chunks, and their embeddings with one row per chunk.
+        """
+        path = self._get_path(content, embedder.model_name, chunking)
+        entry = self._load(path)
+        if entry is not None:
+            return entry
+
+        chunks = [chunk for chunk in split(content) if chunk.strip()]
+        embeddings = embedder.embed_documents(chunks) if chunks else None
+        return self._add(path, chunks, embeddings)
+
+    async def aget_or_create(
+        self,
+        content: str,
+        embedder: AsyncEmbedder,
+        split: Callable[[str], list[str]],
+        chunking: str = "default",
+    ) -> tuple[list[str], np.ndarray]:
+        """
+        Same as get_or_create, embedding the chunks without blocking the event loop.
+        """
+        path = self._get_path(content, embedder.model_name, chunking)
+        entry = self._load(path)
+        if entry is not None:
+            return entry
+
+        chunks = [chunk for chunk in split(content) if chunk.strip()]
+        embeddings = await embedder.aembed_documents(chunks) if chunks else None
+        return self._add(path, chunks, embeddings)
+
+    def _add(
+        self, path: str, chunks: list[str], embeddings: np.ndarray | None
+    ) -> tuple[list[str], np.ndarray]:
+        if embeddings is None:
+            embeddings = np.zeros((0, 0), dtype=np.float16)
+        else:
+            embeddings = np.asarray(embeddings, dtype=np.float16)
+        self._save(path, chunks, embeddings)
+        self._remember(path, (chunks, embeddings))
+        return chunks, embeddings
+
+    def _get_path(self, content: str, model_name: str, chunking: str) -> str:
+        content_hash = hashlib.sha256(content.encode()).hexdigest()
+        return os.path.join(
+            self.directory,
+            _to_directory_name(model_name),
+            _to_directory_name(chunking),
+            content_hash[:2],
+            content_hash,
+        )
+
+    def _load(self, path: str) -> tuple[list[str], np.ndarray] | None:
+        entry = self.loaded.get(path)
+        if entry is not None:
+            self.loaded.move_to_end(path)
+            return entry
+
+        try:
+            with open(f"{path}.json") as f:
+                chunks = json.load(f)
+            # Empty arrays cannot be memory-mapped
+            embeddings = (
+                np.load(f"{path}.npy", mmap_mode="r")
+                if chunks
+                else np.zeros((0, 0), dtype=np.float16)
+            )
+        except (OSError, ValueError):
+            return None
+
+        self._remember(path, (chunks, embeddings))
+        return chunks, embeddings
+
+    def _save(self, path: str, chunks: list[str], embeddings: np.ndarray) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written to temporary files first, so other workers never read a partial entry.
+        # The chunks are written last, they mark the entry as complete
+        _write_atomically(f"{path}.npy", lambda f: np.save(f, embeddings))
+        _write_atomically(f"{path}.json", lambda f: f.write(json.dumps(chunks).encode()))
+
+    def _remember(self, path: str, entry: tuple[list[str], np.ndarray]) -> None:
+        self.loaded[path] = entry
+        self.loaded.move_to_end(path)
+        while len(self.loaded) > self.max_loaded_entries:
+            self.loaded.popitem(last=False)
+
+
+def get_embedding_store(name: str) -> EmbeddingStore:
+    """
+    Get the embedding store with a name, kept in a directory of tools.vector_store_path.
+
+    Args:
+        name (str): Name of the store.
+
+    Returns:
+        EmbeddingStore: Embedding store.
+    """
+    path = Settings().get("tools.vector_store_path") or DEFAULT_VECTOR_STORE_PATH
+    directory = os.path.join(path, name)
+    if directory not in _embedding_stores:
+        _embedding_stores[directory] = EmbeddingStore(directory)
+    return _embedding_stores[directory]
+
+
+class EmbeddingCache:
+    """
+    Embeddings of texts by content hash, embedding model and input type, kept in memory up
+    to max_size embeddings. The least recently used embeddings are evicted first.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_EMBED_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self.entries: OrderedDict[str, np.ndarray] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, model: str, input_type: str, text: str) -> np.ndarray | None:
+        key = self._get_key(model, input_type, text)
+        embedding = self.entries.get(key)
+        if embedding is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return embedding
+
+    def set(self, model: str, input_type: str, text: str, embedding: np.ndarray) -> None:
+        key = self._get_key(model, input_type, text)
+        self.entries[key] = embedding
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def _get_key(self, model: str, input_type: str, text: str) -> str:
+        content_hash = hashlib.sha256(text.encode()).hexdigest()
+        return f"{model}:{input_type}:{content_hash}"
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """
+    Get the embedding cache of the process, holding up to deployments.embed_cache_size
+    embeddings.
+
+    Returns:
+        EmbeddingCache: Embedding cache.
+    """
+    global _embedding_cache
+
+    max_size = Settings().get("deployments.embed_cache_size")
+    if max_size is None:
+        max_size = DEFAULT_EMBED_CACHE_SIZE
+    if _embedding_cache is None or _embedding_cache.max_size != max_size:
+        _embedding_cache = EmbeddingCache(max_size)
+    return _embedding_cache
+
+
+def search_embeddings(
+    query_embedding: np.ndarray, embeddings: np.ndarray, top_k: int
+) -> list[tuple[int, float]]:
+    """
+    Get the embeddings most similar to a query by dot product, the cosine similarity of
+    normalized embeddings.
+
+    Args:
+        query_embedding (np.ndarray): Embedding of the query.
+        embeddings (np.ndarray): Embeddings to search, one row per embedding.
+        top_k (int): Number of results.
+
+    Returns:
+        list[tuple[int, float]]: Row and score of the results, best first.
+    """
+    if not len(embeddings) or top_k <= 0:
+        return []
+
+    scores = np.asarray(embeddings, dtype=np.float32) @ np.asarray(
+        query_embedding, dtype=np.float32
+    )
+    top_k = min(top_k, len(scores))
+    rows = np.argpartition(-scores, top_k - 1)[:top_k]
+    rows = rows[np.argsort(-scores[rows])]
+    return [(int(row), float(scores[row])) for row in rows]
+
+
+def _to_directory_name(name: str) -> str:
+    return re.sub(r"[^\w.-]", "_", name)
+
+
+def _write_atomically(path: str, write: Callable) -> None:
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -1,3 +1,5 @@
+import asyncio
+import hashlib
 import io
 
 import pandas as pd
@@ -5,6 +7,7 @@ from docx import Document
 from fastapi import Depends, HTTPException
 from fastapi import UploadFile as FastAPIUploadFile
 from python_calamine.pandas import pandas_monkeypatch
+from sqlalchemy.exc import IntegrityError
 
 import backend.crud.conversation as conversation_crud
 import backend.crud.file as file_crud
@@ -12,15 +15,24 @@ from backend.crud import message as message_crud
 from backend.database_models.conversation import ConversationFileAssociation
 from backend.database_models.database import DBSessionDep
 from backend.database_models.file import File as FileModel
+from backend.database_models.file import SharedFileContent
 from backend.schemas.context import Context
 from backend.schemas.file import ConversationFilePublic, File
 from backend.services import utils
 from backend.services.agent import validate_agent_exists
 from backend.services.context import get_context
+from backend.services.file_storage import (
+    delete_unreferenced_contents,
+    get_content_hash,
+    get_file_storage,
+    iter_file_content,
+    schedule_shared_file_content_collection,
+)
 from backend.services.logger.utils import LoggerFactory
 
 MAX_FILE_SIZE = 20_000_000  # 20MB
 MAX_TOTAL_FILE_SIZE = 1_000_000_000  # 1GB
+UPLOAD_CHUNK_SIZE = 1_000_000  # 1MB
 
 PDF_EXTENSION = "pdf"
 TEXT_EXTENSION = "txt"
@@ -60,7 +72,8 @@ class FileService:
     FileService class
 
     This class manages interfacing with different file storage solutions,
-    currently supports storing files in PostgreSQL.
+    the text of the files is stored in PostgreSQL or in the file storage set in
+    file_storage.backend.
     """
 
     async def create_conversation_files(
@@ -171,14 +184,14 @@ class FileService:
             ctx (Context): Context object
 
         Returns:
-            list[File]: The files that were created
+            list[File]: The files, without their content
         """
         file_ids = self.get_file_ids_by_agent_id(session, user_id, agent_id, ctx)
 
         if not file_ids:
             return []
 
-        return file_crud.get_files_by_ids(session, file_ids, user_id)
+        return file_crud.get_files_metadata_by_ids(session, file_ids, user_id)
 
     def get_files_by_conversation_id(
         self, session: DBSessionDep, user_id: str, conversation_id: str, ctx: Context
@@ -206,10 +219,33 @@ class FileService:
 
         files = []
         if file_ids is not None:
-            files = file_crud.get_files_by_ids(session, file_ids, user_id)
+            files = file_crud.get_files_metadata_by_ids(session, file_ids, user_id)
 
         return files
 
+    def get_files_by_conversation_ids(
+        self,
+        session: DBSessionDep,
+        user_id: str,
+        conversation_ids: list[str],
+        ctx: Context,
+    ) -> dict[str, list[FileModel]]:
+        """
+        Get the files of several conversations at once, e.g. for a page of conversations.
+        Only their metadata is loaded, not their content.
+
+        Args:
+            session (DBSessionDep): The database session
+            user_id (str): The user ID
+            conversation_ids (list[str]): IDs of conversations of the user
+
+        Returns:
+            dict[str, list[File]]: The files of each conversation, by conversation ID
+        """
+        return file_crud.get_files_by_conversation_ids(
+            session, conversation_ids, user_id
+        )
+
     def delete_conversation_file_by_id(
         self,
         session: DBSessionDep,
@@ -231,7 +267,7 @@ class FileService:
             session, conversation_id, file_id, user_id
         )
 
-        file_crud.delete_file(session, file_id, user_id)
+        delete_files(session, [file_id], user_id)
 
         return
 
@@ -252,7 +288,7 @@ class FileService:
             file_id (str): The file ID
             user_id (str): The user ID
         """
-        file_crud.delete_file(session, file_id, user_id)
+        delete_files(session, [file_id], user_id)
 
         return
 
@@ -279,7 +315,7 @@ class FileService:
         logger.info(
                 event=f"Deleting conversation {conversation_id} files from DB."
             )
-        file_crud.bulk_delete_files(session, file_ids, user_id)
+        delete_files(session, file_ids, user_id)
 
     def get_files_by_message_id(
         self, session: DBSessionDep, message_id: str, user_id: str, ctx: Context
@@ -298,7 +334,7 @@ class FileService:
         message = message_crud.get_message(session, message_id, user_id)
         files = []
         if message.file_ids is not None:
-            files = file_crud.get_files_by_ids(session, message.file_ids, user_id)
+            files = file_crud.get_files_metadata_by_ids(session, message.file_ids, user_id)
 
         return files
 
@@ -316,12 +352,12 @@ def validate_file(
         user_id (str): User ID
 
     Returns:
-        File: File object
+        File: File object, without its content
 
     Raises:
         HTTPException: If the file is not found
     """
-    file = file_crud.get_file(session, file_id, user_id)
+    file = file_crud.get_file_metadata(session, file_id, user_id)
 
     if not file:
         raise HTTPException(
@@ -338,7 +374,7 @@ async def insert_files_in_db(
     user_id: str,
 ) -> list[File]:
     """
-    Insert files into the database
+    Insert files into the database, sharing the text of the contents uploaded before
 
     Args:
         session (DBSessionDep): The database session
@@ -349,24 +385,172 @@ async def insert_files_in_db(
         list[File]: The files that were created
     """
     files_to_upload = []
-    for file in files:
-        content = await get_file_content(file)
-        cleaned_content = content.replace("\x00", "")
-        filename = file.filename.encode("ascii", "ignore").decode("utf-8")
-
-        files_to_upload.append(
-            FileModel(
-                file_name=filename,
-                file_size=file.size,
-                file_content=cleaned_content,
-                user_id=user_id,
+    try:
+        for file in files:
+            filename = file.filename.encode("ascii", "ignore").decode("utf-8")
+            file_contents, upload_hash = await read_upload(file)
+            shared_content = await get_shared_file_content(
+                session, file.filename, file_contents, upload_hash
             )
+
+            files_to_upload.append(
+                FileModel(
+                    file_name=filename,
+                    file_size=file.size,
+                    file_content="",
+                    content_hash=shared_content.content_hash,
+                    shared_content_id=shared_content.id,
+                    user_id=user_id,
+                )
+            )
+
+        uploaded_files = file_crud.batch_create_files(session, files_to_upload)
+    except Exception:
+        # The references taken for the files that aren't created are released
+        if not session.is_active:
+            session.rollback()
+        file_crud.release_shared_file_contents(
+            session, [file.shared_content_id for file in files_to_upload]
         )
+        schedule_shared_file_content_collection(session)
+        raise
 
-    uploaded_files = file_crud.batch_create_files(session, files_to_upload)
     return uploaded_files
 
 
+async def read_upload(file: FastAPIUploadFile) -> tuple[bytes, str]:
+    """
+    Read an uploaded file, hashing it while it's streamed
+
+    Args:
+        file (FastAPIUploadFile): The uploaded file
+
+    Returns:
+        tuple[bytes, str]: The file contents, and the upload hash of the file: the
+            SHA-256 hash of its contents, prefixed with the extension they're parsed with
+    """
+    file_hash = hashlib.sha256()
+    chunks = []
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        file_hash.update(chunk)
+        chunks.append(chunk)
+
+    upload_hash = f"{get_file_extension(file.filename)}:{file_hash.hexdigest()}"
+    return b"".join(chunks), upload_hash
+
+
+async def get_shared_file_content(
+    session: DBSessionDep, file_name: str, file_contents: bytes, upload_hash: str
+) -> SharedFileContent:
+    """
+    Get the shared content of an upload, with a new reference to it. The contents
+    uploaded before are not parsed nor stored again, otherwise their text is extracted
+    and kept in the file storage if there's one, or in the database.
+
+    Args:
+        session (DBSessionDep): The database session
+        file_name (str): The name of the uploaded file
+        file_contents (bytes): The uploaded file contents
+        upload_hash (str): The upload hash of the file
+
+    Returns:
+        SharedFileContent: The shared content of the upload
+    """
+    shared_content = file_crud.acquire_shared_file_content(session, upload_hash)
+    if shared_content is not None:
+        return shared_content
+
+    content = parse_file_content(file_name, file_contents)
+    cleaned_content = content.replace("\x00", "")
+    text = cleaned_content
+    storage_key = None
+    content_hash = get_content_hash(cleaned_content)
+    file_storage = get_file_storage()
+    if file_storage is not None:
+        # Locked until the shared content is created, so the text isn't deleted before
+        storage_key = file_storage.get_storage_key(content_hash)
+        file_crud.lock_storage_keys(session, [storage_key])
+        await asyncio.to_thread(file_storage.put, cleaned_content)
+        text = ""
+
+    try:
+        return file_crud.create_shared_file_content(
+            session,
+            SharedFileContent(
+                upload_hash=upload_hash,
+                content_hash=content_hash,
+                storage_key=storage_key,
+                text=text,
+                ref_count=1,
+            ),
+        )
+    except IntegrityError:
+        # The same content was uploaded concurrently, and its shared content created first
+        session.rollback()
+        shared_content = file_crud.acquire_shared_file_content(session, upload_hash)
+        if shared_content is None:
+            raise
+        return shared_content
+
+
+def delete_files(session: DBSessionDep, file_ids: list[str], user_id: str) -> None:
+    """
+    Delete files, releasing their shared content. The contents no file refers to anymore
+    are deleted in the background, with their stored text.
+
+    Args:
+        session (DBSessionDep): The database session
+        file_ids (list[str]): The file IDs
+        user_id (str): The user ID
+    """
+    files = file_crud.get_files_metadata_by_ids(session, file_ids, user_id)
+    # Files uploaded before the contents were shared keep their own stored text
+    storage_keys = [file.storage_key for file in files]
+    shared_content_ids = [
+        file.shared_content_id for file in files if file.shared_content_id
+    ]
+
+    file_crud.bulk_delete_files(session, file_ids, user_id)
+    delete_unreferenced_contents(session, storage_keys)
+    if shared_content_ids:
+        file_crud.release_shared_file_contents(session, shared_content_ids)
+        schedule_shared_file_content_collection(session)
+
+
+def get_file_preview(
+    session: DBSessionDep, file: FileModel, num_words: int
+) -> tuple[int, str]:
+    """
+    Get the word count and the first words of a file, streaming its content so a large
+    document is never loaded whole
+
+    Args:
+        session (DBSessionDep): The database session
+        file (FileModel): The file
+        num_words (int): The number of words of the preview
+
+    Returns:
+        tuple[int, str]: The word count and the preview
+    """
+    word_count = 0
+    preview_words = []
+    # Part of a word cut at the end of the previous chunk
+    carry = ""
+    for chunk in iter_file_content(session, file):
+        text = carry + chunk
+        words = text.split()
+        carry = words.pop() if words and not text[-1].isspace() else ""
+
+        word_count += len(words)
+        preview_words.extend(words[: num_words - len(preview_words)])
+
+    if carry:
+        word_count += 1
+        preview_words.extend([carry][: num_words - len(preview_words)])
+
+    return word_count, " ".join(preview_words)
+
+
 def attach_conversation_id_to_files(
     conversation_id: str, files: list[FileModel]
 ) -> list[ConversationFilePublic]:
@@ -457,7 +641,23 @@ async def get_file_content(file: FastAPIUploadFile) -> str:
         ValueError: If the file extension is not supported
     """
     file_contents = await file.read()
-    file_extension = get_file_extension(file.filename)
+    return parse_file_content(file.filename, file_contents)
+
+
+def parse_file_content(file_name: str, file_contents: bytes) -> str:
+    """Extracts the text of file contents based on the file extension
+
+    Args:
+        file_name (str): The file name
+        file_contents (bytes): The file contents
+
+    Returns:
+        str: The text of the file
+
+    Raises:
+        ValueError: If the file extension is not supported
+    """
+    file_extension = get_file_extension(file_name)
 
     if file_extension == PDF_EXTENSION:
         return utils.read_pdf(file_contents)
@@ -0,0 +1,157 @@
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Any
+
+import numpy as np
+
+from backend.config.settings import Settings
+from backend.database_models.file import File
+from backend.model_deployments.base import BaseDeployment
+from backend.schemas.context import Context
+from backend.services.embeddings import (
+    AsyncEmbedder,
+    EmbedInputType,
+    HashingEmbedder,
+    get_embedding_store,
+)
+from backend.services.file_storage import aread_file_content
+from backend.services.vector_index import VectorIndex, VectorIndexMode
+
+MAX_FILE_CHUNK_INDEXES = 64
+FILE_CHUNKING = "words-100-300"
+
+# Chunk indexes of the searched files by content, embedding model and index mode
+_file_chunk_indexes: OrderedDict[str, "FileChunkIndex"] = OrderedDict()
+
+
+class DeploymentEmbedder(AsyncEmbedder):
+    """
+    Embeds texts with the invoke_embed of a model deployment, batched and cached.
+    """
+
+    def __init__(self, deployment: BaseDeployment, ctx: Context) -> None:
+        self.deployment = deployment
+        self.ctx = ctx
+        self.model_name = deployment.embed_model() or deployment.id()
+
+    async def aembed_documents(self, texts: list[str]) -> np.ndarray:
+        return await self.deployment.invoke_embed(
+            texts, self.ctx, EmbedInputType.SearchDocument
+        )
+
+    async def aembed_query(self, text: str) -> np.ndarray:
+        embeddings = await self.deployment.invoke_embed(
+            [text], self.ctx, EmbedInputType.SearchQuery
+        )
+        return embeddings[0]
+
+
+class FileChunkIndex:
+    """
+    Chunks of a file and the vector index of their embeddings.
+    """
+
+    def __init__(self, chunks: list[str], embeddings: np.ndarray, mode: str) -> None:
+        self.chunks = chunks
+        self.index = VectorIndex(embeddings, mode)
+
+
+def get_file_embedder(
+    deployment: BaseDeployment | None, ctx: Context
+) -> AsyncEmbedder:
+    """
+    Get the embedder of the file chunks: the model deployment if it supports embeddings,
+    else the local hashing embedder.
+
+    Args:
+        deployment (BaseDeployment | None): Model deployment of the chat.
+        ctx (Context): Context.
+
+    Returns:
+        AsyncEmbedder: Embedder.
+    """
+    if deployment is not None and deployment.embed_enabled():
+        return DeploymentEmbedder(deployment, ctx)
+    return HashingEmbedder()
+
+
+async def get_file_chunk_index(
+    content: str, embedder: AsyncEmbedder, mode: str = VectorIndexMode.Flat
+) -> FileChunkIndex:
+    """
+    Get the chunk index of a file content. The chunk embeddings are computed once and
+    persisted in the files embedding store, and the indexes of the last searched files are
+    kept in memory.
+
+    Args:
+        content (str): Content of the file.
+        embedder (AsyncEmbedder): Embedder of the chunks.
+        mode (str): Index mode, flat, ivf or hnsw.
+
+    Returns:
+        FileChunkIndex: Chunk index of the file.
+    """
+    content_hash = hashlib.sha256(content.encode()).hexdigest()
+    key = f"{embedder.model_name}:{mode}:{content_hash}"
+    file_chunk_index = _file_chunk_indexes.get(key)
+    if file_chunk_index is not None:
+        _file_chunk_indexes.move_to_end(key)
+        return file_chunk_index
+
+    chunks, embeddings = await get_embedding_store("files").aget_or_create(
+        content, embedder, _split, chunking=FILE_CHUNKING
+    )
+    # Building the ivf and hnsw indexes is CPU bound, off the event loop
+    file_chunk_index = await asyncio.to_thread(FileChunkIndex, chunks, embeddings, mode)
+    _file_chunk_indexes[key] = file_chunk_index
+    while len(_file_chunk_indexes) > MAX_FILE_CHUNK_INDEXES:
+        _file_chunk_indexes.popitem(last=False)
+    return file_chunk_index
+
+
+async def search_files(
+    files: list[File], query: str, embedder: AsyncEmbedder, top_k: int
+) -> list[dict[str, Any]]:
+    """
+    Search the chunks of files most similar to a query, with the index mode of
+    tools.file_search_index.
+
+    Args:
+        files (list[File]): Files to search.
+        query (str): Search query.
+        embedder (AsyncEmbedder): Embedder of the chunks and the query.
+        top_k (int): Number of chunks to return.
+
+    Returns:
+        list[dict[str, Any]]: Chunks of the files, most similar first.
+    """
+    mode = Settings().get("tools.file_search_index") or VectorIndexMode.Flat
+    query_embedding = await embedder.aembed_query(query)
+
+    results = []
+    for file in files:
+        file_chunk_index = await get_file_chunk_index(
+            await aread_file_content(file), embedder, mode
+        )
+        for row, score in file_chunk_index.index.search(query_embedding, top_k):
+            results.append(
+                (
+                    score,
+                    {
+                        "text": file_chunk_index.chunks[row],
+                        "title": file.file_name,
+                        "url": file.file_name,
+                    },
+                )
+            )
+
+    results.sort(key=lambda result: result[0], reverse=True)
+    return [result for _, result in results[:top_k]]
+
+
+def _split(content: str) -> list[str]:
+    # Imported here, collate imports the model deployments that import collate
+    from backend.chat.collate import chunk
+
+    return chunk(content, compact_mode=True)
@@ -0,0 +1,441 @@
+import asyncio
+import codecs
+import hashlib
+import io
+import os
+import tempfile
+import zlib
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from enum import StrEnum
+from typing import Callable, Iterable, Iterator
+
+import boto3
+from botocore.exceptions import ClientError
+from sqlalchemy import Connection
+from sqlalchemy.orm import Session
+
+import backend.crud.file as file_crud
+from backend.config.settings import Settings
+from backend.database_models.file import File
+from backend.services.logger.utils import LoggerFactory
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULT_CHUNK_SIZE = 1_000_000
+DEFAULT_COMPRESSION_LEVEL = 3
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+logger = LoggerFactory().get_logger()
+
+_file_storage: "FileStorage | None" = None
+# Running collection of the shared contents no file refers to
+_collection_task: asyncio.Task | None = None
+
+
+class FileStorageBackend(StrEnum):
+    Database = "database"
+    Local = "local"
+    S3 = "s3"
+
+
+@dataclass
+class StoredContent:
+    storage_key: str
+    content_hash: str
+
+
+class FileStorage(ABC):
+    """
+    Content-addressed store of the extracted text of uploaded files. The key of a text is
+    its SHA-256 hash, so storing the same text twice keeps a single copy.
+
+    Texts are compressed with zstd, or zlib if zstandard is not installed. The codec is
+    detected when reading, so both can be read whatever is installed for writing.
+    """
+
+    def __init__(self, compression_level: int = DEFAULT_COMPRESSION_LEVEL) -> None:
+        self.compression_level = compression_level
+
+    def put(self, content: str) -> StoredContent:
+        """
+        Store a text. It's written even if it's already stored, as a concurrent deletion
+        of the unreferenced texts may delete it after it was checked.
+
+        Args:
+            content (str): Text to store.
+
+        Returns:
+            StoredContent: Storage key and hash of the text.
+        """
+        content_hash = get_content_hash(content)
+        storage_key = self.get_storage_key(content_hash)
+        self._write(storage_key, self._compress(content.encode("utf-8")))
+        return StoredContent(storage_key=storage_key, content_hash=content_hash)
+
+    def iter_content(
+        self, storage_key: str, chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> Iterator[str]:
+        """
+        Stream a stored text, decompressed chunk by chunk.
+
+        Args:
+            storage_key (str): Storage key of the text.
+            chunk_size (int): Number of compressed bytes read at a time.
+
+        Yields:
+            str: Chunks of the text.
+        """
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        for data in self._decompress(self._read(storage_key, chunk_size)):
+            text = decoder.decode(data)
+            if text:
+                yield text
+        text = decoder.decode(b"", final=True)
+        if text:
+            yield text
+
+    def read(self, storage_key: str) -> str:
+        """
+        Read a whole stored text.
+
+        Args:
+            storage_key (str): Storage key of the text.
+
+        Returns:
+            str: The text.
+        """
+        return "".join(self.iter_content(storage_key))
+
+    def get_storage_key(self, content_hash: str) -> str:
+        return content_hash
+
+    @abstractmethod
+    def exists(self, storage_key: str) -> bool: ...
+
+    @abstractmethod
+    def delete(self, storage_key: str) -> None: ...
+
+    @abstractmethod
+    def _write(self, storage_key: str, data: bytes) -> None: ...
+
+    @abstractmethod
+    def _read(self, storage_key: str, chunk_size: int) -> Iterator[bytes]: ...
+
+    def _compress(self, data: bytes) -> bytes:
+        if zstandard is not None:
+            return zstandard.ZstdCompressor(level=self.compression_level).compress(data)
+        return zlib.compress(data, self.compression_level)
+
+    @staticmethod
+    def _decompress(chunks: Iterable[bytes]) -> Iterator[bytes]:
+        decompressor = None
+        for chunk in chunks:
+            if decompressor is None:
+                if chunk.startswith(ZSTD_MAGIC):
+                    if zstandard is None:
+                        raise RuntimeError(
+                            "The file is compressed with zstd, install zstandard to read it"
+                        )
+                    decompressor = zstandard.ZstdDecompressor().decompressobj()
+                else:
+                    decompressor = zlib.decompressobj()
+            yield decompressor.decompress(chunk)
+        if decompressor is not None and hasattr(decompressor, "flush"):
+            yield decompressor.flush()
+
+
+class LocalFileStorage(FileStorage):
+    """
+    Stores the texts in a local directory, in subdirectories named after the first
+    characters of their hash.
+    """
+
+    def __init__(
+        self, path: str, compression_level: int = DEFAULT_COMPRESSION_LEVEL
+    ) -> None:
+        super().__init__(compression_level)
+        self.path = path
+
+    def exists(self, storage_key: str) -> bool:
+        return os.path.exists(self._get_path(storage_key))
+
+    def delete(self, storage_key: str) -> None:
+        try:
+            os.remove(self._get_path(storage_key))
+        except FileNotFoundError:
+            pass
+
+    def _write(self, storage_key: str, data: bytes) -> None:
+        path = self._get_path(storage_key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written to a temporary file first, so a text is never read half written
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as file:
+            file.write(data)
+        os.replace(file.name, path)
+
+    def _read(self, storage_key: str, chunk_size: int) -> Iterator[bytes]:
+        with open(self._get_path(storage_key), "rb") as file:
+            while chunk := file.read(chunk_size):
+                yield chunk
+
+    def _get_path(self, storage_key: str) -> str:
+        return os.path.join(self.path, storage_key[:2], storage_key)
+
+
+class S3FileStorage(FileStorage):
+    """
+    Stores the texts in an S3 bucket, or an S3-compatible store like MinIO with an
+    endpoint URL.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        compression_level: int = DEFAULT_COMPRESSION_LEVEL,
+        client=None,
+        **client_kwargs,
+    ) -> None:
+        super().__init__(compression_level)
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = client or boto3.client("s3", **client_kwargs)
+
+    def get_storage_key(self, content_hash: str) -> str:
+        return f"{self.prefix}{content_hash}"
+
+    def exists(self, storage_key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=storage_key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        return True
+
+    def delete(self, storage_key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=storage_key)
+
+    def _write(self, storage_key: str, data: bytes) -> None:
+        self.client.upload_fileobj(io.BytesIO(data), self.bucket, storage_key)
+
+    def _read(self, storage_key: str, chunk_size: int) -> Iterator[bytes]:
+        body = self.client.get_object(Bucket=self.bucket, Key=storage_key)["Body"]
+        try:
+            yield from body.iter_chunks(chunk_size)
+        finally:
+            body.close()
+
+
+def get_content_hash(content: str) -> str:
+    """
+    Get the SHA-256 hash of a text.
+
+    Args:
+        content (str): Text.
+
+    Returns:
+        str: Hex digest of the hash.
+    """
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def get_file_storage() -> FileStorage | None:
+    """
+    Get the file storage set in file_storage.backend, or None if the texts are stored in
+    the database.
+
+    Returns:
+        FileStorage | None: File storage.
+    """
+    global _file_storage
+    if _file_storage is not None:
+        return _file_storage
+
+    settings = Settings().get("file_storage")
+    backend = FileStorageBackend(settings.backend or FileStorageBackend.Database)
+    compression_level = settings.compression_level or DEFAULT_COMPRESSION_LEVEL
+    if backend == FileStorageBackend.Local:
+        _file_storage = LocalFileStorage(settings.local_path, compression_level)
+    elif backend == FileStorageBackend.S3:
+        _file_storage = S3FileStorage(
+            settings.s3_bucket,
+            prefix=settings.s3_prefix or "",
+            compression_level=compression_level,
+            endpoint_url=settings.s3_endpoint_url,
+            region_name=settings.s3_region,
+            aws_access_key_id=settings.s3_access_key,
+            aws_secret_access_key=settings.s3_secret_key,
+        )
+
+    if _file_storage is not None and zstandard is None:
+        logger.warning(
+            event="[File Storage] zstandard is not installed, compressing the files with zlib"
+        )
+    return _file_storage
+
+
+def read_file_content(file: File) -> str:
+    """
+    Read the whole text of a file, from the file storage or the database.
+
+    Args:
+        file (File): File.
+
+    Returns:
+        str: Text of the file.
+    """
+    storage_key, text = _get_content_of(file)
+    if storage_key:
+        return _get_storage_of(file).read(storage_key)
+    return text()
+
+
+async def aread_file_content(file: File) -> str:
+    """
+    Read the whole text of a file without blocking the event loop while it's read from the
+    file storage.
+
+    Args:
+        file (File): File.
+
+    Returns:
+        str: Text of the file.
+    """
+    storage_key, text = _get_content_of(file)
+    if storage_key:
+        return await asyncio.to_thread(_get_storage_of(file).read, storage_key)
+    return text()
+
+
+def iter_file_content(
+    session: Session, file: File, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[str]:
+    """
+    Stream the text of a file, from the file storage or the database, so a large document
+    is never loaded whole.
+
+    Args:
+        session (Session): Database session.
+        file (File): File.
+        chunk_size (int): Size of the chunks read at a time.
+
+    Yields:
+        str: Chunks of the text.
+    """
+    storage_key, _ = _get_content_of(file)
+    if storage_key:
+        yield from _get_storage_of(file).iter_content(storage_key, chunk_size)
+        return
+    yield from file_crud.iter_file_content(session, file.id, file.user_id, chunk_size)
+
+
+def delete_unreferenced_contents(session: Session, storage_keys: list[str]) -> None:
+    """
+    Delete the stored texts no file refers to anymore.
+
+    Args:
+        session (Session): Database session.
+        storage_keys (list[str]): Storage keys of the texts of deleted files.
+    """
+    storage_keys = {storage_key for storage_key in storage_keys if storage_key}
+    if not storage_keys:
+        return
+
+    file_storage = get_file_storage()
+    if file_storage is None:
+        logger.warning(
+            event="[File Storage] No file storage is set, the stored files are not deleted"
+        )
+        return
+
+    # Locked until the commit, so a text isn't deleted while an upload refers to it again
+    file_crud.lock_storage_keys(session, list(storage_keys))
+    try:
+        referenced_keys = file_crud.get_referenced_storage_keys(
+            session, list(storage_keys)
+        )
+        for storage_key in storage_keys - referenced_keys:
+            file_storage.delete(storage_key)
+    finally:
+        session.commit()
+
+
+def collect_shared_file_contents(session: Session) -> None:
+    """
+    Delete the shared contents no file refers to anymore, and their text from the file
+    storage.
+
+    Args:
+        session (Session): Database session.
+    """
+    storage_keys = file_crud.delete_unreferenced_shared_file_contents(session)
+    delete_unreferenced_contents(session, storage_keys)
+
+
+def schedule_shared_file_content_collection(session: Session) -> asyncio.Task | None:
+    """
+    Collect the shared contents no file refers to in the background, with a session of
+    its own, so deleting files doesn't wait for the file storage. The contents released
+    while a collection is running are collected by the next one. Without a running event
+    loop, or if the session is bound to a connection, they're collected right away.
+
+    Args:
+        session (Session): Database session, whose engine the collection uses.
+
+    Returns:
+        asyncio.Task | None: Collection task, or None if they were collected right away.
+    """
+    global _collection_task
+    bind = session.get_bind()
+
+    def collect() -> None:
+        with Session(bind) as collection_session:
+            collect_shared_file_contents(collection_session)
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        collect()
+        return None
+    if isinstance(bind, Connection):
+        # The session is in a transaction of its connection, which can't be shared with
+        # another thread
+        collect()
+        return None
+
+    if _collection_task is not None and not _collection_task.done():
+        return _collection_task
+
+    async def run() -> None:
+        try:
+            await asyncio.to_thread(collect)
+        except Exception as e:
+            logger.exception(
+                event="[File Storage] Error collecting the shared file contents",
+                error=str(e),
+            )
+
+    _collection_task = asyncio.create_task(run())
+    return _collection_task
+
+
+def _get_content_of(file: File) -> tuple[str | None, Callable[[], str]]:
+    # Storage key of the text, or a function reading it from the database
+    shared_content = file.shared_content if file.shared_content_id else None
+    if shared_content is not None:
+        return shared_content.storage_key, lambda: shared_content.text or ""
+    return file.storage_key, lambda: file.file_content or ""
+
+
+def _get_storage_of(file: File) -> FileStorage:
+    file_storage = get_file_storage()
+    if file_storage is None:
+        raise ValueError(
+            f"File {file.id} is in the file storage, but file_storage.backend is not set"
+        )
+    return file_storage
@@ -0,0 +1,213 @@
+import asyncio
+import time
+from abc import ABC, abstractmethod
+
+from fastapi import HTTPException
+
+from backend.config.settings import Settings
+from backend.services.cache import get_client
+
+IDEMPOTENCY_KEY_PREFIX = "idempotency"
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+PENDING_RESPONSE = "pending"
+POLL_INTERVAL_SECONDS = 0.05
+DEFAULT_TTL_SECONDS = 86400
+RESPONSE_TIMEOUT_SECONDS = 300
+
+_in_memory_store: "InMemoryIdempotencyStore | None" = None
+
+
+class IdempotencyStore(ABC):
+    """
+    Stores the value recorded for each Idempotency-Key, e.g. the stream ID or the final response.
+
+    The first request that claims a key owns it; the retries with the same key read its value.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TTL_SECONDS) -> None:
+        self.ttl = ttl
+
+    @abstractmethod
+    async def claim(self, key: str, value: str) -> str | None:
+        """
+        Records the value if the key is new.
+
+        Returns:
+            str | None: Value already recorded for the key, or None if the key was claimed.
+        """
+
+    @abstractmethod
+    async def get(self, key: str) -> str | None:
+        """Returns the value recorded for the key, or None if the key is unknown or expired."""
+
+    @abstractmethod
+    async def set(self, key: str, value: str) -> None:
+        """Replaces the value recorded for the key."""
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        """Forgets the key, so the next request with it is processed again."""
+
+    async def wait(self, key: str, timeout: float) -> str | None:
+        """
+        Waits until the value of the key is no longer pending.
+
+        Args:
+            key (str): Key.
+            timeout (float): Maximum number of seconds to wait.
+
+        Returns:
+            str | None: Final value, or None if the key was deleted or the wait timed out.
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            value = await self.get(key)
+            if value != PENDING_RESPONSE:
+                return value
+            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+        return None
+
+
+class InMemoryIdempotencyStore(IdempotencyStore):
+    """Idempotency keys kept in the memory of the process, retries have to reach the same node."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.values: dict[str, tuple[str, float]] = {}
+
+    async def claim(self, key: str, value: str) -> str | None:
+        existing = await self.get(key)
+        if existing is not None:
+            return existing
+
+        await self.set(key, value)
+        return None
+
+    async def get(self, key: str) -> str | None:
+        self._remove_expired()
+        value = self.values.get(key)
+        return value[0] if value else None
+
+    async def set(self, key: str, value: str) -> None:
+        self.values[key] = (value, time.monotonic() + self.ttl)
+
+    async def delete(self, key: str) -> None:
+        self.values.pop(key, None)
+
+    def _remove_expired(self) -> None:
+        now = time.monotonic()
+        for key in [key for key, (_, expires_at) in self.values.items() if expires_at < now]:
+            del self.values[key]
+
+
+class RedisIdempotencyStore(IdempotencyStore):
+    """Idempotency keys stored in Redis, so retries can reach any node."""
+
+    async def claim(self, key: str, value: str) -> str | None:
+        client = get_client()
+        claimed = await asyncio.to_thread(
+            client.set, key, value, nx=True, ex=int(self.ttl)
+        )
+        if claimed:
+            return None
+        return await self.get(key)
+
+    async def get(self, key: str) -> str | None:
+        client = get_client()
+        return await asyncio.to_thread(client.get, key)
+
+    async def set(self, key: str, value: str) -> None:
+        client = get_client()
+        await asyncio.to_thread(client.set, key, value, ex=int(self.ttl))
+
+    async def delete(self, key: str) -> None:
+        client = get_client()
+        await asyncio.to_thread(client.delete, key)
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    """
+    Get the idempotency store set in chat.idempotency_backend, either memory or redis.
+
+    Returns:
+        IdempotencyStore: Idempotency store.
+    """
+    global _in_memory_store
+
+    ttl = Settings().get("chat.idempotency_ttl") or DEFAULT_TTL_SECONDS
+    if Settings().get("chat.idempotency_backend") == "redis":
+        return RedisIdempotencyStore(ttl)
+
+    if _in_memory_store is None:
+        _in_memory_store = InMemoryIdempotencyStore(ttl)
+    return _in_memory_store
+
+
+def get_idempotency_key(endpoint: str, user_id: str, idempotency_key: str) -> str:
+    """
+    Get the store key of an Idempotency-Key header, the same header value of different users
+    or endpoints does not collide.
+
+    Args:
+        endpoint (str): Endpoint name, e.g. chat-stream.
+        user_id (str): User ID.
+        idempotency_key (str): Value of the Idempotency-Key header.
+
+    Returns:
+        str: Store key.
+
+    Raises:
+        HTTPException: If the Idempotency-Key header is too long.
+    """
+    if len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Idempotency-Key must be at most {IDEMPOTENCY_KEY_MAX_LENGTH} characters.",
+        )
+
+    return f"{IDEMPOTENCY_KEY_PREFIX}:{endpoint}:{user_id}:{idempotency_key}"
+
+
+async def get_or_claim_response(key: str) -> str | None:
+    """
+    Claim an Idempotency-Key for a new response, or get the response of the request that
+    claimed it, waiting while that response is generated.
+
+    Args:
+        key (str): Store key, from get_idempotency_key.
+
+    Returns:
+        str | None: Stored response, or None if the key was claimed and the response has to be generated.
+
+    Raises:
+        HTTPException: If the response of the key is not available in time, or its request failed.
+    """
+    store = get_idempotency_store()
+    response = await store.claim(key, PENDING_RESPONSE)
+    if response == PENDING_RESPONSE:
+        response = await store.wait(key, RESPONSE_TIMEOUT_SECONDS)
+        if response is None:
+            raise HTTPException(
+                status_code=409,
+                detail="The request with this Idempotency-Key is still in progress or failed, retry it later.",
+            )
+
+    return response
+
+
+async def save_response(key: str, response: str | None) -> None:
+    """
+    Store the response of a claimed Idempotency-Key, or release the key when no response
+    should be replayed, e.g. the request failed, was cancelled or ended with an error.
+
+    Args:
+        key (str): Store key, from get_idempotency_key.
+        response (str | None): Response to replay to the retries, or None to let the next
+            retry generate it again.
+    """
+    store = get_idempotency_store()
+    if response is None:
+        await store.delete(key)
+        return
+
+    await store.set(key, response)
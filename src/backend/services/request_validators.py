@@ -13,6 +13,7 @@ from backend.crud import organization as organization_crud
 from backend.database_models.database import DBSessionDep
 from backend.exceptions import DeploymentNotFoundError
 from backend.model_deployments.utils import class_name_validator
+from backend.schemas.cohere_chat import ChatVariant
 from backend.services import deployment as deployment_service
 from backend.services.agent import validate_agent_exists
 from backend.services.auth.utils import get_header_user_id
@@ -154,6 +155,33 @@ def validate_deployment_header(request: Request, session: DBSessionDep):
         _ = deployment_service.get_deployment_definition_by_name(session, deployment_name)
 
 
+def validate_variant_deployments(session: DBSessionDep, variants: list[ChatVariant]):
+    """
+    Validate that the deployments of the variants of a chat with human feedback are
+    available, before any of the variants is generated.
+
+    Args:
+        session (DBSessionDep): The database session
+        variants (list[ChatVariant]): The variants of the response
+
+    Raises:
+        HTTPException: If the deployment of a variant is not available
+        DeploymentNotFoundError: If the deployment of a variant does not exist
+    """
+    for variant in variants:
+        if not variant.deployment:
+            continue
+
+        deployment = deployment_service.get_deployment_definition_by_name(
+            session, variant.deployment
+        )
+        if not deployment.is_available:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Deployment {variant.deployment} is not available.",
+            )
+
+
 async def validate_chat_request(session: DBSessionDep, request: Request):
     """
     Validate that the request has the appropriate values in the body
@@ -164,6 +192,10 @@ async def validate_chat_request(session: DBSessionDep, request: Request):
     Raises:
         HTTPException: If the request does not have the appropriate values in the body
     """
+    # Requests without a body, e.g. resuming a chat stream, have nothing to validate
+    if request.method == "GET":
+        return
+
     # Validate that the agent_id is valid
     body = await request.json()
     user_id = get_header_user_id(request)
@@ -0,0 +1,311 @@
+import asyncio
+import hashlib
+import re
+from collections import OrderedDict
+from dataclasses import dataclass
+from enum import StrEnum
+from typing import Any
+
+import numpy as np
+
+from backend.config.settings import Settings
+from backend.metrics import collector
+from backend.model_deployments.base import BaseDeployment
+from backend.schemas.context import Context
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+TOKEN_PATTERN = re.compile(r"\w+")
+DEFAULT_RERANK_CACHE_SIZE = 10000
+
+_rerank_cache: "RerankCache | None" = None
+
+
+@dataclass
+class RerankCacheStats:
+    calls: int = 0
+    documents: int = 0
+    cached_documents: int = 0
+
+
+rerank_cache_stats = RerankCacheStats()
+
+
+class LocalRerankMethod(StrEnum):
+    BM25 = "bm25"
+    TFIDF = "tfidf"
+
+
+class LocalReranker:
+    """
+    Reranks documents locally by lexical relevance, with the invoke_rerank contract of the
+    deployments. Used for the deployments without rerank.
+
+    The documents are tokenized once into a sparse term matrix held in NumPy arrays, and the
+    query terms are scored with vectorized operations. Scores are normalized between 0 and
+    1 so they can be compared with the relevance thresholds of the rerank models:
+    - bm25: BM25 score divided by the score of a document with every query term.
+    - tfidf: cosine similarity of the TF-IDF vectors of the query and the document.
+    """
+
+    def __init__(self, method: str = LocalRerankMethod.BM25) -> None:
+        self.method = LocalRerankMethod(method)
+
+    @staticmethod
+    def rerank_enabled() -> bool:
+        return True
+
+    async def invoke_rerank(
+        self, query: str, documents: list[str], ctx: Context, **kwargs: Any
+    ) -> Any:
+        # Scoring is CPU bound, run it in a thread so it doesn't block the event loop
+        scores = await asyncio.to_thread(self.score, query, documents)
+        return {
+            "results": [
+                {"index": index, "relevance_score": float(scores[index])}
+                for index in np.argsort(-scores, kind="stable")
+            ]
+        }
+
+    def score(self, query: str, documents: list[str]) -> np.ndarray:
+        """
+        Scores the relevance of documents to a query.
+
+        Args:
+            query (str): Query.
+            documents (list[str]): Documents.
+
+        Returns:
+            np.ndarray: Relevance score of each document, between 0 and 1.
+        """
+        scores = np.zeros(len(documents))
+        query_terms = list(dict.fromkeys(TOKEN_PATTERN.findall(query.lower())))
+        if not documents or not query_terms:
+            return scores
+
+        vocabulary = {term: index for index, term in enumerate(query_terms)}
+        rows, terms, counts, document_lengths = _get_term_matrix(
+            documents, vocabulary, with_all_terms=self.method == LocalRerankMethod.TFIDF
+        )
+        num_query_terms = len(query_terms)
+        document_frequencies = np.bincount(terms, minlength=len(vocabulary))
+        idf = np.log(
+            1 + (len(documents) - document_frequencies + 0.5) / (document_frequencies + 0.5)
+        )
+
+        if self.method == LocalRerankMethod.TFIDF:
+            weights = (1 + np.log(counts)) * idf[terms]
+            norms = np.sqrt(np.bincount(rows, weights**2, minlength=len(documents)))
+            is_query_term = terms < num_query_terms
+            query_weights = idf[:num_query_terms]
+            query_norm = np.linalg.norm(query_weights)
+            if not query_norm:
+                return scores
+            dot_products = np.bincount(
+                rows[is_query_term],
+                weights[is_query_term] * query_weights[terms[is_query_term]],
+                minlength=len(documents),
+            )
+            return np.divide(
+                dot_products,
+                norms * query_norm,
+                out=scores,
+                where=norms > 0,
+            )
+
+        average_length = max(document_lengths.mean(), 1)
+        length_norms = BM25_K1 * (
+            1 - BM25_B + BM25_B * document_lengths[rows] / average_length
+        )
+        term_scores = idf[terms] * counts * (BM25_K1 + 1) / (counts + length_norms)
+        scores = np.bincount(rows, term_scores, minlength=len(documents))
+        max_score = idf.sum() * (BM25_K1 + 1)
+        return np.minimum(scores / max_score, 1) if max_score else scores
+
+
+class RerankCache:
+    """
+    Relevance scores of documents by rerank model, query and document content hash, kept in
+    memory up to max_size scores. The least recently used scores are evicted first.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_RERANK_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self.scores: OrderedDict[str, float] = OrderedDict()
+
+    def get(self, model: str, query: str, document: str) -> float | None:
+        key = self._get_key(model, query, document)
+        score = self.scores.get(key)
+        if score is not None:
+            self.scores.move_to_end(key)
+        return score
+
+    def set(self, model: str, query: str, document: str, score: float) -> None:
+        key = self._get_key(model, query, document)
+        self.scores[key] = score
+        self.scores.move_to_end(key)
+        while len(self.scores) > self.max_size:
+            self.scores.popitem(last=False)
+
+    def _get_key(self, model: str, query: str, document: str) -> str:
+        query_hash = hashlib.sha256(query.encode()).hexdigest()
+        document_hash = hashlib.sha256(document.encode()).hexdigest()
+        return f"{model}:{query_hash}:{document_hash}"
+
+
+class CachedReranker:
+    """
+    Reranks documents with a deployment, reusing the scores of the documents it already
+    reranked for the same query. Only the other documents are sent to the deployment, and
+    the scores are merged back in the order of the documents.
+    """
+
+    def __init__(self, model_deployment: BaseDeployment, cache: RerankCache) -> None:
+        self.model_deployment = model_deployment
+        self.cache = cache
+        self.model = (
+            f"{model_deployment.id()}:{model_deployment.rerank_model() or ''}"
+        )
+
+    @staticmethod
+    def rerank_enabled() -> bool:
+        return True
+
+    async def invoke_rerank(
+        self, query: str, documents: list[str], ctx: Context, **kwargs: Any
+    ) -> Any:
+        scores = [self.cache.get(self.model, query, document) for document in documents]
+        cached_documents = sum(score is not None for score in scores)
+        # Identical documents of the call are sent once
+        missing_documents = list(
+            dict.fromkeys(
+                document
+                for document, score in zip(documents, scores)
+                if score is None
+            )
+        )
+
+        if missing_documents:
+            response = await self.model_deployment.invoke_rerank(
+                query=query, documents=missing_documents, ctx=ctx, **kwargs
+            )
+            if not response:
+                return response
+
+            missing_scores = {}
+            for result in response.get("results", []):
+                document = missing_documents[result["index"]]
+                missing_scores[document] = result["relevance_score"]
+                self.cache.set(self.model, query, document, result["relevance_score"])
+            scores = [
+                missing_scores.get(document) if score is None else score
+                for document, score in zip(documents, scores)
+            ]
+
+        _record(ctx, len(documents), cached_documents)
+        # Documents left out of the response are left out of the results
+        return {
+            "results": [
+                {"index": index, "relevance_score": score}
+                for index, score in enumerate(scores)
+                if score is not None
+            ]
+        }
+
+
+def get_rerank_cache() -> RerankCache:
+    """
+    Get the rerank cache of the process, holding up to chat.rerank_cache_size scores.
+
+    Returns:
+        RerankCache: Rerank cache.
+    """
+    global _rerank_cache
+
+    max_size = Settings().get("chat.rerank_cache_size")
+    if max_size is None:
+        max_size = DEFAULT_RERANK_CACHE_SIZE
+    if _rerank_cache is None or _rerank_cache.max_size != max_size:
+        _rerank_cache = RerankCache(max_size)
+    return _rerank_cache
+
+
+def get_reranker(
+    model_deployment: BaseDeployment,
+) -> BaseDeployment | CachedReranker | LocalReranker | None:
+    """
+    Get the reranker of a deployment: the deployment itself if it supports rerank, through
+    the rerank cache if chat.rerank_cache is enabled, else the local reranker set in
+    chat.local_rerank.
+
+    Args:
+        model_deployment (BaseDeployment): Model deployment.
+
+    Returns:
+        BaseDeployment | CachedReranker | LocalReranker | None: Reranker, or None if the
+            documents can't be reranked.
+    """
+    if model_deployment.rerank_enabled():
+        if Settings().get("chat.rerank_cache"):
+            return CachedReranker(model_deployment, get_rerank_cache())
+        return model_deployment
+
+    # The local scores depend on the other documents of the call, so they are not cached
+    method = Settings().get("chat.local_rerank")
+    if not method:
+        return None
+    return LocalReranker(method)
+
+
+def _record(ctx: Context, documents: int, cached_documents: int) -> None:
+    rerank_cache_stats.calls += 1
+    rerank_cache_stats.documents += documents
+    rerank_cache_stats.cached_documents += cached_documents
+
+    saved_percentage = 100 * cached_documents / documents if documents else 0
+    ctx.get_logger().debug(
+        event="[Rerank Cache] Rerank documents",
+        documents=documents,
+        cached_documents=cached_documents,
+        saved_percentage=saved_percentage,
+    )
+    if Settings().get("metrics.enabled"):
+        collector.add_metric(
+            "cache",
+            "rerank_cache",
+            0,
+            method_params={
+                "documents": documents,
+                "cached_documents": cached_documents,
+                "saved_percentage": saved_percentage,
+            },
+        )
+
+
+def _get_term_matrix(
+    documents: list[str], vocabulary: dict[str, int], with_all_terms: bool
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # Sparse matrix of the term counts of the documents, as row, term and count arrays.
+    # Without all the terms, only the terms already in the vocabulary are counted
+    token_rows = []
+    token_terms = []
+    document_lengths = np.zeros(len(documents))
+    for row, document in enumerate(documents):
+        tokens = TOKEN_PATTERN.findall(document.lower())
+        document_lengths[row] = len(tokens)
+        if with_all_terms:
+            term_ids = [vocabulary.setdefault(token, len(vocabulary)) for token in tokens]
+        else:
+            term_ids = [vocabulary[token] for token in tokens if token in vocabulary]
+        token_terms.extend(term_ids)
+        token_rows.extend([row] * len(term_ids))
+
+    if not token_terms:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0), document_lengths
+
+    keys = np.asarray(token_rows, dtype=np.int64) * len(vocabulary) + np.asarray(
+        token_terms, dtype=np.int64
+    )
+    keys, counts = np.unique(keys, return_counts=True)
+    return keys // len(vocabulary), keys % len(vocabulary), counts, document_lengths
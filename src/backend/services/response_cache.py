@@ -0,0 +1,246 @@
+import asyncio
+import hashlib
+import json
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import aclosing
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator
+
+from fastapi.encoders import jsonable_encoder
+
+from backend.chat.enums import StreamEvent
+from backend.config.settings import Settings
+from backend.metrics import collector
+from backend.schemas.cohere_chat import CohereChatRequest
+from backend.schemas.context import Context
+from backend.services.cache import get_client
+
+RESPONSE_CACHE_KEY_PREFIX = "response_cache"
+DEFAULT_CACHE_SIZE = 1000
+DEFAULT_CACHE_TTL_SECONDS = 3600
+
+_in_memory_cache: "InMemoryResponseCache | None" = None
+
+
+@dataclass
+class ResponseCacheStats:
+    hits: int = 0
+    misses: int = 0
+    bypasses: int = 0
+
+
+response_cache_stats = ResponseCacheStats()
+
+
+class ResponseCache(ABC):
+    """
+    Stores the chat events of a response by request key, bounded by a TTL and a number of
+    least recently used entries.
+    """
+
+    def __init__(
+        self, size: int = DEFAULT_CACHE_SIZE, ttl: float = DEFAULT_CACHE_TTL_SECONDS
+    ) -> None:
+        self.size = size
+        self.ttl = ttl
+
+    @abstractmethod
+    async def get(self, key: str) -> list[dict[str, Any]] | None:
+        """Returns the cached events of the key, or None if they are not cached."""
+
+    @abstractmethod
+    async def set(self, key: str, events: list[dict[str, Any]]) -> None:
+        """Caches the events of the key, evicting the least recently used entries if full."""
+
+
+class InMemoryResponseCache(ResponseCache):
+    """Response cache kept in the memory of the process."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        # The events are kept serialized, so the replayed events can be updated
+        self.entries: OrderedDict[str, tuple[str, float]] = OrderedDict()
+
+    async def get(self, key: str) -> list[dict[str, Any]] | None:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        events, expires_at = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return None
+
+        self.entries.move_to_end(key)
+        return json.loads(events)
+
+    async def set(self, key: str, events: list[dict[str, Any]]) -> None:
+        self.entries[key] = (json.dumps(events), time.monotonic() + self.ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+
+class RedisResponseCache(ResponseCache):
+    """
+    Response cache stored in Redis, shared between nodes. The last access of each entry is kept
+    in a sorted set to evict the least recently used entries.
+    """
+
+    async def get(self, key: str) -> list[dict[str, Any]] | None:
+        client = get_client()
+        events = await asyncio.to_thread(client.get, _entry_key(key))
+        if events is None:
+            return None
+
+        await asyncio.to_thread(client.zadd, _index_key(), {key: time.time()})
+        return json.loads(events)
+
+    async def set(self, key: str, events: list[dict[str, Any]]) -> None:
+        client = get_client()
+        await asyncio.to_thread(
+            client.set, _entry_key(key), json.dumps(events), ex=int(self.ttl)
+        )
+        await asyncio.to_thread(client.zadd, _index_key(), {key: time.time()})
+
+        overflow = await asyncio.to_thread(client.zcard, _index_key()) - self.size
+        if overflow > 0:
+            evicted = await asyncio.to_thread(client.zpopmin, _index_key(), overflow)
+            await asyncio.to_thread(
+                client.delete, *[_entry_key(evicted_key) for evicted_key, _ in evicted]
+            )
+
+
+def get_response_cache() -> ResponseCache:
+    """
+    Get the response cache set in chat.response_cache_backend, either memory or redis.
+
+    Returns:
+        ResponseCache: Response cache.
+    """
+    global _in_memory_cache
+
+    size = Settings().get("chat.response_cache_size") or DEFAULT_CACHE_SIZE
+    ttl = Settings().get("chat.response_cache_ttl") or DEFAULT_CACHE_TTL_SECONDS
+    if Settings().get("chat.response_cache_backend") == "redis":
+        return RedisResponseCache(size, ttl)
+
+    if _in_memory_cache is None:
+        _in_memory_cache = InMemoryResponseCache(size, ttl)
+    return _in_memory_cache
+
+
+def get_response_cache_key(chat_request: CohereChatRequest, ctx: Context) -> str:
+    """
+    Get a stable hash of everything that determines the response of a chat request.
+
+    Args:
+        chat_request (CohereChatRequest): Chat request, with its chat history.
+        ctx (Context): Context object.
+
+    Returns:
+        str: Cache key.
+    """
+    request = chat_request.model_dump(exclude={"conversation_id"})
+    request["file_ids"] = chat_request.file_ids
+    request["deployment"] = ctx.get_deployment_name()
+    request["user_id"] = ctx.get_user_id()
+    request["agent_id"] = ctx.get_agent_id()
+    data = json.dumps(jsonable_encoder(request), sort_keys=True)
+
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def is_response_cacheable(chat_request: CohereChatRequest) -> bool:
+    """
+    Check if the response of a chat request is deterministic enough to be cached: its
+    temperature is explicitly set to 0, or chat.response_cache_force is set. Without a
+    temperature the deployment default is used, which is sampled.
+
+    Args:
+        chat_request (CohereChatRequest): Chat request.
+
+    Returns:
+        bool: Whether the response can be cached.
+    """
+    return chat_request.temperature == 0 or bool(
+        Settings().get("chat.response_cache_force")
+    )
+
+
+async def cached_chat_stream(
+    chat_request: CohereChatRequest,
+    stream: AsyncGenerator[dict[str, Any], None],
+    ctx: Context,
+) -> AsyncGenerator[dict[str, Any], None]:
+    """
+    Replay the cached events of an identical chat request, or run the chat stream and cache its
+    events once the response is complete. Only used if chat.response_cache is set.
+
+    Args:
+        chat_request (CohereChatRequest): Chat request, with its chat history.
+        stream (AsyncGenerator[dict[str, Any], None]): Chat stream, e.g. from CustomChat().chat.
+        ctx (Context): Context object.
+
+    Yields:
+        dict[str, Any]: Chat stream event.
+    """
+    async with aclosing(stream):
+        if not Settings().get("chat.response_cache"):
+            async for event in stream:
+                yield event
+            return
+
+        if not is_response_cacheable(chat_request):
+            _record(ctx, "bypass")
+            async for event in stream:
+                yield event
+            return
+
+        # The key is computed before the chat stream starts and updates the chat history
+        key = get_response_cache_key(chat_request, ctx)
+        cache = get_response_cache()
+
+        cached_events = await cache.get(key)
+        if cached_events is not None:
+            _record(ctx, "hit")
+            for event in cached_events:
+                yield event
+            return
+
+        _record(ctx, "miss")
+        events = []
+        async for event in stream:
+            events.append(jsonable_encoder(event))
+            yield event
+
+        # Only complete responses are cached
+        if (
+            events
+            and events[-1].get("event_type") == StreamEvent.STREAM_END
+            and events[-1].get("finish_reason") != "ERROR"
+        ):
+            await cache.set(key, events)
+
+
+def _record(ctx: Context, result: str) -> None:
+    if result == "hit":
+        response_cache_stats.hits += 1
+    elif result == "miss":
+        response_cache_stats.misses += 1
+    else:
+        response_cache_stats.bypasses += 1
+
+    ctx.get_logger().debug(event=f"[Response Cache] Cache {result}")
+    if Settings().get("metrics.enabled"):
+        collector.add_metric("cache", f"response_cache_{result}", 0)
+
+
+def _entry_key(key: str) -> str:
+    return f"{RESPONSE_CACHE_KEY_PREFIX}:{key}"
+
+
+def _index_key() -> str:
+    return f"{RESPONSE_CACHE_KEY_PREFIX}:index"
@@ -0,0 +1,343 @@
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, AsyncGenerator
+
+from backend.config.settings import Settings
+from backend.services.cache import get_client
+from backend.services.logger.utils import LoggerFactory
+
+STREAM_KEY_PREFIX = "chat_stream"
+REDIS_POLL_INTERVAL_SECONDS = 0.05
+# Seconds between two checks of the producer for a reader of its stream
+READER_CHECK_INTERVAL_SECONDS = 1
+DEFAULT_BUFFER_SIZE = 1000
+DEFAULT_BUFFER_TTL_SECONDS = 300
+
+logger = LoggerFactory().get_logger()
+
+# Keep a reference to the running generations, so they are not garbage collected
+_producer_tasks: set[asyncio.Task] = set()
+_in_memory_buffer: "InMemoryStreamBuffer | None" = None
+
+
+class StreamEventsExpired(Exception):
+    """The events after the requested event ID are no longer buffered."""
+
+
+class StreamBuffer(ABC):
+    """
+    Buffers the most recent events of each chat stream, so a client can resume a stream.
+
+    Each event has a monotonically increasing ID, starting at 1, that is sent as the SSE event ID.
+    The readers of a stream mark it as read, a stream nobody has read for the buffer TTL is
+    no longer generated.
+    """
+
+    def __init__(
+        self,
+        size: int = DEFAULT_BUFFER_SIZE,
+        ttl: float = DEFAULT_BUFFER_TTL_SECONDS,
+    ) -> None:
+        self.size = size
+        self.ttl = ttl
+
+    @abstractmethod
+    async def create(self, stream_id: str, user_id: str) -> None:
+        """Creates an empty stream owned by the user."""
+
+    @abstractmethod
+    async def get_owner(self, stream_id: str) -> str | None:
+        """Returns the user ID of the stream, or None if the stream does not exist."""
+
+    @abstractmethod
+    async def append(self, stream_id: str, event_id: int, data: str) -> None:
+        """Adds an event to the stream, dropping the oldest event if the buffer is full."""
+
+    @abstractmethod
+    async def end(self, stream_id: str) -> None:
+        """Marks the stream as ended, it is kept for the buffer TTL."""
+
+    @abstractmethod
+    async def read(
+        self, stream_id: str, after_id: int
+    ) -> tuple[list[tuple[int, str]], bool]:
+        """
+        Returns the buffered events after an event ID, and whether the stream has ended.
+
+        Raises:
+            StreamEventsExpired: If some of the events after the event ID were dropped.
+        """
+
+    @abstractmethod
+    async def wait(self, stream_id: str, after_id: int) -> None:
+        """Waits until there are events after the event ID or the stream has ended."""
+
+    @abstractmethod
+    async def mark_read(self, stream_id: str) -> None:
+        """Records that a client is reading the stream."""
+
+    @abstractmethod
+    async def get_idle_time(self, stream_id: str) -> float:
+        """Returns the seconds since a client last read the stream, or since it was created."""
+
+    async def events(
+        self, stream_id: str, after_id: int = 0
+    ) -> AsyncGenerator[dict[str, Any], None]:
+        """
+        Replays the buffered events after an event ID, then follows the live stream until it ends.
+
+        Args:
+            stream_id (str): Stream ID.
+            after_id (int): ID of the last event received by the client, 0 to read from the start.
+
+        Yields:
+            dict[str, Any]: SSE event with its id and data.
+        """
+        while True:
+            await self.mark_read(stream_id)
+            events, ended = await self.read(stream_id, after_id)
+            for event_id, data in events:
+                yield {"id": event_id, "data": data}
+                after_id = event_id
+
+            if ended and not events:
+                return
+            if not events:
+                await self.wait(stream_id, after_id)
+
+
+@dataclass
+class _BufferedStream:
+    user_id: str
+    events: deque
+    changed: asyncio.Event = field(default_factory=asyncio.Event)
+    ended: bool = False
+    expires_at: float | None = None
+    read_at: float = field(default_factory=time.monotonic)
+
+
+class InMemoryStreamBuffer(StreamBuffer):
+    """Stream buffer kept in the memory of the process, the client has to resume on the same node."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.streams: dict[str, _BufferedStream] = {}
+
+    async def create(self, stream_id: str, user_id: str) -> None:
+        self._remove_expired()
+        self.streams[stream_id] = _BufferedStream(
+            user_id=user_id, events=deque(maxlen=self.size)
+        )
+
+    async def get_owner(self, stream_id: str) -> str | None:
+        self._remove_expired()
+        stream = self.streams.get(stream_id)
+        return stream.user_id if stream else None
+
+    async def append(self, stream_id: str, event_id: int, data: str) -> None:
+        stream = self.streams[stream_id]
+        stream.events.append((event_id, data))
+        self._notify(stream)
+
+    async def end(self, stream_id: str) -> None:
+        stream = self.streams[stream_id]
+        stream.ended = True
+        stream.expires_at = time.monotonic() + self.ttl
+        self._notify(stream)
+
+    async def read(
+        self, stream_id: str, after_id: int
+    ) -> tuple[list[tuple[int, str]], bool]:
+        stream = self.streams[stream_id]
+        events = [event for event in stream.events if event[0] > after_id]
+        _check_not_expired(events, after_id)
+        return events, stream.ended
+
+    async def wait(self, stream_id: str, after_id: int) -> None:
+        stream = self.streams[stream_id]
+        if stream.ended or (stream.events and stream.events[-1][0] > after_id):
+            return
+        await stream.changed.wait()
+
+    async def mark_read(self, stream_id: str) -> None:
+        self.streams[stream_id].read_at = time.monotonic()
+
+    async def get_idle_time(self, stream_id: str) -> float:
+        return time.monotonic() - self.streams[stream_id].read_at
+
+    def _notify(self, stream: _BufferedStream) -> None:
+        # Wake up the readers waiting for this stream, the next ones wait for the next change
+        stream.changed.set()
+        stream.changed = asyncio.Event()
+
+    def _remove_expired(self) -> None:
+        now = time.monotonic()
+        for stream_id in [
+            stream_id
+            for stream_id, stream in self.streams.items()
+            if stream.expires_at is not None and stream.expires_at < now
+        ]:
+            del self.streams[stream_id]
+
+
+class RedisStreamBuffer(StreamBuffer):
+    """Stream buffer stored in Redis Streams, so a client can resume a stream on any node."""
+
+    async def create(self, stream_id: str, user_id: str) -> None:
+        client = get_client()
+        await asyncio.to_thread(
+            client.hset,
+            _meta_key(stream_id),
+            mapping={"user_id": user_id, "ended": 0, "read_at": time.time()},
+        )
+        await asyncio.to_thread(client.expire, _meta_key(stream_id), int(self.ttl))
+
+    async def get_owner(self, stream_id: str) -> str | None:
+        client = get_client()
+        return await asyncio.to_thread(client.hget, _meta_key(stream_id), "user_id")
+
+    async def append(self, stream_id: str, event_id: int, data: str) -> None:
+        client = get_client()
+        # The Redis entry ID encodes the event ID, so the entries can be read after an event ID
+        await asyncio.to_thread(
+            client.xadd,
+            _events_key(stream_id),
+            {"data": data},
+            id=f"0-{event_id}",
+            maxlen=self.size,
+            approximate=False,
+        )
+        # Keep the stream while it is being generated
+        for key in (_events_key(stream_id), _meta_key(stream_id)):
+            await asyncio.to_thread(client.expire, key, int(self.ttl))
+
+    async def end(self, stream_id: str) -> None:
+        client = get_client()
+        await asyncio.to_thread(client.hset, _meta_key(stream_id), "ended", 1)
+
+    async def read(
+        self, stream_id: str, after_id: int
+    ) -> tuple[list[tuple[int, str]], bool]:
+        client = get_client()
+        ended = await asyncio.to_thread(client.hget, _meta_key(stream_id), "ended")
+        entries = await asyncio.to_thread(
+            client.xrange, _events_key(stream_id), min=f"0-{after_id + 1}"
+        )
+        events = [
+            (int(entry_id.split("-")[1]), fields["data"]) for entry_id, fields in entries
+        ]
+        _check_not_expired(events, after_id)
+        return events, ended == "1"
+
+    async def wait(self, stream_id: str, after_id: int) -> None:
+        await asyncio.sleep(REDIS_POLL_INTERVAL_SECONDS)
+
+    async def mark_read(self, stream_id: str) -> None:
+        # The readers of other nodes mark the stream too, the time is shared. An expired
+        # stream is not created again without a TTL
+        client = get_client()
+        if await asyncio.to_thread(client.hexists, _meta_key(stream_id), "user_id"):
+            await asyncio.to_thread(
+                client.hset, _meta_key(stream_id), "read_at", time.time()
+            )
+
+    async def get_idle_time(self, stream_id: str) -> float:
+        client = get_client()
+        read_at = await asyncio.to_thread(client.hget, _meta_key(stream_id), "read_at")
+        return time.time() - float(read_at) if read_at else 0
+
+
+def get_stream_buffer() -> StreamBuffer:
+    """
+    Get the stream buffer set in chat.stream_buffer_backend, either memory or redis.
+
+    Returns:
+        StreamBuffer: Stream buffer.
+    """
+    global _in_memory_buffer
+
+    size = Settings().get("chat.stream_buffer_size") or DEFAULT_BUFFER_SIZE
+    ttl = Settings().get("chat.stream_buffer_ttl") or DEFAULT_BUFFER_TTL_SECONDS
+    if Settings().get("chat.stream_buffer_backend") == "redis":
+        return RedisStreamBuffer(size, ttl)
+
+    if _in_memory_buffer is None:
+        _in_memory_buffer = InMemoryStreamBuffer(size, ttl)
+    return _in_memory_buffer
+
+
+async def start_resumable_stream(
+    stream_id: str,
+    user_id: str,
+    stream: AsyncGenerator[str, None],
+    buffer: StreamBuffer,
+) -> asyncio.Task:
+    """
+    Runs a chat stream in the background and buffers its events with increasing IDs.
+
+    The generation does not depend on the client connection, so after a disconnect the client
+    can resume from the last event it received. It is cancelled once no client has read the
+    stream for the buffer TTL, as the generations of disconnected clients are without a
+    buffer.
+
+    Args:
+        stream_id (str): Stream ID.
+        user_id (str): ID of the user who can resume the stream.
+        stream (AsyncGenerator[str, None]): Chat stream, e.g. from generate_chat_stream.
+        buffer (StreamBuffer): Stream buffer.
+
+    Returns:
+        asyncio.Task: Task running the chat stream.
+    """
+    await buffer.create(stream_id, user_id)
+
+    async def produce() -> None:
+        event_id = 0
+        checked_at = time.monotonic()
+        try:
+            async for data in stream:
+                event_id += 1
+                await buffer.append(stream_id, event_id, data)
+
+                if time.monotonic() - checked_at < READER_CHECK_INTERVAL_SECONDS:
+                    continue
+                checked_at = time.monotonic()
+                if await buffer.get_idle_time(stream_id) > buffer.ttl:
+                    logger.info(
+                        event="[Chat] Cancelling chat stream without reader",
+                        stream_id=stream_id,
+                    )
+                    # Closing the stream cancels the deployment call
+                    await stream.aclose()
+                    break
+        except Exception as e:
+            logger.exception(
+                event="[Chat] Error while buffering chat stream",
+                stream_id=stream_id,
+                error=str(e),
+            )
+        finally:
+            await buffer.end(stream_id)
+
+    task = asyncio.create_task(produce())
+    _producer_tasks.add(task)
+    task.add_done_callback(_producer_tasks.discard)
+    return task
+
+
+def _check_not_expired(events: list[tuple[int, str]], after_id: int) -> None:
+    if events and events[0][0] > after_id + 1:
+        raise StreamEventsExpired(
+            f"Events {after_id + 1} to {events[0][0] - 1} are no longer buffered"
+        )
+
+
+def _events_key(stream_id: str) -> str:
+    return f"{STREAM_KEY_PREFIX}:{stream_id}:events"
+
+
+def _meta_key(stream_id: str) -> str:
+    return f"{STREAM_KEY_PREFIX}:{stream_id}:meta"
@@ -0,0 +1,145 @@
+from enum import StrEnum
+
+import numpy as np
+
+from backend.services.embeddings import search_embeddings
+from backend.services.logger.utils import LoggerFactory
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+MIN_APPROXIMATE_ROWS = 1000
+DEFAULT_IVF_PROBES = 8
+IVF_ITERATIONS = 10
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+
+logger = LoggerFactory().get_logger()
+
+
+class VectorIndexMode(StrEnum):
+    Flat = "flat"
+    IVF = "ivf"
+    HNSW = "hnsw"
+
+
+class VectorIndex:
+    """
+    Nearest neighbour index of normalized embeddings, scored by dot product.
+
+    The flat mode compares the query with every embedding. The approximate modes build an
+    index once and search part of it: ivf clusters the embeddings with k-means and searches
+    the clusters closest to the query, and hnsw searches a hnswlib graph, falling back to ivf
+    if hnswlib is not installed. Below MIN_APPROXIMATE_ROWS embeddings the index is always
+    flat, an exact search is as fast at that size.
+    """
+
+    def __init__(
+        self,
+        embeddings: np.ndarray,
+        mode: str = VectorIndexMode.Flat,
+        ivf_probes: int = DEFAULT_IVF_PROBES,
+    ) -> None:
+        self.embeddings = np.asarray(embeddings, dtype=np.float32)
+        self.mode = VectorIndexMode(mode)
+        self.ivf_probes = ivf_probes
+
+        if len(self.embeddings) < MIN_APPROXIMATE_ROWS:
+            self.mode = VectorIndexMode.Flat
+        if self.mode == VectorIndexMode.HNSW and hnswlib is None:
+            logger.warning(
+                event="[Vector Index] hnswlib is not installed, using an ivf index"
+            )
+            self.mode = VectorIndexMode.IVF
+
+        if self.mode == VectorIndexMode.IVF:
+            self._build_ivf()
+        elif self.mode == VectorIndexMode.HNSW:
+            self._build_hnsw()
+
+    def __len__(self) -> int:
+        return len(self.embeddings)
+
+    def search(self, query_embedding: np.ndarray, top_k: int) -> list[tuple[int, float]]:
+        """
+        Get the embeddings most similar to a query.
+
+        Args:
+            query_embedding (np.ndarray): Embedding of the query.
+            top_k (int): Number of results.
+
+        Returns:
+            list[tuple[int, float]]: Row and score of the results, best first.
+        """
+        if not len(self.embeddings) or top_k <= 0:
+            return []
+
+        if self.mode == VectorIndexMode.IVF:
+            return self._search_ivf(query_embedding, top_k)
+        if self.mode == VectorIndexMode.HNSW:
+            return self._search_hnsw(query_embedding, top_k)
+        return search_embeddings(query_embedding, self.embeddings, top_k)
+
+    def _build_ivf(self) -> None:
+        # Spherical k-means with a fixed seed, so the index of the same embeddings is the same
+        num_lists = max(1, int(np.sqrt(len(self.embeddings))))
+        random = np.random.default_rng(0)
+        centroids = self.embeddings[
+            random.choice(len(self.embeddings), num_lists, replace=False)
+        ].copy()
+        for _ in range(IVF_ITERATIONS):
+            assignments = np.argmax(self.embeddings @ centroids.T, axis=1)
+            for list_index in range(num_lists):
+                members = self.embeddings[assignments == list_index]
+                if not len(members):
+                    continue
+                centroid = members.mean(axis=0)
+                norm = np.linalg.norm(centroid)
+                centroids[list_index] = centroid / norm if norm else centroid
+
+        assignments = np.argmax(self.embeddings @ centroids.T, axis=1)
+        self.centroids = centroids
+        self.lists = [
+            np.flatnonzero(assignments == list_index) for list_index in range(num_lists)
+        ]
+
+    def _search_ivf(
+        self, query_embedding: np.ndarray, top_k: int
+    ) -> list[tuple[int, float]]:
+        query_embedding = np.asarray(query_embedding, dtype=np.float32)
+        probes = min(self.ivf_probes, len(self.centroids))
+        centroid_scores = self.centroids @ query_embedding
+        closest_lists = np.argpartition(-centroid_scores, probes - 1)[:probes]
+        rows = np.concatenate([self.lists[list_index] for list_index in closest_lists])
+        return [
+            (int(rows[row]), score)
+            for row, score in search_embeddings(
+                query_embedding, self.embeddings[rows], top_k
+            )
+        ]
+
+    def _build_hnsw(self) -> None:
+        self.hnsw = hnswlib.Index(space="ip", dim=self.embeddings.shape[1])
+        self.hnsw.init_index(
+            max_elements=len(self.embeddings),
+            ef_construction=HNSW_EF_CONSTRUCTION,
+            M=HNSW_M,
+        )
+        self.hnsw.add_items(self.embeddings, np.arange(len(self.embeddings)))
+
+    def _search_hnsw(
+        self, query_embedding: np.ndarray, top_k: int
+    ) -> list[tuple[int, float]]:
+        top_k = min(top_k, len(self.embeddings))
+        self.hnsw.set_ef(max(HNSW_EF_SEARCH, top_k))
+        labels, distances = self.hnsw.knn_query(
+            np.asarray(query_embedding, dtype=np.float32), k=top_k
+        )
+        # The inner product distance of hnswlib is 1 - dot product
+        return [
+            (int(label), float(1 - distance))
+            for label, distance in zip(labels[0], distances[0])
+        ]
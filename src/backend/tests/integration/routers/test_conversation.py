@@ -3,6 +3,7 @@ from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session
 
 from backend.config import Settings
+from backend.crud import conversation_search as conversation_search_crud
 from backend.database_models import Conversation
 from backend.model_deployments.cohere_platform import CohereDeployment
 from backend.schemas.user import User
@@ -20,6 +21,7 @@ def test_search_conversations(
     conversation = get_factory("Conversation", session).create(
         title="test title", user_id=user.id
     )
+    conversation_search_crud.index_conversation_title(session, conversation)
     response = session_client.get(
         "/v1/conversations:search",
         headers={"User-Id": user.id},
@@ -38,7 +40,7 @@ def test_search_conversations_with_reranking(
     user: User,
     mock_available_model_deployments,
 ) -> None:
-    _ = get_factory("Conversation", session).create(
+    conversation1 = get_factory("Conversation", session).create(
         title="Hello, how are you?", text_messages=[], user_id=user.id
     )
     conversation2 = get_factory("Conversation", session).create(
@@ -46,6 +48,8 @@ def test_search_conversations_with_reranking(
         text_messages=[],
         user_id=user.id,
     )
+    conversation_search_crud.index_conversation_title(session, conversation1)
+    conversation_search_crud.index_conversation_title(session, conversation2)
     response = session_client.get(
         "/v1/conversations:search",
         headers={
@@ -66,7 +70,10 @@ def test_search_conversations_no_conversations(
     session: Session,
     user: User,
 ) -> None:
-    _ = get_factory("Conversation", session).create(title="test title", user_id=user.id)
+    conversation = get_factory("Conversation", session).create(
+        title="test title", user_id=user.id
+    )
+    conversation_search_crud.index_conversation_title(session, conversation)
     user2 = get_factory("User", session).create()
 
     response = session_client.get(
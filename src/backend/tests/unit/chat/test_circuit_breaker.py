@@ -0,0 +1,208 @@
+import asyncio
+import time
+from unittest.mock import patch
+
+import pytest
+
+from backend.chat.custom.circuit_breaker import (
+    Bulkhead,
+    BulkheadFullError,
+    CircuitBreaker,
+    CircuitState,
+    get_circuit_breaker,
+)
+from backend.chat.custom.tool_calls import async_call_tools
+from backend.services.context import Context
+from backend.tests.unit.mock_tools import get_faulty_tool
+from backend.tests.unit.model_deployments.mock_deployments import MockCohereDeployment
+from backend.tools.base import ToolErrorCode
+
+
+@pytest.fixture(autouse=True)
+def reset_tool_call_limits():
+    with patch.dict("backend.chat.custom.circuit_breaker._bulkheads", clear=True), patch.dict(
+        "backend.chat.custom.circuit_breaker._circuit_breakers", clear=True
+    ):
+        yield
+
+
+@pytest.fixture
+def mock_tool_call_limits_settings():
+    with patch("backend.chat.custom.circuit_breaker.Settings") as mock_settings:
+        settings = {"tools.circuit_breaker_reset_timeout": 60}
+        mock_settings.return_value.get.side_effect = settings.get
+        yield settings
+
+
+@pytest.fixture
+def mock_get_available_tools():
+    with patch("backend.chat.custom.tool_calls.get_available_tools") as mock:
+        yield mock
+
+
+def expire_reset_timeout(tool) -> None:
+    get_circuit_breaker(tool.get_tool_definition()).opened_at -= 60
+
+
+def call_tool(tool, times: int = 1) -> list[dict]:
+    chat_history = [
+        {"tool_calls": [{"name": tool.ID, "parameters": {"text": str(index)}} for index in range(times)]}
+    ]
+    results = asyncio.run(async_call_tools(chat_history, MockCohereDeployment(), Context()))
+    return [output for result in results for output in result["outputs"]]
+
+
+def test_circuit_breaker_opens_after_consecutive_failures() -> None:
+    circuit_breaker = CircuitBreaker("search", failure_threshold=3, reset_timeout=60)
+
+    for success in (False, False, True, False, False):
+        assert circuit_breaker.allow_call()
+        circuit_breaker.record(success)
+
+    # A success resets the consecutive failures
+    assert circuit_breaker.state == CircuitState.Closed
+
+    circuit_breaker.record(False)
+
+    assert circuit_breaker.state == CircuitState.Open
+    assert not circuit_breaker.allow_call()
+
+
+def test_circuit_breaker_half_open_probe() -> None:
+    circuit_breaker = CircuitBreaker("search", failure_threshold=1, reset_timeout=0.05)
+    circuit_breaker.record(False)
+    time.sleep(0.06)
+
+    # Only one probe call goes through
+    assert circuit_breaker.state == CircuitState.HalfOpen
+    assert circuit_breaker.allow_call()
+    assert not circuit_breaker.allow_call()
+
+    circuit_breaker.record(False)
+    assert circuit_breaker.state == CircuitState.Open
+
+    time.sleep(0.06)
+    assert circuit_breaker.allow_call()
+    # A cancelled probe lets the next call probe the tool
+    circuit_breaker.record(None)
+    assert circuit_breaker.allow_call()
+
+    circuit_breaker.record(True)
+    assert circuit_breaker.state == CircuitState.Closed
+    assert circuit_breaker.allow_call() and circuit_breaker.allow_call()
+
+
+@pytest.mark.asyncio
+async def test_bulkhead_limits_concurrent_calls_and_queue() -> None:
+    bulkhead = Bulkhead("search", max_concurrent_calls=2, max_queued_calls=1)
+    release = asyncio.Event()
+
+    async def call() -> None:
+        async with bulkhead.acquire():
+            await release.wait()
+
+    tasks = [asyncio.create_task(call()) for _ in range(3)]
+    await asyncio.sleep(0.01)
+
+    assert (bulkhead.active, bulkhead.queued) == (2, 1)
+    with pytest.raises(BulkheadFullError):
+        await call()
+    assert bulkhead.rejected == 1
+
+    release.set()
+    await asyncio.gather(*tasks)
+    assert (bulkhead.active, bulkhead.queued) == (0, 0)
+
+
+@pytest.mark.parametrize("fault", ["error", "error_output"])
+def test_tool_calls_fail_fast_when_circuit_is_open(
+    mock_get_available_tools, mock_tool_call_limits_settings, fault
+) -> None:
+    tool = get_faulty_tool("search", circuit_breaker_failures=3)
+    mock_get_available_tools.return_value = {tool.ID: tool.get_tool_definition()}
+    tool.fault = fault
+
+    outputs = call_tool(tool, times=3)
+
+    assert len(tool.calls) == 3
+    assert all(output["success"] is False for output in outputs)
+
+    outputs = call_tool(tool, times=2)
+
+    # The tool is not called while the circuit is open
+    assert len(tool.calls) == 3
+    assert [output["type"] for output in outputs] == [ToolErrorCode.UNAVAILABLE] * 2
+
+    # The probe call after the reset timeout restores the tool
+    tool.fault = None
+    expire_reset_timeout(tool)
+    outputs = call_tool(tool)
+
+    assert len(tool.calls) == 4
+    assert outputs == [{"text": "search result"}]
+    assert call_tool(tool, times=2) == [{"text": "search result"}] * 2
+
+
+def test_tool_call_timeouts_open_circuit(
+    mock_get_available_tools, mock_tool_call_limits_settings
+) -> None:
+    tool = get_faulty_tool("search", timeout=0.05, circuit_breaker_failures=2)
+    mock_get_available_tools.return_value = {tool.ID: tool.get_tool_definition()}
+    tool.fault = "hang"
+
+    outputs = call_tool(tool, times=2)
+    assert [output["type"] for output in outputs] == [ToolErrorCode.TIMEOUT] * 2
+
+    outputs = call_tool(tool)
+
+    assert len(tool.calls) == 2
+    assert outputs[0]["type"] == ToolErrorCode.UNAVAILABLE
+
+    # A failed probe opens the circuit again
+    expire_reset_timeout(tool)
+    call_tool(tool)
+    outputs = call_tool(tool)
+
+    assert len(tool.calls) == 3
+    assert outputs[0]["type"] == ToolErrorCode.UNAVAILABLE
+
+
+def test_tool_calls_without_results_do_not_open_circuit(
+    mock_get_available_tools, mock_tool_call_limits_settings
+) -> None:
+    tool = get_faulty_tool("search")
+    mock_get_available_tools.return_value = {tool.ID: tool.get_tool_definition()}
+    mock_tool_call_limits_settings["tools.circuit_breaker_failures"] = 1
+
+    tool.fault = "no_results"
+    call_tool(tool, times=2)
+    tool.fault = None
+
+    assert call_tool(tool) == [{"text": "search result"}]
+
+
+def test_tool_calls_wait_for_a_free_slot(
+    mock_get_available_tools, mock_tool_call_limits_settings
+) -> None:
+    tool = get_faulty_tool("search", latency=0.05, max_concurrent_calls=2)
+    mock_get_available_tools.return_value = {tool.ID: tool.get_tool_definition()}
+
+    outputs = call_tool(tool, times=6)
+
+    assert outputs == [{"text": "search result"}] * 6
+    assert tool.max_active == 2
+
+
+def test_tool_calls_fail_fast_when_queue_is_full(
+    mock_get_available_tools, mock_tool_call_limits_settings
+) -> None:
+    tool = get_faulty_tool("search", latency=0.05)
+    mock_get_available_tools.return_value = {tool.ID: tool.get_tool_definition()}
+    mock_tool_call_limits_settings["tools.max_concurrent_calls"] = 2
+    mock_tool_call_limits_settings["tools.max_queued_calls"] = 1
+
+    outputs = call_tool(tool, times=4)
+
+    assert len(tool.calls) == 3
+    assert outputs.count({"text": "search result"}) == 3
+    assert [output["type"] for output in outputs if "type" in output] == [ToolErrorCode.UNAVAILABLE]
@@ -0,0 +1,381 @@
+import asyncio
+import json
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from backend.chat.custom.custom import MAX_STEPS, CustomChat
+from backend.chat.enums import StreamEvent
+from backend.database_models.message import Message, MessageAgent
+from backend.schemas.cohere_chat import CohereChatRequest
+from backend.schemas.context import Context
+from backend.schemas.tool import Tool
+from backend.services.chat import LOOKBACKS, generate_chat_stream
+from backend.tests.unit.factories import get_factory
+from backend.tests.unit.mock_tools import get_latency_tool
+from backend.tests.unit.model_deployments.mock_deployments import (
+    MockLatencyDeployment,
+)
+
+TOOL_CALLS = [
+    {"name": "slow_tool", "parameters": {"code": "6*7"}},
+    {"name": "fast_tool", "parameters": {"code": "6*7"}},
+]
+
+
+def get_tool_calls_stream(
+    tool_calls: list[dict], chunk_size: int | None = None
+) -> list[dict]:
+    # Optionally stream every tool call in chunks, like the model does before the generation
+    chunks = []
+    for index, tool_call in enumerate(tool_calls if chunk_size else []):
+        parameters = json.dumps(tool_call["parameters"])
+        chunks.append(
+            {
+                "event_type": StreamEvent.TOOL_CALLS_CHUNK,
+                "tool_call_delta": {"index": index, "name": tool_call["name"]},
+            }
+        )
+        chunks.extend(
+            {
+                "event_type": StreamEvent.TOOL_CALLS_CHUNK,
+                "tool_call_delta": {
+                    "index": index,
+                    "parameters": parameters[i : i + chunk_size],
+                },
+            }
+            for i in range(0, len(parameters), chunk_size)
+        )
+
+    return [
+        {"event_type": StreamEvent.STREAM_START, "generation_id": "tool-calls"},
+        *chunks,
+        {"event_type": StreamEvent.TOOL_CALLS_GENERATION, "text": "", "tool_calls": tool_calls},
+        {
+            "event_type": StreamEvent.STREAM_END,
+            "finish_reason": "COMPLETE",
+            "response": {
+                "chat_history": [{"role": "CHATBOT", "tool_calls": tool_calls}],
+                "tool_calls": tool_calls,
+            },
+        },
+    ]
+
+
+def get_text_stream(text: str) -> list[dict]:
+    return [
+        {"event_type": StreamEvent.STREAM_START, "generation_id": "text"},
+        {"event_type": StreamEvent.TEXT_GENERATION, "text": text},
+        {
+            "event_type": StreamEvent.STREAM_END,
+            "finish_reason": "COMPLETE",
+            "response": {"chat_history": [{"role": "CHATBOT", "message": text}]},
+        },
+    ]
+
+
+@pytest.fixture
+def mock_tools():
+    tools = [get_latency_tool("slow_tool", 0.2), get_latency_tool("fast_tool", 0.01)]
+    available_tools = {tool.ID: tool.get_tool_definition() for tool in tools}
+    with (
+        patch("backend.chat.custom.custom.get_available_tools", return_value=available_tools),
+        patch("backend.chat.custom.tool_calls.get_available_tools", return_value=available_tools),
+    ):
+        yield tools
+
+
+def get_chat_request() -> CohereChatRequest:
+    return CohereChatRequest(
+        message="Hello",
+        tools=[Tool(name=tool_call["name"]) for tool_call in TOOL_CALLS],
+    )
+
+
+async def collect_events(stream) -> list[dict]:
+    return [event async for event in stream]
+
+
+@pytest.mark.asyncio
+async def test_call_chat_streams_tool_results_when_each_tool_finishes(mock_tools) -> None:
+    deployment = MockLatencyDeployment(
+        event_streams=[get_tool_calls_stream(TOOL_CALLS), get_text_stream("Done.")]
+    )
+    chat = CustomChat()
+
+    with patch("backend.chat.custom.custom.Settings") as mock_settings:
+        mock_settings.return_value.get.side_effect = lambda path: path == "tools.stream_tool_results"
+        events = await collect_events(
+            chat.call_chat(get_chat_request(), deployment, None, Context())
+        )
+
+    tool_result_events = [
+        event for event in events if event["event_type"] == StreamEvent.TOOL_RESULT
+    ]
+    assert [event["tool_name"] for event in tool_result_events] == ["fast_tool", "slow_tool"]
+    assert tool_result_events[0]["result"] == [{"text": "fast_tool result"}]
+    # The tool results are sent before the second model step starts
+    assert events.index(tool_result_events[-1]) < events.index(
+        next(event for event in events if event.get("generation_id") == "text")
+    )
+    assert chat.chat_request.tool_results == [
+        {"call": TOOL_CALLS[0], "outputs": [{"text": "slow_tool result"}]},
+        {"call": TOOL_CALLS[1], "outputs": [{"text": "fast_tool result"}]},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_call_chat_does_not_stream_tool_results_by_default(mock_tools) -> None:
+    deployment = MockLatencyDeployment(
+        event_streams=[get_tool_calls_stream(TOOL_CALLS), get_text_stream("Done.")]
+    )
+
+    events = await collect_events(
+        CustomChat().call_chat(get_chat_request(), deployment, None, Context())
+    )
+
+    assert not [
+        event for event in events if event["event_type"] == StreamEvent.TOOL_RESULT
+    ]
+    assert deployment.chat_calls == 2
+
+
+@pytest.fixture
+def mock_speculative_settings():
+    with patch("backend.chat.custom.custom.Settings") as mock_settings:
+        mock_settings.return_value.get.side_effect = (
+            lambda path: path == "tools.speculative_tool_calls"
+        )
+        yield mock_settings
+
+
+@pytest.fixture
+def mock_idempotent_tools():
+    tools = [
+        get_latency_tool("slow_tool", 0.3, is_idempotent=True),
+        get_latency_tool("fast_tool", 0.01, is_idempotent=True),
+    ]
+    available_tools = {tool.ID: tool.get_tool_definition() for tool in tools}
+    with (
+        patch("backend.chat.custom.custom.get_available_tools", return_value=available_tools),
+        patch("backend.chat.custom.tool_calls.get_available_tools", return_value=available_tools),
+    ):
+        yield tools
+
+
+@pytest.mark.asyncio
+async def test_call_chat_speculative_tool_calls_start_before_stream_end(
+    mock_idempotent_tools, mock_speculative_settings
+) -> None:
+    deployment = MockLatencyDeployment(
+        event_latency=0.01,
+        event_streams=[
+            get_tool_calls_stream(TOOL_CALLS, chunk_size=4),
+            get_text_stream("Done."),
+        ],
+    )
+    chat = CustomChat()
+
+    calls_at_generation = None
+    async for event in chat.call_chat(get_chat_request(), deployment, None, Context()):
+        if event["event_type"] == StreamEvent.TOOL_CALLS_GENERATION:
+            calls_at_generation = [len(tool.calls) for tool in mock_idempotent_tools]
+
+    # Both tools were started while their tool calls were streamed
+    assert calls_at_generation == [1, 1]
+    # And the final tool calls reused them
+    assert [tool.calls for tool in mock_idempotent_tools] == [[{"code": "6*7"}]] * 2
+    assert chat.chat_request.tool_results == [
+        {"call": TOOL_CALLS[0], "outputs": [{"text": "slow_tool result"}]},
+        {"call": TOOL_CALLS[1], "outputs": [{"text": "fast_tool result"}]},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_call_chat_cancels_speculative_tool_calls_when_stream_is_closed(
+    mock_idempotent_tools, mock_speculative_settings
+) -> None:
+    deployment = MockLatencyDeployment(
+        event_latency=0.01,
+        event_streams=[get_tool_calls_stream(TOOL_CALLS, chunk_size=4)],
+    )
+    stream = CustomChat().call_chat(get_chat_request(), deployment, None, Context())
+
+    async for event in stream:
+        if event["event_type"] == StreamEvent.TOOL_CALLS_GENERATION:
+            break
+    await stream.aclose()
+    await asyncio.sleep(0.01)
+
+    assert mock_idempotent_tools[0].calls == [{"code": "6*7"}]
+    assert mock_idempotent_tools[0].cancelled
+
+
+@pytest.mark.benchmark
+@pytest.mark.asyncio
+async def test_call_chat_speculative_tool_calls_reduce_latency() -> None:
+    tools = [
+        get_latency_tool("slow_tool", 0.3, is_idempotent=True),
+        get_latency_tool("fast_tool", 0.01, is_idempotent=True),
+    ]
+    available_tools = {tool.ID: tool.get_tool_definition() for tool in tools}
+
+    async def run(speculative: bool) -> tuple[float, CustomChat]:
+        deployment = MockLatencyDeployment(
+            event_latency=0.05,
+            event_streams=[
+                get_tool_calls_stream(TOOL_CALLS, chunk_size=4),
+                get_text_stream("Done."),
+            ],
+        )
+        chat = CustomChat()
+        with (
+            patch("backend.chat.custom.custom.get_available_tools", return_value=available_tools),
+            patch("backend.chat.custom.tool_calls.get_available_tools", return_value=available_tools),
+            patch("backend.chat.custom.custom.Settings") as mock_settings,
+        ):
+            mock_settings.return_value.get.side_effect = (
+                lambda path: speculative and path == "tools.speculative_tool_calls"
+            )
+            start = time.perf_counter()
+            await collect_events(
+                chat.call_chat(get_chat_request(), deployment, None, Context())
+            )
+        return time.perf_counter() - start, chat
+
+    baseline_elapsed, baseline_chat = await run(speculative=False)
+    speculative_elapsed, speculative_chat = await run(speculative=True)
+
+    # The slow tool runs while the rest of the tool calls are streamed
+    assert speculative_elapsed < baseline_elapsed - 0.2
+    assert speculative_chat.chat_request.tool_results == baseline_chat.chat_request.tool_results
+    # Each tool is called once per run
+    assert tools[0].calls == [{"code": "6*7"}, {"code": "6*7"}]
+    assert tools[1].calls == [{"code": "6*7"}, {"code": "6*7"}]
+
+
+@pytest.mark.asyncio
+async def test_chat_loop_detection_state_is_per_request() -> None:
+    tools = [get_latency_tool("slow_tool", 0), get_latency_tool("fast_tool", 0)]
+    available_tools = {tool.ID: tool.get_tool_definition() for tool in tools}
+    # The model never stops calling tools, so every request runs all the steps
+    deployment = MockLatencyDeployment(event_streams=[get_tool_calls_stream(TOOL_CALLS)])
+
+    chats = [CustomChat(), CustomChat()]
+    with (
+        patch("backend.chat.custom.custom.get_deployment", return_value=deployment),
+        patch("backend.chat.custom.custom.get_available_tools", return_value=available_tools),
+        patch("backend.chat.custom.tool_calls.get_available_tools", return_value=available_tools),
+    ):
+        for chat in chats:
+            await collect_events(chat.chat(get_chat_request(), None, Context()))
+
+    assert deployment.chat_calls == 2 * MAX_STEPS
+    assert not hasattr(CustomChat, "event_state")
+    assert chats[0].event_state is not chats[1].event_state
+    for chat in chats:
+        assert chat.event_state.distances_actions.maxlen == max(LOOKBACKS)
+        assert len(chat.event_state.distances_actions) == max(LOOKBACKS)
+
+
+def get_chat_stream(
+    ctx: Context,
+    session=None,
+    response_message=None,
+    should_store: bool = False,
+):
+    return generate_chat_stream(
+        session,
+        CustomChat().chat(get_chat_request(), session, ctx),
+        response_message or MagicMock(id="message-id", is_parallel=False),
+        should_store=should_store,
+        ctx=ctx,
+    )
+
+
+@pytest.mark.asyncio
+async def test_chat_stream_cancelled_on_disconnect_stops_model_and_tools(mock_tools) -> None:
+    # The model never stops calling tools, so the work would go on for MAX_STEPS steps
+    deployment = MockLatencyDeployment(
+        event_latency=0.01, event_streams=[get_tool_calls_stream(TOOL_CALLS)]
+    )
+    slow_tool = mock_tools[0]
+
+    with patch("backend.chat.custom.custom.get_deployment", return_value=deployment):
+        stream = get_chat_stream(Context())
+        # EventSourceResponse cancels the streaming task when the client disconnects
+        task = asyncio.create_task(collect_events(stream))
+        while not slow_tool.calls:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        chat_calls, events_sent = deployment.chat_calls, deployment.events_sent
+        await asyncio.sleep(0.3)
+
+    assert slow_tool.cancelled
+    assert deployment.open_streams == 0
+    # No model or tool work continues after the disconnect
+    assert (deployment.chat_calls, deployment.events_sent) == (chat_calls, events_sent)
+    assert slow_tool.calls == [{"code": "6*7"}]
+
+
+@pytest.mark.asyncio
+async def test_chat_stream_closed_on_disconnect_closes_model_stream(mock_tools) -> None:
+    deployment = MockLatencyDeployment(
+        event_latency=0.01, event_streams=[get_tool_calls_stream(TOOL_CALLS)]
+    )
+
+    with patch("backend.chat.custom.custom.get_deployment", return_value=deployment):
+        stream = get_chat_stream(Context())
+        # Stop reading in the middle of the first model stream
+        await stream.__anext__()
+        assert deployment.open_streams == 1
+        await stream.aclose()
+        # The model stream is closed right away, not when it is garbage collected
+        assert deployment.open_streams == 0
+        await asyncio.sleep(0.1)
+
+    assert deployment.chat_calls == 1
+    assert all(not tool.calls for tool in mock_tools)
+
+
+@pytest.mark.asyncio
+async def test_chat_stream_persists_partial_message_on_disconnect(session, user) -> None:
+    conversation = get_factory("Conversation", session).create(user_id=user.id)
+    ctx = Context()
+    ctx.with_user_id(user.id)
+    ctx.with_conversation_id(conversation.id)
+    response_message = Message(
+        user_id=user.id,
+        conversation_id=conversation.id,
+        text="",
+        position=1,
+        is_active=True,
+        agent=MessageAgent.CHATBOT,
+    )
+    text_events = [
+        {"event_type": StreamEvent.STREAM_START, "generation_id": "text"},
+        {"event_type": StreamEvent.TEXT_GENERATION, "text": "The answer "},
+        {"event_type": StreamEvent.TEXT_GENERATION, "text": "is"},
+        {"event_type": StreamEvent.TEXT_GENERATION, "text": " 42."},
+    ]
+    deployment = MockLatencyDeployment(event_streams=[text_events])
+
+    with (
+        patch("backend.chat.custom.custom.get_deployment", return_value=deployment),
+        patch("backend.services.chat.Settings") as mock_settings,
+    ):
+        mock_settings.return_value.get.side_effect = (
+            lambda path: path == "chat.persist_partial_message_on_disconnect"
+        )
+        stream = get_chat_stream(ctx, session, response_message, should_store=True)
+        for _ in range(3):
+            await stream.__anext__()
+        await stream.aclose()
+
+    session.refresh(conversation)
+    assert [message.text for message in conversation.messages] == ["The answer is"]
+    assert conversation.description == "The answer is"
@@ -0,0 +1,221 @@
+from unittest.mock import patch
+
+import pytest
+
+from backend.chat.custom.custom import CustomChat
+from backend.chat.enums import StreamEvent
+from backend.chat.history import (
+    COMPACTED_OUTPUT_CHARACTERS,
+    count_message_tokens,
+    count_tokens_approximately,
+    fit_chat_history,
+    fit_chat_request_history,
+    register_tokenizer,
+)
+from backend.schemas.chat import ChatMessage, ChatRole
+from backend.schemas.cohere_chat import CohereChatRequest
+from backend.schemas.context import Context
+from backend.tests.unit.model_deployments.mock_deployments import (
+    MockLatencyDeployment,
+)
+
+EVENTS = [
+    {"event_type": StreamEvent.STREAM_START, "generation_id": "text"},
+    {"event_type": StreamEvent.TEXT_GENERATION, "text": "Hello"},
+    {
+        "event_type": StreamEvent.STREAM_END,
+        "finish_reason": "COMPLETE",
+        "response": {"chat_history": []},
+    },
+]
+
+
+def get_tool_turn(index: int, output_length: int = 2000) -> list[dict]:
+    tool_call = {"name": "web_search", "parameters": {"query": f"query {index}"}}
+    return [
+        {"role": "USER", "message": f"Question {index}"},
+        {"role": "CHATBOT", "tool_calls": [tool_call]},
+        {
+            "role": "TOOL",
+            "tool_results": [
+                {"call": tool_call, "outputs": [{"text": "x" * output_length}]}
+            ],
+        },
+        {"role": "CHATBOT", "message": f"Answer {index}"},
+    ]
+
+
+def get_long_conversation(turns: int) -> list[dict]:
+    return [message for index in range(turns) for message in get_tool_turn(index)]
+
+
+def count_history_tokens(chat_history: list) -> int:
+    return sum(
+        count_message_tokens(message, count_tokens_approximately)
+        for message in chat_history
+    )
+
+
+@pytest.fixture
+def mock_history_settings():
+    with patch("backend.chat.history.Settings") as mock_settings:
+        settings = {
+            "chat.history_token_budget": 1000,
+            "chat.history_token_budgets": {"command-r": 2000},
+            "chat.history_recent_messages": 4,
+        }
+        mock_settings.return_value.get.side_effect = settings.get
+        yield settings
+
+
+def test_fit_chat_history_within_budget() -> None:
+    chat_history = get_long_conversation(2)
+
+    history, tokens_saved = fit_chat_history(chat_history, 100_000)
+
+    assert history == chat_history
+    assert tokens_saved == 0
+
+
+def test_fit_chat_history_compacts_older_tool_results_first() -> None:
+    chat_history = get_long_conversation(3)
+    total_tokens = count_history_tokens(chat_history)
+
+    history, tokens_saved = fit_chat_history(
+        chat_history, total_tokens - 300, recent_messages=4
+    )
+
+    # Only the oldest tool result is compacted, the recent turn is verbatim
+    assert len(history) == len(chat_history)
+    output = history[2]["tool_results"][0]["outputs"][0]["text"]
+    assert output == "x" * COMPACTED_OUTPUT_CHARACTERS + "..."
+    assert history[6] == chat_history[6]
+    assert history[-4:] == chat_history[-4:]
+    assert tokens_saved == total_tokens - count_history_tokens(history)
+    assert count_history_tokens(history) <= total_tokens - 300
+
+
+def test_fit_chat_history_drops_oldest_messages() -> None:
+    chat_history = get_long_conversation(10)
+
+    history, tokens_saved = fit_chat_history(chat_history, 300, recent_messages=4)
+
+    assert history == chat_history[-4:]
+    assert tokens_saved == count_history_tokens(chat_history) - count_history_tokens(
+        history
+    )
+
+
+def test_fit_chat_history_does_not_keep_orphan_tool_results() -> None:
+    chat_history = get_long_conversation(2)
+
+    # The recent messages start with the tool results of a dropped tool call
+    history, _ = fit_chat_history(chat_history, 10, recent_messages=6)
+
+    assert history == chat_history[3:]
+    assert history[0]["role"] != "TOOL"
+
+
+def test_fit_chat_history_keeps_chat_messages() -> None:
+    chat_history = [
+        ChatMessage(role=ChatRole.USER, message="x" * 400),
+        ChatMessage(role=ChatRole.CHATBOT, message="Hello"),
+    ]
+
+    history, tokens_saved = fit_chat_history(chat_history, 10, recent_messages=1)
+
+    assert history == chat_history[1:]
+    assert tokens_saved == 100
+
+
+def test_fit_chat_history_keeps_summary() -> None:
+    summary = {"role": "SYSTEM", "message": "Summary of the earlier conversation"}
+    chat_history = [summary] + get_long_conversation(10)
+
+    history, _ = fit_chat_history(chat_history, 300, recent_messages=4)
+
+    # The oldest turns are dropped, not the summary
+    assert history == [summary] + chat_history[-4:]
+
+
+def test_fit_chat_request_history_uses_model_budget(mock_history_settings) -> None:
+    ctx = Context()
+
+    chat_request = CohereChatRequest(
+        message="Hello", model="command-r", chat_history=get_long_conversation(5)
+    )
+    tokens_saved = fit_chat_request_history(chat_request, ctx)
+
+    assert tokens_saved > 0
+    assert 1000 < count_history_tokens(chat_request.chat_history) <= 2000
+
+    mock_history_settings["chat.history_token_budget"] = None
+    chat_request = CohereChatRequest(
+        message="Hello", model="command", chat_history=get_long_conversation(5)
+    )
+
+    assert fit_chat_request_history(chat_request, ctx) == 0
+    assert len(chat_request.chat_history) == 20
+
+
+def test_fit_chat_request_history_uses_registered_tokenizer(
+    mock_history_settings,
+) -> None:
+    register_tokenizer("words", lambda text: len(text.split()))
+    mock_history_settings["chat.history_tokenizer"] = "words"
+    chat_history = [
+        ChatMessage(role=ChatRole.USER, message="one two three"),
+        ChatMessage(role=ChatRole.CHATBOT, message="four"),
+    ]
+    mock_history_settings["chat.history_token_budget"] = 3
+    mock_history_settings["chat.history_recent_messages"] = 0
+
+    chat_request = CohereChatRequest(message="Hello", chat_history=chat_history)
+
+    assert fit_chat_request_history(chat_request, Context()) == 3
+    assert chat_request.chat_history == chat_history[1:]
+
+
+@pytest.mark.asyncio
+async def test_custom_chat_fits_chat_history(mock_history_settings) -> None:
+    sent_histories = []
+
+    class RecordingDeployment(MockLatencyDeployment):
+        async def invoke_chat_stream(self, chat_request, ctx, **kwargs):
+            sent_histories.append(list(chat_request.chat_history))
+            async for event in super().invoke_chat_stream(chat_request, ctx, **kwargs):
+                yield event
+
+    chat_history = get_long_conversation(10)
+    chat_request = CohereChatRequest(message="Hello", chat_history=chat_history)
+    deployment = RecordingDeployment(event_streams=[EVENTS])
+    ctx = Context()
+    ctx.with_deployment_name("Cohere Platform")
+
+    with patch("backend.chat.custom.custom.get_deployment", return_value=deployment):
+        events = [event async for event in CustomChat().chat(chat_request, None, ctx)]
+
+    assert events[-1]["finish_reason"] == "COMPLETE"
+    assert len(sent_histories[0]) < len(chat_history)
+    assert count_history_tokens(sent_histories[0]) <= 1000
+    assert sent_histories[0][-1].message == "Answer 9"
+
+
+@pytest.mark.benchmark
+def test_benchmark_prompt_size_of_long_conversation() -> None:
+    # Each step of a tool loop resends the chat history with the results of the previous steps
+    def get_prompt_tokens(token_budget: int | None) -> int:
+        chat_history = get_long_conversation(50)
+        prompt_tokens = 0
+        for step in range(15):
+            if token_budget is not None:
+                chat_history, _ = fit_chat_history(chat_history, token_budget)
+            prompt_tokens += count_history_tokens(chat_history)
+            chat_history = chat_history + get_tool_turn(50 + step)[1:3]
+        return prompt_tokens
+
+    unlimited_tokens = get_prompt_tokens(None)
+    fitted_tokens = get_prompt_tokens(8000)
+
+    assert fitted_tokens <= 15 * 8000
+    assert fitted_tokens < unlimited_tokens * 0.3
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from backend.chat.custom.single_flight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_single_flight_coalesces_concurrent_calls() -> None:
+    single_flight = SingleFlight()
+    calls = []
+
+    async def call(key: str) -> str:
+        calls.append(key)
+        await asyncio.sleep(0.05)
+        return f"{key} result"
+
+    results = await asyncio.gather(
+        *[single_flight.call("same", lambda: call("same")) for _ in range(10)],
+        single_flight.call("other", lambda: call("other")),
+    )
+
+    assert calls == ["same", "other"]
+    assert results == ["same result"] * 10 + ["other result"]
+    assert single_flight.stats.calls == 2
+    assert single_flight.stats.coalesced == 9
+    assert single_flight.flights == {}
+
+    # A finished call is not cached
+    await single_flight.call("same", lambda: call("same"))
+    assert calls == ["same", "other", "same"]
+
+
+@pytest.mark.asyncio
+async def test_single_flight_shares_errors() -> None:
+    single_flight = SingleFlight()
+
+    async def call() -> None:
+        await asyncio.sleep(0.01)
+        raise ValueError("Upstream error")
+
+    results = await asyncio.gather(
+        single_flight.call("key", call),
+        single_flight.call("key", call),
+        return_exceptions=True,
+    )
+
+    assert [str(result) for result in results] == ["Upstream error"] * 2
+    assert single_flight.stats.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_single_flight_cancels_call_when_all_callers_are_cancelled() -> None:
+    single_flight = SingleFlight()
+    cancelled = asyncio.Event()
+
+    async def call() -> str:
+        try:
+            await asyncio.sleep(0.2)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        return "result"
+
+    leader = asyncio.create_task(single_flight.call("key", call))
+    follower = asyncio.create_task(single_flight.call("key", call))
+    await asyncio.sleep(0.01)
+
+    # The follower still gets the result when the caller that started the call is cancelled
+    leader.cancel()
+    assert await follower == "result"
+    assert not cancelled.is_set()
+
+    only_caller = asyncio.create_task(single_flight.call("key", call))
+    await asyncio.sleep(0.01)
+    only_caller.cancel()
+    await asyncio.wait_for(cancelled.wait(), timeout=1)
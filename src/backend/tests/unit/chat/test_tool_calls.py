@@ -1,14 +1,15 @@
 import asyncio
+import time
 from typing import Any, Dict, List
 from unittest.mock import patch
 
 import pytest
-from fastapi import HTTPException
 
-from backend.chat.custom.tool_calls import async_call_tools
+from backend.chat.custom.tool_calls import SpeculativeToolCalls, async_call_tools
 from backend.config.tools import Tool
-from backend.schemas.tool import ToolCategory, ToolDefinition
+from backend.schemas.tool import ToolCallScope, ToolCategory, ToolDefinition
 from backend.services.context import Context
+from backend.tests.unit.mock_tools import get_latency_tool
 from backend.tests.unit.model_deployments.mock_deployments import MockCohereDeployment
 from backend.tools.base import BaseTool
 
@@ -160,12 +161,18 @@ def test_async_call_tools_timeout(mock_get_available_tools) -> None:
     ]
     mock_get_available_tools.return_value = {Tool.Calculator.value.ID: MockCalculator.get_tool_definition()}
 
-    with pytest.raises(HTTPException) as excinfo:
-        asyncio.run(async_call_tools(chat_history, MockCohereDeployment(), ctx))
-    assert str(excinfo.value.status_code) == "500"
-    assert (
-        str(excinfo.value.detail) == "Timeout while calling tools with timeout: 1"
-        )
+    results = asyncio.run(
+        async_call_tools(chat_history, MockCohereDeployment(), ctx)
+    )
+    assert results == [
+        {
+            "call": {
+                "name": "toolkit_calculator",
+                "parameters": {"code": "6*7"},
+            },
+            "outputs": [{'type': 'timeout', 'success': False, 'text': 'Timeout while calling tool toolkit_calculator.', 'details': 'Tool call did not finish within 1 seconds'}],
+        }
+    ]
 
 
 def test_async_call_tools_failure_and_success(mock_get_available_tools) -> None:
@@ -388,3 +395,224 @@ def test_tools_params_checker_required_param_empty(mock_get_available_tools) ->
     assert {'call': {'name': 'toolkit_calculator', 'parameters': {'code': ''}}, 'outputs': [
         {'details': 'Model passed empty value for required parameter: code', 'success': False,
          'text': 'Error calling tool toolkit_calculator.', 'type': 'other'}]} in results
+
+
+def test_async_call_tools_timeout_keeps_completed_results(mock_get_available_tools) -> None:
+    fast_tool = get_latency_tool("fast_tool", 0.05)
+    slow_tool = get_latency_tool("slow_tool", 5, timeout=0.2)
+    mock_get_available_tools.return_value = {
+        fast_tool.ID: fast_tool.get_tool_definition(),
+        slow_tool.ID: slow_tool.get_tool_definition(),
+    }
+    chat_history = [
+        {
+            "tool_calls": [
+                {"name": "fast_tool", "parameters": {"code": "6*7"}},
+                {"name": "slow_tool", "parameters": {"code": "6*7"}},
+            ]
+        }
+    ]
+
+    start = time.perf_counter()
+    results = asyncio.run(
+        async_call_tools(chat_history, MockCohereDeployment(), Context())
+    )
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 1
+    assert slow_tool.cancelled
+    assert results == [
+        {
+            "call": {"name": "fast_tool", "parameters": {"code": "6*7"}},
+            "outputs": [{"text": "fast_tool result"}],
+        },
+        {
+            "call": {"name": "slow_tool", "parameters": {"code": "6*7"}},
+            "outputs": [{'type': 'timeout', 'success': False, 'text': 'Timeout while calling tool slow_tool.', 'details': 'Tool call did not finish within 0.2 seconds'}],
+        },
+    ]
+
+
+def test_async_call_tools_reports_each_tool_when_finished(mock_get_available_tools) -> None:
+    tools = [
+        get_latency_tool("slow_tool", 0.3),
+        get_latency_tool("medium_tool", 0.15),
+        get_latency_tool("fast_tool", 0.01),
+    ]
+    mock_get_available_tools.return_value = {
+        tool.ID: tool.get_tool_definition() for tool in tools
+    }
+    chat_history = [
+        {"tool_calls": [{"name": tool.ID, "parameters": {"code": "6*7"}} for tool in tools]}
+    ]
+
+    finished = []
+    results = asyncio.run(
+        async_call_tools(
+            chat_history,
+            MockCohereDeployment(),
+            Context(),
+            on_tool_result=lambda results: finished.extend(
+                result["call"]["name"] for result in results
+            ),
+        )
+    )
+
+    assert finished == ["fast_tool", "medium_tool", "slow_tool"]
+    # Results keep the order of the tool calls
+    assert [result["call"]["name"] for result in results] == [
+        "slow_tool",
+        "medium_tool",
+        "fast_tool",
+    ]
+
+
+def get_tool_call_deltas(index: int, name: str, parameters_text: str, size: int = 3) -> list[dict]:
+    return [{"index": index, "name": name}] + [
+        {"index": index, "parameters": parameters_text[i : i + size]}
+        for i in range(0, len(parameters_text), size)
+    ]
+
+
+def test_speculative_tool_calls_start_when_parameters_are_complete(mock_get_available_tools) -> None:
+    tool = get_latency_tool("search", 0.01, is_idempotent=True)
+    mock_get_available_tools.return_value = {tool.ID: tool.get_tool_definition()}
+    # Braces and escaped quotes inside strings do not close the object
+    parameters_text = '{"text": "a \\"}\\" {b}", "filters": {"year": [2023, 2024]}}'
+
+    async def run() -> list[dict]:
+        speculative = SpeculativeToolCalls(None, MockCohereDeployment(), Context())
+        deltas = get_tool_call_deltas(0, tool.ID, parameters_text)
+        for delta in deltas[:-1]:
+            speculative.add_delta(delta)
+            assert not speculative.tasks
+        speculative.add_delta(deltas[-1])
+        assert speculative.tasks
+
+        chat_history = [
+            {"tool_calls": [{"name": tool.ID, "parameters": {"filters": {"year": [2023, 2024]}, "text": 'a "}" {b}'}}]}
+        ]
+        return await async_call_tools(
+            chat_history,
+            MockCohereDeployment(),
+            Context(),
+            speculative_tool_calls=speculative,
+        )
+
+    results = asyncio.run(run())
+
+    assert tool.calls == [{"text": 'a "}" {b}', "filters": {"year": [2023, 2024]}}]
+    assert results == [
+        {
+            "call": {"name": "search", "parameters": {"filters": {"year": [2023, 2024]}, "text": 'a "}" {b}'}},
+            "outputs": [{"text": "search result"}],
+        }
+    ]
+
+
+def test_speculative_tool_calls_skip_tools_that_are_not_idempotent(mock_get_available_tools) -> None:
+    tool = get_latency_tool("send_email", 0.01)
+    mock_get_available_tools.return_value = {tool.ID: tool.get_tool_definition()}
+
+    async def run() -> None:
+        speculative = SpeculativeToolCalls(None, MockCohereDeployment(), Context())
+        for delta in get_tool_call_deltas(0, tool.ID, '{"to": "someone"}'):
+            speculative.add_delta(delta)
+        assert not speculative.tasks
+
+    asyncio.run(run())
+
+    assert tool.calls == []
+
+
+def test_speculative_tool_calls_are_cancelled_when_final_call_differs(mock_get_available_tools) -> None:
+    tool = get_latency_tool("search", 0.3, is_idempotent=True)
+    mock_get_available_tools.return_value = {tool.ID: tool.get_tool_definition()}
+
+    async def run() -> list[dict]:
+        speculative = SpeculativeToolCalls(None, MockCohereDeployment(), Context())
+        for delta in get_tool_call_deltas(0, tool.ID, '{"text": "draft"}'):
+            speculative.add_delta(delta)
+        await asyncio.sleep(0)
+
+        chat_history = [{"tool_calls": [{"name": tool.ID, "parameters": {"text": "final"}}]}]
+        results = await async_call_tools(
+            chat_history,
+            MockCohereDeployment(),
+            Context(),
+            speculative_tool_calls=speculative,
+        )
+        await asyncio.sleep(0)
+        return results
+
+    results = asyncio.run(run())
+
+    assert tool.calls == [{"text": "draft"}, {"text": "final"}]
+    assert tool.cancelled
+    assert results == [
+        {
+            "call": {"name": "search", "parameters": {"text": "final"}},
+            "outputs": [{"text": "search result"}],
+        }
+    ]
+
+
+@pytest.fixture
+def mock_single_flight_settings():
+    with patch("backend.chat.custom.tool_calls.Settings") as mock_settings:
+        settings = {"tools.single_flight_tool_calls": True, "tools.single_flight_scope": "step"}
+        mock_settings.return_value.get.side_effect = settings.get
+        yield settings
+
+
+@pytest.mark.parametrize("is_idempotent, upstream_calls", [(True, 1), (False, 5)])
+def test_async_call_tools_coalesces_identical_calls_in_a_step(
+    mock_get_available_tools, mock_single_flight_settings, is_idempotent, upstream_calls
+) -> None:
+    tool = get_latency_tool("search", 0.05, is_idempotent=is_idempotent)
+    mock_get_available_tools.return_value = {tool.ID: tool.get_tool_definition()}
+    tool_call = {"name": tool.ID, "parameters": {"text": "trending"}}
+
+    results = asyncio.run(
+        async_call_tools(
+            [{"tool_calls": [tool_call] * 5}], MockCohereDeployment(), Context()
+        )
+    )
+
+    assert len(tool.calls) == upstream_calls
+    # The results of identical calls are merged when they are reranked
+    assert results == [{"call": tool_call, "outputs": [{"text": "search result"}] * 5}]
+
+
+@pytest.mark.parametrize(
+    "scope, upstream_calls",
+    [
+        (ToolCallScope.Step, 4),
+        (ToolCallScope.User, 2),
+        (ToolCallScope.Global, 1),
+    ],
+)
+def test_async_call_tools_coalesces_concurrent_requests_in_scope(
+    mock_get_available_tools, mock_single_flight_settings, scope, upstream_calls
+) -> None:
+    tool = get_latency_tool("search", 0.1, is_idempotent=True, single_flight_scope=scope)
+    mock_get_available_tools.return_value = {tool.ID: tool.get_tool_definition()}
+    chat_history = [{"tool_calls": [{"name": tool.ID, "parameters": {"text": "trending"}}]}]
+
+    def get_ctx(user_id: str) -> Context:
+        ctx = Context()
+        ctx.with_user_id(user_id)
+        return ctx
+
+    async def run() -> list[list[dict]]:
+        return await asyncio.gather(
+            *[
+                async_call_tools(chat_history, MockCohereDeployment(), get_ctx(user_id))
+                for user_id in ("user-1", "user-1", "user-2", "user-2")
+            ]
+        )
+
+    results = asyncio.run(run())
+
+    assert len(tool.calls) == upstream_calls
+    assert all(result == results[0] for result in results)
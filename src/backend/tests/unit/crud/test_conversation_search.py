@@ -0,0 +1,202 @@
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import Session
+
+from backend.crud import conversation as conversation_crud
+from backend.crud import conversation_search as conversation_search_crud
+from backend.database_models.base import Base
+from backend.database_models.conversation import Conversation, ConversationSearch
+from backend.schemas.conversation import UpdateConversationRequest
+from backend.tests.unit.factories import get_factory
+
+
+def create_indexed_conversation(session, user, title, texts=(), **kwargs):
+    conversation = get_factory("Conversation", session).create(
+        title=title, user_id=user.id, **kwargs
+    )
+    conversation_search_crud.index_conversation_title(session, conversation)
+    conversation_search_crud.index_conversation_messages(
+        session, conversation, list(texts)
+    )
+    return conversation
+
+
+def test_search_conversations_by_title(session, user):
+    conversation = create_indexed_conversation(session, user, "Rainbow colors")
+    _ = create_indexed_conversation(session, user, "Hello, World!")
+
+    results = conversation_search_crud.search_conversations(session, user.id, "colors")
+    assert [result.id for result in results] == [conversation.id]
+
+
+def test_search_conversations_by_message_text(session, user):
+    conversation = create_indexed_conversation(
+        session, user, "New Conversation", ["How far is the moon?"]
+    )
+    conversation_search_crud.index_conversation_messages(
+        session, conversation, ["About 384,400 kilometers."]
+    )
+
+    results = conversation_search_crud.search_conversations(
+        session, user.id, "moon kilometers"
+    )
+    assert [result.id for result in results] == [conversation.id]
+
+
+def test_index_conversation_messages_truncates_long_messages(session, user):
+    long_text = "filler " * conversation_search_crud.MAX_INDEXED_MESSAGE_LENGTH
+    _ = create_indexed_conversation(
+        session, user, "New Conversation", [long_text + "kilometers"]
+    )
+
+    assert conversation_search_crud.search_conversations(session, user.id, "filler")
+    assert not conversation_search_crud.search_conversations(
+        session, user.id, "kilometers"
+    )
+
+
+def test_index_conversation_messages_caps_content_vector(session, user):
+    conversation = create_indexed_conversation(session, user, "New Conversation")
+
+    with patch.object(conversation_search_crud, "MAX_CONTENT_VECTOR_SIZE", 4096):
+        for turn in range(20):
+            conversation_search_crud.index_conversation_messages(
+                session,
+                conversation,
+                [" ".join(f"turn{turn}word{word}" for word in range(50))],
+            )
+
+    size = session.query(
+        func.pg_column_size(ConversationSearch.content_vector)
+    ).scalar()
+    assert size <= 4096
+    assert conversation_search_crud.search_conversations(session, user.id, "turn0word0")
+    assert not conversation_search_crud.search_conversations(
+        session, user.id, "turn19word0"
+    )
+
+
+def test_search_conversations_ranks_title_first(session, user):
+    message_match = create_indexed_conversation(
+        session, user, "Astronomy", ["Tell me about the moon"]
+    )
+    title_match = create_indexed_conversation(session, user, "The moon")
+
+    results = conversation_search_crud.search_conversations(session, user.id, "moon")
+    assert [result.id for result in results] == [title_match.id, message_match.id]
+
+    results = conversation_search_crud.search_conversations(
+        session, user.id, "moon", offset=1, limit=1
+    )
+    assert [result.id for result in results] == [message_match.id]
+
+
+def test_search_conversations_other_user(session, user):
+    _ = create_indexed_conversation(session, user, "Rainbow colors")
+    user2 = get_factory("User", session).create()
+
+    assert conversation_search_crud.search_conversations(session, user2.id, "colors") == []
+
+
+def test_search_conversations_by_agent(session, user):
+    agent = get_factory("Agent", session).create(user=user)
+    conversation = create_indexed_conversation(
+        session, user, "Rainbow colors", agent_id=agent.id
+    )
+    _ = create_indexed_conversation(session, user, "Rainbow colors")
+
+    results = conversation_search_crud.search_conversations(
+        session, user.id, "colors", agent_id=agent.id
+    )
+    assert [result.id for result in results] == [conversation.id]
+
+
+def test_search_conversations_empty_query(session, user):
+    _ = create_indexed_conversation(session, user, "Rainbow colors")
+
+    assert conversation_search_crud.search_conversations(session, user.id, " ?! ") == []
+
+
+def test_create_and_update_conversation_index_title(session, user):
+    conversation = conversation_crud.create_conversation(
+        session, Conversation(user_id=user.id, title="Rainbow colors")
+    )
+    results = conversation_search_crud.search_conversations(session, user.id, "rainbow")
+    assert [result.id for result in results] == [conversation.id]
+
+    conversation_crud.update_conversation(
+        session, conversation, UpdateConversationRequest(title="Moon landing")
+    )
+    assert conversation_search_crud.search_conversations(session, user.id, "rainbow") == []
+    results = conversation_search_crud.search_conversations(session, user.id, "moon")
+    assert [result.id for result in results] == [conversation.id]
+
+
+def test_reindex_conversation(session, user):
+    conversation = create_indexed_conversation(
+        session, user, "New Conversation", ["Tell me about the moon"]
+    )
+    _ = get_factory("Message", session).create(
+        text="Tell me about the sun",
+        conversation_id=conversation.id,
+        user_id=user.id,
+        is_active=True,
+    )
+    session.refresh(conversation)
+
+    conversation_search_crud.reindex_conversation(session, conversation)
+
+    assert conversation_search_crud.search_conversations(session, user.id, "moon") == []
+    results = conversation_search_crud.search_conversations(session, user.id, "sun")
+    assert [result.id for result in results] == [conversation.id]
+
+
+def test_delete_conversation_deletes_index(session, user):
+    conversation = create_indexed_conversation(session, user, "Rainbow colors")
+
+    conversation_crud.delete_conversation(session, conversation.id, user.id)
+
+    assert session.query(ConversationSearch).count() == 0
+
+
+@pytest.fixture
+def sqlite_session():
+    engine = create_engine("sqlite://")
+    tables = [
+        table
+        for table in Base.metadata.sorted_tables
+        if table.name != ConversationSearch.__tablename__
+    ]
+    Base.metadata.create_all(engine, tables=tables)
+    session = Session(bind=engine)
+    conversation_search_crud.create_sqlite_search_table(session)
+
+    yield session
+
+    session.close()
+    engine.dispose()
+
+
+def test_search_conversations_sqlite(sqlite_session):
+    conversation = Conversation(id="1", user_id="1", title="Astronomy")
+    title_match = Conversation(id="2", user_id="1", title="The moon")
+    other_user = Conversation(id="3", user_id="2", title="The moon")
+    for item in (conversation, title_match, other_user):
+        conversation_crud.create_conversation(sqlite_session, item)
+    conversation_search_crud.index_conversation_messages(
+        sqlite_session, conversation, ["Tell me about the moon"]
+    )
+
+    results = conversation_search_crud.search_conversations(sqlite_session, "1", "moon")
+    assert [result.id for result in results] == ["2", "1"]
+
+    results = conversation_search_crud.search_conversations(
+        sqlite_session, "1", "moon", offset=1, limit=1
+    )
+    assert [result.id for result in results] == ["1"]
+
+    conversation_crud.delete_conversation(sqlite_session, "2", "1")
+    results = conversation_search_crud.search_conversations(sqlite_session, "1", "moon")
+    assert [result.id for result in results] == ["1"]
@@ -1,7 +1,12 @@
+import tracemalloc
+from contextlib import contextmanager
+
 import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import InvalidRequestError
 
 from backend.crud import file as file_crud
-from backend.database_models.file import File
+from backend.database_models.file import File, SharedFileContent
 from backend.tests.unit.factories import get_factory
 
 
@@ -10,6 +15,27 @@ def conversation(session, user):
     return get_factory("Conversation", session).create(id="1", user_id=user.id)
 
 
+@contextmanager
+def record_queries(session):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = session.get_bind().engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def loaded_bytes(files):
+    return sum(
+        len(value) for file in files for value in vars(file).values() if isinstance(value, str)
+    )
+
+
 def test_create_file(session, user):
     file_data = File(
         file_name="test.txt",
@@ -115,3 +141,187 @@ def test_delete_file(session, user):
 
     file_crud.delete_file(session, file.id, user.id)
     assert file_crud.get_file(session, file.id, user.id) is None
+
+
+def test_get_files_by_conversation_ids(session, user):
+    conversation2 = get_factory("Conversation", session).create(id="2", user_id=user.id)
+    conversation3 = get_factory("Conversation", session).create(id="3", user_id=user.id)
+    file = get_factory("File", session).create(file_name="test.txt", user_id=user.id)
+    file2 = get_factory("File", session).create(file_name="test2.txt", user_id=user.id)
+    other_user_file = get_factory("File", session).create(file_name="test3.txt")
+    for conversation_id, file_id in [
+        ("1", file.id),
+        ("1", other_user_file.id),
+        (conversation2.id, file2.id),
+    ]:
+        _ = get_factory("ConversationFileAssociation", session).create(
+            conversation_id=conversation_id, user_id=user.id, file_id=file_id
+        )
+
+    files = file_crud.get_files_by_conversation_ids(
+        session, ["1", conversation2.id, conversation3.id], user.id
+    )
+    assert {
+        conversation_id: [file.file_name for file in conversation_files]
+        for conversation_id, conversation_files in files.items()
+    } == {"1": ["test.txt"], "2": ["test2.txt"], "3": []}
+
+
+def test_get_files_by_conversation_ids_loads_metadata_once(session, user):
+    content = "a" * 1_000_000
+    conversation_ids = ["1"]
+    for i in range(2, 11):
+        conversation_ids.append(
+            get_factory("Conversation", session).create(id=str(i), user_id=user.id).id
+        )
+    for conversation_id in conversation_ids:
+        file = get_factory("File", session).create(
+            file_name="test.txt", file_content=content, user_id=user.id
+        )
+        _ = get_factory("ConversationFileAssociation", session).create(
+            conversation_id=conversation_id, user_id=user.id, file_id=file.id
+        )
+    session.expunge_all()
+
+    with record_queries(session) as statements:
+        files = file_crud.get_files_by_conversation_ids(session, conversation_ids, user.id)
+
+    batched_files = [
+        file for conversation_files in files.values() for file in conversation_files
+    ]
+    assert [file.file_name for file in batched_files] == ["test.txt"] * 10
+    assert len(statements) == 1
+    assert "file_content" not in statements[0]
+    file_ids = [file.id for file in batched_files]
+    session.expunge_all()
+
+    # A query per conversation, loading the content of every file
+    with record_queries(session) as statements:
+        files = [
+            file_crud.get_files_by_ids(session, [file_id], user.id, with_content=True)[0]
+            for file_id in file_ids
+        ]
+
+    assert len(statements) == 10
+    assert loaded_bytes(files) > 10 * len(content)
+    assert loaded_bytes(batched_files) < len(content) / 100
+
+
+def test_get_file_defers_content(session, user):
+    _ = get_factory("File", session).create(
+        id="1", file_name="test.txt", file_content="Hello, World!", user_id=user.id
+    )
+    session.expunge_all()
+
+    file = file_crud.get_file(session, "1", user.id)
+    assert "file_content" not in vars(file)
+    assert file.file_content == "Hello, World!"
+
+    session.expunge_all()
+    file = file_crud.get_file(session, "1", user.id, with_content=True)
+    assert vars(file)["file_content"] == "Hello, World!"
+
+
+def test_get_file_metadata(session, user):
+    _ = get_factory("File", session).create(
+        id="1", file_name="test.txt", file_content="Hello, World!", user_id=user.id
+    )
+    session.expunge_all()
+
+    file = file_crud.get_file_metadata(session, "1", user.id)
+    assert file.file_name == "test.txt"
+    with pytest.raises(InvalidRequestError):
+        _ = file.file_content
+
+
+def test_get_files_metadata_by_ids(session, user):
+    for i in range(3):
+        _ = get_factory("File", session).create(
+            id=str(i), file_name=f"test{i}.txt", file_content="Hello", user_id=user.id
+        )
+    session.expunge_all()
+
+    files = file_crud.get_files_metadata_by_ids(session, ["0", "2"], user.id)
+    assert sorted(file.file_name for file in files) == ["test0.txt", "test2.txt"]
+    assert all("file_content" not in vars(file) for file in files)
+
+
+def test_iter_file_content(session, user):
+    _ = get_factory("File", session).create(
+        id="1", file_name="test.txt", file_content="Hello, World!", user_id=user.id
+    )
+
+    chunks = list(file_crud.iter_file_content(session, "1", user.id, chunk_size=5))
+    assert chunks == ["Hello", ", Wor", "ld!"]
+    assert list(file_crud.iter_file_content(session, "1", "2")) == []
+
+
+def test_iter_shared_file_content(session, user):
+    shared_content = file_crud.create_shared_file_content(
+        session, SharedFileContent(upload_hash="txt:1", text="Hello, World!")
+    )
+    _ = get_factory("File", session).create(
+        id="1", file_name="test.txt", shared_content_id=shared_content.id, user_id=user.id
+    )
+
+    chunks = list(file_crud.iter_file_content(session, "1", user.id, chunk_size=5))
+    assert chunks == ["Hello", ", Wor", "ld!"]
+
+
+def test_acquire_and_release_shared_file_content(session, user):
+    assert file_crud.acquire_shared_file_content(session, "txt:1") is None
+    shared_content = file_crud.create_shared_file_content(
+        session, SharedFileContent(upload_hash="txt:1", storage_key="key", ref_count=1)
+    )
+
+    acquired = file_crud.acquire_shared_file_content(session, "txt:1")
+    assert acquired.id == shared_content.id
+    session.refresh(acquired)
+    assert acquired.ref_count == 2
+
+    file_crud.release_shared_file_contents(session, [shared_content.id])
+    assert file_crud.delete_unreferenced_shared_file_contents(session) == []
+
+    file_crud.release_shared_file_contents(session, [shared_content.id])
+    assert file_crud.get_referenced_storage_keys(session, ["key"]) == {"key"}
+    assert file_crud.delete_unreferenced_shared_file_contents(session) == ["key"]
+    assert session.query(SharedFileContent).count() == 0
+    assert file_crud.get_referenced_storage_keys(session, ["key"]) == set()
+
+
+def test_delete_unreferenced_shared_file_contents_keeps_referenced(session, user):
+    shared_content = file_crud.create_shared_file_content(
+        session, SharedFileContent(upload_hash="txt:1", ref_count=0)
+    )
+    _ = get_factory("File", session).create(
+        shared_content_id=shared_content.id, user_id=user.id
+    )
+
+    assert file_crud.delete_unreferenced_shared_file_contents(session) == []
+    assert session.query(SharedFileContent).count() == 1
+
+
+def test_list_agent_files_metadata_memory(session, user):
+    content = "a" * 2_000_000
+    file_ids = [
+        get_factory("File", session).create(file_content=content, user_id=user.id).id
+        for _ in range(10)
+    ]
+
+    def peak_memory(get_files):
+        session.expunge_all()
+        tracemalloc.start()
+        try:
+            files = get_files(session, file_ids, user.id)
+            assert len(files) == 10
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    with_content = peak_memory(
+        lambda *args: file_crud.get_files_by_ids(*args, with_content=True)
+    )
+    metadata = peak_memory(file_crud.get_files_metadata_by_ids)
+
+    assert with_content > 10 * len(content)
+    assert metadata < len(content)
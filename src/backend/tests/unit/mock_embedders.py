@@ -0,0 +1,23 @@
+import numpy as np
+
+from backend.services.embeddings import HashingEmbedder
+
+
+class CountingEmbedder(HashingEmbedder):
+    """
+    Hashing embedder that counts the embedded documents in `embedded_texts`, and the
+    embedded queries in `queries`.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.embedded_texts = 0
+        self.queries = 0
+
+    def embed_documents(self, texts: list[str]) -> np.ndarray:
+        self.embedded_texts += len(texts)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text: str) -> np.ndarray:
+        self.queries += 1
+        return HashingEmbedder.embed_documents(self, [text])[0]
@@ -0,0 +1,7 @@
+from backend.tests.unit.mock_tools.mock_faulty import get_faulty_tool
+from backend.tests.unit.mock_tools.mock_latency import get_latency_tool
+
+__all__ = [
+    "get_faulty_tool",
+    "get_latency_tool",
+]
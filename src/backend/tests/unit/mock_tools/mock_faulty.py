@@ -0,0 +1,68 @@
+import asyncio
+from typing import Any, Dict, List
+
+from backend.schemas.tool import ToolCategory, ToolDefinition
+from backend.tools.base import BaseTool
+
+
+def get_faulty_tool(
+    tool_id: str,
+    latency: float = 0,
+    timeout: float | None = None,
+    max_concurrent_calls: int | None = None,
+    circuit_breaker_failures: int | None = None,
+) -> type[BaseTool]:
+    """
+    Create a mocked tool whose faults are injected by setting its `fault` attribute:
+    None to succeed, "error" to raise an error, "error_output" to return a tool error,
+    "no_results" to return no results, or "hang" to never return.
+
+    Each call records its parameters in `calls`, and `max_active` is the most concurrent calls.
+    """
+
+    class MockFaultyTool(BaseTool):
+        ID = tool_id
+        fault = None
+        calls = []
+        active = 0
+        max_active = 0
+
+        @classmethod
+        def get_tool_definition(cls) -> ToolDefinition:
+            return ToolDefinition(
+                name=cls.ID,
+                display_name=cls.ID,
+                implementation=cls,
+                parameter_definitions={},
+                is_visible=False,
+                is_available=True,
+                category=ToolCategory.DataLoader,
+                error_message=cls.generate_error_message(),
+                description="Tool with injectable faults.",
+                timeout=timeout,
+                max_concurrent_calls=max_concurrent_calls,
+                circuit_breaker_failures=circuit_breaker_failures,
+            )
+
+        async def call(
+            self, parameters: dict, ctx: Any, **kwargs: Any
+        ) -> List[Dict[str, Any]]:
+            cls = self.__class__
+            cls.calls.append(parameters)
+            cls.active += 1
+            cls.max_active = max(cls.max_active, cls.active)
+            try:
+                await asyncio.sleep(latency)
+                if cls.fault == "hang":
+                    await asyncio.Event().wait()
+                if cls.fault == "error":
+                    raise ConnectionError("Connection refused")
+                if cls.fault == "error_output":
+                    return self.get_tool_error(details="Service unavailable")
+                if cls.fault == "no_results":
+                    return self.get_no_results_error()
+            finally:
+                cls.active -= 1
+            return [{"text": f"{self.ID} result"}]
+
+    return MockFaultyTool
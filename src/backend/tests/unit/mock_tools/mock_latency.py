@@ -0,0 +1,54 @@
+import asyncio
+from typing import Any, Dict, List
+
+from backend.schemas.tool import ToolCallScope, ToolCategory, ToolDefinition
+from backend.tools.base import BaseTool
+
+
+def get_latency_tool(
+    tool_id: str,
+    latency: float,
+    timeout: float | None = None,
+    is_idempotent: bool = False,
+    single_flight_scope: ToolCallScope | None = None,
+) -> type[BaseTool]:
+    """
+    Create a mocked tool that takes `latency` seconds to return its result.
+
+    Each call records its parameters in `calls`, and `cancelled` is set if a call is cancelled.
+    """
+
+    class MockLatencyTool(BaseTool):
+        ID = tool_id
+        cancelled = False
+        calls = []
+
+        @classmethod
+        def get_tool_definition(cls) -> ToolDefinition:
+            return ToolDefinition(
+                name=cls.ID,
+                display_name=cls.ID,
+                implementation=cls,
+                parameter_definitions={},
+                is_visible=False,
+                is_available=True,
+                category=ToolCategory.DataLoader,
+                error_message=cls.generate_error_message(),
+                description="Tool with a controllable latency.",
+                is_idempotent=is_idempotent,
+                timeout=timeout,
+                single_flight_scope=single_flight_scope,
+            )
+
+        async def call(
+            self, parameters: dict, ctx: Any, **kwargs: Any
+        ) -> List[Dict[str, Any]]:
+            self.calls.append(parameters)
+            try:
+                await asyncio.sleep(latency)
+            except asyncio.CancelledError:
+                self.__class__.cancelled = True
+                raise
+            return [{"text": f"{self.ID} result"}]
+
+    return MockLatencyTool
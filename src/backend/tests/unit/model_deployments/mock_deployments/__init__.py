@@ -7,6 +7,9 @@ from backend.tests.unit.model_deployments.mock_deployments.mock_bedrock import (
 from backend.tests.unit.model_deployments.mock_deployments.mock_cohere_platform import (
     MockCohereDeployment,
 )
+from backend.tests.unit.model_deployments.mock_deployments.mock_latency import (
+    MockLatencyDeployment,
+)
 from backend.tests.unit.model_deployments.mock_deployments.mock_sagemaker import (
     MockSageMakerDeployment,
 )
@@ -20,4 +23,5 @@ __all__ = [
     "MockAzureDeployment",
     "MockBedrockDeployment",
     "MockSingleContainerDeployment",
+    "MockLatencyDeployment",
 ]
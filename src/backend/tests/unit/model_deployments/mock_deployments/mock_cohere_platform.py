@@ -6,6 +6,7 @@ from cohere.types import StreamedChatResponse
 from backend.schemas.cohere_chat import CohereChatRequest
 from backend.schemas.context import Context
 from backend.services.conversation import SEARCH_RELEVANCE_THRESHOLD
+from backend.services.embeddings import HashingEmbedder
 from backend.tests.unit.model_deployments.mock_deployments.mock_base import (
     MockDeployment,
 )
@@ -17,7 +18,7 @@ class MockCohereDeployment(MockDeployment):
     DEFAULT_MODELS = ["command", "command-r"]
 
     def __init__(self, **kwargs: Any):
-        pass
+        self.embed_batches = []
 
     @staticmethod
     def name() -> str:
@@ -31,6 +32,13 @@ class MockCohereDeployment(MockDeployment):
     def rerank_enabled() -> bool:
         return True
 
+    @staticmethod
+    def embed_enabled() -> bool:
+        return True
+
+    def embed_model(self) -> str | None:
+        return HashingEmbedder().model_name
+
     @classmethod
     def list_models(cls) -> list[str]:
         return cls.DEFAULT_MODELS
@@ -44,9 +52,9 @@ class MockCohereDeployment(MockDeployment):
         return {"COHERE_API_KEY": "fake-api-key"}
 
 
-    def invoke_chat(
-        self, chat_request: CohereChatRequest, ctx: Context, **kwargs: Any
-    ) -> Generator[StreamedChatResponse, None, None]:
+    async def invoke_chat(
+        self, chat_request: CohereChatRequest, **kwargs: Any
+    ) -> Any:
         event = {
             "text": "Hi! Hello there! How's it going?",
             "generation_id": "ca0f398e-f8c8-48f0-b093-12d1754d00ed",
@@ -96,5 +104,11 @@ class MockCohereDeployment(MockDeployment):
         }
         return event
 
+    async def embed_batch(
+        self, texts: list[str], input_type: str, ctx: Context, **kwargs: Any
+    ) -> list[list[float]]:
+        self.embed_batches.append(texts)
+        return HashingEmbedder().embed_documents(texts).tolist()
+
 # Overriding the name so that the proper deployment is selected
 MockCohereDeployment.__name__ = "CohereDeployment"
@@ -0,0 +1,81 @@
+import asyncio
+import random
+from typing import Any, Generator
+
+from cohere.types import StreamedChatResponse
+
+from backend.schemas.cohere_chat import CohereChatRequest
+from backend.schemas.context import Context
+from backend.tests.unit.model_deployments.mock_deployments.mock_cohere_platform import (
+    MockCohereDeployment,
+)
+
+
+class MockLatencyDeployment(MockCohereDeployment):
+    """
+    Mocked Cohere Platform Deployment that adds latency to every call. With failure_rate, the
+    chat calls fail before their first event with that probability.
+    """
+
+    def __init__(
+        self,
+        rerank_latency: float = 0,
+        event_latency: float = 0,
+        event_streams: list[list[dict]] | None = None,
+        first_event_latency: float = 0,
+        failure_rate: float = 0,
+        seed: int = 0,
+        **kwargs: Any,
+    ):
+        super().__init__(**kwargs)
+        self.rerank_latency = rerank_latency
+        self.event_latency = event_latency
+        # One event stream per chat call, the last one is repeated
+        self.event_streams = event_streams
+        self.first_event_latency = first_event_latency
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.failed_calls = 0
+        self.chat_calls = 0
+        self.rerank_calls = 0
+        self.events_sent = 0
+        self.open_streams = 0
+        self.in_flight_reranks = 0
+        self.max_in_flight_reranks = 0
+
+    async def invoke_chat_stream(
+        self, chat_request: CohereChatRequest, ctx: Context, **kwargs: Any
+    ) -> Generator[StreamedChatResponse, None, None]:
+        event_stream = self.event_stream
+        if self.event_streams:
+            event_stream = self.event_streams[
+                min(self.chat_calls, len(self.event_streams) - 1)
+            ]
+        self.chat_calls += 1
+
+        self.open_streams += 1
+        try:
+            await asyncio.sleep(self.first_event_latency)
+            if self.random.random() < self.failure_rate:
+                self.failed_calls += 1
+                raise ConnectionError("Deployment unavailable")
+            for event in event_stream:
+                await asyncio.sleep(self.event_latency)
+                self.events_sent += 1
+                yield event
+        finally:
+            self.open_streams -= 1
+
+    async def invoke_rerank(
+        self, query: str, documents: list[str], ctx: Context, **kwargs: Any
+    ) -> Any:
+        self.rerank_calls += 1
+        self.in_flight_reranks += 1
+        self.max_in_flight_reranks = max(
+            self.max_in_flight_reranks, self.in_flight_reranks
+        )
+        try:
+            await asyncio.sleep(self.rerank_latency)
+            return await super().invoke_rerank(query, documents, ctx, **kwargs)
+        finally:
+            self.in_flight_reranks -= 1
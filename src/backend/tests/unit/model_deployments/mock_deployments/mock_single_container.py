@@ -4,6 +4,7 @@ from cohere.types import StreamedChatResponse
 
 from backend.schemas.cohere_chat import CohereChatRequest
 from backend.schemas.context import Context
+from backend.services.embeddings import HashingEmbedder
 from backend.tests.unit.model_deployments.mock_deployments.mock_base import (
     MockDeployment,
 )
@@ -15,7 +16,7 @@ class MockSingleContainerDeployment(MockDeployment):
     DEFAULT_MODELS = ["command-r"]
 
     def __init__(self, **kwargs: Any):
-        pass
+        self.embed_batches = []
 
     @staticmethod
     def name() -> str:
@@ -29,6 +30,13 @@ class MockSingleContainerDeployment(MockDeployment):
     def rerank_enabled() -> bool:
         return False
 
+    @staticmethod
+    def embed_enabled() -> bool:
+        return True
+
+    def embed_model(self) -> str | None:
+        return HashingEmbedder().model_name
+
     @classmethod
     def list_models(cls) -> list[str]:
         return cls.DEFAULT_MODELS
@@ -75,5 +83,11 @@ class MockSingleContainerDeployment(MockDeployment):
         # TODO: Add
         pass
 
+    async def embed_batch(
+        self, texts: list[str], input_type: str, ctx: Context, **kwargs: Any
+    ) -> list[list[float]]:
+        self.embed_batches.append(texts)
+        return HashingEmbedder().embed_documents(texts).tolist()
+
 # Overriding the name so that the proper deployment is selected
 MockSingleContainerDeployment.__name__ = "SingleContainerDeployment"
@@ -0,0 +1,71 @@
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from backend.schemas.context import Context
+from backend.services.embeddings import EmbeddingCache, EmbedInputType, HashingEmbedder
+from backend.tests.unit.model_deployments.mock_deployments import (
+    MockAzureDeployment,
+    MockCohereDeployment,
+    MockSingleContainerDeployment,
+)
+
+
+@pytest.fixture
+def embedding_cache():
+    cache = EmbeddingCache()
+    with patch(
+        "backend.model_deployments.base.get_embedding_cache", return_value=cache
+    ), patch("backend.model_deployments.base.Settings") as mock_settings:
+        settings = {"deployments.embed_batch_size": 2}
+        mock_settings.return_value.get.side_effect = settings.get
+        yield cache
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "deployment_class", [MockCohereDeployment, MockSingleContainerDeployment]
+)
+async def test_invoke_embed_batches_texts(embedding_cache, deployment_class) -> None:
+    deployment = deployment_class()
+    texts = ["Mariana Trench", "Mount Everest", "Tapas", "Mariana Trench", "Cardistry"]
+
+    embeddings = await deployment.invoke_embed(texts, Context())
+
+    assert np.allclose(embeddings, HashingEmbedder().embed_documents(texts))
+    # The repeated text is embedded once, in batches of embed_batch_size texts
+    assert deployment.embed_batches == [
+        ["Mariana Trench", "Mount Everest"],
+        ["Tapas", "Cardistry"],
+    ]
+
+
+@pytest.mark.asyncio
+async def test_invoke_embed_reuses_cached_embeddings(embedding_cache) -> None:
+    deployment = MockCohereDeployment()
+    await deployment.invoke_embed(["Mariana Trench", "Mount Everest"], Context())
+
+    embeddings = await deployment.invoke_embed(
+        ["Mount Everest", "Tapas", "Mariana Trench"], Context()
+    )
+
+    assert np.allclose(
+        embeddings,
+        HashingEmbedder().embed_documents(["Mount Everest", "Tapas", "Mariana Trench"]),
+    )
+    assert deployment.embed_batches[1:] == [["Tapas"]]
+    assert embedding_cache.hits == 2
+
+    # Queries are embedded separately from the documents
+    await deployment.invoke_embed(
+        ["Mount Everest"], Context(), input_type=EmbedInputType.SearchQuery
+    )
+
+    assert deployment.embed_batches[2:] == [["Mount Everest"]]
+    assert (await deployment.invoke_embed([], Context())).shape == (0, 0)
+
+
+@pytest.mark.asyncio
+async def test_invoke_embed_without_embeddings(embedding_cache) -> None:
+    assert await MockAzureDeployment().invoke_embed(["Mariana Trench"], Context()) is None
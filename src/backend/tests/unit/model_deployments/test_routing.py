@@ -0,0 +1,237 @@
+import asyncio
+import time
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+
+from backend.chat.enums import StreamEvent
+from backend.model_deployments.routing import RoutingDeployment, get_member_stats
+from backend.schemas.cohere_chat import CohereChatRequest
+from backend.schemas.context import Context
+from backend.tests.unit.model_deployments.mock_deployments import (
+    MockLatencyDeployment,
+)
+
+EVENTS = [
+    {"event_type": StreamEvent.STREAM_START, "generation_id": "text"},
+    {"event_type": StreamEvent.TEXT_GENERATION, "text": "Hello"},
+    {"event_type": StreamEvent.STREAM_END, "finish_reason": "COMPLETE"},
+]
+
+
+@pytest.fixture(autouse=True)
+def reset_member_stats():
+    with patch.dict("backend.model_deployments.routing._member_stats", clear=True):
+        yield
+
+
+@pytest.fixture
+def mock_routing_settings():
+    with patch("backend.model_deployments.routing.Settings") as mock_settings:
+        settings = {
+            "deployments.routing.strategy": "least_outstanding",
+            "deployments.routing.failure_threshold": 2,
+            "deployments.routing.cooldown": 60,
+            "deployments.routing.hedged_requests": False,
+            "deployments.routing.hedge_percentile": 95,
+        }
+        mock_settings.return_value.get.side_effect = settings.get
+        yield settings
+
+
+def get_member(**kwargs: Any) -> MockLatencyDeployment:
+    return MockLatencyDeployment(event_streams=[EVENTS], **kwargs)
+
+
+def get_routing_deployment(**members: MockLatencyDeployment) -> RoutingDeployment:
+    return RoutingDeployment(members=list(members.items()))
+
+
+async def stream_chat(deployment: RoutingDeployment) -> list[dict]:
+    return [
+        event
+        async for event in deployment.invoke_chat_stream(
+            CohereChatRequest(message="Hello"), Context()
+        )
+    ]
+
+
+@pytest.mark.asyncio
+async def test_routing_spreads_requests_to_least_outstanding(mock_routing_settings) -> None:
+    members = {
+        name: get_member(first_event_latency=0.05) for name in ("a", "b", "c")
+    }
+    deployment = get_routing_deployment(**members)
+
+    results = await asyncio.gather(*[stream_chat(deployment) for _ in range(6)])
+
+    assert all(events == EVENTS for events in results)
+    assert [member.chat_calls for member in members.values()] == [2, 2, 2]
+    assert all(get_member_stats(name).outstanding == 0 for name in members)
+
+
+@pytest.mark.asyncio
+async def test_routing_prefers_lowest_latency_ewma(mock_routing_settings) -> None:
+    mock_routing_settings["deployments.routing.strategy"] = "ewma"
+    fast = get_member(first_event_latency=0.01)
+    slow = get_member(first_event_latency=0.05)
+    deployment = get_routing_deployment(slow=slow, fast=fast)
+
+    for _ in range(10):
+        await stream_chat(deployment)
+
+    # Each deployment is tried once before their latencies are known
+    assert slow.chat_calls == 1
+    assert fast.chat_calls == 9
+    assert get_member_stats("fast").ewma_latency < get_member_stats("slow").ewma_latency
+
+
+@pytest.mark.asyncio
+async def test_routing_fails_over_before_first_token(mock_routing_settings) -> None:
+    failing = get_member(failure_rate=1)
+    healthy = get_member()
+    deployment = get_routing_deployment(failing=failing, healthy=healthy)
+
+    for _ in range(4):
+        # The failing deployment has no requests in flight, so it keeps being selected first
+        get_member_stats("healthy").outstanding = 1
+        events = await stream_chat(deployment)
+        get_member_stats("healthy").outstanding = 0
+
+        assert events == EVENTS
+
+    # The failing deployment is skipped after 2 consecutive failures
+    assert failing.chat_calls == 2
+    assert healthy.chat_calls == 4
+    assert not get_member_stats("failing").is_healthy()
+    assert failing.open_streams == 0
+
+
+@pytest.mark.asyncio
+async def test_routing_uses_unhealthy_deployments_as_last_resort(mock_routing_settings) -> None:
+    first = get_member(failure_rate=1)
+    second = get_member(failure_rate=1)
+    deployment = get_routing_deployment(first=first, second=second)
+
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            await stream_chat(deployment)
+
+    assert not get_member_stats("first").is_healthy()
+    second.failure_rate = 0
+
+    assert await stream_chat(deployment) == EVENTS
+    assert get_member_stats("second").is_healthy()
+
+
+@pytest.mark.asyncio
+async def test_routing_does_not_fail_over_after_first_token(mock_routing_settings) -> None:
+    class BrokenStreamDeployment(MockLatencyDeployment):
+        async def invoke_chat_stream(self, chat_request, ctx, **kwargs: Any):
+            self.chat_calls += 1
+            yield EVENTS[0]
+            raise ConnectionError("Connection reset")
+
+    broken = BrokenStreamDeployment(event_streams=[EVENTS])
+    healthy = get_member()
+    deployment = get_routing_deployment(broken=broken, healthy=healthy)
+
+    events = []
+    with pytest.raises(ConnectionError):
+        async for event in deployment.invoke_chat_stream(
+            CohereChatRequest(message="Hello"), Context()
+        ):
+            events.append(event)
+
+    assert events == EVENTS[:1]
+    assert healthy.chat_calls == 0
+    assert get_member_stats("broken").failures == 1
+
+
+@pytest.mark.asyncio
+async def test_routing_hedges_slow_first_token(mock_routing_settings) -> None:
+    mock_routing_settings["deployments.routing.hedged_requests"] = True
+    slow = get_member(first_event_latency=2)
+    fast = get_member(first_event_latency=0.01)
+    deployment = get_routing_deployment(slow=slow, fast=fast)
+    for _ in range(20):
+        get_member_stats("slow").record_success(0.05)
+    get_member_stats("fast").outstanding = 1
+
+    start = time.perf_counter()
+    events = await stream_chat(deployment)
+
+    assert events == EVENTS
+    assert time.perf_counter() - start < 1
+    assert (slow.chat_calls, fast.chat_calls) == (1, 1)
+    # The slower request is cancelled
+    assert slow.open_streams == 0
+    assert get_member_stats("slow").outstanding == 0
+
+
+@pytest.mark.asyncio
+async def test_routing_does_not_hedge_without_latencies(mock_routing_settings) -> None:
+    mock_routing_settings["deployments.routing.hedged_requests"] = True
+    slow = get_member(first_event_latency=0.2)
+    fast = get_member()
+    deployment = get_routing_deployment(slow=slow, fast=fast)
+    get_member_stats("fast").outstanding = 1
+
+    await stream_chat(deployment)
+
+    assert fast.chat_calls == 0
+
+
+@pytest.mark.asyncio
+async def test_routing_with_failure_rates(mock_routing_settings) -> None:
+    mock_routing_settings["deployments.routing.cooldown"] = 0
+    members = {
+        "flaky": get_member(failure_rate=0.5, seed=1),
+        "degraded": get_member(failure_rate=0.2, seed=2),
+        "healthy": get_member(failure_rate=0.05, seed=3),
+    }
+    deployment = get_routing_deployment(**members)
+
+    for _ in range(50):
+        assert await stream_chat(deployment) == EVENTS
+
+    assert sum(member.failed_calls for member in members.values()) > 0
+    assert all(member.open_streams == 0 for member in members.values())
+
+
+@pytest.mark.asyncio
+async def test_routing_non_streamed_chat_fails_over(mock_routing_settings) -> None:
+    class FailingDeployment(MockLatencyDeployment):
+        async def invoke_chat(self, chat_request, **kwargs: Any):
+            raise ConnectionError("Deployment unavailable")
+            yield
+
+    deployment = get_routing_deployment(
+        failing=FailingDeployment(event_streams=[EVENTS]), healthy=get_member()
+    )
+
+    responses = [
+        response
+        async for response in deployment.invoke_chat(CohereChatRequest(message="Hello"))
+    ]
+
+    assert responses[0]["text"] == "Hi! Hello there! How's it going?"
+    assert get_member_stats("failing").failures == 1
+    assert get_member_stats("healthy").failures == 0
+
+
+def test_routing_pool_from_settings(mock_routing_settings) -> None:
+    mock_routing_settings["deployments.routing.deployments"] = [
+        {"deployment": "cohere_platform", "config": {"COHERE_API_KEY": "key-1"}},
+        {"deployment": "cohere_platform", "config": {"COHERE_API_KEY": "key-2"}},
+        {"deployment": "unknown"},
+    ]
+
+    deployment = RoutingDeployment()
+
+    assert [key for key, _ in deployment.members] == [
+        "0:cohere_platform",
+        "1:cohere_platform",
+    ]
+    assert RoutingDeployment.config() == {}
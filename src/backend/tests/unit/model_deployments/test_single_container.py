@@ -1,7 +1,12 @@
 from fastapi.testclient import TestClient
 
 from backend.database_models.user import User
-from backend.model_deployments.single_container import SingleContainerDeployment
+from backend.model_deployments.single_container import (
+    DEFAULT_RERANK_MODEL,
+    SC_MODEL_ENV_VAR,
+    SC_URL_ENV_VAR,
+    SingleContainerDeployment,
+)
 from backend.tests.unit.model_deployments.mock_deployments import (
     MockSingleContainerDeployment,
 )
@@ -42,3 +47,12 @@ def test_non_streamed_chat(
 
     assert response.status_code == 200
     assert type(deployment) is MockSingleContainerDeployment
+
+
+def test_rerank_model_is_the_invoked_model() -> None:
+    # The rerank cache is keyed by the model invoke_rerank calls, not the chat model
+    deployment = SingleContainerDeployment(
+        db_config={SC_URL_ENV_VAR: "http://localhost", SC_MODEL_ENV_VAR: "command-r"}
+    )
+
+    assert deployment.rerank_model() == DEFAULT_RERANK_MODEL
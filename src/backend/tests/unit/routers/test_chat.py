@@ -1,6 +1,8 @@
+import asyncio
 import json
 import uuid
 from typing import Any
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 from fastapi.testclient import TestClient
@@ -11,7 +13,13 @@ from backend.database_models.conversation import Conversation
 from backend.database_models.message import Message, MessageAgent
 from backend.database_models.user import User
 from backend.model_deployments.cohere_platform import CohereDeployment
+from backend.routers.chat import chat, claim_stream
+from backend.schemas.chat import NonStreamedChatResponse
+from backend.schemas.cohere_chat import CohereChatRequest
+from backend.schemas.context import Context
 from backend.schemas.tool import ToolCategory
+from backend.services.idempotency import InMemoryIdempotencyStore
+from backend.services.stream_buffer import InMemoryStreamBuffer
 from backend.tests.unit.factories import get_factory
 from backend.tests.unit.model_deployments.mock_deployments.mock_cohere_platform import (
     MockCohereDeployment,
@@ -767,6 +775,180 @@ def test_stream_regenerate_existing_chat_not_existing_user_messages(
     assert response.json() == {"detail": f"Messages for user with ID: {user.id} not found."}
 
 
+def parse_sse_events(response) -> list[tuple[int, dict]]:
+    events = []
+    event_id = None
+    for line in response.iter_lines():
+        if line.startswith("id: "):
+            event_id = int(line.replace("id: ", ""))
+        elif line.startswith("data: "):
+            events.append((event_id, json.loads(line.replace("data: ", ""))))
+    return events
+
+
+def test_streaming_chat_resume_after_last_event_id(
+    session_client_chat: TestClient,
+    session_chat: Session,
+    user: User,
+    mock_available_model_deployments: list[dict],
+) -> None:
+    with patch("backend.routers.chat.Settings") as mock_settings:
+        mock_settings.return_value.get.side_effect = (
+            lambda path: path == "chat.resumable_streams"
+        )
+        response = session_client_chat.post(
+            "/v1/chat-stream",
+            headers={
+                "User-Id": user.id,
+                "Deployment-Name": MockCohereDeployment.name(),
+            },
+            json={"message": "Hello", "max_tokens": 10},
+        )
+
+    assert response.status_code == 200
+    events = parse_sse_events(response)
+    assert [event_id for event_id, _ in events] == list(range(1, len(events) + 1))
+    assert events[-1][1]["event"] == StreamEvent.STREAM_END
+
+    stream_id = response.headers["X-Stream-ID"]
+    resumed_response = session_client_chat.get(
+        f"/v1/chat-stream/{stream_id}/resume",
+        headers={"User-Id": user.id, "Last-Event-ID": "2"},
+    )
+
+    assert resumed_response.status_code == 200
+    assert parse_sse_events(resumed_response) == events[2:]
+
+
+def test_streaming_chat_resume_stream_of_other_user(
+    session_client_chat: TestClient,
+    user: User,
+) -> None:
+    response = session_client_chat.get(
+        f"/v1/chat-stream/{uuid.uuid4()}/resume",
+        headers={"User-Id": user.id, "Last-Event-ID": "2"},
+    )
+
+    assert response.status_code == 404
+
+
+
+def test_streaming_chat_human_feedback_unknown_variant_deployment(
+    session_client_chat: TestClient,
+    session_chat: Session,
+    user: User,
+    mock_available_model_deployments: list[dict],
+) -> None:
+    response = session_client_chat.post(
+        "/v1/chat-human-feedback",
+        headers={
+            "User-Id": user.id,
+            "Deployment-Name": MockCohereDeployment.name(),
+        },
+        json={
+            "message": "Hello",
+            "max_tokens": 10,
+            "variants": [{}, {"deployment": "Unknown Deployment"}],
+        },
+    )
+
+    assert response.status_code == 404
+
+
+def test_streaming_chat_human_feedback_variants(
+    session_client_chat: TestClient,
+    session_chat: Session,
+    user: User,
+    mock_available_model_deployments: list[dict],
+) -> None:
+    response = session_client_chat.post(
+        "/v1/chat-human-feedback",
+        headers={
+            "User-Id": user.id,
+            "Deployment-Name": MockCohereDeployment.name(),
+        },
+        json={
+            "message": "Hello",
+            "max_tokens": 10,
+            "variants": [{}, {"temperature": 0.9}, {"temperature": 0.1}],
+        },
+    )
+
+    assert response.status_code == 200
+    events = [event for _, event in parse_sse_events(response)]
+    assert {event["parallel_variant"] for event in events} == {1, 2, 3}
+    stream_ends = [
+        event for event in events if event["event"] == StreamEvent.STREAM_END
+    ]
+    assert len(stream_ends) == 3
+
+    conversation_id = stream_ends[0]["data"]["conversation_id"]
+    messages = (
+        session_chat.query(Message)
+        .filter(
+            Message.conversation_id == conversation_id,
+            Message.agent == MessageAgent.CHATBOT,
+        )
+        .all()
+    )
+    assert sorted(message.parallel_variant for message in messages) == [1, 2, 3]
+    assert all(message.is_parallel for message in messages)
+    assert len({message.parallel_group_id for message in messages}) == 1
+    assert len({message.position for message in messages}) == 1
+    assert {message.id for message in messages} == {
+        event["data"]["message_id"] for event in stream_ends
+    }
+
+
+def test_streaming_chat_retry_with_idempotency_key(
+    session_client_chat: TestClient,
+    session_chat: Session,
+    user: User,
+    mock_available_model_deployments: list[dict],
+) -> None:
+    headers = {
+        "User-Id": user.id,
+        "Deployment-Name": MockCohereDeployment.name(),
+        "Idempotency-Key": str(uuid.uuid4()),
+    }
+    response = session_client_chat.post(
+        "/v1/chat-stream",
+        headers=headers,
+        json={"message": "Hello", "max_tokens": 10},
+    )
+    retried_response = session_client_chat.post(
+        "/v1/chat-stream",
+        headers=headers,
+        json={"message": "Hello", "max_tokens": 10},
+    )
+
+    assert response.status_code == 200
+    assert retried_response.status_code == 200
+    assert response.headers["X-Stream-ID"] == retried_response.headers["X-Stream-ID"]
+    events = parse_sse_events(response)
+    assert parse_sse_events(retried_response) == events
+
+    conversation_id = events[-1][1]["data"]["conversation_id"]
+    validate_conversation(session_chat, user, conversation_id, 2)
+
+@pytest.mark.asyncio
+async def test_claim_stream_of_expired_buffer() -> None:
+    store = InMemoryIdempotencyStore()
+    buffer = InMemoryStreamBuffer()
+    await buffer.create("live-stream", "user")
+    await store.claim("live-key", "live-stream")
+    await store.claim("expired-key", "expired-stream")
+
+    with (
+        patch("backend.routers.chat.get_idempotency_store", return_value=store),
+        patch("backend.routers.chat.get_stream_buffer", return_value=buffer),
+    ):
+        assert await claim_stream("live-key", "new-stream") == "live-stream"
+        assert await claim_stream("expired-key", "new-stream") is None
+
+    assert await store.get("expired-key") == "new-stream"
+
+
 # NON-STREAMING CHAT TESTS
 def test_non_streaming_chat(
     session_client_chat: TestClient,
@@ -789,6 +971,39 @@ def test_non_streaming_chat(
     validate_conversation(session_chat, user, conversation_id, 2)
 
 
+def test_non_streaming_chat_retry_with_idempotency_key(
+    session_client_chat: TestClient,
+    session_chat: Session,
+    user: User,
+    mock_available_model_deployments: list[dict],
+) -> None:
+    headers = {
+        "User-Id": user.id,
+        "Deployment-Name": CohereDeployment.name(),
+        "Idempotency-Key": str(uuid.uuid4()),
+    }
+    response = session_client_chat.post(
+        "/v1/chat", json={"message": "Hello", "max_tokens": 10}, headers=headers
+    )
+    retried_response = session_client_chat.post(
+        "/v1/chat", json={"message": "Hello", "max_tokens": 10}, headers=headers
+    )
+    other_user = get_factory("User", session_chat).create()
+    other_user_response = session_client_chat.post(
+        "/v1/chat",
+        json={"message": "Hello", "max_tokens": 10},
+        headers=headers | {"User-Id": other_user.id},
+    )
+
+    assert response.status_code == 200
+    assert retried_response.json() == response.json()
+    assert (
+        other_user_response.json()["conversation_id"]
+        != response.json()["conversation_id"]
+    )
+    validate_conversation(session_chat, user, response.json()["conversation_id"], 2)
+
+
 def test_non_streaming_chat_with_managed_tools(
     session_client_chat: TestClient,
     session_chat: Session,
@@ -1141,3 +1356,39 @@ def is_valid_uuid(id: str) -> bool:
         return True
     except ValueError:
         return False
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "outcome",
+    [
+        asyncio.CancelledError(),
+        ValueError("Deployment error"),
+        NonStreamedChatResponse(text="", finish_reason="ERROR", error="Error"),
+    ],
+)
+async def test_non_streaming_chat_releases_idempotency_key(outcome) -> None:
+    store = InMemoryIdempotencyStore()
+    if isinstance(outcome, NonStreamedChatResponse):
+        generate_chat = AsyncMock(return_value=outcome)
+    else:
+        generate_chat = AsyncMock(side_effect=outcome)
+    ctx = Context()
+    ctx.with_user_id("user")
+
+    with (
+        patch("backend.services.idempotency.get_idempotency_store", return_value=store),
+        patch("backend.routers.chat.generate_chat", generate_chat),
+    ):
+        try:
+            await chat(
+                CohereChatRequest(message="Hello"),
+                MagicMock(),
+                ctx,
+                idempotency_key="key",
+            )
+        except (asyncio.CancelledError, ValueError):
+            pass
+
+    # The next retry generates the response again
+    assert store.values == {}
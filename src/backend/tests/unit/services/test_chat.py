@@ -1,13 +1,35 @@
+import datetime
+import json
+import time
+from unittest.mock import MagicMock, patch
 
 import pytest
 
-from backend.schemas.chat import EventState
+from backend.chat.custom.custom import CustomChat
+from backend.chat.enums import StreamEvent
+from backend.schemas.chat import ChatRole, EventState, StreamToolResult
+from backend.schemas.cohere_chat import CohereChatRequest
 from backend.schemas.context import Context
+from backend.schemas.tool import Tool
 from backend.services.chat import (
     DEATHLOOP_SIMILARITY_THRESHOLDS,
+    LOOKBACKS,
     are_previous_actions_similar,
     check_death_loop,
     check_similarity,
+    create_event_state,
+    generate_chat_stream,
+    handle_stream_event,
+    index_conversation_turn,
+    multiplex_chat_streams,
+    process_message_regeneration,
+    save_tool_results,
+    update_conversation_after_turn,
+)
+from backend.tests.unit.factories import get_factory
+from backend.tests.unit.mock_tools import get_latency_tool
+from backend.tests.unit.model_deployments.mock_deployments import (
+    MockLatencyDeployment,
 )
 
 
@@ -161,3 +183,441 @@ def test_check_no_death_loop():
 
     assert new_event_state.distances_plans[-1] < max(DEATHLOOP_SIMILARITY_THRESHOLDS)
     assert new_event_state.distances_actions[-1] < max(DEATHLOOP_SIMILARITY_THRESHOLDS)
+
+
+def test_check_death_loop_keeps_only_lookback_distances():
+    ctx = Context()
+    # The repeated plans are detected as a death loop, keep the warnings out of the output
+    ctx.logger = MagicMock()
+    event_state = create_event_state()
+
+    for step in range(1000):
+        event = {
+            "text": f"Plan {step % 3}",
+            "tool_calls": [{"name": "tool", "parameters": {"step": step % 5}}],
+        }
+        event_state = check_death_loop(event, event_state, ctx)
+
+    assert len(event_state.distances_plans) == max(LOOKBACKS)
+    assert len(event_state.distances_actions) == max(LOOKBACKS)
+    assert event_state.previous_plan == "Plan 0"
+
+
+def test_check_similarity_with_event_state_distances():
+    ctx = Context()
+    event_state = create_event_state()
+    event_state.distances_actions.extend([0.1, 0.1, 0.95, 0.95, 0.95])
+
+    assert check_similarity(event_state.distances_actions, ctx)
+
+
+def test_handle_stream_event_tool_result():
+    ctx = Context()
+    stream_end_data = {"text": "", "tool_results": []}
+    event = {
+        "event_type": StreamEvent.TOOL_RESULT,
+        "tool_name": "web_search",
+        "result": [{"text": "A chunk of the page", "url": "https://cohere.com"}],
+    }
+
+    stream_event, new_stream_end_data, _, _ = handle_stream_event(
+        event, "conversation-id", stream_end_data, None, ctx, should_store=False
+    )
+
+    assert isinstance(stream_event, StreamToolResult)
+    assert stream_event.tool_name == "web_search"
+    assert stream_event.result == event["result"]
+    # The results are not kept until the end of the stream
+    assert new_stream_end_data == {"text": "", "tool_results": []}
+
+
+def get_text_events(word_count: int = 10) -> list[dict]:
+    return [
+        {"event_type": StreamEvent.STREAM_START, "generation_id": "text"},
+        *[
+            {"event_type": StreamEvent.TEXT_GENERATION, "text": f"word{i} "}
+            for i in range(word_count)
+        ],
+        {
+            "event_type": StreamEvent.STREAM_END,
+            "finish_reason": "COMPLETE",
+            "response": {"chat_history": []},
+        },
+    ]
+
+
+def get_parallel_variant_streams(deployments: dict[str, MockLatencyDeployment]):
+    streams = []
+    for parallel_variant, deployment_name in enumerate(deployments, start=1):
+        ctx = Context()
+        ctx.with_deployment_name(deployment_name)
+        streams.append(
+            generate_chat_stream(
+                None,
+                CustomChat().chat(CohereChatRequest(message="Hello"), None, ctx),
+                MagicMock(
+                    id=f"message-{parallel_variant}",
+                    is_parallel=True,
+                    parallel_variant=parallel_variant,
+                ),
+                should_store=False,
+                ctx=ctx,
+            )
+        )
+    return streams
+
+
+async def collect_parallel_variants(deployments: dict[str, MockLatencyDeployment]):
+    with patch(
+        "backend.chat.custom.custom.get_deployment",
+        side_effect=lambda name, session, ctx: deployments[name],
+    ):
+        return [
+            json.loads(data)
+            async for data in multiplex_chat_streams(
+                get_parallel_variant_streams(deployments)
+            )
+        ]
+
+
+@pytest.mark.asyncio
+async def test_multiplex_chat_streams_interleaves_parallel_variants():
+    deployments = {
+        "first": MockLatencyDeployment(
+            event_latency=0.01, event_streams=[get_text_events()]
+        ),
+        "second": MockLatencyDeployment(
+            event_latency=0.01, event_streams=[get_text_events()]
+        ),
+    }
+
+    events = await collect_parallel_variants(deployments)
+    variants = [event["parallel_variant"] for event in events]
+
+    assert sorted(set(variants)) == [1, 2]
+    # The second variant starts before the first one ends
+    assert variants.index(2) < len(variants) - variants[::-1].index(1) - 1
+    assert [
+        event["parallel_variant"]
+        for event in events
+        if event["event"] == StreamEvent.STREAM_END
+    ] == [1, 2]
+    assert all(deployment.chat_calls == 1 for deployment in deployments.values())
+
+
+@pytest.mark.asyncio
+async def test_multiplex_chat_streams_closes_all_variants():
+    deployments = {
+        "first": MockLatencyDeployment(
+            event_latency=0.01, event_streams=[get_text_events()]
+        ),
+        "second": MockLatencyDeployment(
+            event_latency=0.01, event_streams=[get_text_events()]
+        ),
+    }
+
+    with patch(
+        "backend.chat.custom.custom.get_deployment",
+        side_effect=lambda name, session, ctx: deployments[name],
+    ):
+        stream = multiplex_chat_streams(get_parallel_variant_streams(deployments))
+        await stream.__anext__()
+        await stream.aclose()
+
+    assert all(deployment.open_streams == 0 for deployment in deployments.values())
+
+
+@pytest.mark.benchmark
+@pytest.mark.asyncio
+async def test_multiplex_chat_streams_takes_slowest_variant_time():
+    latencies = (0.03, 0.04, 0.05)
+
+    def get_deployments():
+        return {
+            f"variant-{latency}": MockLatencyDeployment(
+                event_latency=latency, event_streams=[get_text_events()]
+            )
+            for latency in latencies
+        }
+
+    start = time.perf_counter()
+    for name, deployment in get_deployments().items():
+        await collect_parallel_variants({name: deployment})
+    sequential_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await collect_parallel_variants(get_deployments())
+    parallel_elapsed = time.perf_counter() - start
+
+    slowest_variant_latency = len(get_text_events()) * max(latencies)
+    assert parallel_elapsed >= slowest_variant_latency
+    assert parallel_elapsed < sequential_elapsed * 0.75
+
+
+TOOL_CALL = {"name": "slow_tool", "parameters": {"query": "weather"}}
+TOOL_OUTPUTS = [{"text": "Sunny"}]
+
+
+def get_tool_calls_events() -> list[dict]:
+    return [
+        {"event_type": StreamEvent.STREAM_START, "generation_id": "tool-calls"},
+        {"event_type": StreamEvent.TOOL_CALLS_GENERATION, "text": "", "tool_calls": [TOOL_CALL]},
+        {
+            "event_type": StreamEvent.STREAM_END,
+            "finish_reason": "COMPLETE",
+            "response": {"chat_history": [{"role": "CHATBOT", "tool_calls": [TOOL_CALL]}]},
+        },
+    ]
+
+
+@pytest.fixture
+def mock_slow_tool():
+    tool = get_latency_tool("slow_tool", 0.3)
+    available_tools = {tool.ID: tool.get_tool_definition()}
+    with (
+        patch("backend.chat.custom.custom.get_available_tools", return_value=available_tools),
+        patch("backend.chat.custom.tool_calls.get_available_tools", return_value=available_tools),
+        patch("backend.services.chat.get_available_tools", return_value=available_tools),
+    ):
+        tool.calls.clear()
+        yield tool
+
+
+@pytest.fixture
+def mock_reuse_tool_results_settings():
+    with patch("backend.services.chat.Settings") as mock_settings:
+        mock_settings.return_value.get.side_effect = (
+            lambda path: path == "tools.reuse_tool_results_on_regeneration"
+        )
+        yield mock_settings
+
+
+def create_tool_turn(session, user, outputs: list[dict] | None = TOOL_OUTPUTS):
+    conversation = get_factory("Conversation", session).create(user_id=user.id)
+    created_at = datetime.datetime(2024, 1, 1)
+    messages = {}
+    for name, agent, text in (
+        ("user", "USER", "What is the weather?"),
+        ("tool_calls", "CHATBOT", "I will search the weather."),
+        ("response", "CHATBOT", "It is sunny."),
+    ):
+        messages[name] = get_factory("Message", session).create(
+            conversation_id=conversation.id,
+            user_id=user.id,
+            agent=agent,
+            text=text,
+            tool_plan=text,
+            position=0,
+            is_active=True,
+            created_at=created_at,
+        )
+        created_at += datetime.timedelta(seconds=1)
+
+    tool_call = get_factory("ToolCall", session).create(
+        message_id=messages["tool_calls"].id, outputs=outputs, **TOOL_CALL
+    )
+    session.refresh(conversation)
+    return conversation, messages, tool_call
+
+
+def get_regeneration_ctx(user) -> Context:
+    ctx = Context()
+    ctx.set_request({"headers": []})
+    ctx.with_user_id(user.id)
+    return ctx
+
+
+def test_save_tool_results_of_the_turn(session, user) -> None:
+    conversation, _, tool_call = create_tool_turn(session, user, outputs=None)
+    chat_history = [
+        {"role": "USER", "message": "What was the weather yesterday?"},
+        {"role": "TOOL", "tool_results": [{"call": TOOL_CALL, "outputs": [{"text": "Rainy"}]}]},
+        {"role": "USER", "message": "What is the weather?"},
+        {"role": "CHATBOT", "tool_calls": [TOOL_CALL]},
+        {"role": "TOOL", "tool_results": [{"call": TOOL_CALL, "outputs": TOOL_OUTPUTS}]},
+        {"role": "CHATBOT", "message": "It is sunny."},
+    ]
+
+    save_tool_results(session, conversation.id, user.id, 0, chat_history)
+
+    session.refresh(tool_call)
+    assert tool_call.outputs == TOOL_OUTPUTS
+
+
+def test_regeneration_replays_stored_tool_results(
+    session, user, mock_slow_tool, mock_reuse_tool_results_settings
+) -> None:
+    conversation, messages, _ = create_tool_turn(session, user)
+    chat_request = CohereChatRequest(
+        message="", conversation_id=conversation.id, tools=[Tool(name="slow_tool")]
+    )
+
+    _, chat_request, _, previous_message_ids, _, _ = process_message_regeneration(
+        session, chat_request, get_regeneration_ctx(user)
+    )
+
+    assert chat_request.message == ""
+    assert chat_request.tool_results == [{"call": TOOL_CALL, "outputs": TOOL_OUTPUTS}]
+    assert [message.role for message in chat_request.chat_history] == [
+        ChatRole.USER,
+        ChatRole.CHATBOT,
+    ]
+    assert chat_request.chat_history[-1].tool_calls == [TOOL_CALL]
+    # The tool calls are kept for the regenerated response
+    assert previous_message_ids == [messages["response"].id]
+
+
+def test_regeneration_replays_tool_results_of_first_variant(
+    session, user, mock_slow_tool, mock_reuse_tool_results_settings
+) -> None:
+    conversation, messages, _ = create_tool_turn(session, user)
+    for message in (messages["tool_calls"], messages["response"]):
+        message.is_parallel = True
+        message.parallel_variant = 1
+    variant_message = get_factory("Message", session).create(
+        conversation_id=conversation.id,
+        user_id=user.id,
+        agent="CHATBOT",
+        text="I will search the forecast.",
+        position=0,
+        is_active=True,
+        is_parallel=True,
+        parallel_variant=2,
+    )
+    _ = get_factory("ToolCall", session).create(
+        message_id=variant_message.id,
+        name="slow_tool",
+        parameters={"query": "forecast"},
+        outputs=[{"text": "Cloudy"}],
+    )
+    session.refresh(conversation)
+    chat_request = CohereChatRequest(
+        message="", conversation_id=conversation.id, tools=[Tool(name="slow_tool")]
+    )
+
+    _, chat_request, _, previous_message_ids, _, _ = process_message_regeneration(
+        session, chat_request, get_regeneration_ctx(user)
+    )
+
+    # The tool calls of the other variants are not mixed in, they're replaced
+    assert chat_request.tool_results == [{"call": TOOL_CALL, "outputs": TOOL_OUTPUTS}]
+    assert sorted(previous_message_ids) == sorted(
+        [messages["response"].id, variant_message.id]
+    )
+
+
+@pytest.mark.parametrize(
+    "outputs, tools",
+    [(None, [Tool(name="slow_tool")]), (TOOL_OUTPUTS, [])],
+)
+def test_regeneration_calls_tools_without_stored_tool_results(
+    session, user, mock_slow_tool, mock_reuse_tool_results_settings, outputs, tools
+) -> None:
+    conversation, messages, _ = create_tool_turn(session, user, outputs=outputs)
+    chat_request = CohereChatRequest(
+        message="", conversation_id=conversation.id, tools=tools
+    )
+
+    _, chat_request, _, previous_message_ids, _, _ = process_message_regeneration(
+        session, chat_request, get_regeneration_ctx(user)
+    )
+
+    assert chat_request.message == "What is the weather?"
+    assert chat_request.tool_results is None
+    assert len(previous_message_ids) == 2
+
+
+async def regenerate(session, user, conversation_id: str) -> tuple[float, MockLatencyDeployment]:
+    chat_request = CohereChatRequest(
+        message="", conversation_id=conversation_id, tools=[Tool(name="slow_tool")]
+    )
+    ctx = get_regeneration_ctx(user)
+    _, chat_request, _, _, _, ctx = process_message_regeneration(
+        session, chat_request, ctx
+    )
+    deployment = MockLatencyDeployment(
+        event_streams=[get_tool_calls_events(), get_text_events()]
+        if chat_request.message
+        else [get_text_events()]
+    )
+
+    start = time.perf_counter()
+    async for _ in CustomChat().call_chat(chat_request, deployment, session, ctx):
+        pass
+    return time.perf_counter() - start, deployment
+
+
+@pytest.mark.asyncio
+async def test_regeneration_with_stored_tool_results_does_not_call_tools(
+    session, user, mock_slow_tool, mock_reuse_tool_results_settings
+) -> None:
+    conversation, _, _ = create_tool_turn(session, user)
+
+    _, deployment = await regenerate(session, user, conversation.id)
+
+    assert mock_slow_tool.calls == []
+    assert deployment.chat_calls == 1
+
+
+@pytest.mark.benchmark
+@pytest.mark.asyncio
+async def test_regeneration_latency_with_stored_tool_results(
+    session, user, mock_slow_tool, mock_reuse_tool_results_settings
+) -> None:
+    conversation, _, _ = create_tool_turn(session, user)
+    replay_elapsed, _ = await regenerate(session, user, conversation.id)
+
+    mock_reuse_tool_results_settings.return_value.get.side_effect = lambda path: False
+    conversation, _, _ = create_tool_turn(session, user)
+    rerun_elapsed, _ = await regenerate(session, user, conversation.id)
+
+    assert mock_slow_tool.calls == [TOOL_CALL["parameters"]]
+    assert rerun_elapsed >= 0.3
+    assert replay_elapsed < rerun_elapsed * 0.5
+
+
+@pytest.mark.parametrize("parallel_variant,turn_updated", [(1, True), (2, False)])
+def test_update_conversation_after_turn_of_parallel_variant(
+    parallel_variant, turn_updated
+):
+    response_message = MagicMock(is_parallel=True, parallel_variant=parallel_variant)
+    chat_history = [{"role": "TOOL", "tool_results": []}]
+
+    with (
+        patch("backend.services.chat.message_crud") as message_crud,
+        patch("backend.services.chat.conversation_crud") as conversation_crud,
+        patch("backend.services.chat.save_tool_results") as save_results,
+        patch("backend.services.chat.index_conversation_turn") as index_turn,
+        patch("backend.services.chat.schedule_conversation_summary") as schedule_summary,
+    ):
+        update_conversation_after_turn(
+            MagicMock(),
+            response_message,
+            "conversation",
+            "Hello",
+            "user",
+            ctx=Context(),
+            chat_history=chat_history,
+        )
+
+    # Each variant is stored, the turn is updated once
+    message_crud.create_message.assert_called_once()
+    for mock in (
+        conversation_crud.update_conversation,
+        save_results,
+        index_turn,
+        schedule_summary,
+    ):
+        assert mock.called == turn_updated
+
+
+def test_index_conversation_turn_does_not_fail_the_turn():
+    conversation = MagicMock(id="conversation", messages=[])
+
+    with patch("backend.services.chat.conversation_search_crud") as search_crud:
+        search_crud.index_conversation_messages.side_effect = Exception(
+            "string is too long for tsvector"
+        )
+        index_conversation_turn(MagicMock(), conversation, MagicMock(text="Hello"))
+
+    search_crud.index_conversation_messages.assert_called_once()
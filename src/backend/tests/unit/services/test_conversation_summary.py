@@ -0,0 +1,163 @@
+import datetime
+from unittest.mock import patch
+
+import pytest
+
+from backend.schemas.chat import ChatRole
+from backend.schemas.cohere_chat import CohereChatRequest
+from backend.schemas.context import Context
+from backend.services.chat import create_chat_history
+from backend.services.conversation_summary import (
+    get_turns_to_summarize,
+    schedule_conversation_summary,
+    summarize_conversation,
+)
+from backend.tests.unit.factories import get_factory
+from backend.tests.unit.model_deployments.mock_deployments import (
+    MockCohereDeployment,
+)
+
+SUMMARY = "Hi! Hello there! How's it going?"
+
+
+class RecordingDeployment(MockCohereDeployment):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.prompts = []
+
+    async def invoke_chat(self, chat_request, **kwargs):
+        self.prompts.append(chat_request.message)
+        async for response in super().invoke_chat(chat_request, **kwargs):
+            yield response
+
+
+@pytest.fixture
+def deployment():
+    deployment = RecordingDeployment()
+    with patch(
+        "backend.services.conversation_summary.get_deployment",
+        return_value=deployment,
+    ):
+        yield deployment
+
+
+@pytest.fixture
+def mock_summary_settings():
+    with patch("backend.services.conversation_summary.Settings") as mock_settings:
+        settings = {
+            "chat.conversation_summary": True,
+            "chat.conversation_summary_window": 4,
+        }
+        mock_settings.return_value.get.side_effect = settings.get
+        yield settings
+
+
+@pytest.fixture
+def conversation(session, user):
+    conversation = get_factory("Conversation", session).create(user_id=user.id)
+    for position in range(6):
+        add_turn(session, conversation, position)
+    return conversation
+
+
+@pytest.fixture
+def ctx(user):
+    ctx = Context()
+    ctx.with_user_id(user.id)
+    ctx.with_deployment_name("Cohere Platform")
+    return ctx
+
+
+def add_turn(session, conversation, position: int) -> None:
+    created_at = datetime.datetime(2024, 1, 1) + datetime.timedelta(minutes=position)
+    for agent, text in (("USER", "Question"), ("CHATBOT", "Answer")):
+        get_factory("Message", session).create(
+            conversation_id=conversation.id,
+            user_id=conversation.user_id,
+            position=position,
+            is_active=True,
+            agent=agent,
+            text=f"{text} {position}",
+            created_at=created_at,
+        )
+        created_at += datetime.timedelta(seconds=1)
+    session.refresh(conversation)
+
+
+def test_get_turns_to_summarize(conversation) -> None:
+    messages, summary_position = get_turns_to_summarize(conversation, 4)
+
+    assert [message.text for message in messages] == [
+        "Question 0",
+        "Answer 0",
+        "Question 1",
+        "Answer 1",
+    ]
+    assert summary_position == 2
+
+    conversation.summary_position = 2
+
+    assert get_turns_to_summarize(conversation, 4) == ([], 2)
+
+
+@pytest.mark.asyncio
+async def test_summarize_conversation_is_incremental(
+    session, conversation, ctx, deployment, mock_summary_settings
+) -> None:
+    summary = await summarize_conversation(session, conversation.id, ctx)
+
+    assert summary == SUMMARY
+    assert conversation.summary_position == 2
+    assert "Question 1" in deployment.prompts[0]
+    assert "Question 2" not in deployment.prompts[0]
+
+    # Nothing new to summarize until the window moves
+    assert await summarize_conversation(session, conversation.id, ctx) is None
+
+    add_turn(session, conversation, 6)
+    await summarize_conversation(session, conversation.id, ctx)
+
+    assert conversation.summary_position == 3
+    assert SUMMARY in deployment.prompts[1]
+    assert "Question 1" not in deployment.prompts[1]
+    assert "Question 2" in deployment.prompts[1]
+    assert len(deployment.prompts) == 2
+
+
+@pytest.mark.asyncio
+async def test_schedule_conversation_summary(
+    session, conversation, ctx, deployment, mock_summary_settings
+) -> None:
+    task = schedule_conversation_summary(session, conversation.id, ctx)
+
+    # Only one summary of a conversation is updated at a time
+    assert schedule_conversation_summary(session, conversation.id, ctx) is None
+    await task
+
+    # Updated with a session of its own
+    session.refresh(conversation)
+    assert conversation.summary == SUMMARY
+
+    mock_summary_settings["chat.conversation_summary"] = False
+    assert schedule_conversation_summary(session, conversation.id, ctx) is None
+
+
+def test_create_chat_history_sends_summary(session, conversation) -> None:
+    conversation.summary = "The user asked two questions."
+    conversation.summary_position = 2
+
+    chat_history = create_chat_history(
+        conversation, 6, CohereChatRequest(message="Hello")
+    )
+
+    assert chat_history[0].role == ChatRole.SYSTEM
+    assert "The user asked two questions." in chat_history[0].message
+    assert [message.message for message in chat_history[1:3]] == [
+        "Question 2",
+        "Answer 2",
+    ]
+    assert len(chat_history) == 9
+
+    # Without a summary the whole conversation is sent
+    conversation.summary = None
+    assert len(create_chat_history(conversation, 6, CohereChatRequest(message="Hello"))) == 12
@@ -0,0 +1,101 @@
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from backend.services.embeddings import (
+    AsyncEmbedder,
+    EmbeddingStore,
+    HashingEmbedder,
+    get_embedding_store,
+    search_embeddings,
+)
+from backend.tests.unit.mock_embedders import CountingEmbedder
+
+
+class AsyncHashingEmbedder(AsyncEmbedder):
+    def __init__(self) -> None:
+        self.embedder = HashingEmbedder()
+        self.model_name = self.embedder.model_name
+
+    async def aembed_documents(self, texts: list[str]) -> np.ndarray:
+        return self.embedder.embed_documents(texts)
+
+    async def aembed_query(self, text: str) -> np.ndarray:
+        return self.embedder.embed_query(text)
+
+
+def split(text: str) -> list[str]:
+    return text.split("\n")
+
+
+def test_hashing_embedder_is_deterministic() -> None:
+    embedder = HashingEmbedder()
+
+    embeddings = embedder.embed_documents(["The Mariana Trench", "Mount Everest", ""])
+
+    assert embeddings.shape == (3, 512)
+    assert np.allclose(embeddings, HashingEmbedder().embed_documents(["The Mariana Trench", "Mount Everest", ""]))
+    assert np.isclose(np.linalg.norm(embeddings[0]), 1)
+    assert not embeddings[2].any()
+    assert embedder.embed_query("mariana trench") @ embeddings[0] > embedder.embed_query("mariana trench") @ embeddings[1]
+
+
+def test_search_embeddings_returns_top_k() -> None:
+    embeddings = np.array([[0.1, 0], [0.9, 0], [0.5, 0], [0.7, 0]], dtype=np.float16)
+
+    results = search_embeddings(np.array([1, 0]), embeddings, 2)
+
+    assert [row for row, _ in results] == [1, 3]
+    assert results[0][1] == pytest.approx(0.9, abs=1e-3)
+    assert len(search_embeddings(np.array([1, 0]), embeddings, 10)) == 4
+    assert search_embeddings(np.array([1, 0]), embeddings[:0], 2) == []
+
+
+def test_embedding_store_embeds_each_content_once(tmp_path) -> None:
+    embedder = CountingEmbedder()
+    content = "The Mariana Trench\nMount Everest"
+
+    chunks, embeddings = EmbeddingStore(str(tmp_path)).get_or_create(content, embedder, split)
+
+    assert chunks == ["The Mariana Trench", "Mount Everest"]
+    assert embeddings.dtype == np.float16
+    assert embedder.embedded_texts == 2
+
+    # Another worker loads the stored embeddings from the disk
+    store = EmbeddingStore(str(tmp_path))
+    stored_chunks, stored_embeddings = store.get_or_create(content, embedder, split)
+
+    assert stored_chunks == chunks
+    assert isinstance(stored_embeddings, np.memmap)
+    assert np.array_equal(stored_embeddings, embeddings)
+    assert embedder.embedded_texts == 2
+
+    # The content, embedding model and chunking are part of the key
+    store.get_or_create(content + "\nChallenger Deep", embedder, split)
+    store.get_or_create(content, embedder, split, chunking="lines")
+    store.get_or_create(content, HashingEmbedder(dimensions=64), split)
+
+    assert embedder.embedded_texts == 7
+    assert store.get_or_create("", embedder, split)[0] == []
+
+
+@pytest.mark.asyncio
+async def test_embedding_store_embeds_with_async_embedder(tmp_path) -> None:
+    content = "The Mariana Trench\nMount Everest"
+
+    chunks, embeddings = await EmbeddingStore(str(tmp_path)).aget_or_create(
+        content, AsyncHashingEmbedder(), split
+    )
+
+    assert chunks == ["The Mariana Trench", "Mount Everest"]
+    assert np.allclose(embeddings, HashingEmbedder().embed_documents(chunks), atol=1e-3)
+
+
+def test_get_embedding_store(tmp_path) -> None:
+    with patch("backend.services.embeddings.Settings") as mock_settings:
+        mock_settings.return_value.get.return_value = str(tmp_path)
+        store = get_embedding_store("files")
+
+        assert store.directory == str(tmp_path / "files")
+        assert get_embedding_store("files") is store
@@ -0,0 +1,102 @@
+import io
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+from fastapi import UploadFile
+
+from backend.database_models.file import SharedFileContent
+from backend.services.file import (
+    delete_files,
+    get_file_preview,
+    insert_files_in_db,
+    parse_file_content,
+)
+from backend.services.file_storage import get_content_hash, read_file_content
+from backend.tests.unit.factories import get_factory
+
+
+def test_get_file_preview_across_chunks():
+    chunks = ["Hello wo", "rld, how", " are you ", "today"]
+    with patch("backend.services.file.iter_file_content", return_value=iter(chunks)):
+        word_count, preview = get_file_preview(MagicMock(), MagicMock(), 3)
+
+    assert word_count == 6
+    assert preview == "Hello world, how"
+
+
+def test_get_file_preview_empty_file():
+    with patch("backend.services.file.iter_file_content", return_value=iter([])):
+        assert get_file_preview(MagicMock(), MagicMock(), 25) == (0, "")
+
+
+def create_upload(content: bytes, filename: str = "test.txt") -> UploadFile:
+    return UploadFile(io.BytesIO(content), size=len(content), filename=filename)
+
+
+@pytest.mark.asyncio
+async def test_insert_files_shares_content_of_repeat_uploads(session, user):
+    user2 = get_factory("User", session).create()
+    with patch(
+        "backend.services.file.parse_file_content", wraps=parse_file_content
+    ) as parse:
+        [file] = await insert_files_in_db(session, [create_upload(b"Hello")], user.id)
+        [repeat] = await insert_files_in_db(
+            session, [create_upload(b"Hello", "copy.txt")], user2.id
+        )
+        [other] = await insert_files_in_db(session, [create_upload(b"World")], user.id)
+
+    assert parse.call_count == 2
+    assert repeat.shared_content_id == file.shared_content_id
+    assert other.shared_content_id != file.shared_content_id
+    assert (repeat.file_name, repeat.user_id) == ("copy.txt", user2.id)
+    assert repeat.content_hash == get_content_hash("Hello")
+    assert read_file_content(repeat) == "Hello"
+    assert session.get(SharedFileContent, file.shared_content_id).ref_count == 2
+
+
+@pytest.mark.asyncio
+async def test_delete_files_releases_shared_content(session, user):
+    [file] = await insert_files_in_db(session, [create_upload(b"Hello")], user.id)
+    [repeat] = await insert_files_in_db(session, [create_upload(b"Hello")], user.id)
+    shared_content_id = file.shared_content_id
+
+    delete_files(session, [file.id], user.id)
+    session.expire_all()
+    assert session.get(SharedFileContent, shared_content_id).ref_count == 1
+    assert read_file_content(repeat) == "Hello"
+
+    delete_files(session, [repeat.id], user.id)
+    session.expire_all()
+    assert session.get(SharedFileContent, shared_content_id) is None
+
+
+@pytest.mark.asyncio
+async def test_insert_files_releases_references_on_error(session, user):
+    _ = await insert_files_in_db(session, [create_upload(b"Hello")], user.id)
+
+    with pytest.raises(ValueError):
+        await insert_files_in_db(
+            session,
+            [create_upload(b"Hello"), create_upload(b"Hello", "test.unknown")],
+            user.id,
+        )
+
+    session.expire_all()
+    assert session.query(SharedFileContent).one().ref_count == 1
+
+
+@pytest.mark.benchmark
+@pytest.mark.asyncio
+async def test_repeat_uploads_benchmark(session, user):
+    # 20MB document, uploaded 5 times
+    content = b"The quick brown fox jumps over the lazy dog. " * 450_000
+    timings = []
+    for _ in range(5):
+        start = time.perf_counter()
+        _ = await insert_files_in_db(session, [create_upload(content)], user.id)
+        timings.append(time.perf_counter() - start)
+
+    repeat = sum(timings[1:]) / len(timings[1:])
+    # The repeat uploads are hashed, not parsed nor stored again
+    assert repeat < timings[0] / 2
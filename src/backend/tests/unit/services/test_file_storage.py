@@ -0,0 +1,125 @@
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from backend.crud import file as file_crud
+from backend.database_models.file import SharedFileContent
+from backend.services import file_storage
+from backend.services.file_storage import (
+    LocalFileStorage,
+    S3FileStorage,
+    delete_unreferenced_contents,
+    get_content_hash,
+    read_file_content,
+)
+
+CONTENT = "Héllo, wörld! " * 10000
+
+
+def test_local_file_storage(tmp_path) -> None:
+    storage = LocalFileStorage(str(tmp_path))
+
+    stored_content = storage.put(CONTENT)
+
+    assert stored_content.content_hash == get_content_hash(CONTENT)
+    assert storage.exists(stored_content.storage_key)
+    assert storage.read(stored_content.storage_key) == CONTENT
+    # Compressed on disk
+    path = tmp_path / stored_content.storage_key[:2] / stored_content.storage_key
+    assert os.path.getsize(path) < len(CONTENT) / 10
+
+    storage.delete(stored_content.storage_key)
+    assert not storage.exists(stored_content.storage_key)
+
+
+def test_local_file_storage_is_content_addressed(tmp_path) -> None:
+    storage = LocalFileStorage(str(tmp_path))
+
+    stored_content = storage.put(CONTENT)
+    # Written again, it may be deleted concurrently after it was found stored
+    with patch.object(storage, "_write") as write:
+        assert storage.put(CONTENT) == stored_content
+    write.assert_called_once()
+
+    assert storage.put("Other content").storage_key != stored_content.storage_key
+
+
+def test_delete_unreferenced_contents_keeps_referenced(session, user, tmp_path) -> None:
+    storage = LocalFileStorage(str(tmp_path))
+    referenced = storage.put(CONTENT)
+    unreferenced = storage.put("Other content")
+    file_crud.create_shared_file_content(
+        session,
+        SharedFileContent(
+            upload_hash="txt:1", storage_key=referenced.storage_key, ref_count=1
+        ),
+    )
+
+    with patch.object(file_storage, "_file_storage", storage):
+        delete_unreferenced_contents(
+            session, [referenced.storage_key, unreferenced.storage_key]
+        )
+
+    assert storage.exists(referenced.storage_key)
+    assert not storage.exists(unreferenced.storage_key)
+
+
+def test_iter_content_streams_chunks(tmp_path) -> None:
+    storage = LocalFileStorage(str(tmp_path))
+    stored_content = storage.put(CONTENT)
+
+    chunks = list(storage.iter_content(stored_content.storage_key, chunk_size=16))
+
+    assert len(chunks) > 1
+    assert "".join(chunks) == CONTENT
+
+
+def test_zlib_without_zstandard(tmp_path) -> None:
+    with patch.object(file_storage, "zstandard", None):
+        storage = LocalFileStorage(str(tmp_path))
+        stored_content = storage.put(CONTENT)
+
+        assert storage.read(stored_content.storage_key) == CONTENT
+
+
+def test_s3_file_storage() -> None:
+    moto = pytest.importorskip("moto")
+    import boto3
+
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket="files")
+        storage = S3FileStorage("files", prefix="files/", client=client)
+
+        stored_content = storage.put(CONTENT)
+
+        assert stored_content.storage_key == f"files/{get_content_hash(CONTENT)}"
+        assert storage.exists(stored_content.storage_key)
+        assert storage.read(stored_content.storage_key) == CONTENT
+
+        storage.delete(stored_content.storage_key)
+        assert not storage.exists(stored_content.storage_key)
+
+
+def test_read_file_content(tmp_path) -> None:
+    storage = LocalFileStorage(str(tmp_path))
+    stored_content = storage.put(CONTENT)
+    stored_file = MagicMock(
+        shared_content_id=None, storage_key=stored_content.storage_key
+    )
+    database_file = MagicMock(
+        shared_content_id=None, storage_key=None, file_content="In the database"
+    )
+    shared_stored_file = MagicMock(
+        shared_content=MagicMock(storage_key=stored_content.storage_key)
+    )
+    shared_database_file = MagicMock(
+        shared_content=MagicMock(storage_key=None, text="Shared in the database")
+    )
+
+    with patch.object(file_storage, "_file_storage", storage):
+        assert read_file_content(stored_file) == CONTENT
+        assert read_file_content(database_file) == "In the database"
+        assert read_file_content(shared_stored_file) == CONTENT
+        assert read_file_content(shared_database_file) == "Shared in the database"
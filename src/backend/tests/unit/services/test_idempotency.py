@@ -0,0 +1,114 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+from fastapi import HTTPException
+
+from backend.services.idempotency import (
+    PENDING_RESPONSE,
+    InMemoryIdempotencyStore,
+    RedisIdempotencyStore,
+    get_idempotency_key,
+    get_or_claim_response,
+    save_response,
+)
+
+
+@pytest.fixture(params=["memory", "redis"])
+def idempotency_store(request, mock_redis_client):
+    with patch(
+        "backend.services.idempotency.get_client", return_value=mock_redis_client
+    ):
+        if request.param == "redis":
+            yield RedisIdempotencyStore(ttl=60)
+        else:
+            yield InMemoryIdempotencyStore(ttl=60)
+
+
+@pytest.mark.asyncio
+async def test_idempotency_store_claims_key_once(idempotency_store) -> None:
+    assert await idempotency_store.claim("key", "first") is None
+    assert await idempotency_store.claim("key", "second") == "first"
+
+    await idempotency_store.delete("key")
+
+    assert await idempotency_store.claim("key", "third") is None
+
+
+@pytest.mark.asyncio
+async def test_idempotency_store_waits_for_response(idempotency_store) -> None:
+    await idempotency_store.claim("key", PENDING_RESPONSE)
+
+    async def set_response():
+        await asyncio.sleep(0.1)
+        await idempotency_store.set("key", "response")
+
+    task = asyncio.create_task(set_response())
+
+    assert await idempotency_store.wait("key", timeout=5) == "response"
+    await task
+
+
+@pytest.mark.asyncio
+async def test_idempotency_store_wait_times_out(idempotency_store) -> None:
+    await idempotency_store.claim("key", PENDING_RESPONSE)
+
+    assert await idempotency_store.wait("key", timeout=0.1) is None
+
+
+@pytest.mark.asyncio
+async def test_in_memory_idempotency_store_removes_expired_keys() -> None:
+    store = InMemoryIdempotencyStore(ttl=0)
+    await store.claim("key", "first")
+    await asyncio.sleep(0.01)
+
+    assert await store.claim("key", "second") is None
+
+
+@pytest.mark.asyncio
+async def test_get_or_claim_response_of_failed_request() -> None:
+    store = InMemoryIdempotencyStore()
+    await store.claim("key", PENDING_RESPONSE)
+
+    async def fail_request():
+        await asyncio.sleep(0.1)
+        await store.delete("key")
+
+    task = asyncio.create_task(fail_request())
+    with patch(
+        "backend.services.idempotency.get_idempotency_store", return_value=store
+    ):
+        with pytest.raises(HTTPException) as exc:
+            await get_or_claim_response("key")
+
+    assert exc.value.status_code == 409
+    await task
+
+
+@pytest.mark.asyncio
+async def test_save_response_stores_or_releases_key() -> None:
+    store = InMemoryIdempotencyStore()
+    await store.claim("key", PENDING_RESPONSE)
+    await store.claim("failed-key", PENDING_RESPONSE)
+
+    with patch(
+        "backend.services.idempotency.get_idempotency_store", return_value=store
+    ):
+        await save_response("key", "response")
+        await save_response("failed-key", None)
+
+    assert await store.get("key") == "response"
+    assert await store.get("failed-key") is None
+
+
+def test_get_idempotency_key_is_scoped_to_user_and_endpoint() -> None:
+    keys = {
+        get_idempotency_key("chat", "user", "key"),
+        get_idempotency_key("chat", "other-user", "key"),
+        get_idempotency_key("chat-stream", "user", "key"),
+    }
+
+    assert len(keys) == 3
+    with pytest.raises(HTTPException) as exc:
+        get_idempotency_key("chat", "user", "k" * 256)
+    assert exc.value.status_code == 400
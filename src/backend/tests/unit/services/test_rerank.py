@@ -0,0 +1,137 @@
+import random
+import time
+from unittest.mock import ANY, patch
+
+import numpy as np
+import pytest
+
+from backend.schemas.context import Context
+from backend.services.rerank import (
+    LocalReranker,
+    get_rerank_cache,
+    get_reranker,
+    rerank_cache_stats,
+)
+from backend.tests.unit.model_deployments.mock_deployments import (
+    MockCohereDeployment,
+    MockLatencyDeployment,
+    MockSingleContainerDeployment,
+)
+
+DOCUMENTS = [
+    "Mount Everest is Earth's highest mountain above sea level.",
+    "The Mariana Trench is the deepest oceanic trench on Earth.",
+    "Tapas are small Spanish savory dishes.",
+    "The trench, the trench and the trench again.",
+    "",
+]
+
+
+@pytest.mark.parametrize("method", ["bm25", "tfidf"])
+def test_local_reranker_scores(method) -> None:
+    scores = LocalReranker(method).score("deepest oceanic trench", DOCUMENTS)
+
+    assert np.argmax(scores) == 1
+    assert scores[3] > 0
+    assert scores[0] == scores[2] == scores[4] == 0
+    assert np.all(scores <= 1)
+    assert not LocalReranker(method).score("", DOCUMENTS).any()
+    assert LocalReranker(method).score("trench", []).shape == (0,)
+
+
+@pytest.mark.asyncio
+async def test_local_reranker_invoke_rerank() -> None:
+    response = await LocalReranker().invoke_rerank(
+        query="highest mountain", documents=DOCUMENTS, ctx=Context()
+    )
+
+    assert [result["index"] for result in response["results"]] == [0, 1, 2, 3, 4]
+    assert response["results"][0]["relevance_score"] > 0.3
+    assert response["results"][1]["relevance_score"] == 0
+
+
+def test_get_reranker() -> None:
+    with patch("backend.services.rerank.Settings") as mock_settings:
+        settings = {"chat.local_rerank": "tfidf"}
+        mock_settings.return_value.get.side_effect = settings.get
+
+        deployment = MockCohereDeployment()
+        assert get_reranker(deployment) is deployment
+        assert get_reranker(MockSingleContainerDeployment()).method == "tfidf"
+
+        settings["chat.local_rerank"] = None
+        assert get_reranker(MockSingleContainerDeployment()) is None
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("method", ["bm25", "tfidf"])
+def test_local_reranker_benchmark(method) -> None:
+    # 10k chunks of 200 words from a vocabulary of 20k words
+    random.seed(0)
+    vocabulary = [f"word{index}" for index in range(20_000)]
+    documents = [" ".join(random.choices(vocabulary, k=200)) for _ in range(10_000)]
+    reranker = LocalReranker(method)
+
+    start = time.perf_counter()
+    for query in ("word1 word2 word3", "word10 word20 word30 word40"):
+        scores = reranker.score(query, documents)
+    elapsed = (time.perf_counter() - start) / 2
+
+    assert scores.shape == (10_000,)
+    # At least 5000 chunks reranked per second
+    assert len(documents) / elapsed > 5000
+
+
+@pytest.fixture
+def mock_rerank_cache_settings():
+    with patch("backend.services.rerank.Settings") as mock_settings:
+        settings = {"chat.rerank_cache": True, "chat.rerank_cache_size": 100}
+        mock_settings.return_value.get.side_effect = settings.get
+        yield settings
+
+
+@pytest.mark.asyncio
+async def test_cached_reranker_sends_cache_misses(mock_rerank_cache_settings) -> None:
+    deployment = MockLatencyDeployment()
+    reranker = get_reranker(deployment)
+    await reranker.invoke_rerank(
+        query="trench", documents=DOCUMENTS[:2], ctx=Context()
+    )
+
+    cached_documents = rerank_cache_stats.cached_documents
+
+    with patch.object(
+        deployment, "invoke_rerank", wraps=deployment.invoke_rerank
+    ) as mock_invoke_rerank:
+        response = await get_reranker(deployment).invoke_rerank(
+            query="trench", documents=DOCUMENTS[:4] + [DOCUMENTS[3]], ctx=Context()
+        )
+
+    # Only the documents without a score are reranked, once each. The mock deployment
+    # leaves out the documents without the query, they are not cached
+    mock_invoke_rerank.assert_called_once_with(
+        query="trench", documents=[DOCUMENTS[0], DOCUMENTS[2], DOCUMENTS[3]], ctx=ANY
+    )
+    results = response["results"]
+    assert [result["index"] for result in results] == [1, 3, 4]
+    assert results[1]["relevance_score"] == results[2]["relevance_score"]
+    assert rerank_cache_stats.cached_documents == cached_documents + 1
+
+
+@pytest.mark.asyncio
+async def test_rerank_cache_is_keyed_by_query_and_model(
+    mock_rerank_cache_settings,
+) -> None:
+    cache = get_rerank_cache()
+    deployment = MockCohereDeployment()
+    await get_reranker(deployment).invoke_rerank(
+        query="Mariana", documents=DOCUMENTS, ctx=Context()
+    )
+
+    model = f"{deployment.id()}:"
+    assert cache.get(model, "Mariana", DOCUMENTS[1]) is not None
+    assert cache.get(model, "Everest", DOCUMENTS[1]) is None
+    assert cache.get("other:model", "Mariana", DOCUMENTS[1]) is None
+
+    mock_rerank_cache_settings["chat.rerank_cache"] = False
+    assert get_reranker(deployment) is deployment
@@ -0,0 +1,195 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from backend.chat.custom.custom import CustomChat
+from backend.chat.enums import StreamEvent
+from backend.schemas.chat import ChatMessage, ChatRole
+from backend.schemas.cohere_chat import CohereChatRequest
+from backend.schemas.context import Context
+from backend.services.conversation import generate_conversation_title
+from backend.services.response_cache import (
+    InMemoryResponseCache,
+    RedisResponseCache,
+    cached_chat_stream,
+    get_response_cache_key,
+    response_cache_stats,
+)
+from backend.tests.unit.factories import get_factory
+from backend.tests.unit.model_deployments.mock_deployments import (
+    MockLatencyDeployment,
+)
+
+EVENTS = [
+    {"event_type": StreamEvent.STREAM_START, "generation_id": "text"},
+    {"event_type": StreamEvent.TEXT_GENERATION, "text": "Hello"},
+    {
+        "event_type": StreamEvent.STREAM_END,
+        "finish_reason": "COMPLETE",
+        "response": {"chat_history": []},
+    },
+]
+
+
+@pytest.fixture(params=["memory", "redis"])
+def response_cache(request, mock_redis_client):
+    with patch(
+        "backend.services.response_cache.get_client", return_value=mock_redis_client
+    ):
+        if request.param == "redis":
+            yield RedisResponseCache(size=2, ttl=60)
+        else:
+            yield InMemoryResponseCache(size=2, ttl=60)
+
+
+@pytest.fixture
+def mock_response_cache_settings():
+    cache = InMemoryResponseCache()
+    with (
+        patch("backend.services.response_cache.Settings") as mock_settings,
+        patch(
+            "backend.services.response_cache.get_response_cache", return_value=cache
+        ),
+    ):
+        mock_settings.return_value.get.side_effect = (
+            lambda path: path == "chat.response_cache"
+        )
+        yield mock_settings
+
+
+def get_ctx(deployment_name: str = "Cohere Platform") -> Context:
+    ctx = Context()
+    ctx.with_deployment_name(deployment_name)
+    return ctx
+
+
+async def chat(deployment, chat_request: CohereChatRequest) -> list[dict]:
+    ctx = get_ctx()
+    with patch("backend.chat.custom.custom.get_deployment", return_value=deployment):
+        return [
+            event
+            async for event in cached_chat_stream(
+                chat_request, CustomChat().chat(chat_request, None, ctx), ctx
+            )
+        ]
+
+
+def test_response_cache_key_is_stable() -> None:
+    history = [ChatMessage(role=ChatRole.USER, message="Hi")]
+    chat_request = CohereChatRequest(message="Hello", chat_history=history)
+
+    key = get_response_cache_key(chat_request, get_ctx())
+
+    # The conversation ID is generated for each request
+    assert key == get_response_cache_key(
+        CohereChatRequest(message="Hello", chat_history=history), get_ctx()
+    )
+    assert key != get_response_cache_key(
+        CohereChatRequest(message="Hello"), get_ctx()
+    )
+    assert key != get_response_cache_key(
+        CohereChatRequest(message="Hello", chat_history=history, preamble="Be brief"),
+        get_ctx(),
+    )
+    assert key != get_response_cache_key(chat_request, get_ctx("Azure"))
+
+
+@pytest.mark.asyncio
+async def test_response_cache_evicts_least_recently_used(response_cache) -> None:
+    await response_cache.set("first", EVENTS)
+    await response_cache.set("second", EVENTS)
+    await response_cache.get("first")
+    await response_cache.set("third", EVENTS)
+
+    assert await response_cache.get("first") == EVENTS
+    assert await response_cache.get("second") is None
+    assert await response_cache.get("third") == EVENTS
+
+
+@pytest.mark.asyncio
+async def test_in_memory_response_cache_expires_entries() -> None:
+    cache = InMemoryResponseCache(ttl=0)
+    await cache.set("key", EVENTS)
+    await asyncio.sleep(0.01)
+
+    assert await cache.get("key") is None
+
+
+@pytest.mark.asyncio
+async def test_cached_chat_stream_replays_identical_request(
+    mock_response_cache_settings,
+) -> None:
+    deployment = MockLatencyDeployment(event_streams=[EVENTS])
+    hits, misses = response_cache_stats.hits, response_cache_stats.misses
+
+    events = await chat(deployment, CohereChatRequest(message="Hello", temperature=0))
+    cached_events = await chat(
+        deployment, CohereChatRequest(message="Hello", temperature=0)
+    )
+    await chat(deployment, CohereChatRequest(message="Hello again", temperature=0))
+
+    assert cached_events == events
+    assert deployment.chat_calls == 2
+    assert response_cache_stats.hits == hits + 1
+    assert response_cache_stats.misses == misses + 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("temperature", [0.3, None])
+@pytest.mark.parametrize("force, chat_calls", [(False, 2), (True, 1)])
+async def test_cached_chat_stream_bypasses_temperature(
+    mock_response_cache_settings, force: bool, chat_calls: int, temperature
+) -> None:
+    mock_response_cache_settings.return_value.get.side_effect = lambda path: (
+        path == "chat.response_cache" or (force and path == "chat.response_cache_force")
+    )
+    deployment = MockLatencyDeployment(event_streams=[EVENTS])
+
+    for _ in range(2):
+        # Without a temperature, the sampled deployment default is used
+        await chat(
+            deployment, CohereChatRequest(message="Hello", temperature=temperature)
+        )
+
+    assert deployment.chat_calls == chat_calls
+
+
+@pytest.mark.asyncio
+async def test_cached_chat_stream_does_not_cache_errors(
+    mock_response_cache_settings,
+) -> None:
+    class FailingDeployment(MockLatencyDeployment):
+        async def invoke_chat_stream(self, *args, **kwargs):
+            self.chat_calls += 1
+            raise ValueError("Deployment error")
+            yield
+
+    deployment = FailingDeployment()
+
+    for _ in range(2):
+        events = await chat(deployment, CohereChatRequest(message="Hello", temperature=0))
+
+    assert events[-1]["finish_reason"] == "ERROR"
+    assert deployment.chat_calls == 2
+
+
+@pytest.mark.asyncio
+async def test_generate_conversation_title_is_cached(
+    session, user, mock_response_cache_settings
+) -> None:
+    deployment = MockLatencyDeployment(event_streams=[EVENTS])
+    conversation = get_factory("Conversation", session).create(user_id=user.id)
+    ctx = get_ctx()
+    ctx.with_user_id(user.id)
+    hits = response_cache_stats.hits
+
+    with patch("backend.chat.custom.custom.get_deployment", return_value=deployment):
+        titles = [
+            await generate_conversation_title(session, conversation, None, ctx)
+            for _ in range(2)
+        ]
+
+    assert titles[0] == titles[1] == ("Hello", None)
+    assert deployment.chat_calls == 1
+    assert response_cache_stats.hits == hits + 1
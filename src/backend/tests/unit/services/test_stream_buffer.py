@@ -0,0 +1,159 @@
+import asyncio
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from backend.chat.custom.custom import CustomChat
+from backend.chat.enums import StreamEvent
+from backend.schemas.cohere_chat import CohereChatRequest
+from backend.schemas.context import Context
+from backend.services.chat import generate_chat_stream
+from backend.services.stream_buffer import (
+    InMemoryStreamBuffer,
+    RedisStreamBuffer,
+    StreamEventsExpired,
+    start_resumable_stream,
+)
+from backend.tests.unit.model_deployments.mock_deployments import (
+    MockLatencyDeployment,
+)
+
+
+@pytest.fixture(params=["memory", "redis"])
+def stream_buffer(request, mock_redis_client):
+    with patch(
+        "backend.services.stream_buffer.get_client", return_value=mock_redis_client
+    ):
+        if request.param == "redis":
+            yield RedisStreamBuffer(size=5, ttl=60)
+        else:
+            yield InMemoryStreamBuffer(size=5, ttl=60)
+
+
+async def slow_stream(count: int, latency: float = 0.01):
+    for i in range(count):
+        await asyncio.sleep(latency)
+        yield f"event {i + 1}"
+
+
+async def read_events(buffer, stream_id: str, after_id: int = 0, limit: int | None = None):
+    events = []
+    async for event in buffer.events(stream_id, after_id):
+        events.append(event)
+        if limit and len(events) == limit:
+            break
+    return events
+
+
+@pytest.mark.asyncio
+async def test_stream_buffer_resumes_after_last_event_id(stream_buffer) -> None:
+    await start_resumable_stream("stream", "user", slow_stream(4), stream_buffer)
+
+    # The client disconnects after the second event, while the stream is still generated
+    first_events = await read_events(stream_buffer, "stream", limit=2)
+    resumed_events = await read_events(stream_buffer, "stream", after_id=2)
+
+    assert first_events == [
+        {"id": 1, "data": "event 1"},
+        {"id": 2, "data": "event 2"},
+    ]
+    assert resumed_events == [
+        {"id": 3, "data": "event 3"},
+        {"id": 4, "data": "event 4"},
+    ]
+    assert await stream_buffer.get_owner("stream") == "user"
+
+
+@pytest.mark.asyncio
+async def test_stream_buffer_reports_dropped_events(stream_buffer) -> None:
+    task = await start_resumable_stream(
+        "stream", "user", slow_stream(8, latency=0), stream_buffer
+    )
+    await task
+
+    # Only the last 5 events are buffered
+    assert await read_events(stream_buffer, "stream", after_id=3) == [
+        {"id": i, "data": f"event {i}"} for i in range(4, 9)
+    ]
+    with pytest.raises(StreamEventsExpired):
+        await stream_buffer.read("stream", 2)
+
+
+@pytest.mark.asyncio
+async def test_stream_buffer_ends_when_stream_fails(stream_buffer) -> None:
+    async def failing_stream():
+        yield "event 1"
+        raise ValueError("Deployment error")
+
+    task = await start_resumable_stream("stream", "user", failing_stream(), stream_buffer)
+    await task
+
+    assert await read_events(stream_buffer, "stream") == [{"id": 1, "data": "event 1"}]
+
+
+@pytest.mark.asyncio
+async def test_stream_without_reader_is_cancelled() -> None:
+    buffer = InMemoryStreamBuffer(size=100, ttl=0.05)
+
+    with patch("backend.services.stream_buffer.READER_CHECK_INTERVAL_SECONDS", 0):
+        # Read by a client, then no client reads it for the buffer TTL
+        task = await start_resumable_stream("read", "user", slow_stream(20), buffer)
+        await read_events(buffer, "read")
+        await task
+        task = await start_resumable_stream("unread", "user", slow_stream(20), buffer)
+        await task
+
+    events, ended = await buffer.read("unread", 0)
+    assert ended
+    assert 0 < events[-1][0] < 20
+    assert (await buffer.read("read", 0))[0][-1][0] == 20
+
+
+@pytest.mark.asyncio
+async def test_in_memory_stream_buffer_removes_expired_streams() -> None:
+    buffer = InMemoryStreamBuffer(size=5, ttl=0)
+    task = await start_resumable_stream("stream", "user", slow_stream(1, 0), buffer)
+    await task
+    await asyncio.sleep(0.01)
+
+    assert await buffer.get_owner("stream") is None
+
+
+@pytest.mark.asyncio
+async def test_resumable_chat_stream_is_not_regenerated_after_disconnect() -> None:
+    text_events = [
+        {"event_type": StreamEvent.STREAM_START, "generation_id": "text"},
+        *[
+            {"event_type": StreamEvent.TEXT_GENERATION, "text": f"word{i} "}
+            for i in range(10)
+        ],
+        {
+            "event_type": StreamEvent.STREAM_END,
+            "finish_reason": "COMPLETE",
+            "response": {"chat_history": []},
+        },
+    ]
+    deployment = MockLatencyDeployment(event_latency=0.01, event_streams=[text_events])
+    buffer = InMemoryStreamBuffer()
+
+    with patch("backend.chat.custom.custom.get_deployment", return_value=deployment):
+        stream = generate_chat_stream(
+            None,
+            CustomChat().chat(CohereChatRequest(message="Hello"), None, Context()),
+            MagicMock(id="message-id", is_parallel=False),
+            should_store=False,
+            ctx=Context(),
+        )
+        await start_resumable_stream("stream", "user", stream, buffer)
+
+        # Forced disconnects after a few events each time
+        events = []
+        while not events or '"stream-end"' not in events[-1]["data"]:
+            last_event_id = events[-1]["id"] if events else 0
+            events.extend(await read_events(buffer, "stream", last_event_id, limit=3))
+
+    assert [event["id"] for event in events] == list(range(1, len(text_events) + 1))
+    assert "".join(
+        event["data"] for event in events if '"text-generation"' in event["data"]
+    ).count("word") == 10
+    assert deployment.chat_calls == 1
@@ -0,0 +1,53 @@
+from unittest.mock import patch
+
+import numpy as np
+
+from backend.services.embeddings import HashingEmbedder, search_embeddings
+from backend.services.vector_index import VectorIndex, VectorIndexMode
+
+
+def get_embeddings(count: int) -> np.ndarray:
+    return HashingEmbedder().embed_documents(
+        [
+            f"document {index} about topic {index % 97} and subject {index % 89}"
+            for index in range(count)
+        ]
+    )
+
+
+def test_small_index_is_flat() -> None:
+    embeddings = get_embeddings(100)
+
+    index = VectorIndex(embeddings, VectorIndexMode.IVF)
+
+    assert index.mode == VectorIndexMode.Flat
+    assert index.search(embeddings[3], 5) == search_embeddings(embeddings[3], embeddings, 5)
+    assert VectorIndex(np.zeros((0, 0))).search(embeddings[3], 5) == []
+
+
+def test_ivf_index_finds_nearest_neighbours() -> None:
+    embeddings = get_embeddings(5000)
+    queries = HashingEmbedder().embed_documents(
+        [f"topic {index} and subject {index}" for index in range(20)]
+    )
+
+    index = VectorIndex(embeddings, VectorIndexMode.IVF)
+
+    assert index.mode == VectorIndexMode.IVF
+    assert sum(len(rows) for rows in index.lists) == len(embeddings)
+    # Many documents tie, a result is relevant if it scores as high as the exact top 10
+    recall = np.mean(
+        [
+            score >= search_embeddings(query, embeddings, 10)[-1][1] - 1e-6
+            for query in queries
+            for _, score in index.search(query, 10)
+        ]
+    )
+    assert recall >= 0.8
+
+
+@patch("backend.services.vector_index.hnswlib", None)
+def test_hnsw_index_falls_back_to_ivf() -> None:
+    index = VectorIndex(get_embeddings(1000), VectorIndexMode.HNSW)
+
+    assert index.mode == VectorIndexMode.IVF
@@ -1,8 +1,15 @@
+import time
+from unittest.mock import patch
+
 import pytest
 
 from backend.chat import collate
 from backend.schemas.context import Context
-from backend.tests.unit.model_deployments.mock_deployments import MockCohereDeployment
+from backend.tests.unit.model_deployments.mock_deployments import (
+    MockCohereDeployment,
+    MockLatencyDeployment,
+    MockSingleContainerDeployment,
+)
 
 
 @pytest.mark.asyncio
@@ -70,6 +77,38 @@ async def test_rerank() -> None:
     assert output == expected_output
 
 
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("local_rerank", ["bm25", "tfidf"])
+async def test_rerank_without_deployment_rerank(local_rerank) -> None:
+    model = MockSingleContainerDeployment()
+    outputs = [
+        {"text": "There are four components of blood: red blood cells, white blood cells, plasma and platelets."},
+        {"text": "Mount Everest is Earth's highest mountain above sea level."},
+        {"text": "Tapas are small Spanish savory dishes."},
+    ]
+    tool_results = [
+        {
+            "call": {"parameters": {"query": "highest mountain"}, "name": "retriever"},
+            "outputs": outputs,
+        }
+    ]
+
+    with patch("backend.services.rerank.Settings") as mock_settings:
+        settings = {"chat.local_rerank": local_rerank}
+        mock_settings.return_value.get.side_effect = settings.get
+        output = await collate.rerank_and_chunk(tool_results, model, Context())
+
+        # Reordered, the documents without a shared token are kept
+        assert output[0]["outputs"][0] == outputs[1]
+        assert len(output[0]["outputs"]) == len(outputs)
+
+        # Without a local reranker the documents are returned as is
+        settings["chat.local_rerank"] = None
+        output = await collate.rerank_and_chunk(tool_results, model, Context())
+
+        assert output == tool_results
+
 def test_chunk_normal_mode() -> None:
     content = "This is a test. We are testing the chunk function."
     expected_output = ["This is a test.", "We are testing the chunk function."]
@@ -110,3 +149,99 @@ def test_chunk_empty_content() -> None:
     expected_output = []
     output = collate.chunk(content, False, 3, 10)
     assert output == expected_output
+
+
+def test_chunk_sentence_terminators() -> None:
+    content = "Is this a test? Yes it is! We are testing the chunk function."
+    expected_output = [
+        "Is this a test?",
+        "Yes it is!",
+        "We are testing the chunk function.",
+    ]
+    output = collate.chunk(content, False, 2, 10)
+    assert output == expected_output
+
+
+def test_chunk_overlap() -> None:
+    content = "one two three four five six seven eight nine ten"
+    expected_output = [
+        "one two three four",
+        "three four five six",
+        "five six seven eight",
+        "seven eight nine ten",
+    ]
+    output = collate.chunk(content, False, 10, 4, overlap=2)
+    assert output == expected_output
+
+
+@pytest.mark.parametrize(
+    "soft_word_cut_off,hard_word_cut_off,overlap",
+    [(10, 2, 5), (10, 2, 2), (100, 300, 100), (100, 300, 299)],
+)
+def test_chunk_overlap_not_smaller_than_cut_offs(
+    soft_word_cut_off: int, hard_word_cut_off: int, overlap: int
+) -> None:
+    with pytest.raises(ValueError):
+        collate.chunk(
+            "w " * 1000, False, soft_word_cut_off, hard_word_cut_off, overlap=overlap
+        )
+
+
+@pytest.mark.benchmark
+def test_chunk_large_content_benchmark() -> None:
+    sentence = "Mount Everest is Earth's highest mountain above sea level. "
+    content = sentence * (1024 * 1024 // len(sentence))
+
+    start = time.perf_counter()
+    output = collate.chunk(content)
+    elapsed = time.perf_counter() - start
+
+    assert " ".join(output) == " ".join(content.split())
+    assert all(len(chunk.split()) <= 300 for chunk in output)
+    assert all(chunk.endswith(".") for chunk in output)
+    # A single pass over 1 MB of text should take well under a second
+    assert elapsed < 2
+
+
+@pytest.mark.asyncio
+async def test_rerank_runs_queries_concurrently() -> None:
+    model = MockLatencyDeployment(rerank_latency=0.2)
+    text = "Mount Everest is Earth's highest mountain. " * 25_000
+    tool_results = [
+        {
+            "call": {
+                "parameters": {"query": f"highest mountain {i}"},
+                "name": "retriever",
+            },
+            "outputs": [{"text": text}],
+        }
+        for i in range(collate.MAX_CONCURRENT_RERANKS)
+    ]
+
+    output = await collate.rerank_and_chunk(tool_results, model, Context())
+
+    assert len(output) == len(tool_results)
+    assert model.rerank_calls == len(tool_results)
+    # All the queries were reranked at the same time
+    assert model.max_in_flight_reranks == len(tool_results)
+
+
+@pytest.mark.asyncio
+@patch("backend.chat.collate.MAX_CONCURRENT_RERANKS", 2)
+async def test_rerank_concurrency_is_bounded() -> None:
+    model = MockLatencyDeployment(rerank_latency=0.05)
+    tool_results = [
+        {
+            "call": {"parameters": {"query": f"query {i}"}, "name": "retriever"},
+            "outputs": [{"text": f"query {i} result"}],
+        }
+        for i in range(6)
+    ]
+
+    output = await collate.rerank_and_chunk(tool_results, model, Context())
+
+    assert [result["call"] for result in output] == [
+        result["call"] for result in tool_results
+    ]
+    assert model.rerank_calls == 6
+    assert model.max_in_flight_reranks == 2
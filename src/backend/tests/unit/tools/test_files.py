@@ -0,0 +1,143 @@
+import time
+from unittest.mock import patch
+
+import pytest
+
+from backend.schemas.context import Context
+from backend.services.embeddings import _embedding_stores
+from backend.services.file_search import _file_chunk_indexes
+from backend.tests.unit.factories import get_factory
+from backend.tests.unit.model_deployments.mock_deployments import (
+    MockCohereDeployment,
+)
+from backend.tools import SearchFileTool
+
+TOPICS = [
+    "The Mariana Trench is the deepest oceanic trench on Earth.",
+    "Mount Everest is the highest mountain above sea level.",
+    "Tapas are small Spanish savory dishes served with drinks.",
+    "Cardistry is the performance art of card flourishing.",
+]
+
+
+@pytest.fixture
+def mock_file_search_settings(tmp_path):
+    _embedding_stores.clear()
+    _file_chunk_indexes.clear()
+    with patch("backend.services.embeddings.Settings") as mock_settings, patch(
+        "backend.services.file_search.Settings", mock_settings
+    ):
+        settings = {
+            "tools.vector_store_path": str(tmp_path),
+            "tools.file_search_index": "flat",
+        }
+        mock_settings.return_value.get.side_effect = settings.get
+        yield settings
+    _embedding_stores.clear()
+    _file_chunk_indexes.clear()
+
+
+def create_file(session, user, content: str, file_name: str):
+    return get_factory("File", session).create(
+        user_id=user.id, file_name=file_name, file_content=content
+    )
+
+
+def get_content(topic: str, paragraphs: int) -> str:
+    filler = "Unrelated notes with numbers {index} and words like lorem ipsum dolor."
+    return " ".join(
+        topic if index % 10 == 0 else filler.format(index=index)
+        for index in range(paragraphs * 100)
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("model_deployment", [None, MockCohereDeployment()])
+async def test_search_file_returns_relevant_chunks(
+    session, user, mock_file_search_settings, model_deployment
+) -> None:
+    files = [
+        create_file(session, user, get_content(topic, 1), f"{index}.txt")
+        for index, topic in enumerate(TOPICS)
+    ]
+
+    result = await SearchFileTool().call(
+        {
+            "search_query": "highest mountain above sea level",
+            "files": [(file.file_name, file.id) for file in files],
+        },
+        Context(),
+        session=session,
+        user_id=user.id,
+        model_deployment=model_deployment,
+    )
+
+    assert len(result) == SearchFileTool.MAX_NUM_CHUNKS
+    assert "Mount Everest" in result[0]["text"]
+    assert result[0]["title"] == "1.txt"
+
+
+@pytest.mark.asyncio
+async def test_search_file_embeds_file_once(
+    session, user, mock_file_search_settings
+) -> None:
+    model_deployment = MockCohereDeployment()
+    file = create_file(session, user, get_content(TOPICS[0], 1), "trench.txt")
+    parameters = {
+        "search_query": "deepest oceanic trench",
+        "files": [(file.file_name, file.id)],
+    }
+
+    await SearchFileTool().call(
+        parameters,
+        Context(),
+        session=session,
+        user_id=user.id,
+        model_deployment=model_deployment,
+    )
+    embedded_texts = sum(len(batch) for batch in model_deployment.embed_batches)
+    # Another worker reuses the persisted embeddings of the chunks
+    _file_chunk_indexes.clear()
+    await SearchFileTool().call(
+        dict(parameters, search_query="trench"),
+        Context(),
+        session=session,
+        user_id=user.id,
+        model_deployment=model_deployment,
+    )
+
+    # Only the new query was embedded
+    assert (
+        sum(len(batch) for batch in model_deployment.embed_batches)
+        == embedded_texts + 1
+    )
+
+
+@pytest.mark.benchmark
+@pytest.mark.asyncio
+@pytest.mark.parametrize("index_mode", ["flat", "ivf"])
+async def test_search_file_benchmark(
+    session, user, mock_file_search_settings, index_mode
+) -> None:
+    mock_file_search_settings["tools.file_search_index"] = index_mode
+    # About 5 MB of text split into about 7000 chunks, embedded offline with the hashing embedder
+    file = create_file(session, user, get_content(TOPICS[1], 700), "everest.txt")
+    parameters = {
+        "search_query": "highest mountain above sea level",
+        "files": [(file.file_name, file.id)],
+    }
+
+    start = time.perf_counter()
+    await SearchFileTool().call(parameters, Context(), session=session, user_id=user.id)
+    first_query = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(20):
+        result = await SearchFileTool().call(
+            parameters, Context(), session=session, user_id=user.id
+        )
+    query = (time.perf_counter() - start) / 20
+
+    assert "Mount Everest" in result[0]["text"]
+    # The chunks are embedded and indexed once
+    assert query < first_query / 10
@@ -1,3 +1,4 @@
+import os
 from unittest.mock import MagicMock, patch
 
 import pytest
@@ -6,6 +7,73 @@ from langchain_core.documents.base import Document
 from backend.services.context import Context
 from backend.tools import LangChainVectorDBRetriever, LangChainWikiRetriever
 from backend.tools.base import ToolError, ToolErrorCode
+from backend.tools.lang_chain import _file_vector_stores
+
+
+class FakeChroma:
+    """Chroma collection kept in memory, shared by the instances with the same name."""
+
+    collections = {}
+
+    def __init__(self, collection_name, embedding_function, persist_directory):
+        self.documents = self.collections.setdefault(collection_name, {})
+        self.added = []
+        self.deleted = []
+
+    def get(self, include):
+        return {"ids": list(self.documents)}
+
+    def add_documents(self, documents, ids):
+        self.documents.update(zip(ids, documents))
+        self.added.extend(document.page_content for document in documents)
+
+    def delete(self, ids):
+        for chunk_id in ids:
+            self.deleted.append(self.documents.pop(chunk_id).page_content)
+
+    def as_retriever(self):
+        retriever = MagicMock()
+        retriever.get_relevant_documents.return_value = list(self.documents.values())
+        return retriever
+
+
+class FakePDFLoader:
+    """Splits each line of the file into a chunk."""
+
+    loads = 0
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+
+    def load_and_split(self, text_splitter):
+        FakePDFLoader.loads += 1
+        with open(self.filepath) as f:
+            return [Document(page_content=line) for line in f.read().splitlines()]
+
+
+@pytest.fixture
+def mock_vector_store_settings(tmp_path):
+    _file_vector_stores.clear()
+    FakeChroma.collections.clear()
+    FakePDFLoader.loads = 0
+    with patch("backend.tools.lang_chain.Settings") as mock_settings:
+        settings = {"tools.vector_store_path": str(tmp_path / "vector_stores")}
+        mock_settings.return_value.get.side_effect = settings.get
+        yield settings
+    _file_vector_stores.clear()
+
+
+@pytest.fixture
+def fake_chroma():
+    with patch("backend.tools.lang_chain.Chroma", FakeChroma), patch(
+        "backend.tools.lang_chain.PyPDFLoader", FakePDFLoader
+    ):
+        yield
+
+
+def write_file(path, lines, mtime_ns):
+    path.write_text("\n".join(lines))
+    os.utime(path, ns=(mtime_ns, mtime_ns))
 
 
 @pytest.mark.asyncio
@@ -83,7 +151,7 @@ async def test_wiki_retriever_no_docs() -> None:
 
 
 @pytest.mark.asyncio
-async def test_vector_db_retriever() -> None:
+async def test_vector_db_retriever(mock_vector_store_settings) -> None:
     ctx = Context()
     file_path = "src/backend/tests/unit/test_data/Mariana_Trench.pdf"
     retriever = LangChainVectorDBRetriever(file_path)
@@ -132,11 +200,10 @@ async def test_vector_db_retriever() -> None:
     db_get_relevant_docs_mock = MagicMock()
     db_get_relevant_docs_mock.get_relevant_docs.return_value = mock_docs
 
-    with patch(
-        "langchain_community.vectorstores.Chroma.from_documents"
-    ) as mock_from_documents:
+    with patch("backend.tools.lang_chain.Chroma") as mock_chroma:
         mock_db = MagicMock()
-        mock_from_documents.return_value = mock_db
+        mock_chroma.return_value = mock_db
+        mock_db.get.return_value = {"ids": []}
         mock_db.as_retriever().get_relevant_documents.return_value = mock_docs
         result = await retriever.call({"query": query}, ctx)
 
@@ -144,7 +211,7 @@ async def test_vector_db_retriever() -> None:
 
 
 @pytest.mark.asyncio
-async def test_vector_db_retriever_no_docs() -> None:
+async def test_vector_db_retriever_no_docs(mock_vector_store_settings) -> None:
     ctx = Context()
     file_path = "src/backend/tests/unit/test_data/Mariana_Trench.pdf"
     retriever = LangChainVectorDBRetriever(file_path)
@@ -154,11 +221,10 @@ async def test_vector_db_retriever_no_docs() -> None:
     db_get_relevant_docs_mock = MagicMock()
     db_get_relevant_docs_mock.get_relevant_docs.return_value = mock_docs
 
-    with patch(
-        "langchain_community.vectorstores.Chroma.from_documents"
-    ) as mock_from_documents:
+    with patch("backend.tools.lang_chain.Chroma") as mock_chroma:
         mock_db = MagicMock()
-        mock_from_documents.return_value = mock_db
+        mock_chroma.return_value = mock_db
+        mock_db.get.return_value = {"ids": []}
         mock_db.as_retriever().get_relevant_documents.return_value = mock_docs
         result = await retriever.call({"query": query}, ctx)
 
@@ -169,3 +235,52 @@ async def test_vector_db_retriever_no_docs() -> None:
         details='No results found for the given params.'
     ).model_dump()
     assert result == [expected_error]
+
+
+@pytest.mark.asyncio
+async def test_vector_db_retriever_reuses_vector_store(
+    tmp_path, mock_vector_store_settings, fake_chroma
+) -> None:
+    ctx = Context()
+    file_path = tmp_path / "file.pdf"
+    write_file(file_path, ["Mariana Trench", "Pacific plate"], 1_000_000_000)
+    retriever = LangChainVectorDBRetriever(str(file_path))
+
+    result = await retriever.call({"query": "trench"}, ctx)
+    await LangChainVectorDBRetriever(str(file_path)).call({"query": "plate"}, ctx)
+
+    assert result == [{"text": "Mariana Trench"}, {"text": "Pacific plate"}]
+    assert FakePDFLoader.loads == 1
+
+    # Another worker reuses the persisted collection of the unchanged file
+    _file_vector_stores.clear()
+    await retriever.call({"query": "trench"}, ctx)
+
+    assert FakePDFLoader.loads == 1
+
+    # Touching the file without changing it does not embed it again
+    os.utime(file_path, ns=(2_000_000_000, 2_000_000_000))
+    await retriever.call({"query": "trench"}, ctx)
+
+    assert FakePDFLoader.loads == 1
+
+
+@pytest.mark.asyncio
+async def test_vector_db_retriever_updates_changed_file(
+    tmp_path, mock_vector_store_settings, fake_chroma
+) -> None:
+    ctx = Context()
+    file_path = tmp_path / "file.pdf"
+    write_file(file_path, ["Mariana Trench", "Pacific plate"], 1_000_000_000)
+    retriever = LangChainVectorDBRetriever(str(file_path))
+    await retriever.call({"query": "trench"}, ctx)
+
+    write_file(file_path, ["Mariana Trench", "Challenger Deep"], 2_000_000_000)
+    result = await retriever.call({"query": "trench"}, ctx)
+
+    (vector_store,) = _file_vector_stores.values()
+    # Only the new chunk is embedded, and the removed chunk is deleted
+    assert vector_store.db.added == ["Mariana Trench", "Pacific plate", "Challenger Deep"]
+    assert vector_store.db.deleted == ["Pacific plate"]
+    assert result == [{"text": "Mariana Trench"}, {"text": "Challenger Deep"}]
+    assert FakePDFLoader.loads == 2
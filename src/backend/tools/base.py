@@ -22,6 +22,8 @@ logger = LoggerFactory().get_logger()
 class ToolErrorCode(StrEnum):
     HTTP_ERROR = "http_error"
     AUTH = "auth"
+    TIMEOUT = "timeout"
+    UNAVAILABLE = "unavailable"
     OTHER = "other"
 
 
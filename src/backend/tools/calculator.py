@@ -34,6 +34,7 @@ class Calculator(BaseTool):
             is_visible=False,
             is_available=Calculator.is_available(),
             category=ToolCategory.Function,
+            is_idempotent=True,
             error_message=cls.generate_error_message(),
             description="A powerful multi-purpose calculator capable of a wide array of math calculations.",
         )  # type: ignore
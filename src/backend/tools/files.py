@@ -4,6 +4,8 @@ from typing import Any
 import backend.crud.file as file_crud
 from backend.schemas.context import Context
 from backend.schemas.tool import ToolCategory, ToolDefinition
+from backend.services.file_search import get_file_embedder, search_files
+from backend.services.file_storage import aread_file_content
 from backend.tools.base import BaseTool
 
 
@@ -43,6 +45,7 @@ class ReadFileTool(BaseTool):
             is_available=cls.is_available(),
             error_message=cls.generate_error_message(),
             category=ToolCategory.FileLoader,
+            is_idempotent=True,
             description="Returns the chunked textual contents of an uploaded file.",
         ) # type: ignore
 
@@ -65,13 +68,15 @@ class ReadFileTool(BaseTool):
             return self.get_tool_error(details="Files are not passed in model generated params")
 
         _, file_id = file
-        retrieved_file = file_crud.get_file(session, file_id, user_id)
+        retrieved_file = file_crud.get_file(
+            session, file_id, user_id, with_content=True
+        )
         if not retrieved_file:
             return self.get_tool_error(details="The wrong files were passed in the tool parameters, or files were not found")
 
         return [
             {
-                "text": retrieved_file.file_content,
+                "text": await aread_file_content(retrieved_file),
                 "title": retrieved_file.file_name,
                 "url": retrieved_file.file_name,
             }
@@ -116,6 +121,7 @@ class SearchFileTool(BaseTool):
             is_available=cls.is_available(),
             error_message=cls.generate_error_message(),
             category=ToolCategory.FileLoader,
+            is_idempotent=True,
             description="Searches across one or more attached files based on a textual search query.",
         ) # type: ignore
 
@@ -133,21 +139,22 @@ class SearchFileTool(BaseTool):
                 details="Missing query or files. The wrong files might have been passed in the tool parameters")
 
         file_ids = [file_id for _, file_id in files]
-        retrieved_files = file_crud.get_files_by_ids(session, file_ids, user_id)
+        retrieved_files = file_crud.get_files_by_ids(
+            session, file_ids, user_id, with_content=True
+        )
 
         if not retrieved_files:
             return self.get_tool_error(
                 details="Missing files. The wrong files might have been passed in the tool parameters")
 
-        results = []
-        for file in retrieved_files:
-            results.append(
-                {
-                    "text": file.file_content,
-                    "title": file.file_name,
-                    "url": file.file_name,
-                }
+        # The chunks of the files most similar to the query, embedded with the model deployment
+        embedder = get_file_embedder(kwargs.get("model_deployment"), ctx)
+        try:
+            results = await search_files(
+                retrieved_files, query, embedder, self.MAX_NUM_CHUNKS
             )
+        except Exception as e:
+            return self.get_tool_error(details=str(e))
         if not results:
             return self.get_no_results_error()
 
@@ -44,6 +44,7 @@ class GmailTool(BaseTool):
             auth_implementation=GmailAuth,
             error_message=cls.generate_error_message(),
             category=ToolCategory.DataLoader,
+            is_idempotent=True,
             description="Returns a list of relevant email snippets from Gmail.",
         ) # type: ignore
 
@@ -53,6 +53,7 @@ class GoogleDrive(BaseTool):
             should_return_token=True,
             error_message=cls.generate_error_message(),
             category=ToolCategory.DataLoader,
+            is_idempotent=True,
             description="Returns a list of relevant document snippets from the user's Google drive.",
         ) # type: ignore
 
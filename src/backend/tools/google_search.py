@@ -37,6 +37,7 @@ class GoogleWebSearch(BaseTool):
             is_available=cls.is_available(),
             error_message=cls.generate_error_message(),
             category=ToolCategory.WebSearch,
+            is_idempotent=True,
             description="Returns relevant results by performing a Google web search.",
         ) # type: ignore
 
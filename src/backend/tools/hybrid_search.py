@@ -5,7 +5,8 @@ from typing import Any, Callable, Dict, List
 from backend.config.settings import Settings
 from backend.model_deployments.base import BaseDeployment
 from backend.schemas.context import Context
-from backend.schemas.tool import ToolCategory, ToolDefinition
+from backend.schemas.tool import ToolCallScope, ToolCategory, ToolDefinition
+from backend.services.rerank import get_reranker
 from backend.tools.base import BaseTool, ToolArgument
 from backend.tools.brave_search.tool import BraveWebSearch
 from backend.tools.google_search import GoogleWebSearch
@@ -58,6 +59,9 @@ class HybridWebSearch(BaseTool):
             is_available=cls.is_available(),
             error_message=cls.generate_error_message(),
             category=ToolCategory.WebSearch,
+            is_idempotent=True,
+            # The results do not depend on the user
+            single_flight_scope=ToolCallScope.Global,
             description=(
                 "Returns a list of relevant document snippets for a textual query "
                 "retrieved from the internet using a mix of any existing Web Search tools."
@@ -133,6 +137,10 @@ class HybridWebSearch(BaseTool):
         if not results:
             return []
 
+        reranker = get_reranker(model)
+        if reranker is None:
+            return results[: self.POST_RERANK_MAX_RESULTS]
+
         rerank_batch_size = 500
         relevance_scores = [None for _ in range(len(results))]
         for batch_start in range(0, len(results), rerank_batch_size):
@@ -144,7 +152,7 @@ class HybridWebSearch(BaseTool):
                 if isinstance(result, dict) and "text" in result
             ]
 
-            batch_output = await model.invoke_rerank(
+            batch_output = await reranker.invoke_rerank(
                 query=query,
                 documents=documents,
                 ctx=ctx,
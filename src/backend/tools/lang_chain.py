@@ -1,3 +1,8 @@
+import asyncio
+import hashlib
+import json
+import os
+from collections import Counter
 from typing import Any
 
 from langchain.text_splitter import CharacterTextSplitter
@@ -8,7 +13,8 @@ from langchain_community.vectorstores import Chroma
 
 from backend.config.settings import Settings
 from backend.schemas.context import Context
-from backend.schemas.tool import ToolCategory, ToolDefinition
+from backend.schemas.tool import ToolCallScope, ToolCategory, ToolDefinition
+from backend.services.embeddings import DEFAULT_VECTOR_STORE_PATH
 from backend.tools.base import BaseTool
 
 """
@@ -52,6 +58,9 @@ class LangChainWikiRetriever(BaseTool):
             is_available=cls.is_available(),
             error_message=cls.generate_error_message(),
             category=ToolCategory.DataLoader,
+            is_idempotent=True,
+            # The results do not depend on the user
+            single_flight_scope=ToolCallScope.Global,
             description="Retrieves documents from Wikipedia.",
         ) # type: ignore
 
@@ -113,6 +122,7 @@ class LangChainVectorDBRetriever(BaseTool):
             is_available=cls.is_available(),
             error_message=cls.generate_error_message(),
             category=ToolCategory.DataLoader,
+            is_idempotent=True,
             description="Retrieves documents from Wikipedia.",
         ) # type: ignore
 
@@ -121,14 +131,9 @@ class LangChainVectorDBRetriever(BaseTool):
     ) -> list[dict[str, Any]]:
         cohere_embeddings = CohereEmbeddings(cohere_api_key=self.COHERE_API_KEY)
 
-        # Load text files and split into chunks
         try:
-            loader = PyPDFLoader(self.filepath)
-            text_splitter = CharacterTextSplitter(chunk_size=300, chunk_overlap=0)
-            pages = loader.load_and_split(text_splitter)
-
-            # Create a vector store from the documents
-            db = Chroma.from_documents(documents=pages, embedding=cohere_embeddings)
+            # The vector store of the file is built once and updated when the file changes
+            db = await get_file_vector_store(self.filepath, cohere_embeddings).sync()
             query = parameters.get("query", "")
             input_docs = db.as_retriever().get_relevant_documents(query)
         except Exception as e:
@@ -137,3 +142,123 @@ class LangChainVectorDBRetriever(BaseTool):
             return self.get_no_results_error()
 
         return [{"text": doc.page_content} for doc in input_docs]
+
+
+class FileVectorStore:
+    """
+    Chroma collection of the chunks of a PDF file, persisted in tools.vector_store_path and
+    shared by the calls and the workers.
+
+    The collection is synced lazily when the file is queried: nothing is done while its
+    modification time and size are unchanged, and when its content changes only the new
+    chunks are embedded and the removed chunks are deleted.
+    """
+
+    CHUNK_SIZE = 300
+
+    def __init__(self, filepath: str, embeddings: Any, directory: str) -> None:
+        self.filepath = filepath
+        model = getattr(embeddings, "model", None) or ""
+        name = "file_" + hashlib.sha256(f"{filepath}:{model}".encode()).hexdigest()[:32]
+        self.db = Chroma(
+            collection_name=name,
+            embedding_function=embeddings,
+            persist_directory=directory,
+        )
+        self.state_path = os.path.join(directory, f"{name}.json")
+        self.signature = None
+        self.lock = asyncio.Lock()
+
+    async def sync(self) -> Chroma:
+        """
+        Update the collection if the file changed since it was last synced.
+
+        Returns:
+            Chroma: Vector store of the file.
+        """
+        async with self.lock:
+            stat = os.stat(self.filepath)
+            signature = [stat.st_mtime_ns, stat.st_size]
+            if signature != self.signature:
+                await asyncio.to_thread(self._sync, signature)
+                self.signature = signature
+        return self.db
+
+    def _sync(self, signature: list[int]) -> None:
+        state = self._read_state()
+        if state.get("signature") == signature:
+            return
+
+        with open(self.filepath, "rb") as f:
+            content_hash = hashlib.sha256(f.read()).hexdigest()
+        if state.get("content_hash") != content_hash:
+            loader = PyPDFLoader(self.filepath)
+            text_splitter = CharacterTextSplitter(chunk_size=self.CHUNK_SIZE, chunk_overlap=0)
+            pages = loader.load_and_split(text_splitter)
+            ids = _get_chunk_ids(pages)
+
+            existing_ids = set(self.db.get(include=[])["ids"])
+            new_pages = [
+                (chunk_id, page)
+                for chunk_id, page in zip(ids, pages)
+                if chunk_id not in existing_ids
+            ]
+            if new_pages:
+                self.db.add_documents(
+                    [page for _, page in new_pages],
+                    ids=[chunk_id for chunk_id, _ in new_pages],
+                )
+            removed_ids = existing_ids - set(ids)
+            if removed_ids:
+                self.db.delete(ids=list(removed_ids))
+
+        self._write_state({"signature": signature, "content_hash": content_hash})
+
+    def _read_state(self) -> dict:
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_state(self, state: dict) -> None:
+        tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+
+# Vector store of each file, reused by the calls of the process
+_file_vector_stores: dict[tuple[str, str], FileVectorStore] = {}
+
+
+def get_file_vector_store(filepath: str, embeddings: Any) -> FileVectorStore:
+    """
+    Get the vector store of a PDF file, created on first use.
+
+    Args:
+        filepath (str): Path of the file.
+        embeddings (Any): LangChain embeddings of the chunks.
+
+    Returns:
+        FileVectorStore: Vector store of the file.
+    """
+    path = Settings().get("tools.vector_store_path") or DEFAULT_VECTOR_STORE_PATH
+    directory = os.path.join(path, "chroma")
+    key = (os.path.abspath(filepath), directory)
+    if key not in _file_vector_stores:
+        os.makedirs(directory, exist_ok=True)
+        _file_vector_stores[key] = FileVectorStore(key[0], embeddings, directory)
+    return _file_vector_stores[key]
+
+
+def _get_chunk_ids(pages: list) -> list[str]:
+    # Chunks are identified by their content, so an unchanged chunk keeps its embedding
+    # when the file changes. Repeated chunks are numbered
+    ids = []
+    occurrences = Counter()
+    for page in pages:
+        content_hash = hashlib.sha256(page.page_content.encode()).hexdigest()
+        ids.append(f"{content_hash}-{occurrences[content_hash]}")
+        occurrences[content_hash] += 1
+    return ids
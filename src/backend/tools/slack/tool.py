@@ -45,6 +45,7 @@ class SlackTool(BaseTool):
             should_return_token=False,
             error_message=cls.generate_error_message(),
             category=ToolCategory.DataLoader,
+            is_idempotent=True,
             description="Returns a list of relevant document snippets from slack.",
         ) # type: ignore
 
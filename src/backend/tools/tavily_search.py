@@ -36,6 +36,7 @@ class TavilyWebSearch(BaseTool):
             is_available=cls.is_available(),
             error_message=cls.generate_error_message(),
             category=ToolCategory.WebSearch,
+            is_idempotent=True,
             description="Returns a list of relevant document snippets for a textual query retrieved from the internet.",
         ) # type: ignore
 
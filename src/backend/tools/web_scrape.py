@@ -42,6 +42,7 @@ class WebScrapeTool(BaseTool):
             is_available=cls.is_available(),
             error_message=cls.generate_error_message(),
             category=ToolCategory.DataLoader,
+            is_idempotent=True,
             description="Scrape and returns the textual contents of a webpage as a list of passages for a given url.",
         ) # type: ignore
 
@@ -1,5 +1,10 @@
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
 import pytest
 
+from backend.tests.unit.mock_embedders import CountingEmbedder
 from community.tools import LlamaIndexUploadPDFRetriever
 
 
@@ -40,3 +45,94 @@ async def test_pdf_retriever() -> None:
     result = await retriever.call({"query": query})
 
     assert expected_docs == result
+
+
+def get_file(index: int, paragraphs: int = 20) -> SimpleNamespace:
+    content = "\n\n".join(
+        f"Paragraph {paragraph} of file {index}. " + f"topic{index}x{paragraph} " * 20
+        for paragraph in range(paragraphs)
+    )
+    # Uploaded files share their text, their own file_content is empty
+    return SimpleNamespace(
+        id=f"file-{index}",
+        file_name=f"file-{index}.pdf",
+        file_content="",
+        storage_key=None,
+        shared_content_id=f"content-{index}",
+        shared_content=SimpleNamespace(storage_key=None, text=content),
+    )
+
+
+@pytest.fixture
+def embedder(tmp_path):
+    embedder = CountingEmbedder()
+    with patch("backend.services.embeddings.Settings") as mock_settings, patch.object(
+        LlamaIndexUploadPDFRetriever, "_get_embedder", return_value=embedder
+    ):
+        mock_settings.return_value.get.return_value = str(tmp_path)
+        yield embedder
+
+
+async def retrieve(files: list[SimpleNamespace], query: str) -> list[dict]:
+    with patch(
+        "community.tools.llama_index.file_crud.get_files_by_ids", return_value=files
+    ):
+        return await LlamaIndexUploadPDFRetriever().call(
+            {"query": query, "files": [(file.file_name, file.id) for file in files]},
+            ctx=None,
+            session=None,
+            user_id="user",
+        )
+
+
+@pytest.mark.asyncio
+async def test_pdf_retriever_embeds_files_once(embedder) -> None:
+    files = [get_file(index, paragraphs=5) for index in range(3)]
+
+    results = await retrieve(files, "topic1x3")
+
+    assert "topic1x3" in results[0]["text"]
+    assert len(results) <= LlamaIndexUploadPDFRetriever.TOP_K
+    embedded_texts = embedder.embedded_texts
+
+    results = await retrieve(files, "topic2x4")
+
+    # Only the query is embedded once the files are
+    assert "topic2x4" in results[0]["text"]
+    assert embedder.embedded_texts == embedded_texts
+    assert embedder.queries == 2
+
+
+@pytest.mark.asyncio
+async def test_pdf_retriever_without_content(embedder) -> None:
+    files = [
+        SimpleNamespace(
+            id="file",
+            file_name="empty.pdf",
+            file_content="",
+            storage_key=None,
+            shared_content_id=None,
+        )
+    ]
+
+    results = await retrieve(files, "topic")
+
+    assert results == LlamaIndexUploadPDFRetriever.get_no_results_error()
+
+
+@pytest.mark.benchmark
+@pytest.mark.asyncio
+async def test_benchmark_pdf_retriever_query_latency(embedder) -> None:
+    files = [get_file(index) for index in range(100)]
+
+    start = time.perf_counter()
+    await retrieve(files, "topic0x0")
+    first_query = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for index in range(10):
+        results = await retrieve(files, f"topic{index}x{index}")
+        assert any(f"topic{index}x{index}" in result["text"] for result in results)
+    cached_query = (time.perf_counter() - start) / 10
+
+    assert cached_query < first_query / 5
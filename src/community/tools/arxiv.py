@@ -2,7 +2,7 @@ from typing import Any, Dict, List
 
 from langchain_community.utilities import ArxivAPIWrapper
 
-from backend.schemas.tool import ToolCategory, ToolDefinition
+from backend.schemas.tool import ToolCallScope, ToolCategory, ToolDefinition
 from backend.tools.base import BaseTool
 
 
@@ -33,6 +33,9 @@ class ArxivRetriever(BaseTool):
             is_available=cls.is_available(),
             error_message=cls.generate_error_message(),
             category=ToolCategory.DataLoader,
+            is_idempotent=True,
+            # The results do not depend on the user
+            single_flight_scope=ToolCallScope.Global,
             description="Retrieves documents from Arxiv.",
         )
 
@@ -32,6 +32,7 @@ class ClinicalTrials(BaseTool):
             is_available=cls.is_available(),
             error_message=cls.generate_error_message(),
             category=ToolCategory.Function,
+            is_idempotent=True,
             description="Retrieves clinical studies from ClinicalTrials.gov.",
             parameter_definitions={
                 "condition": {
@@ -1,14 +1,19 @@
 from typing import Any, Dict, List
 
-from llama_index.core import VectorStoreIndex
+import numpy as np
 from llama_index.core.node_parser import SentenceSplitter
-from llama_index.core.readers import StringIterableReader
 from llama_index.embeddings.cohere import CohereEmbedding
 
 import backend.crud.file as file_crud
 from backend.config import Settings
 from backend.schemas.context import Context
 from backend.schemas.tool import ToolCategory, ToolDefinition
+from backend.services.embeddings import (
+    Embedder,
+    get_embedding_store,
+    search_embeddings,
+)
+from backend.services.file_storage import aread_file_content
 from backend.tools.base import BaseTool
 
 """
@@ -21,6 +26,32 @@ https://docs.llamaindex.ai/en/stable/module_guides/querying/retriever/root.html
 """
 
 
+class LlamaIndexCohereEmbedder(Embedder):
+    """
+    Embeds the file chunks and the queries with the Cohere embedding of llama_index.
+    """
+
+    model_name = "embed-english-v3.0"
+
+    def __init__(self, api_key: str | None) -> None:
+        self.api_key = api_key
+
+    def embed_documents(self, texts: list[str]) -> np.ndarray:
+        embeddings = self._get_embedding("search_document").get_text_embedding_batch(texts)
+        return np.asarray(embeddings, dtype=np.float32)
+
+    def embed_query(self, text: str) -> np.ndarray:
+        embedding = self._get_embedding("search_query").get_query_embedding(text)
+        return np.asarray(embedding, dtype=np.float32)
+
+    def _get_embedding(self, embed_type: str) -> CohereEmbedding:
+        return CohereEmbedding(
+            api_key=self.api_key,
+            model_name=self.model_name,
+            input_type=embed_type,
+        )
+
+
 class LlamaIndexUploadPDFRetriever(BaseTool):
     """
     This class retrieves documents from a PDF using the llama_index package.
@@ -29,17 +60,16 @@ class LlamaIndexUploadPDFRetriever(BaseTool):
 
     ID = "file_reader_llamaindex"
     CHUNK_SIZE = 512
+    TOP_K = 10
 
     def __init__(self):
         self.COHERE_API_KEY = Settings().get('deployments.cohere_platform.api_key')
 
+    def _get_embedder(self) -> Embedder:
+        return LlamaIndexCohereEmbedder(self.COHERE_API_KEY)
 
-    def _get_embedding(self, embed_type):
-        return CohereEmbedding(
-            api_key=self.COHERE_API_KEY,
-            model_name="embed-english-v3.0",
-            input_type=embed_type,
-        )
+    def _split(self, text: str) -> list[str]:
+        return SentenceSplitter(chunk_size=self.CHUNK_SIZE).split_text(text)
 
     @classmethod
     def is_available(cls) -> bool:
@@ -68,6 +98,7 @@ class LlamaIndexUploadPDFRetriever(BaseTool):
             is_available=cls.is_available(),
             error_message=cls.generate_error_message(),
             category=ToolCategory.FileLoader,
+            is_idempotent=True,
             description=(
                 "Retrieves the most relevant documents from the uploaded "
                 "files based on the query using Llama Index."
@@ -86,38 +117,39 @@ class LlamaIndexUploadPDFRetriever(BaseTool):
             return []
 
         file_ids = [file_id for _, file_id in files]
-        retrieved_files = file_crud.get_files_by_ids(session, file_ids, user_id)
+        retrieved_files = file_crud.get_files_by_ids(
+            session, file_ids, user_id, with_content=True
+        )
         if not retrieved_files:
             return self.get_no_results_error()
 
-        file_str_list = []
-        for file in retrieved_files:
-            file_str_list.append(file.file_content)
-        # LLamaIndex get documents from parsed PDFs, split it into sentences, embed, index and retrieve
+        # The chunks of each file are embedded once, and kept by content hash and embedding
+        # model, so a query only embeds itself. The Cohere calls run in a worker thread, off
+        # the event loop
         try:
-            docs = StringIterableReader().load_data(file_str_list)
-            node_parser = SentenceSplitter(chunk_size=LlamaIndexUploadPDFRetriever.CHUNK_SIZE)
-            nodes = node_parser.get_nodes_from_documents(docs)
-            embed_model = self._get_embedding("search_document")
-            vector_index = VectorStoreIndex(
-                nodes,
-                embed_model=embed_model,
-            )
-            embed_model_query = self._get_embedding("search_query")
-            retriever = vector_index.as_retriever(
-                similarity_top_k=10,
-                embed_model=embed_model_query,
+            embedder = self._get_embedder()
+            store = get_embedding_store("llama_index")
+            chunks = []
+            embeddings = []
+            for file in retrieved_files:
+                file_chunks, file_embeddings = await store.aget_or_create(
+                    await aread_file_content(file),
+                    embedder,
+                    self._split,
+                    chunking=f"sentence-{self.CHUNK_SIZE}",
+                )
+                if file_chunks:
+                    chunks.extend(file_chunks)
+                    embeddings.append(file_embeddings)
+            if not chunks:
+                return self.get_no_results_error()
+
+            results = search_embeddings(
+                await embedder.aembed_query(query),
+                np.concatenate(embeddings),
+                self.TOP_K,
             )
-            results = retriever.retrieve(query)
-            llama_results = [{"text": doc.text} for doc in results]
         except Exception as e:
             return self.get_tool_error(details=str(e))
 
-        if not llama_results and not docs:
-            return self.get_no_results_error()
-
-        # If llama results are found, return them
-        if llama_results:
-            return llama_results
-        # If no llama results are found, return the original file content
-        return [{"text": doc.text} for doc in docs]
+        return [{"text": chunks[row]} for row, _ in results]
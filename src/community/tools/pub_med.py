@@ -33,6 +33,7 @@ class PubMedRetriever(BaseTool):
             is_available=cls.is_available(),
             error_message=cls.generate_error_message(),
             category=ToolCategory.DataLoader,
+            is_idempotent=True,
             description="Retrieves documents from Pub Med.",
         )
 
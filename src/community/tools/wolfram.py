@@ -36,6 +36,7 @@ class WolframAlpha(BaseTool):
             is_available=cls.is_available(),
             error_message=cls.generate_error_message(),
             category=ToolCategory.Function,
+            is_idempotent=True,
             description="Evaluate arithmetic expressions using Wolfram Alpha.",
         )
 